@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+"""Load and latency benchmark for the shop agent.
+
+Drives `/health`, authenticated `/status` and `/ops/*` at a fixed concurrency for a
+fixed duration over keep-alive connections, then reports throughput and p50/p95/p99
+latency per scenario. Results can be written as a JSON baseline and compared against
+a previous one; regressions beyond the threshold make the run exit non-zero.
+
+Examples:
+
+    python3 backend/shop-agent/bench/agent_bench.py --duration 10 --concurrency 16 --output baseline.json
+    python3 backend/shop-agent/bench/agent_bench.py --compare baseline.json --threshold 0.15
+    python3 backend/shop-agent/bench/agent_bench.py --mode subprocess --scenarios health,status
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import hashlib
+import hmac
+import http.client
+import importlib.util
+import json
+import math
+import os
+import pathlib
+import platform
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from types import ModuleType
+from urllib.parse import urlsplit
+
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+SERVER_PATH = ROOT / "src" / "server.py"
+
+BENCH_SECRET = "bench-secret"
+BENCH_STORE_ID = "bench-store"
+BENCH_ENV = {
+    "AGENT_AUTH_MODE": "jwt",
+    "AGENT_JWT_SECRET": BENCH_SECRET,
+    "AGENT_JWT_ISSUER": "control-plane",
+    "AGENT_JWT_AUDIENCE": "shop-agent",
+    "AGENT_JWT_LEEWAY_SECONDS": "5",
+    "AGENT_JWT_MAX_TTL_SECONDS": "900",
+    "STORE_ID": BENCH_STORE_ID,
+    "SHOP_AGENT_VERSION": "bench",
+    "DEPLOYMENT_VERSION": "bench",
+    # Measure serving cost, not admission control: per-actor limits are disabled.
+    "AGENT_RATE_LIMITS": "",
+}
+
+# Scenario name -> (method, path, authenticated).
+SCENARIOS: dict[str, tuple[str, str, bool]] = {
+    "health": ("GET", "/health", False),
+    "status": ("GET", "/status", True),
+    "ops": ("POST", "/ops/cache/flush", True),
+    "diagnostics": ("POST", "/ops/diagnostics", True),
+}
+
+# Metrics where a larger value is worse; throughput is compared in the other direction.
+LATENCY_KEYS = ("p50_ms", "p95_ms", "p99_ms")
+
+
+def load_server_module() -> ModuleType:
+    spec = importlib.util.spec_from_file_location("shop_agent_server", SERVER_PATH)
+    assert spec is not None and spec.loader is not None
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _b64url(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).decode("utf-8").rstrip("=")
+
+
+def jwt_token(
+    *,
+    secret: str = BENCH_SECRET,
+    issuer: str = "control-plane",
+    audience: str = "shop-agent",
+    store_id: str = BENCH_STORE_ID,
+    ttl_seconds: int = 600,
+) -> str:
+    """Same claim layout as the unit-test helper, signed HS256."""
+    now = int(time.time())
+    header = {"alg": "HS256", "typ": "JWT"}
+    payload = {
+        "iss": issuer,
+        "aud": audience,
+        "iat": now,
+        "exp": now + ttl_seconds,
+        "store_id": store_id,
+        "sub": "bench",
+    }
+    header_b64 = _b64url(json.dumps(header, separators=(",", ":")).encode("utf-8"))
+    payload_b64 = _b64url(json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+    signing_input = f"{header_b64}.{payload_b64}".encode("utf-8")
+    signature = hmac.new(secret.encode("utf-8"), signing_input, hashlib.sha256).digest()
+    return f"{header_b64}.{payload_b64}.{_b64url(signature)}"
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(latencies: list[float], errors: int, elapsed: float) -> dict:
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "throughput_rps": round(len(ordered) / elapsed, 2) if elapsed > 0 else 0.0,
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 3),
+        "max_ms": round((ordered[-1] if ordered else 0.0) * 1000, 3),
+    }
+
+
+def run_scenario(
+    host: str, port: int, scenario: str, *, concurrency: int, duration: float, token: str
+) -> dict:
+    method, path, authenticated = SCENARIOS[scenario]
+    headers = {"X-Actor-Id": "bench", "Content-Length": "0"}
+    if authenticated:
+        headers["Authorization"] = f"Bearer {token}"
+
+    lock = threading.Lock()
+    latencies: list[float] = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    def worker() -> None:
+        nonlocal errors
+        local_latencies: list[float] = []
+        local_errors = 0
+        conn = http.client.HTTPConnection(host, port, timeout=10)
+        try:
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    conn.request(method, path, headers=headers)
+                    resp = conn.getresponse()
+                    resp.read()
+                except (OSError, http.client.HTTPException):
+                    local_errors += 1
+                    conn.close()
+                    conn = http.client.HTTPConnection(host, port, timeout=10)
+                    continue
+                if resp.status >= 400:
+                    local_errors += 1
+                else:
+                    local_latencies.append(time.perf_counter() - started)
+        finally:
+            conn.close()
+        with lock:
+            latencies.extend(local_latencies)
+            errors += local_errors
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list[str]:
+    """Return human-readable regressions of ``current`` against ``baseline``."""
+    regressions: list[str] = []
+    for scenario, base in baseline.get("scenarios", {}).items():
+        now = current.get("scenarios", {}).get(scenario)
+        if now is None:
+            continue
+        if base["throughput_rps"] > 0 and now["throughput_rps"] < base["throughput_rps"] * (1 - threshold):
+            regressions.append(
+                f"{scenario}: throughput {now['throughput_rps']} rps < baseline {base['throughput_rps']} rps"
+            )
+        for key in LATENCY_KEYS:
+            if base[key] > 0 and now[key] > base[key] * (1 + threshold):
+                regressions.append(f"{scenario}: {key} {now[key]} > baseline {base[key]}")
+    return regressions
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_health(host: str, port: int, timeout: float = 15.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=1)
+            conn.request("GET", "/health")
+            if conn.getresponse().status == 200:
+                conn.close()
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"shop-agent on {host}:{port} did not become healthy within {timeout}s")
+
+
+@contextmanager
+def inprocess_agent(env: dict[str, str]) -> Iterator[tuple[str, int]]:
+    """Run the agent in this process; clients and server then share one GIL."""
+    server = load_server_module()
+    settings = server.reload_settings(dict(os.environ, **env))
+    devnull = open(os.devnull, "w", encoding="utf-8")
+    server.LOGGER = server.AsyncLogWriter(stream=devnull)
+    httpd = server.AgentHTTPServer(
+        ("127.0.0.1", 0),
+        server.Handler,
+        max_workers=settings.max_workers,
+        max_in_flight=settings.max_in_flight,
+        idle_timeout=settings.keepalive_idle_seconds,
+    )
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield "127.0.0.1", httpd.server_address[1]
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+        thread.join(timeout=5)
+        server.LOGGER.close()
+        devnull.close()
+
+
+@contextmanager
+def subprocess_agent(env: dict[str, str]) -> Iterator[tuple[str, int]]:
+    port = _free_port()
+    child_env = dict(os.environ, **env, HOST="127.0.0.1", PORT=str(port))
+    proc = subprocess.Popen(
+        [sys.executable, str(SERVER_PATH)], env=child_env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        _wait_for_health("127.0.0.1", port)
+        yield "127.0.0.1", port
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+@contextmanager
+def external_agent(url: str) -> Iterator[tuple[str, int]]:
+    parts = urlsplit(url)
+    yield parts.hostname or "127.0.0.1", parts.port or 80
+
+
+def run_benchmark(args: argparse.Namespace) -> dict:
+    env = dict(BENCH_ENV)
+    env["AGENT_SERVER_MODE"] = args.server_mode
+    secret = args.secret or BENCH_SECRET
+    env["AGENT_JWT_SECRET"] = secret
+    token = jwt_token(secret=secret, store_id=args.store_id or BENCH_STORE_ID)
+    if args.store_id:
+        env["STORE_ID"] = args.store_id
+
+    if args.target:
+        target = external_agent(args.target)
+    elif args.mode == "subprocess":
+        target = subprocess_agent(env)
+    else:
+        target = inprocess_agent(env)
+
+    results: dict[str, dict] = {}
+    with target as (host, port):
+        for scenario in args.scenarios:
+            if args.warmup > 0:
+                run_scenario(host, port, scenario, concurrency=args.concurrency, duration=args.warmup, token=token)
+            results[scenario] = run_scenario(
+                host, port, scenario, concurrency=args.concurrency, duration=args.duration, token=token
+            )
+
+    return {
+        "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "config": {
+            "mode": "external" if args.target else args.mode,
+            "server_mode": args.server_mode,
+            "concurrency": args.concurrency,
+            "duration_seconds": args.duration,
+            "python": platform.python_version(),
+        },
+        "scenarios": results,
+    }
+
+
+def _print_report(report: dict) -> None:
+    print(f"{'scenario':<12} {'requests':>9} {'errors':>7} {'rps':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, row in report["scenarios"].items():
+        print(
+            f"{name:<12} {row['requests']:>9} {row['errors']:>7} {row['throughput_rps']:>10} "
+            f"{row['p50_ms']:>9} {row['p95_ms']:>9} {row['p99_ms']:>9}"
+        )
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", choices=("inprocess", "subprocess"), default="inprocess")
+    parser.add_argument("--target", help="Benchmark an already running agent at this base URL instead.")
+    parser.add_argument("--secret", help="JWT secret of the --target agent.")
+    parser.add_argument("--store-id", help="STORE_ID of the --target agent.")
+    parser.add_argument("--server-mode", choices=("pool", "single"), default="pool")
+    parser.add_argument("--scenarios", default="health,status,ops", type=lambda raw: raw.split(","))
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds per scenario.")
+    parser.add_argument("--warmup", type=float, default=1.0, help="Unmeasured seconds before each scenario.")
+    parser.add_argument("--output", help="Write the JSON report to this file.")
+    parser.add_argument("--compare", help="Baseline JSON report to compare against.")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Allowed relative regression (0.10 = 10%%).")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}; choose from {', '.join(SCENARIOS)}")
+    return args
+
+
+def main(argv: list[str]) -> int:
+    args = parse_args(argv)
+    report = run_benchmark(args)
+    _print_report(report)
+
+    if args.output:
+        pathlib.Path(args.output).write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+        print(f"Report written to {args.output}")
+
+    if args.compare:
+        baseline = json.loads(pathlib.Path(args.compare).read_text(encoding="utf-8"))
+        regressions = compare(baseline, report, args.threshold)
+        if regressions:
+            print(f"Regressions over {args.threshold:.0%} threshold:")
+            for regression in regressions:
+                print(f"- {regression}")
+            return 1
+        print(f"No regressions over {args.threshold:.0%} threshold.")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -1,26 +1,1194 @@
 #!/usr/bin/env python3
 import base64
 import errno
+import fcntl
 import hashlib
 import hmac
 import json
+import math
 import os
+import queue
+import random
+import selectors
+import signal
+import socket
+import sys
+import tempfile
 import time
-from datetime import datetime, timezone
+import urllib.error
+import urllib.request
+from bisect import bisect_left
+from collections import Counter, OrderedDict, deque
+from collections.abc import Callable, Iterator, Mapping
+from typing import TextIO
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta, timezone
 from http.server import BaseHTTPRequestHandler, HTTPServer
-from threading import Lock
-from urllib.parse import urlsplit
+from io import BufferedReader
+from threading import BoundedSemaphore, Event, Lock, Thread, get_ident
+from threading import enumerate as threading_enumerate
+from types import FrameType
+from urllib.parse import parse_qs, urlsplit
 from uuid import uuid4
 
 
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class MetricsRegistry:
+    """In-process counters, gauges and fixed-bucket histograms in Prometheus text format.
+
+    Metrics are declared once with their label names; recording is a dict update under
+    a single short lock. Callback metrics are sampled only when rendering.
+    """
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._meta: dict[str, tuple[str, str, tuple[str, ...]]] = {}
+        self._values: dict[str, dict[tuple[str, ...], float]] = {}
+        self._histograms: dict[str, dict[tuple[str, ...], list[float]]] = {}
+        self._callbacks: dict[str, Callable[[], float]] = {}
+
+    def describe(
+        self,
+        name: str,
+        kind: str,
+        help_text: str,
+        labels: tuple[str, ...] = (),
+        callback: Callable[[], float] | None = None,
+    ) -> None:
+        self._meta[name] = (kind, help_text, labels)
+        if callback is not None:
+            self._callbacks[name] = callback
+        elif kind == "histogram":
+            self._histograms[name] = {}
+        else:
+            self._values[name] = {}
+
+    def inc(self, name: str, *labels: str, value: float = 1.0) -> None:
+        series = self._values[name]
+        with self._lock:
+            series[labels] = series.get(labels, 0.0) + value
+
+    def observe(self, name: str, seconds: float, *labels: str) -> None:
+        series = self._histograms[name]
+        index = bisect_left(LATENCY_BUCKETS, seconds)
+        with self._lock:
+            buckets = series.get(labels)
+            if buckets is None:
+                # One slot per bucket, then +Inf, then the running sum.
+                buckets = series[labels] = [0.0] * (len(LATENCY_BUCKETS) + 2)
+            buckets[index] += 1
+            buckets[-1] += seconds
+
+    def reset(self) -> None:
+        with self._lock:
+            for series in self._values.values():
+                series.clear()
+            for histogram in self._histograms.values():
+                histogram.clear()
+
+    def render(self) -> str:
+        lines: list[str] = []
+        with self._lock:
+            values = {name: dict(series) for name, series in self._values.items()}
+            histograms = {name: {k: list(v) for k, v in series.items()} for name, series in self._histograms.items()}
+        for name, (kind, help_text, label_names) in self._meta.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if name in self._callbacks:
+                lines.append(f"{name} {_format_metric_value(self._callbacks[name]())}")
+            elif kind == "histogram":
+                for labels, buckets in sorted(histograms[name].items()):
+                    cumulative = 0.0
+                    for bound, count in zip((*LATENCY_BUCKETS, float("inf")), buckets):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append(f"{name}_bucket{_format_labels(label_names, labels, le)} {_format_metric_value(cumulative)}")
+                    lines.append(f"{name}_sum{_format_labels(label_names, labels)} {buckets[-1]!r}")
+                    lines.append(f"{name}_count{_format_labels(label_names, labels)} {_format_metric_value(cumulative)}")
+            else:
+                for labels, value in sorted(values[name].items()):
+                    lines.append(f"{name}{_format_labels(label_names, labels)} {_format_metric_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], le: str | None = None) -> str:
+    pairs = [f'{key}="{value}"' for key, value in zip(names, values)]
+    if le is not None:
+        pairs.append(f'le="{le}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_metric_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+class AsyncLogWriter:
+    """JSON-lines log writer that keeps stdout I/O off request threads.
+
+    ``emit`` only enqueues; a daemon thread drains the bounded queue in batches and
+    flushes once per batch. When the queue is full, ``drop`` policy discards the
+    record and counts it, ``block`` policy waits for space. ``close`` drains what is
+    queued before returning.
+    """
+
+    def __init__(
+        self,
+        max_queue: int = 10000,
+        overflow: str = "drop",
+        batch_size: int = 256,
+        stream: TextIO | None = None,
+    ) -> None:
+        self.overflow = overflow
+        self.batch_size = batch_size
+        self.dropped = 0
+        self._stream = stream
+        self._queue: queue.Queue[dict | None] = queue.Queue(maxsize=max_queue)
+        self._lock = Lock()
+        self._thread: Thread | None = None
+
+    def configure(self, max_queue: int, overflow: str) -> None:
+        with self._lock:
+            self.overflow = overflow
+            if self._thread is None:
+                self._queue = queue.Queue(maxsize=max_queue)
+
+    def emit(self, record: dict) -> None:
+        if self._thread is None:
+            self.start()
+        if self.overflow == "block":
+            self._queue.put(record)
+            return
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = Thread(target=self._run, name="shop-agent-log-writer", daemon=True)
+            self._thread.start()
+
+    def close(self, timeout: float = 5.0) -> None:
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._queue.put(None)
+        thread.join(timeout=timeout)
+
+    def _run(self) -> None:
+        while True:
+            record = self._queue.get()
+            batch: list[dict] = []
+            stop = record is None
+            if record is not None:
+                batch.append(record)
+            while not stop and len(batch) < self.batch_size:
+                try:
+                    record = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if record is None:
+                    stop = True
+                else:
+                    batch.append(record)
+            if batch:
+                self._write(batch)
+            if stop:
+                return
+
+    def _write(self, batch: list[dict]) -> None:
+        stream = self._stream or sys.stdout
+        try:
+            stream.write("".join(json.dumps(record, separators=(",", ":")) + "\n" for record in batch))
+            stream.flush()
+        except (OSError, ValueError):
+            with self._lock:
+                self.dropped += len(batch)
+
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+TRACE_EXPORT_BATCH = 512
+TRACE_EXPORT_TIMEOUT_SECONDS = 5.0
+_HEX_DIGITS = frozenset("0123456789abcdef")
+# Returned for every span of an unsampled request, so not recording costs no allocation.
+NO_SPAN = nullcontext()
+
+
+def parse_traceparent(header: str) -> tuple[str, str, bool] | None:
+    """Return ``(trace_id, parent_id, sampled)`` from a W3C ``traceparent`` header, or None if it is invalid."""
+    parts = header.strip().split("-")
+    if len(parts) < 4:
+        return None
+    version, trace_id, parent_id, flags = parts[:4]
+    # Version 00 has exactly four fields; later versions may append more and are read as 00.
+    if version == "ff" or (version == "00" and len(parts) != 4):
+        return None
+    if len(version) != 2 or len(trace_id) != 32 or len(parent_id) != 16 or len(flags) != 2:
+        return None
+    if not set(version + trace_id + parent_id + flags) <= _HEX_DIGITS:
+        return None
+    if trace_id == "0" * 32 or parent_id == "0" * 16:
+        return None
+    return trace_id, parent_id, bool(int(flags, 16) & 1)
+
+
+def _new_span_id() -> str:
+    return f"{random.getrandbits(64) or 1:016x}"
+
+
+def _otlp_attributes(attributes: Mapping[str, object]) -> list[dict]:
+    encoded = []
+    for key, value in attributes.items():
+        if isinstance(value, bool):
+            encoded.append({"key": key, "value": {"boolValue": value}})
+        elif isinstance(value, int):
+            encoded.append({"key": key, "value": {"intValue": str(value)}})
+        elif isinstance(value, float):
+            encoded.append({"key": key, "value": {"doubleValue": value}})
+        else:
+            encoded.append({"key": key, "value": {"stringValue": str(value)}})
+    return encoded
+
+
+class Span:
+    """One timed operation of a sampled trace; the tracer stamps its end when it is recorded."""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "attributes", "start_ns", "end_ns", "error")
+
+    def __init__(self, trace_id: str, parent_id: str | None, name: str, kind: int, attributes: dict) -> None:
+        self.trace_id = trace_id
+        self.span_id = _new_span_id()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.error = False
+
+    def set_status(self, code: int) -> None:
+        """Record an HTTP status; no response (``0``) and 5xx mark the span as failed."""
+        self.attributes["http.response.status_code"] = code
+        self.error = code == 0 or code >= 500
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": _otlp_attributes(self.attributes),
+            "status": {"code": 2 if self.error else 0},
+        }
+        if self.parent_id is not None:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class TraceContext:
+    """A request's place in a trace: W3C ids, the sampling decision and the span children attach to.
+
+    Spans are only allocated when the request is sampled and the tracer has an export
+    target; otherwise ``span`` and ``client`` return the shared ``NO_SPAN``. ``span``
+    nests (children opened inside it attach to it) and belongs to the request thread;
+    ``client`` opens a leaf span and may be used from fan-out threads.
+    """
+
+    __slots__ = ("trace_id", "sampled", "_tracer", "_root", "_current")
+
+    def __init__(
+        self, tracer: "Tracer", trace_id: str, parent_id: str | None, sampled: bool, name: str, kind: int
+    ) -> None:
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self._tracer = tracer
+        self._root = Span(trace_id, parent_id, name, kind, {}) if sampled and tracer.recording else None
+        self._current = _new_span_id() if self._root is None else self._root.span_id
+
+    @property
+    def recording(self) -> bool:
+        return self._root is not None
+
+    def traceparent(self, span: Span | None = None) -> str:
+        """Header value for an outgoing call made from ``span`` (default: the innermost open span)."""
+        parent_id = self._current if span is None else span.span_id
+        return f"00-{self.trace_id}-{parent_id}-{'01' if self.sampled else '00'}"
+
+    def span(self, name: str, attributes: dict | None = None) -> AbstractContextManager[Span | None]:
+        if self._root is None:
+            return NO_SPAN
+        return self._open(name, SPAN_KIND_INTERNAL, attributes or {}, nest=True)
+
+    def client(self, name: str, attributes: dict | None = None) -> AbstractContextManager[Span | None]:
+        if self._root is None:
+            return NO_SPAN
+        return self._open(name, SPAN_KIND_CLIENT, attributes or {}, nest=False)
+
+    @contextmanager
+    def _open(self, name: str, kind: int, attributes: dict, nest: bool) -> Iterator[Span]:
+        span = Span(self.trace_id, self._current, name, kind, attributes)
+        parent = self._current
+        if nest:
+            self._current = span.span_id
+        try:
+            yield span
+        except BaseException:
+            span.error = True
+            raise
+        finally:
+            if nest:
+                self._current = parent
+            self._tracer.record(span)
+
+    def finish(self, status_code: int = 0, attributes: dict | None = None, name: str | None = None) -> None:
+        """Record the root span, optionally renaming it; later calls are ignored."""
+        root = self._root
+        if root is None or root.end_ns:
+            return
+        if name is not None:
+            root.name = name
+        if attributes:
+            root.attributes.update(attributes)
+        if status_code:
+            root.set_status(status_code)
+        self._tracer.record(root)
+
+
+class Tracer:
+    """Head-sampled tracing with a bounded span buffer and batched OTLP/JSON export.
+
+    ``begin`` continues the caller's ``traceparent`` or starts a trace, and decides once:
+    a valid parent's sampled flag wins, otherwise the trace id is compared against
+    ``sample_ratio`` so every service keeps the same root traces. Spans are recorded
+    only for sampled requests while an export target is configured. Finished spans go
+    into a ring buffer of ``buffer_size`` (the oldest are dropped and counted when it is
+    full) that a daemon thread drains every ``export_interval`` seconds, or as soon as a
+    batch is full, writing one OTLP ``ExportTraceServiceRequest`` per batch: appended as
+    one line to ``export_file`` and/or POSTed to a collector's ``export_url``.
+    """
+
+    def __init__(self, service: str) -> None:
+        self.service = service
+        self.recording = False
+        self.exported = 0
+        self.dropped = 0
+        self._threshold = 0
+        self._resource: dict[str, object] = {"service.name": service}
+        self._export_file = ""
+        self._export_url = ""
+        self._interval = 5.0
+        self._buffer: deque[Span] = deque(maxlen=2048)
+        self._lock = Lock()
+        self._wake = Event()
+        self._stop = Event()
+        self._thread: Thread | None = None
+
+    def configure(
+        self,
+        sample_ratio: float,
+        buffer_size: int,
+        export_file: str,
+        export_url: str,
+        export_interval: float,
+        resource: Mapping[str, object],
+    ) -> None:
+        with self._lock:
+            self._threshold = int(sample_ratio * (1 << 64))
+            if buffer_size != self._buffer.maxlen:
+                self._buffer = deque(self._buffer, maxlen=buffer_size)
+            self._export_file = export_file
+            self._export_url = export_url
+            self._interval = export_interval
+            self._resource = {"service.name": self.service, **resource}
+            self.recording = bool(export_file or export_url)
+
+    def begin(self, traceparent: str | None, name: str = "request", kind: int = SPAN_KIND_SERVER) -> TraceContext:
+        parent = parse_traceparent(traceparent) if traceparent else None
+        if parent is not None:
+            return TraceContext(self, parent[0], parent[1], parent[2], name, kind)
+        trace_id = f"{random.getrandbits(128) or 1:032x}"
+        return TraceContext(self, trace_id, None, int(trace_id[16:], 16) < self._threshold, name, kind)
+
+    def record(self, span: Span) -> None:
+        span.end_ns = time.time_ns()
+        with self._lock:
+            if len(self._buffer) == self._buffer.maxlen:
+                self.dropped += 1
+            self._buffer.append(span)
+            full = len(self._buffer) >= TRACE_EXPORT_BATCH
+        if self._thread is None:
+            self.start()
+        if full:
+            self._wake.set()
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = Thread(target=self._run, name=f"{self.service}-trace-exporter", daemon=True)
+            self._thread.start()
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Stop the exporter thread after it exported what is buffered."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._stop.set()
+        self._wake.set()
+        thread.join(timeout=timeout)
+        self._stop.clear()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._buffer.clear()
+            self.exported = 0
+            self.dropped = 0
+
+    def flush(self) -> None:
+        while True:
+            with self._lock:
+                batch = [self._buffer.popleft() for _ in range(min(len(self._buffer), TRACE_EXPORT_BATCH))]
+                export_file, export_url, resource = self._export_file, self._export_url, self._resource
+            if not batch:
+                return
+            self._export(batch, export_file, export_url, resource)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self._interval)
+            self._wake.clear()
+            self.flush()
+        self.flush()
+
+    def _export(self, batch: list[Span], export_file: str, export_url: str, resource: dict[str, object]) -> None:
+        document = {
+            "resourceSpans": [
+                {
+                    "resource": {"attributes": _otlp_attributes({**resource, "process.pid": os.getpid()})},
+                    "scopeSpans": [{"scope": {"name": self.service}, "spans": [span.to_otlp() for span in batch]}],
+                }
+            ]
+        }
+        data = json.dumps(document, separators=(",", ":")).encode("utf-8")
+        ok = True
+        if export_file:
+            try:
+                # One O_APPEND write per batch keeps lines whole when several processes share the file.
+                fd = os.open(export_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o640)
+                try:
+                    os.write(fd, data + b"\n")
+                finally:
+                    os.close(fd)
+            except OSError:
+                ok = False
+        if export_url:
+            request = urllib.request.Request(
+                export_url, data=data, headers={"Content-Type": "application/json"}, method="POST"
+            )
+            try:
+                with urllib.request.urlopen(request, timeout=TRACE_EXPORT_TIMEOUT_SECONDS) as response:
+                    response.read()
+            except (OSError, ValueError):
+                ok = False
+        with self._lock:
+            if ok:
+                self.exported += len(batch)
+            else:
+                self.dropped += len(batch)
+
+
+def _collapse_stack(frame: FrameType | None, root: str) -> str:
+    """``root;outermost;...;innermost`` with one ``qualname (file:line)`` entry per frame."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    names.append(root.replace(";", ":"))
+    return ";".join(reversed(names))
+
+
+class SamplingProfiler:
+    """On-demand wall-clock sampler of every thread's stack, written as collapsed stacks.
+
+    Nothing runs until ``trigger`` (wired to SIGUSR2): a daemon thread then reads
+    ``sys._current_frames()`` every ``interval`` seconds for ``duration`` seconds and
+    counts each stack as one ``root;frame;...;frame count`` line, the format flame-graph
+    tools read. Request threads label themselves with their route only while a run is
+    ``active``, so an idle profiler costs one attribute read per request; requests
+    already in flight when a run starts are sampled under their thread name. Each run
+    writes ``<directory>/<service>-<pid>-<UTC time>.collapsed`` and a ``.routes.json``
+    with the wall time request threads spent per route.
+    """
+
+    def __init__(self, service: str, report: Callable[[str, dict[str, object]], None]) -> None:
+        self.service = service
+        self.active = False
+        self._report = report
+        self._directory = tempfile.gettempdir()
+        self._duration = 30.0
+        self._interval = 0.01
+        self._routes: dict[int, str] = {}
+        self._stop = Event()
+        self._thread: Thread | None = None
+
+    def configure(self, directory: str, duration: float, interval: float) -> None:
+        # Applies to the next run; a run in progress keeps the values it started with.
+        self._directory = directory
+        self._duration = duration
+        self._interval = interval
+
+    def enter(self, route: str) -> None:
+        self._routes[get_ident()] = route
+
+    def leave(self) -> None:
+        self._routes.pop(get_ident(), None)
+
+    def trigger(self) -> bool:
+        """Start a run unless one is in progress; cheap enough to call from a signal handler."""
+        if self._thread is not None and self._thread.is_alive():
+            return False
+        self._routes.clear()
+        self._stop.clear()
+        self.active = True
+        self._thread = Thread(
+            target=self._run,
+            args=(self._directory, self._duration, self._interval),
+            name=f"{self.service}-profiler",
+            daemon=True,
+        )
+        self._thread.start()
+        return True
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """End a run early; what was sampled so far is still written."""
+        thread = self._thread
+        if thread is None:
+            return
+        self._stop.set()
+        thread.join(timeout=timeout)
+
+    def _run(self, directory: str, duration: float, interval: float) -> None:
+        own = get_ident()
+        stacks: Counter[str] = Counter()
+        route_seconds: dict[str, float] = {}
+        samples = 0
+        started_at = datetime.now(timezone.utc)
+        begin = last = time.monotonic()
+        self._report("profile-started", {"duration_seconds": duration, "interval_seconds": interval})
+        try:
+            while True:
+                now = time.monotonic()
+                elapsed, last = now - last, now
+                routes = dict(self._routes)
+                names = {thread.ident: thread.name for thread in threading_enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident == own:
+                        continue
+                    route = routes.get(ident)
+                    stacks[_collapse_stack(frame, route or f"thread:{names.get(ident, ident)}")] += 1
+                    if route is not None:
+                        route_seconds[route] = route_seconds.get(route, 0.0) + elapsed
+                samples += 1
+                remaining = begin + duration - time.monotonic()
+                if remaining <= 0 or self._stop.wait(min(interval, remaining)):
+                    break
+        finally:
+            self.active = False
+            self._routes.clear()
+        base = os.path.join(directory, f"{self.service}-{os.getpid()}-{started_at.strftime('%Y%m%dT%H%M%SZ')}")
+        summary = {
+            "service": self.service,
+            "pid": os.getpid(),
+            "started_at": started_at.isoformat(),
+            "duration_seconds": round(time.monotonic() - begin, 3),
+            "interval_seconds": interval,
+            "samples": samples,
+            "routes": [
+                {"route": route, "wall_seconds": round(seconds, 6)}
+                for route, seconds in sorted(route_seconds.items(), key=lambda item: -item[1])
+            ],
+        }
+        try:
+            self._write(f"{base}.collapsed", "".join(f"{stack} {count}\n" for stack, count in sorted(stacks.items())))
+            self._write(f"{base}.routes.json", json.dumps(summary, indent=2) + "\n")
+        except OSError as exc:
+            self._report("profile-write-failed", {"error": exc.strerror})
+            return
+        self._report("profile-written", {"path": f"{base}.collapsed", "samples": samples})
+
+    def _write(self, path: str, text: str) -> None:
+        # Renamed into place so a watcher never reads a partial file.
+        fd = os.open(f"{path}.tmp", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o640)
+        with os.fdopen(fd, "w", encoding="utf-8") as handle:
+            handle.write(text)
+        os.replace(f"{path}.tmp", path)
+
+
+class VerifiedTokenCache:
+    """Bounded LRU of already-verified JWTs keyed by a SHA-256 digest of the token.
+
+    Entries expire at the token's ``exp`` plus leeway, so a cached token is never
+    accepted after direct verification would have rejected it. Only successful
+    verifications are stored.
+    """
+
+    def __init__(self, max_entries: int = 1024) -> None:
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[bytes, float] = OrderedDict()
+        self._lock = Lock()
+
+    def _key(self, token: str) -> bytes:
+        return hashlib.sha256(token.encode("utf-8")).digest()
+
+    def contains(self, token: str) -> bool:
+        key = self._key(token)
+        now = time.time()
+        with self._lock:
+            expires_at = self._entries.get(key)
+            if expires_at is not None and expires_at > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True
+            if expires_at is not None:
+                del self._entries[key]
+            self.misses += 1
+            return False
+
+    def add(self, token: str, expires_at: float) -> None:
+        if self.max_entries <= 0:
+            return
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = expires_at
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def configure(self, max_entries: int) -> None:
+        with self._lock:
+            self.max_entries = max_entries
+            self._entries.clear()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+# Per-actor token buckets: operation=capacity/period_seconds. Unlisted operations are unlimited.
+DEFAULT_RATE_LIMITS = (
+    "ops.cache.flush=12/60,ops.index.reindex=4/300,ops.cron.run=6/60,ops.diagnostics=30/60,verify.smoke=12/60"
+)
+
+
+def parse_rate_limits(raw: str) -> tuple[tuple[str, int, float], ...]:
+    limits: list[tuple[str, int, float]] = []
+    for entry in raw.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        operation, sep, spec = entry.partition("=")
+        capacity, slash, period = spec.partition("/")
+        try:
+            parsed = (operation.strip(), int(capacity), float(period))
+        except ValueError:
+            parsed = ("", 0, 0.0)
+        if not sep or not slash or not parsed[0] or parsed[1] < 1 or parsed[2] <= 0:
+            raise ValueError(f"AGENT_RATE_LIMITS entry must be operation=capacity/seconds, got {entry!r}")
+        limits.append(parsed)
+    return tuple(limits)
+
+
+class RateLimiter:
+    """Token buckets keyed by (actor, operation).
+
+    Each configured operation allows ``capacity`` calls per ``period`` seconds per
+    actor, refilled continuously. Buckets are kept in a bounded LRU so unbounded
+    actor ids cannot grow memory.
+    """
+
+    def __init__(self, max_buckets: int = 10000) -> None:
+        self.max_buckets = max_buckets
+        self._limits: dict[str, tuple[int, float]] = {}
+        self._buckets: OrderedDict[tuple[str, str], tuple[float, float]] = OrderedDict()
+        self._lock = Lock()
+
+    def configure(self, limits: tuple[tuple[str, int, float], ...]) -> None:
+        with self._lock:
+            self._limits = {operation: (capacity, period) for operation, capacity, period in limits}
+            self._buckets.clear()
+
+    def acquire(self, actor: str, operation: str) -> float:
+        """Take one token; returns 0 when allowed, otherwise seconds until a token is available."""
+        limit = self._limits.get(operation)
+        if limit is None:
+            return 0.0
+        capacity, period = limit
+        rate = capacity / period
+        key = (actor, operation)
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (float(capacity), now))
+            tokens = min(float(capacity), tokens + (now - updated) * rate)
+            if tokens >= 1.0:
+                self._buckets[key] = (tokens - 1.0, now)
+                wait = 0.0
+            else:
+                self._buckets[key] = (tokens, now)
+                wait = (1.0 - tokens) / rate
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def reset(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+
+@dataclass(frozen=True)
+class JwtKey:
+    kid: str
+    secret: str = field(repr=False)
+    not_before: int | None = None
+    not_after: int | None = None
+
+
+class JwtKeyring:
+    """HS256 verification keys selected by the JWT ``kid`` header.
+
+    Keyed HMAC state is prepared once per key and cloned for each verification.
+    Tokens without ``kid`` use the legacy ``AGENT_JWT_SECRET`` key (kid ``""``).
+    A key only verifies inside its ``not_before``/``not_after`` window (epoch seconds).
+    """
+
+    def __init__(self, keys: tuple[JwtKey, ...] = ()) -> None:
+        self.keys = keys
+        self._prepared = {
+            key.kid: (key, hmac.new(key.secret.encode("utf-8"), digestmod=hashlib.sha256)) for key in keys
+        }
+
+    def __len__(self) -> int:
+        return len(self._prepared)
+
+    def signer(self, kid: str, now: int) -> "hmac.HMAC | None":
+        """Return a fresh HMAC for ``kid`` if the key exists and is inside its window."""
+        entry = self._prepared.get(kid)
+        if entry is None:
+            return None
+        key, prepared = entry
+        if key.not_before is not None and now < key.not_before:
+            return None
+        if key.not_after is not None and now > key.not_after:
+            return None
+        return prepared.copy()
+
+
+def parse_jwt_keys(raw: str, legacy_secret: str) -> JwtKeyring:
+    keys: list[JwtKey] = [JwtKey("", legacy_secret)] if legacy_secret else []
+    if raw.strip():
+        try:
+            entries = json.loads(raw)
+            if not isinstance(entries, list):
+                raise ValueError
+            for entry in entries:
+                key = JwtKey(
+                    kid=entry["kid"],
+                    secret=entry["secret"],
+                    not_before=entry.get("not_before"),
+                    not_after=entry.get("not_after"),
+                )
+                if not isinstance(key.kid, str) or not key.kid or not isinstance(key.secret, str) or not key.secret:
+                    raise ValueError
+                if any(bound is not None and not isinstance(bound, int) for bound in (key.not_before, key.not_after)):
+                    raise ValueError
+                keys.append(key)
+        except (ValueError, TypeError, KeyError, AttributeError):
+            # Never echo the value back: it carries secrets.
+            raise ValueError(
+                'AGENT_JWT_KEYS must be a JSON list of {"kid", "secret", "not_before"?, "not_after"?} objects'
+            ) from None
+    kids = [key.kid for key in keys]
+    if len(set(kids)) != len(kids):
+        raise ValueError("AGENT_JWT_KEYS must not repeat a kid")
+    return JwtKeyring(tuple(keys))
+
+
+@dataclass
+class StoredResponse:
+    code: int
+    body: bytes
+    content_type: str
+    headers: dict[str, str]
+    outcome: str
+    error_code: str | None
+
+
+class IdempotencyEntry:
+    def __init__(self) -> None:
+        self.done = Event()
+        self.response: StoredResponse | None = None
+        self.expires_at = 0.0
+
+
+class IdempotencyCache:
+    """First responses to ``Idempotency-Key`` POSTs, keyed by (actor, path, key).
+
+    The first caller owns the entry and runs the operation; retries that arrive
+    meanwhile wait on the entry instead of starting a second run. Completed entries
+    live for a TTL in a bounded, insertion-ordered map.
+    """
+
+    def __init__(self, max_entries: int = 1024) -> None:
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple[str, str, str], IdempotencyEntry] = OrderedDict()
+        self._lock = Lock()
+
+    def configure(self, max_entries: int) -> None:
+        with self._lock:
+            self.max_entries = max_entries
+            self._evict(time.monotonic())
+
+    def begin(self, key: tuple[str, str, str]) -> tuple[IdempotencyEntry, bool]:
+        """Return the entry for ``key`` and whether the caller owns (must run) it."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (not entry.done.is_set() or entry.expires_at > now):
+                return entry, False
+            entry = IdempotencyEntry()
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self._evict(now)
+            return entry, True
+
+    def complete(
+        self, key: tuple[str, str, str], entry: IdempotencyEntry, response: StoredResponse | None, ttl: float
+    ) -> None:
+        """Publish the owner's response; ``None`` (not replayable) lets the next retry run again."""
+        with self._lock:
+            entry.response = response
+            entry.expires_at = time.monotonic() + ttl
+            if response is None and self._entries.get(key) is entry:
+                del self._entries[key]
+        entry.done.set()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _evict(self, now: float) -> None:
+        for key in [key for key, entry in self._entries.items() if entry.done.is_set() and entry.expires_at <= now]:
+            del self._entries[key]
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+@dataclass(frozen=True)
+class Settings:
+    """Validated runtime configuration, loaded once and swapped atomically on reload."""
+
+    host: str
+    port: int
+    store_id: str
+    agent_version: str
+    deployment_version: str
+    auth_mode: str
+    auth_token: str
+    jwt_secret: str = field(repr=False)
+    jwt_keys: JwtKeyring = field(repr=False)
+    jwt_issuer: str
+    jwt_audience: str
+    jwt_leeway_seconds: int
+    jwt_max_ttl_seconds: int
+    jwt_cache_size: int
+    server_mode: str
+    max_workers: int
+    max_in_flight: int
+    keepalive_idle_seconds: float
+    job_workers: int
+    job_retention: int
+    probe_backend_url: str
+    probe_search_url: str
+    probe_cache_address: str
+    probe_interval_seconds: float
+    probe_ttl_seconds: float
+    probe_timeout_seconds: float
+    log_queue_size: int
+    log_overflow: str
+    rate_limits: tuple[tuple[str, int, float], ...]
+    smoke_storefront_url: str
+    smoke_graphql_url: str
+    storefront_enabled: bool
+    smoke_check_timeout_seconds: float
+    smoke_budget_seconds: float
+    smoke_cache_seconds: float
+    idempotency_ttl_seconds: float
+    idempotency_max_entries: int
+    idempotency_wait_seconds: float
+    processes: int
+    state_dir: str
+    drain_seconds: float
+    journal_dir: str
+    journal_segment_bytes: int
+    journal_max_segments: int
+    trace_sample_ratio: float
+    trace_buffer_size: int
+    trace_export_file: str
+    trace_export_url: str
+    trace_export_interval_seconds: float
+    profile_dir: str
+    profile_seconds: float
+    profile_interval_seconds: float
+
+    @classmethod
+    def from_env(cls, env: Mapping[str, str] | None = None) -> "Settings":
+        env = os.environ if env is None else env
+
+        def integer(name: str, default: str, minimum: int) -> int:
+            raw = env.get(name, default)
+            try:
+                value = int(raw)
+            except ValueError:
+                raise ValueError(f"{name} must be an integer, got {raw!r}") from None
+            if value < minimum:
+                raise ValueError(f"{name} must be >= {minimum}, got {value}")
+            return value
+
+        def choice(name: str, default: str, allowed: set[str]) -> str:
+            value = env.get(name, default).lower()
+            if value not in allowed:
+                raise ValueError(f"{name} must be one of {sorted(allowed)}, got {value!r}")
+            return value
+
+        auth_mode = choice("AGENT_AUTH_MODE", "jwt", {"jwt", "token"})
+        jwt_secret = env.get("AGENT_JWT_SECRET", "")
+        jwt_keys = parse_jwt_keys(env.get("AGENT_JWT_KEYS", ""), jwt_secret)
+        if auth_mode == "jwt" and not jwt_keys:
+            raise ValueError("AGENT_JWT_SECRET or AGENT_JWT_KEYS is required when AGENT_AUTH_MODE=jwt")
+
+        def seconds(name: str, default: str) -> float:
+            raw = env.get(name, default)
+            try:
+                value = float(raw)
+            except ValueError:
+                raise ValueError(f"{name} must be a number, got {raw!r}") from None
+            if value <= 0:
+                raise ValueError(f"{name} must be > 0, got {value}")
+            return value
+
+        def ratio(name: str, default: str) -> float:
+            raw = env.get(name, default)
+            try:
+                value = float(raw)
+            except ValueError:
+                raise ValueError(f"{name} must be a number, got {raw!r}") from None
+            if not 0 <= value <= 1:
+                raise ValueError(f"{name} must be in [0, 1], got {value}")
+            return value
+
+        trace_export_url = env.get("AGENT_TRACE_EXPORT_URL", "")
+        if trace_export_url and urlsplit(trace_export_url).scheme not in ("http", "https"):
+            raise ValueError(f"AGENT_TRACE_EXPORT_URL must be an http(s) URL, got {trace_export_url!r}")
+        profile_seconds = seconds("AGENT_PROFILE_SECONDS", "30")
+        if profile_seconds > 600:
+            raise ValueError(f"AGENT_PROFILE_SECONDS must be <= 600, got {profile_seconds}")
+        profile_interval_ms = integer("AGENT_PROFILE_INTERVAL_MS", "10", 1)
+        if profile_interval_ms > 1000:
+            raise ValueError(f"AGENT_PROFILE_INTERVAL_MS must be <= 1000, got {profile_interval_ms}")
+
+        processes = integer("AGENT_PROCESSES", "1", 1)
+        journal_dir = env.get("AGENT_JOURNAL_DIR", "")
+        # An in-memory journal is per process, so workers would serve different histories.
+        if processes > 1 and not journal_dir:
+            raise ValueError("AGENT_JOURNAL_DIR is required when AGENT_PROCESSES > 1")
+
+        probe_cache_address = env.get("AGENT_PROBE_CACHE_ADDRESS", "")
+        if probe_cache_address:
+            cache_host, _, cache_port = probe_cache_address.rpartition(":")
+            if not cache_host or not cache_port.isdigit():
+                raise ValueError(f"AGENT_PROBE_CACHE_ADDRESS must be host:port, got {probe_cache_address!r}")
+
+        return cls(
+            host=env.get("HOST", "0.0.0.0"),
+            port=integer("PORT", "8080", 0),
+            store_id=env.get("STORE_ID", "unknown-store"),
+            agent_version=env.get("SHOP_AGENT_VERSION", "dev"),
+            deployment_version=env.get("DEPLOYMENT_VERSION", "unknown"),
+            auth_mode=auth_mode,
+            auth_token=env.get("AGENT_AUTH_TOKEN", "dev-token"),
+            jwt_secret=jwt_secret,
+            jwt_keys=jwt_keys,
+            jwt_issuer=env.get("AGENT_JWT_ISSUER", "control-plane"),
+            jwt_audience=env.get("AGENT_JWT_AUDIENCE", "shop-agent"),
+            jwt_leeway_seconds=integer("AGENT_JWT_LEEWAY_SECONDS", "5", 0),
+            jwt_max_ttl_seconds=integer("AGENT_JWT_MAX_TTL_SECONDS", "900", 1),
+            jwt_cache_size=integer("AGENT_JWT_CACHE_SIZE", "1024", 0),
+            server_mode=choice("AGENT_SERVER_MODE", "pool", {"pool", "single"}),
+            max_workers=integer("AGENT_MAX_WORKERS", "16", 1),
+            max_in_flight=integer("AGENT_MAX_IN_FLIGHT", "12", 1),
+            keepalive_idle_seconds=seconds("AGENT_KEEPALIVE_IDLE_SECONDS", "15"),
+            job_workers=integer("AGENT_JOB_WORKERS", "2", 1),
+            job_retention=integer("AGENT_JOB_RETENTION", "256", 1),
+            probe_backend_url=env.get("AGENT_PROBE_BACKEND_URL", ""),
+            probe_search_url=env.get("AGENT_PROBE_SEARCH_URL", ""),
+            probe_cache_address=probe_cache_address,
+            probe_interval_seconds=seconds("AGENT_PROBE_INTERVAL_SECONDS", "10"),
+            probe_ttl_seconds=seconds("AGENT_PROBE_TTL_SECONDS", "30"),
+            probe_timeout_seconds=seconds("AGENT_PROBE_TIMEOUT_SECONDS", "2"),
+            log_queue_size=integer("AGENT_LOG_QUEUE_SIZE", "10000", 1),
+            log_overflow=choice("AGENT_LOG_OVERFLOW", "drop", {"drop", "block"}),
+            rate_limits=parse_rate_limits(env.get("AGENT_RATE_LIMITS", DEFAULT_RATE_LIMITS)),
+            smoke_storefront_url=env.get("AGENT_SMOKE_STOREFRONT_URL", ""),
+            smoke_graphql_url=env.get("AGENT_SMOKE_GRAPHQL_URL", ""),
+            storefront_enabled=choice("AGENT_STOREFRONT_ENABLED", "1", {"0", "1"}) == "1",
+            smoke_check_timeout_seconds=seconds("AGENT_SMOKE_CHECK_TIMEOUT_SECONDS", "5"),
+            smoke_budget_seconds=seconds("AGENT_SMOKE_BUDGET_SECONDS", "10"),
+            smoke_cache_seconds=seconds("AGENT_SMOKE_CACHE_SECONDS", "15"),
+            idempotency_ttl_seconds=seconds("AGENT_IDEMPOTENCY_TTL_SECONDS", "600"),
+            idempotency_max_entries=integer("AGENT_IDEMPOTENCY_MAX_ENTRIES", "1024", 1),
+            idempotency_wait_seconds=seconds("AGENT_IDEMPOTENCY_WAIT_SECONDS", "30"),
+            processes=processes,
+            state_dir=env.get("AGENT_STATE_DIR", ""),
+            drain_seconds=seconds("AGENT_DRAIN_SECONDS", "20"),
+            journal_dir=journal_dir,
+            journal_segment_bytes=integer("AGENT_JOURNAL_SEGMENT_BYTES", "262144", 4096),
+            journal_max_segments=integer("AGENT_JOURNAL_MAX_SEGMENTS", "16", 2),
+            trace_sample_ratio=ratio("AGENT_TRACE_SAMPLE_RATIO", "0.1"),
+            trace_buffer_size=integer("AGENT_TRACE_BUFFER_SIZE", "2048", 16),
+            trace_export_file=env.get("AGENT_TRACE_EXPORT_FILE", ""),
+            trace_export_url=trace_export_url,
+            trace_export_interval_seconds=seconds("AGENT_TRACE_EXPORT_INTERVAL_SECONDS", "5"),
+            profile_dir=env.get("AGENT_PROFILE_DIR", "") or tempfile.gettempdir(),
+            profile_seconds=profile_seconds,
+            profile_interval_seconds=profile_interval_ms / 1000,
+        )
+
+
 STATE_LOCK = Lock()
 STATE: dict[str, str | None] = {"last_successful_operation_timestamp": None}
+JWT_CACHE = VerifiedTokenCache()
+RATE_LIMITER = RateLimiter()
+IDEMPOTENCY = IdempotencyCache()
+_SETTINGS: Settings | None = None
+
+
+def current_settings() -> Settings:
+    settings = _SETTINGS
+    if settings is None:
+        settings = reload_settings()
+    return settings
+
+
+def settings_source() -> dict[str, str]:
+    """Process environment overlaid with the optional ``AGENT_SETTINGS_FILE`` (KEY=VALUE lines).
+
+    The file is what makes SIGHUP reloads useful: a container's environment is fixed at
+    start, but a mounted file can be rewritten in place when secrets or versions rotate.
+    """
+    env = dict(os.environ)
+    path = env.get("AGENT_SETTINGS_FILE")
+    if not path:
+        return env
+    try:
+        with open(path, encoding="utf-8") as handle:
+            lines = handle.read().splitlines()
+    except OSError as exc:
+        raise ValueError(f"AGENT_SETTINGS_FILE unreadable: {exc.strerror}") from None
+    for number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        key, sep, value = line.partition("=")
+        if not sep:
+            raise ValueError(f"AGENT_SETTINGS_FILE has a malformed line {number}")
+        env[key.strip()] = value.strip()
+    return env
+
+
+def reload_settings(env: Mapping[str, str] | None = None) -> Settings:
+    """Validate configuration and publish it; raises ValueError and keeps the old snapshot on bad input."""
+    global _SETTINGS
+    settings = Settings.from_env(settings_source() if env is None else env)
+    # Secrets or claims may have rotated, so previously verified tokens must be re-checked.
+    JWT_CACHE.configure(settings.jwt_cache_size)
+    RATE_LIMITER.configure(settings.rate_limits)
+    IDEMPOTENCY.configure(settings.idempotency_max_entries)
+    TRACER.configure(
+        settings.trace_sample_ratio,
+        settings.trace_buffer_size,
+        settings.trace_export_file,
+        settings.trace_export_url,
+        settings.trace_export_interval_seconds,
+        {"service.version": settings.agent_version, "bolerdrop.store_id": settings.store_id},
+    )
+    PROFILER.configure(settings.profile_dir, settings.profile_seconds, settings.profile_interval_seconds)
+    _SETTINGS = settings
+    return settings
+
+
+class SettingsReloader:
+    """Runs SIGHUP-requested settings reloads on a dedicated thread.
+
+    Reloading takes the locks of the token cache, tracer and log writer, which the main
+    thread may hold when the signal interrupts it, so the handler only calls ``request``
+    (an ``Event.set``) and this thread does the work. Requests that arrive during a
+    reload are coalesced into one more run. ``lock`` is held for the whole reload so a
+    fork can wait for a consistent state; ``start`` runs again in a forked child, which
+    inherits neither the thread nor a usable copy of its locks.
+    """
+
+    def __init__(self, name: str, reload: Callable[[], None]) -> None:
+        self.name = name
+        self.lock = Lock()
+        self._reload = reload
+        self._requested = Event()
+
+    def start(self) -> None:
+        self.lock = Lock()
+        self._requested = Event()
+        Thread(target=self._run, args=(self._requested,), name=self.name, daemon=True).start()
+
+    def request(self) -> None:
+        self._requested.set()
+
+    def _run(self, requested: Event) -> None:
+        while True:
+            requested.wait()
+            requested.clear()
+            with self.lock:
+                self._reload()
 
 
 def utc_ts() -> str:
     return datetime.now(timezone.utc).isoformat()
 
 
+def log_event(event: str, **fields: object) -> None:
+    LOGGER.emit({"timestamp": utc_ts(), "component": "shop-agent", "event": event, **fields})
+
+
 def b64url_encode(raw: bytes) -> str:
     return base64.urlsafe_b64encode(raw).decode("utf-8").rstrip("=")
 
@@ -30,7 +1198,376 @@ def b64url_decode(data: str) -> bytes:
     return base64.urlsafe_b64decode(data + padding)
 
 
+class SharedStateStore:
+    """File-backed state shared by pre-forked worker processes (``AGENT_STATE_DIR``).
+
+    Each record is a small JSON file replaced atomically, so readers never lock.
+    Read-modify-write sequences (last-success timestamp, per-operation job claims)
+    hold an ``flock`` on ``.lock`` so they are serialized across processes.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        for sub in ("jobs", "active"):
+            os.makedirs(os.path.join(directory, sub), exist_ok=True)
+        self._lock_path = os.path.join(directory, ".lock")
+        self._thread_lock = Lock()
+
+    @contextmanager
+    def locked(self) -> Iterator[None]:
+        with self._thread_lock, open(self._lock_path, "a") as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            yield
+
+    def read(self, name: str) -> dict | None:
+        try:
+            with open(os.path.join(self.directory, name), encoding="utf-8") as handle:
+                value = json.load(handle)
+        except (OSError, ValueError):
+            return None
+        return value if isinstance(value, dict) else None
+
+    def write(self, name: str, value: dict) -> None:
+        path = os.path.join(self.directory, name)
+        tmp = f"{path}.{os.getpid()}-{uuid4().hex}.tmp"
+        with open(tmp, "w", encoding="utf-8") as handle:
+            json.dump(value, handle, separators=(",", ":"))
+        os.replace(tmp, path)
+
+    def record_success(self, timestamp: str) -> None:
+        with self.locked():
+            current = self.read("last-success.json")
+            if current is None or current.get("timestamp", "") < timestamp:
+                self.write("last-success.json", {"timestamp": timestamp})
+
+    def last_success(self) -> str | None:
+        current = self.read("last-success.json")
+        return None if current is None else current.get("timestamp")
+
+    def save_job(self, snapshot: dict) -> None:
+        self.write(f"jobs/{snapshot['job_id']}.json", snapshot)
+
+    def load_job(self, job_id: str) -> dict | None:
+        # Job ids come from the URL; only plain uuid hex names may reach the filesystem.
+        if not job_id.isalnum():
+            return None
+        return self.read(f"jobs/{job_id}.json")
+
+    def claim(self, operation: str, snapshot: dict) -> dict | None:
+        """Register ``snapshot`` as the running job for ``operation`` across processes.
+
+        Returns ``None`` when the claim succeeded, otherwise the live job to join.
+        """
+        with self.locked():
+            marker = self.read(f"active/{operation}.json")
+            if marker is not None and _pid_alive(marker.get("pid", 0)):
+                existing = self.load_job(str(marker.get("job_id", "")))
+                if existing is not None and existing.get("finished_at") is None:
+                    return existing
+            self.save_job(snapshot)
+            self.write(f"active/{operation}.json", {"job_id": snapshot["job_id"], "pid": os.getpid()})
+        return None
+
+    def release(self, operation: str, job_id: str, retain: int) -> None:
+        with self.locked():
+            marker = self.read(f"active/{operation}.json")
+            if marker is not None and marker.get("job_id") == job_id:
+                os.remove(os.path.join(self.directory, "active", f"{operation}.json"))
+            jobs_dir = os.path.join(self.directory, "jobs")
+            with os.scandir(jobs_dir) as entries:
+                files = sorted(
+                    (entry.stat().st_mtime, entry.path) for entry in entries if entry.name.endswith(".json")
+                )
+            for _, path in files[: max(0, len(files) - retain)]:
+                os.remove(path)
+
+    def clear_active(self) -> None:
+        """Forget claims from a previous run; only called before any worker is started."""
+        with self.locked():
+            active_dir = os.path.join(self.directory, "active")
+            for name in os.listdir(active_dir):
+                os.remove(os.path.join(active_dir, name))
+
+
+def _pid_alive(pid: object) -> bool:
+    if not isinstance(pid, int) or pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class OperationJournal:
+    """Append-only journal of operation outcomes (``AGENT_JOURNAL_DIR``).
+
+    ``append`` only enqueues; a writer thread writes each batch as JSON lines to the
+    newest segment and fsyncs once per batch. A segment past ``segment_bytes`` is
+    sealed: the latest success it holds is folded into ``checkpoint.json`` and
+    segments beyond ``max_segments`` are deleted, so recovery reads the checkpoint
+    and the newest segment only. Batches hold an ``flock`` on ``.lock`` so pre-forked
+    workers can share one directory. Without a directory, the most recent
+    ``memory_records`` outcomes are kept in memory only.
+    """
+
+    def __init__(self, memory_records: int = 256, batch_size: int = 256) -> None:
+        self.directory = ""
+        self.segment_bytes = 262144
+        self.max_segments = 16
+        self.batch_size = batch_size
+        self.failed = 0
+        self._recent: deque[dict] = deque(maxlen=memory_records)
+        self._seq = 0
+        self._queue: queue.Queue[dict | None] = queue.Queue()
+        self._lock = Lock()
+        self._thread: Thread | None = None
+
+    def configure(self, directory: str, segment_bytes: int, max_segments: int) -> str | None:
+        """Use ``directory`` and recover from it; returns the latest recorded success, if any."""
+        with self._lock:
+            self.directory = directory
+            self.segment_bytes = segment_bytes
+            self.max_segments = max_segments
+        if not directory:
+            return None
+        os.makedirs(directory, exist_ok=True)
+        with self._locked():
+            segments = self._segments()
+            last_success = self._read_checkpoint().get("last_success")
+            if not segments:
+                return last_success
+            self._repair_tail(segments[-1][1])
+            return self._latest_success(segments[-1][1], last_success)
+
+    def append(
+        self,
+        operation: str,
+        actor: str,
+        started_at: str,
+        finished_at: str,
+        duration_ms: float,
+        outcome: str,
+        error_code: str | None,
+    ) -> None:
+        record = {
+            "seq": 0,
+            "operation": operation,
+            "actor": actor,
+            "started_at": started_at,
+            "finished_at": finished_at,
+            "duration_ms": duration_ms,
+            "outcome": outcome,
+            "error_code": error_code,
+        }
+        if not self.directory:
+            with self._lock:
+                self._seq += 1
+                record["seq"] = self._seq
+                self._recent.append(record)
+            return
+        if self._thread is None:
+            self.start()
+        self._queue.put(record)
+
+    def history(self, before: int | None, limit: int) -> list[dict]:
+        """Up to ``limit`` records with ``seq`` below ``before`` (all when None), newest first."""
+        if not self.directory:
+            with self._lock:
+                records = [r for r in reversed(self._recent) if before is None or r["seq"] < before]
+            return [dict(record) for record in records[:limit]]
+        records = []
+        # Readers never lock: segments are append-only and a torn last line fails to parse.
+        for first_seq, path in reversed(self._segments()):
+            if before is not None and first_seq >= before:
+                continue
+            for record in reversed(self._read_segment(path)):
+                if before is None or record["seq"] < before:
+                    records.append(record)
+                    if len(records) >= limit:
+                        return records
+        return records
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = Thread(target=self._run, name="shop-agent-journal-writer", daemon=True)
+            self._thread.start()
+
+    def close(self, timeout: float = 5.0) -> None:
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._queue.put(None)
+        thread.join(timeout=timeout)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._recent.clear()
+            self._seq = 0
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        with open(os.path.join(self.directory, ".lock"), "a") as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            yield
+
+    def _segments(self) -> list[tuple[int, str]]:
+        segments = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        for name in names:
+            stem = name[len("segment-"):-len(".jsonl")]
+            if name.startswith("segment-") and name.endswith(".jsonl") and stem.isdigit():
+                segments.append((int(stem), os.path.join(self.directory, name)))
+        return sorted(segments)
+
+    def _segment_path(self, first_seq: int) -> str:
+        return os.path.join(self.directory, f"segment-{first_seq:012d}.jsonl")
+
+    def _read_checkpoint(self) -> dict:
+        try:
+            with open(os.path.join(self.directory, "checkpoint.json"), encoding="utf-8") as handle:
+                value = json.load(handle)
+        except (OSError, ValueError):
+            return {}
+        return value if isinstance(value, dict) else {}
+
+    def _write_checkpoint(self, value: dict) -> None:
+        path = os.path.join(self.directory, "checkpoint.json")
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as handle:
+            json.dump(value, handle, separators=(",", ":"))
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(tmp, path)
+
+    def _read_segment(self, path: str) -> list[dict]:
+        try:
+            with open(path, "rb") as handle:
+                lines = handle.read().splitlines()
+        except OSError:
+            return []
+        records = []
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict) and isinstance(record.get("seq"), int):
+                records.append(record)
+        return records
+
+    def _repair_tail(self, path: str) -> None:
+        """Cut a torn last line left by a crash mid-write so later appends start on a line boundary."""
+        with open(path, "rb+") as handle:
+            data = handle.read()
+            if not data or data.endswith(b"\n"):
+                return
+            handle.truncate(data.rfind(b"\n") + 1)
+
+    def _latest_success(self, path: str, latest: str | None) -> str | None:
+        for record in self._read_segment(path):
+            finished_at = record.get("finished_at")
+            if record.get("outcome") == "success" and isinstance(finished_at, str):
+                if latest is None or finished_at > latest:
+                    latest = finished_at
+        return latest
+
+    def _next_seq(self, segments: list[tuple[int, str]]) -> int:
+        if not segments:
+            return int(self._read_checkpoint().get("through_seq", 0)) + 1
+        first_seq, path = segments[-1]
+        with open(path, "rb") as handle:
+            handle.seek(max(0, os.fstat(handle.fileno()).st_size - 4096))
+            tail = handle.read().splitlines()
+        for line in reversed(tail):
+            try:
+                return int(json.loads(line)["seq"]) + 1
+            except (ValueError, KeyError, TypeError):
+                continue
+        return first_seq
+
+    def _rotate(self, segments: list[tuple[int, str]], next_seq: int) -> None:
+        """Seal the newest segment into the checkpoint and drop segments past retention."""
+        checkpoint = self._read_checkpoint()
+        self._write_checkpoint(
+            {
+                "through_seq": next_seq - 1,
+                "last_success": self._latest_success(segments[-1][1], checkpoint.get("last_success")),
+            }
+        )
+        for _, path in segments[: max(0, len(segments) + 1 - self.max_segments)]:
+            os.remove(path)
+
+    def _run(self) -> None:
+        while True:
+            record = self._queue.get()
+            batch: list[dict] = []
+            stop = record is None
+            if record is not None:
+                batch.append(record)
+            while not stop and len(batch) < self.batch_size:
+                try:
+                    record = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if record is None:
+                    stop = True
+                else:
+                    batch.append(record)
+            if batch:
+                self._write(batch)
+            if stop:
+                return
+
+    def _write(self, batch: list[dict]) -> None:
+        try:
+            with self._locked():
+                segments = self._segments()
+                next_seq = self._next_seq(segments)
+                if not segments or os.path.getsize(segments[-1][1]) >= self.segment_bytes:
+                    if segments:
+                        self._rotate(segments, next_seq)
+                    path = self._segment_path(next_seq)
+                else:
+                    path = segments[-1][1]
+                lines = []
+                for record in batch:
+                    record["seq"] = next_seq
+                    next_seq += 1
+                    lines.append(json.dumps(record, separators=(",", ":")) + "\n")
+                fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o640)
+                try:
+                    os.write(fd, "".join(lines).encode("utf-8"))
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+        except OSError as exc:
+            with self._lock:
+                self.failed += len(batch)
+            log_event("journal-write-failed", error=type(exc).__name__, records=len(batch))
+
+
+JOURNAL = OperationJournal()
+SHARED_STATE: SharedStateStore | None = None
+
+
+def configure_shared_state(directory: str | None) -> SharedStateStore | None:
+    global SHARED_STATE
+    SHARED_STATE = None if not directory else SharedStateStore(directory)
+    return SHARED_STATE
+
+
 def get_last_successful_operation_timestamp() -> str | None:
+    if SHARED_STATE is not None:
+        return SHARED_STATE.last_success()
     with STATE_LOCK:
         return STATE["last_successful_operation_timestamp"]
 
@@ -38,48 +1575,928 @@ def get_last_successful_operation_timestamp() -> str | None:
 def set_last_successful_operation_timestamp(value: str) -> None:
     with STATE_LOCK:
         STATE["last_successful_operation_timestamp"] = value
+    if SHARED_STATE is not None:
+        SHARED_STATE.record_success(value)
 
 
 def reset_state_for_tests() -> None:
     with STATE_LOCK:
         STATE["last_successful_operation_timestamp"] = None
+    JWT_CACHE.clear()
+    JOBS.reset()
+    PROBER.reset()
+    METRICS.reset()
+    RATE_LIMITER.reset()
+    SMOKE.reset()
+    IDEMPOTENCY.clear()
+    JOURNAL.reset()
+    TRACER.reset()
+    PROFILER.stop()
+
+
+@dataclass
+class Job:
+    job_id: str
+    operation: str
+    actor: str
+    state: str
+    submitted_at: str
+    started_at: str | None = None
+    finished_at: str | None = None
+    duration_ms: float | None = None
+    message: str | None = None
+    error_code: str | None = None
+
+
+class JobManager:
+    """Runs allowlisted operations on a bounded executor with per-operation single-flight.
+
+    While a job for an operation is queued or running, further submissions for the
+    same operation join it instead of starting another run. Finished jobs are kept
+    for status reads up to ``max_retained`` entries, oldest evicted first.
+    """
+
+    def __init__(self, max_workers: int = 2, max_retained: int = 256) -> None:
+        self.max_workers = max_workers
+        self.max_retained = max_retained
+        self._lock = Lock()
+        self._jobs: OrderedDict[str, Job] = OrderedDict()
+        self._active: dict[str, Job] = {}
+        self._executor: ThreadPoolExecutor | None = None
+
+    def configure(self, max_workers: int, max_retained: int) -> None:
+        with self._lock:
+            self.max_workers = max_workers
+            self.max_retained = max_retained
+
+    def submit(self, operation: str, actor: str, work: Callable[[], str]) -> tuple[dict, bool]:
+        """Start (or join) a job for ``operation``; returns its snapshot and whether it was coalesced."""
+        with self._lock:
+            active = self._active.get(operation)
+            if active is not None:
+                return asdict(active), True
+            job = Job(job_id=uuid4().hex, operation=operation, actor=actor, state="queued", submitted_at=utc_ts())
+            if SHARED_STATE is not None:
+                # Another worker process may already be running this operation.
+                running = SHARED_STATE.claim(operation, asdict(job))
+                if running is not None:
+                    return running, True
+            self._jobs[job.job_id] = job
+            self._active[operation] = job
+            self._trim()
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="shop-agent-job")
+            snapshot = asdict(job)
+            self._executor.submit(self._run, job, work)
+        return snapshot, False
+
+    def get(self, job_id: str) -> dict | None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return asdict(job)
+        return None if SHARED_STATE is None else SHARED_STATE.load_job(job_id)
+
+    def active_count(self) -> int:
+        with self._lock:
+            return len(self._active)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._jobs.clear()
+            self._active.clear()
+
+    def drain(self, timeout: float) -> bool:
+        """Wait up to ``timeout`` seconds for queued and running jobs to finish."""
+        deadline = time.monotonic() + timeout
+        while self.active_count():
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def _trim(self) -> None:
+        excess = len(self._jobs) - self.max_retained
+        if excess <= 0:
+            return
+        for job_id in [jid for jid, job in self._jobs.items() if job.finished_at is not None][:excess]:
+            del self._jobs[job_id]
+
+    def _run(self, job: Job, work: Callable[[], str]) -> None:
+        started = time.monotonic()
+        with self._lock:
+            job.state = "running"
+            job.started_at = utc_ts()
+            snapshot = asdict(job)
+        if SHARED_STATE is not None:
+            SHARED_STATE.save_job(snapshot)
+        try:
+            message = work()
+            state, error_code = "succeeded", None
+        except Exception as exc:  # noqa: BLE001
+            message, state, error_code = f"{job.operation} failed: {type(exc).__name__}", "failed", "OPERATION_FAILED"
+        finished_at = utc_ts()
+        elapsed = time.monotonic() - started
+        if state == "succeeded":
+            set_last_successful_operation_timestamp(finished_at)
+        METRICS.inc("shop_agent_jobs_total", job.operation, state)
+        METRICS.observe("shop_agent_job_duration_seconds", elapsed, job.operation)
+        JOURNAL.append(
+            job.operation,
+            job.actor,
+            job.started_at or finished_at,
+            finished_at,
+            round(elapsed * 1000, 3),
+            "success" if state == "succeeded" else "failure",
+            error_code,
+        )
+        with self._lock:
+            job.state = state
+            job.message = message
+            job.error_code = error_code
+            job.finished_at = finished_at
+            job.duration_ms = round(elapsed * 1000, 3)
+            if SHARED_STATE is not None:
+                SHARED_STATE.save_job(asdict(job))
+                SHARED_STATE.release(job.operation, job.job_id, self.max_retained)
+            if self._active.get(job.operation) is job:
+                del self._active[job.operation]
+
+
+def _run_cache_flush() -> str:
+    return "cache flush completed"
+
+
+def _run_reindex() -> str:
+    return "reindex completed"
+
+
+def _run_cron() -> str:
+    return "cron run completed"
+
+
+def probe_http(url: str, timeout: float) -> bool:
+    """Reachable means the endpoint answered with anything below 500 within ``timeout``."""
+    request = urllib.request.Request(url, headers={"User-Agent": "BoilerDropShopAgent-probe"})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status < 500
+    except urllib.error.HTTPError as exc:
+        return exc.code < 500
+    except OSError:
+        return False
+
+
+def probe_redis(address: str, timeout: float) -> bool:
+    """Reachable means the server replied to PING (``-NOAUTH`` still proves it is up)."""
+    host, _, port = address.rpartition(":")
+    try:
+        with socket.create_connection((host, int(port)), timeout=timeout) as sock:
+            sock.sendall(b"PING\r\n")
+            reply = sock.recv(64)
+    except OSError:
+        return False
+    return reply[:1] in (b"+", b"-")
+
+
+COMPONENT_KEYS = ("backend_reachable", "search_reachable", "cache_reachable")
+
+
+class ComponentProber:
+    """Background reachability probes with a TTL-bounded snapshot for request handlers.
+
+    Probes run concurrently on a small dedicated pool once per interval, independent
+    of request rate. Handlers only read the last snapshot; components without a
+    configured target, or a snapshot older than the TTL, report ``unknown``.
+    """
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._states: dict[str, str] = {}
+        self._checked_at: str | None = None
+        self._checked_monotonic: float | None = None
+        self._pool = ThreadPoolExecutor(max_workers=len(COMPONENT_KEYS), thread_name_prefix="shop-agent-probe")
+        self._stop = Event()
+        self._thread: Thread | None = None
+
+    def _targets(self, settings: Settings) -> dict[str, Callable[[], bool]]:
+        timeout = settings.probe_timeout_seconds
+        targets: dict[str, Callable[[], bool]] = {}
+        if settings.probe_backend_url:
+            targets["backend_reachable"] = lambda: probe_http(settings.probe_backend_url, timeout)
+        if settings.probe_search_url:
+            targets["search_reachable"] = lambda: probe_http(settings.probe_search_url, timeout)
+        if settings.probe_cache_address:
+            targets["cache_reachable"] = lambda: probe_redis(settings.probe_cache_address, timeout)
+        return targets
+
+    def refresh(self, settings: Settings) -> None:
+        futures = {key: self._pool.submit(probe) for key, probe in self._targets(settings).items()}
+        deadline = time.monotonic() + settings.probe_timeout_seconds + 0.5
+        states: dict[str, str] = {}
+        for key in COMPONENT_KEYS:
+            future = futures.get(key)
+            if future is None:
+                states[key] = "unknown"
+                continue
+            try:
+                reachable = future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except Exception:  # noqa: BLE001
+                reachable = False
+            states[key] = "yes" if reachable else "no"
+        with self._lock:
+            self._states = states
+            self._checked_at = utc_ts()
+            self._checked_monotonic = time.monotonic()
+            checked_at = self._checked_at
+        if SHARED_STATE is not None:
+            SHARED_STATE.write("components.json", {"states": states, "checked_at": checked_at, "epoch": time.time()})
+
+    def _shared_age(self) -> float | None:
+        shared = None if SHARED_STATE is None else SHARED_STATE.read("components.json")
+        if shared is None or not isinstance(shared.get("epoch"), (int, float)):
+            return None
+        return time.time() - shared["epoch"]
+
+    def snapshot(self, ttl_seconds: float) -> tuple[dict[str, str], str | None]:
+        if SHARED_STATE is not None:
+            # Every worker answers from the same file so /status agrees across processes.
+            shared = SHARED_STATE.read("components.json") or {}
+            epoch, checked_at = shared.get("epoch"), shared.get("checked_at")
+            if not isinstance(epoch, (int, float)) or time.time() - epoch > ttl_seconds:
+                return {key: "unknown" for key in COMPONENT_KEYS}, checked_at
+            states = shared.get("states") or {}
+            return {key: states.get(key, "unknown") for key in COMPONENT_KEYS}, checked_at
+        with self._lock:
+            checked = self._checked_monotonic
+            if checked is None or (time.monotonic() - checked) > ttl_seconds:
+                return {key: "unknown" for key in COMPONENT_KEYS}, self._checked_at
+            return dict(self._states), self._checked_at
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = Thread(target=self._loop, name="shop-agent-prober", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def reset(self) -> None:
+        with self._lock:
+            self._states = {}
+            self._checked_at = None
+            self._checked_monotonic = None
+
+    def _loop(self) -> None:
+        while True:
+            # Settings are re-read every cycle so SIGHUP can retarget probes.
+            settings = current_settings()
+            try:
+                age = self._shared_age()
+                # With several workers, whoever is due probes; the rest reuse its snapshot.
+                if age is None or age >= settings.probe_interval_seconds:
+                    self.refresh(settings)
+            except Exception as exc:  # noqa: BLE001
+                log_event("probe-cycle-failed", error=type(exc).__name__)
+            if self._stop.wait(settings.probe_interval_seconds):
+                return
+
+
+@dataclass(frozen=True)
+class SmokeCheck:
+    """A declarative smoke check (see docs/SMOKE_TESTS.md section 4).
+
+    ``target`` names the Settings field holding the URL. GraphQL checks POST
+    ``query`` and require ``expect`` under ``data`` with no ``errors``. The required
+    shop agent health and authorized status checks are the caller's own ``/health``
+    and authorized ``/verify/smoke`` calls, so they are not repeated here.
+    """
+
+    name: str
+    target: str
+    query: str | None = None
+    expect: str | None = None
+
+
+SMOKE_CHECKS: tuple[SmokeCheck, ...] = (
+    SmokeCheck("storefront-home", "smoke_storefront_url"),
+    SmokeCheck(
+        "catalog-product-query",
+        "smoke_graphql_url",
+        '{ products(search: "", pageSize: 1) { total_count } }',
+        "products",
+    ),
+    SmokeCheck("cart-create", "smoke_graphql_url", "mutation { createEmptyCart }", "createEmptyCart"),
+    SmokeCheck("magento-health", "probe_backend_url"),
+)
+
+
+def run_smoke_check(check: SmokeCheck, url: str, timeout: float) -> str | None:
+    """Return ``None`` when the check passes, otherwise a short failure classification."""
+    headers = {"User-Agent": "BoilerDropShopAgent-smoke"}
+    body = None
+    if check.query is not None:
+        body = json.dumps({"query": check.query}).encode("utf-8")
+        headers["Content-Type"] = "application/json"
+    request = urllib.request.Request(url, data=body, headers=headers)
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            raw = response.read()
+    except urllib.error.HTTPError as exc:
+        return f"http {exc.code}"
+    except urllib.error.URLError as exc:
+        return "timeout" if isinstance(exc.reason, TimeoutError) else "unreachable"
+    except TimeoutError:
+        return "timeout"
+    except OSError:
+        return "unreachable"
+    if check.query is None:
+        return None
+    try:
+        document = json.loads(raw)
+    except ValueError:
+        return "invalid json"
+    if not isinstance(document, dict) or document.get("errors"):
+        return "graphql errors"
+    data = document.get("data")
+    if not isinstance(data, dict) or data.get(check.expect) is None:
+        return "unexpected response"
+    return None
+
+
+class SmokeRunner:
+    """Runs SMOKE_CHECKS concurrently within per-check and whole-suite budgets.
+
+    A finished run is reused for ``smoke_cache_seconds`` so repeated verify calls
+    during a deploy wave do not re-drive the store; concurrent callers wait for the
+    run in progress instead of starting their own.
+    """
+
+    def __init__(self, checks: tuple[SmokeCheck, ...] = SMOKE_CHECKS) -> None:
+        self.checks = checks
+        self._lock = Lock()
+        self._pool = ThreadPoolExecutor(max_workers=len(checks), thread_name_prefix="shop-agent-smoke")
+        self._cached: tuple[Settings, float, dict] | None = None
+
+    def run(self, settings: Settings) -> dict:
+        with self._lock:
+            cached = self._cached
+            if (
+                cached is not None
+                and cached[0] is settings
+                and time.monotonic() - cached[1] < settings.smoke_cache_seconds
+            ):
+                return dict(cached[2], cached=True)
+            result = self._execute(settings)
+            self._cached = (settings, time.monotonic(), result)
+        METRICS.inc("shop_agent_smoke_runs_total", result["result"])
+        return dict(result, cached=False)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._cached = None
+
+    def _timed(self, check: SmokeCheck, url: str, timeout: float) -> tuple[str | None, float]:
+        started = time.perf_counter()
+        failure = run_smoke_check(check, url, timeout)
+        return failure, time.perf_counter() - started
+
+    def _execute(self, settings: Settings) -> dict:
+        started_at = utc_ts()
+        started = time.perf_counter()
+        deadline = time.monotonic() + settings.smoke_budget_seconds
+        timeout = min(settings.smoke_check_timeout_seconds, settings.smoke_budget_seconds)
+        # Stores running without the decoupled storefront have no storefront to load.
+        checks = [
+            check
+            for check in self.checks
+            if settings.storefront_enabled or check.target != "smoke_storefront_url"
+        ]
+        futures = {}
+        for check in checks:
+            url = getattr(settings, check.target)
+            if url:
+                futures[check.name] = self._pool.submit(self._timed, check, url, timeout)
+        results = []
+        for check in checks:
+            entry: dict[str, object] = {"name": check.name, "status": "pass", "duration_ms": 0.0}
+            future = futures.get(check.name)
+            if future is None:
+                entry.update(status="skipped", detail="target not configured")
+            else:
+                try:
+                    failure, elapsed = future.result(timeout=max(0.0, deadline - time.monotonic()))
+                except Exception:  # noqa: BLE001
+                    failure, elapsed = "suite budget exceeded", time.perf_counter() - started
+                entry["duration_ms"] = round(elapsed * 1000, 3)
+                if failure is not None:
+                    entry.update(status="fail", detail=failure)
+                METRICS.observe("shop_agent_smoke_check_duration_seconds", elapsed, check.name)
+            results.append(entry)
+        return {
+            "run_id": str(uuid4()),
+            "result": "pass" if all(entry["status"] == "pass" for entry in results) else "fail",
+            "started_at": started_at,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+            "checks": results,
+        }
+
+
+LOGGER = AsyncLogWriter()
+TRACER = Tracer("shop-agent")
+PROFILER = SamplingProfiler("shop-agent", lambda event, fields: log_event(event, **fields))
+METRICS = MetricsRegistry()
+PROBER = ComponentProber()
+SMOKE = SmokeRunner()
+JOBS = JobManager()
+# Route -> (operation name, accepted message, runner). Runners execute on the job executor.
+JOB_OPERATIONS: dict[str, tuple[str, str, Callable[[], str]]] = {
+    "/ops/cache/flush": ("ops.cache.flush", "cache flush accepted", _run_cache_flush),
+    "/ops/index/reindex": ("ops.index.reindex", "reindex accepted", _run_reindex),
+    "/ops/cron/run": ("ops.cron.run", "cron run accepted", _run_cron),
+}
+POST_OPERATIONS: dict[str, str] = {
+    **{path: spec[0] for path, spec in JOB_OPERATIONS.items()},
+    "/ops/diagnostics": "ops.diagnostics",
+    "/verify/smoke": "verify.smoke",
+}
+# Fixed route labels keep metric cardinality bounded regardless of what clients request.
+ROUTE_LABELS = frozenset(
+    {"/health", "/status", "/metrics", "/ops/history", "/ops/diagnostics", "/verify/smoke", *JOB_OPERATIONS}
+)
+HISTORY_DEFAULT_LIMIT = 50
+HISTORY_MAX_LIMIT = 200
+# No agent route takes a body; larger ones are refused before authentication instead of read.
+MAX_REQUEST_BODY_BYTES = 65536
+# /status fields that make up its ETag; request_id, timestamp and probe times change on every read.
+STATUS_ETAG_FIELDS = (
+    "agent_version",
+    "store_id",
+    "deployment_version",
+    "last_successful_operation_timestamp",
+    "component_states",
+)
+
+
+def status_etag(payload: dict) -> str:
+    """Weak ETag over the state-bearing ``/status`` fields (the body itself differs per request)."""
+    state = json.dumps([payload[name] for name in STATUS_ETAG_FIELDS], sort_keys=True, separators=(",", ":"))
+    return f'W/"{hashlib.sha256(state.encode("utf-8")).hexdigest()[:20]}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison of ``etag`` against an ``If-None-Match`` list (RFC 9110 section 13.1.2)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in if_none_match.split(","))
+
+
+METRICS.describe(
+    "shop_agent_requests_total", "counter", "Requests by route, method, outcome and HTTP code.",
+    ("route", "method", "outcome", "code"),
+)
+METRICS.describe(
+    "shop_agent_request_duration_seconds", "histogram", "Request handling latency by route and outcome.",
+    ("route", "outcome"),
+)
+METRICS.describe("shop_agent_requests_in_flight", "gauge", "Requests currently being handled.")
+METRICS.describe("shop_agent_auth_failures_total", "counter", "Requests rejected as unauthorized.")
+METRICS.describe(
+    "shop_agent_requests_shed_total", "counter", "Requests rejected by admission control.", ("reason", "operation")
+)
+METRICS.describe("shop_agent_jobs_total", "counter", "Finished jobs by operation and state.", ("operation", "state"))
+METRICS.describe(
+    "shop_agent_job_duration_seconds", "histogram", "Job run time by operation.", ("operation",)
+)
+METRICS.describe(
+    "shop_agent_idempotency_requests_total",
+    "counter",
+    "POSTs carrying Idempotency-Key by result (miss runs, hit replays, joined waited for an in-flight run).",
+    ("result",),
+)
+METRICS.describe("shop_agent_smoke_runs_total", "counter", "Executed (non-cached) smoke runs by result.", ("result",))
+METRICS.describe(
+    "shop_agent_smoke_check_duration_seconds", "histogram", "Smoke check duration by check.", ("check",)
+)
+METRICS.describe("shop_agent_jobs_in_flight", "gauge", "Jobs queued or running.", callback=JOBS.active_count)
+METRICS.describe(
+    "shop_agent_log_records_dropped_total", "counter", "Log records dropped because the writer queue was full.",
+    callback=lambda: LOGGER.dropped,
+)
+METRICS.describe(
+    "shop_agent_trace_spans_exported_total", "counter", "Sampled spans exported.", callback=lambda: TRACER.exported
+)
+METRICS.describe(
+    "shop_agent_trace_spans_dropped_total",
+    "counter",
+    "Sampled spans dropped because the span buffer was full or their export failed.",
+    callback=lambda: TRACER.dropped,
+)
+METRICS.describe(
+    "shop_agent_journal_records_failed_total", "counter", "Operation journal records that could not be written.",
+    callback=lambda: JOURNAL.failed,
+)
+METRICS.describe(
+    "shop_agent_jwt_cache_hits_total", "counter", "Verified-token cache hits.",
+    callback=lambda: JWT_CACHE.stats()["hits"],
+)
+METRICS.describe(
+    "shop_agent_jwt_cache_misses_total", "counter", "Verified-token cache misses.",
+    callback=lambda: JWT_CACHE.stats()["misses"],
+)
+
+
+def request_ready(handler: "Handler") -> bool:
+    """Whether the handler's next request can be read without blocking.
+
+    Pipelined requests may already sit in ``rfile``'s buffer where a selector cannot
+    see them, so the buffer is peeked with the socket briefly made non-blocking. A
+    closed or failed connection sets ``close_connection`` and is not ready.
+    """
+    connection = handler.connection
+    timeout = connection.gettimeout()
+    connection.setblocking(False)
+    try:
+        if isinstance(handler.rfile, BufferedReader) and handler.rfile.peek(1):
+            return True
+        # An empty peek is either "nothing yet" or EOF; only EOF reads as b"" here.
+        if connection.recv(1, socket.MSG_PEEK) == b"":
+            handler.close_connection = True
+        return False
+    except BlockingIOError:
+        return False
+    except OSError:
+        handler.close_connection = True
+        return False
+    finally:
+        connection.settimeout(timeout)
+
+
+class IdleConnectionPoller:
+    """Holds idle keep-alive connections off the worker pool until their next request.
+
+    A worker that answered a request and finds nothing more to read parks the handler
+    here instead of blocking on the connection. One thread waits on every parked socket
+    with a selector and passes the handler to ``resume`` once it turns readable (a new
+    request, or EOF when the client closed). Handlers idle for ``idle_timeout`` seconds
+    are passed to ``expire``. Deadlines follow parking order, so expiry only looks at
+    the oldest entries.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        idle_timeout: float,
+        resume: Callable[["Handler"], None],
+        expire: Callable[["Handler"], None],
+    ) -> None:
+        self.name = name
+        self.idle_timeout = idle_timeout
+        self._resume = resume
+        self._expire = expire
+        self._pending: deque["Handler"] = deque()
+        self._closed = False
+        self._lock = Lock()
+        self._thread: Thread | None = None
+        self._wake_reader, self._wake_writer = socket.socketpair()
+        self._wake_writer.setblocking(False)
+
+    def park(self, handler: "Handler") -> None:
+        with self._lock:
+            closed = self._closed
+            if not closed:
+                self._pending.append(handler)
+                if self._thread is None:
+                    self._thread = Thread(target=self._run, name=self.name, daemon=True)
+                    self._thread.start()
+        if closed:
+            self._expire(handler)
+            return
+        self._wake()
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Stop polling and expire every parked handler."""
+        with self._lock:
+            self._closed = True
+            thread = self._thread
+        self._wake()
+        if thread is not None:
+            thread.join(timeout=timeout)
+        else:
+            self._wake_reader.close()
+            self._wake_writer.close()
+
+    def _wake(self) -> None:
+        try:
+            self._wake_writer.send(b"\0")
+        except OSError:
+            # A full wake buffer already guarantees a wake-up; a closed one means shutdown.
+            pass
+
+    def _run(self) -> None:
+        selector = selectors.DefaultSelector()
+        selector.register(self._wake_reader, selectors.EVENT_READ)
+        deadlines: OrderedDict[int, tuple["Handler", float]] = OrderedDict()
+        try:
+            while True:
+                with self._lock:
+                    closed = self._closed
+                    pending = list(self._pending)
+                    self._pending.clear()
+                if closed:
+                    for handler in pending:
+                        self._expire(handler)
+                    break
+                now = time.monotonic()
+                for handler in pending:
+                    try:
+                        key = selector.register(handler.connection, selectors.EVENT_READ, handler)
+                    except (OSError, ValueError):
+                        self._expire(handler)
+                        continue
+                    deadlines[key.fd] = (handler, now + self.idle_timeout)
+                while deadlines:
+                    fd, (handler, deadline) = next(iter(deadlines.items()))
+                    if deadline > now:
+                        break
+                    del deadlines[fd]
+                    selector.unregister(handler.connection)
+                    self._expire(handler)
+                wait = next(iter(deadlines.values()))[1] - now if deadlines else None
+                for key, _ in selector.select(wait):
+                    if key.data is None:
+                        self._wake_reader.recv(4096)
+                        continue
+                    selector.unregister(key.fileobj)
+                    del deadlines[key.fd]
+                    self._resume(key.data)
+        finally:
+            for handler, _ in deadlines.values():
+                self._expire(handler)
+            selector.close()
+            self._wake_reader.close()
+            self._wake_writer.close()
+
+
+class AgentHTTPServer(HTTPServer):
+    """HTTP server that dispatches requests to a bounded worker pool.
+
+    Connections are kept alive (HTTP/1.1) until the client closes them or they
+    stay idle for ``idle_timeout`` seconds. A connection holds a worker only while
+    it has a request to read; between requests it waits in an
+    ``IdleConnectionPoller``, so idle clients never starve the pool.
+    ``request_slots`` caps how many protected requests run at once; ``/health``
+    never takes a slot so liveness probes stay fast while slow operations hold
+    the others.
+    """
+
+    daemon_threads = True
+    keep_alive = True
+
+    def __init__(
+        self,
+        server_address: tuple[str, int],
+        handler_class: type[BaseHTTPRequestHandler],
+        *,
+        max_workers: int = 16,
+        max_in_flight: int = 12,
+        idle_timeout: float = 15.0,
+        reuse_port: bool = False,
+    ) -> None:
+        self.allow_reuse_port = reuse_port
+        super().__init__(server_address, handler_class)
+        self.idle_timeout = idle_timeout
+        self.request_slots = BoundedSemaphore(max_in_flight)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="shop-agent-worker")
+        self._connections: set[socket.socket] = set()
+        self._connections_lock = Lock()
+        self._handler_class = handler_class
+        self._idle = IdleConnectionPoller("shop-agent-idle-connections", idle_timeout, self._resume, self._expire)
+
+    def process_request(self, request, client_address) -> None:
+        # Bounds a read that stalls mid-request; waiting between requests is the poller's job.
+        request.settimeout(self.idle_timeout)
+        with self._connections_lock:
+            self._connections.add(request)
+        self._pool.submit(self._process_request_worker, request, client_address)
+
+    def _process_request_worker(self, request, client_address) -> None:
+        try:
+            handler = self._handler_class(request, client_address, self)
+        except Exception:  # noqa: BLE001
+            self.handle_error(request, client_address)
+            self._close_connection(request)
+            return
+        self._after_turn(handler)
+
+    def _resume(self, handler: "Handler") -> None:
+        try:
+            self._pool.submit(self._resume_worker, handler)
+        except RuntimeError:
+            # The pool is shut down, so the server is closing.
+            self._expire(handler)
+
+    def _resume_worker(self, handler: "Handler") -> None:
+        try:
+            handler.handle()
+        except Exception:  # noqa: BLE001
+            handler.parked = False
+            self.handle_error(handler.request, handler.client_address)
+        finally:
+            handler.finish()
+        self._after_turn(handler)
+
+    def _after_turn(self, handler: BaseHTTPRequestHandler) -> None:
+        if isinstance(handler, Handler) and handler.parked:
+            self._idle.park(handler)
+        else:
+            self._close_connection(handler.request)
+
+    def _expire(self, handler: "Handler") -> None:
+        handler.parked = False
+        handler.finish()
+        self._close_connection(handler.request)
+
+    def _close_connection(self, request: socket.socket) -> None:
+        with self._connections_lock:
+            self._connections.discard(request)
+        self.shutdown_request(request)
+
+    def drain(self, timeout: float) -> bool:
+        """Stop accepting and wait up to ``timeout`` seconds for open connections to finish.
+
+        Request bodies are consumed before handling, so shutting down the read side
+        lets in-flight responses complete while idle keep-alive connections see EOF
+        and close instead of holding the drain for their full idle timeout.
+        """
+        self.socket.close()
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._connections_lock:
+                connections = list(self._connections)
+            if not connections:
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            for connection in connections:
+                try:
+                    connection.shutdown(socket.SHUT_RD)
+                except OSError:
+                    pass
+            time.sleep(0.05)
+
+    def server_close(self) -> None:
+        super().server_close()
+        self._idle.close()
+        self._pool.shutdown(wait=False, cancel_futures=True)
 
 
 class Handler(BaseHTTPRequestHandler):
     server_version = "BoilerDropShopAgent/0.1"
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out as separate writes; with Nagle enabled a kept-alive
+    # client waits for the delayed ACK (~40 ms) before receiving the body.
+    disable_nagle_algorithm = True
+    settings: Settings
+    _trace: TraceContext
+    _started = 0.0
+    _response_code = 0
+    _idempotency: str | None = None
+    _stored: StoredResponse | None = None
+    # Set when a pooled server should keep the connection open for the idle poller.
+    parked = False
+
+    def setup(self) -> None:
+        # Plain HTTPServer instances (single mode, tests) keep HTTP/1.0 semantics
+        # so one idle client cannot monopolise the only serving thread.
+        if not getattr(self.server, "keep_alive", False):
+            self.protocol_version = "HTTP/1.0"
+        super().setup()
+
+    def handle(self) -> None:
+        if not getattr(self.server, "keep_alive", False):
+            super().handle()
+            return
+        # Serve what can be read now; the server parks the connection until the next request.
+        self.parked = False
+        self.close_connection = False
+        while not self.close_connection and request_ready(self):
+            self.handle_one_request()
+        self.parked = not self.close_connection
+
+    def finish(self) -> None:
+        if not self.parked:
+            super().finish()
+
+    def _begin_request(self) -> None:
+        self._started = time.perf_counter()
+        self._response_code = 0
+        self._trace = TRACER.begin(self.headers.get("traceparent"))
+        if PROFILER.active:
+            PROFILER.enter(f"{self.command} {self._route_label()}")
+        METRICS.inc("shop_agent_requests_in_flight")
+        # One snapshot per request so a concurrent reload never mixes old and new values.
+        self.settings = current_settings()
+        self._idempotency = None
+        self._stored = None
+
+    def _end_request(self) -> None:
+        METRICS.inc("shop_agent_requests_in_flight", value=-1)
+        if PROFILER.active:
+            PROFILER.leave()
+        if self._trace.recording:
+            route = self._route_label()
+            attributes = {"http.request.method": self.command, "http.route": route}
+            self._trace.finish(self._response_code, attributes, f"{self.command} {route}")
+
+    def _route_label(self) -> str:
+        path = self._path()
+        if path in ROUTE_LABELS:
+            return path
+        if path.startswith("/ops/jobs/"):
+            return "/ops/jobs/{job_id}"
+        return "unmatched"
+
+    def _discard_body(self) -> bool:
+        """Consume the request body so a kept-alive connection stays in sync; False if rejected."""
+        try:
+            length = int(self.headers.get("Content-Length", "0"))
+        except ValueError:
+            self.close_connection = True
+            return True
+        if length > MAX_REQUEST_BODY_BYTES:
+            self.close_connection = True
+            self._error(413, "request body too large", "PAYLOAD_TOO_LARGE", retryable=False)
+            self._log_audit("failure", 413, "PAYLOAD_TOO_LARGE")
+            return False
+        if length > 0:
+            self.rfile.read(length)
+        return True
+
+    def _acquire_slot(self) -> bool:
+        slots = getattr(self.server, "request_slots", None)
+        if slots is None or slots.acquire(blocking=False):
+            return True
+        METRICS.inc("shop_agent_requests_shed_total", "busy", POST_OPERATIONS.get(self._path(), "-"))
+        self._error(503, "agent busy", "AGENT_BUSY", retryable=True, headers={"Retry-After": "1"})
+        self._log_audit("failure", 503, "AGENT_BUSY")
+        return False
+
+    def _admit(self, operation: str) -> bool:
+        wait = RATE_LIMITER.acquire(self._actor(), operation)
+        if wait <= 0:
+            return True
+        METRICS.inc("shop_agent_requests_shed_total", "rate_limited", operation)
+        retry_after = str(max(1, math.ceil(wait)))
+        self._error(429, "rate limit exceeded", "RATE_LIMITED", retryable=True, headers={"Retry-After": retry_after})
+        self._log_audit("failure", 429, "RATE_LIMITED")
+        return False
+
+    def _release_slot(self) -> None:
+        slots = getattr(self.server, "request_slots", None)
+        if slots is not None:
+            slots.release()
 
     def _path(self) -> str:
         return urlsplit(self.path).path
 
     def _store_id(self) -> str:
-        return os.getenv("STORE_ID", "unknown-store")
+        return self.settings.store_id
 
     def _agent_version(self) -> str:
-        return os.getenv("SHOP_AGENT_VERSION", "dev")
+        return self.settings.agent_version
 
     def _deployment_version(self) -> str:
-        return os.getenv("DEPLOYMENT_VERSION", "unknown")
+        return self.settings.deployment_version
 
     def _auth_token(self) -> str:
-        return os.getenv("AGENT_AUTH_TOKEN", "dev-token")
+        return self.settings.auth_token
 
     def _auth_mode(self) -> str:
-        return os.getenv("AGENT_AUTH_MODE", "jwt").lower()
+        return self.settings.auth_mode
 
-    def _jwt_secret(self) -> str:
-        return os.getenv("AGENT_JWT_SECRET", "")
+    def _jwt_keys(self) -> JwtKeyring:
+        return self.settings.jwt_keys
 
     def _jwt_issuer(self) -> str:
-        return os.getenv("AGENT_JWT_ISSUER", "control-plane")
+        return self.settings.jwt_issuer
 
     def _jwt_audience(self) -> str:
-        return os.getenv("AGENT_JWT_AUDIENCE", "shop-agent")
+        return self.settings.jwt_audience
 
     def _jwt_leeway_seconds(self) -> int:
-        return int(os.getenv("AGENT_JWT_LEEWAY_SECONDS", "5"))
+        return self.settings.jwt_leeway_seconds
 
     def _jwt_max_ttl_seconds(self) -> int:
-        return int(os.getenv("AGENT_JWT_MAX_TTL_SECONDS", "900"))
+        return self.settings.jwt_max_ttl_seconds
 
     def _actor(self) -> str:
         return self.headers.get("X-Actor-Id", "unknown")
@@ -87,6 +2504,7 @@ class Handler(BaseHTTPRequestHandler):
     def _base_payload(self, status: str, message: str) -> dict:
         return {
             "request_id": str(uuid4()),
+            "trace_id": self._trace.trace_id,
             "timestamp": utc_ts(),
             "status": status,
             "message": message,
@@ -99,29 +2517,50 @@ class Handler(BaseHTTPRequestHandler):
             return exc.errno in {errno.EPIPE, errno.ECONNRESET, 54}
         return False
 
-    def _send_json(self, code: int, payload: dict) -> bool:
-        body = json.dumps(payload).encode("utf-8")
+    def _send_json(self, code: int, payload: dict, headers: dict[str, str] | None = None) -> bool:
+        return self._send_body(code, json.dumps(payload).encode("utf-8"), "application/json", headers)
+
+    def _send_body(self, code: int, body: bytes, content_type: str, headers: dict[str, str] | None = None) -> bool:
+        self._response_code = code
         try:
-            self.send_response(code)
-            self.send_header("Content-Type", "application/json")
-            self.send_header("Content-Length", str(len(body)))
-            self.end_headers()
-            self.wfile.write(body)
+            with self._trace.span("write"):
+                self.send_response(code)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                if self._idempotency == "miss":
+                    self._stored = StoredResponse(code, body, content_type, dict(headers or {}), "", None)
+                self.wfile.write(body)
             return True
         except Exception as exc:  # noqa: BLE001
             if self._is_client_disconnect(exc):
-                print(
-                    f"{utc_ts()} component=shop-agent event=client-disconnect "
-                    f"method={self.command} path={self._path()} code={code}"
-                )
+                log_event("client-disconnect", method=self.command, path=self._path(), code=code)
+                return False
+            raise
+
+    def _send_not_modified(self, etag: str) -> bool:
+        self._response_code = 304
+        try:
+            with self._trace.span("write"):
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+            return True
+        except Exception as exc:  # noqa: BLE001
+            if self._is_client_disconnect(exc):
+                log_event("client-disconnect", method=self.command, path=self._path(), code=304)
                 return False
             raise
 
-    def _error(self, code: int, message: str, error_code: str, retryable: bool) -> None:
+    def _error(
+        self, code: int, message: str, error_code: str, retryable: bool, headers: dict[str, str] | None = None
+    ) -> None:
         payload = self._base_payload("failure", message)
         payload["error_code"] = error_code
         payload["retryable"] = retryable
-        self._send_json(code, payload)
+        self._send_json(code, payload, headers)
 
     def _is_authorized(self) -> bool:
         auth_header = self.headers.get("Authorization", "")
@@ -142,30 +2581,41 @@ class Handler(BaseHTTPRequestHandler):
         return False
 
     def _is_valid_jwt(self, token: str) -> bool:
-        secret = self._jwt_secret()
-        if not secret:
+        if JWT_CACHE.contains(token):
+            return True
+        expires_at = self._verify_jwt(token)
+        if expires_at is None:
             return False
+        JWT_CACHE.add(token, expires_at)
+        return True
 
+    def _verify_jwt(self, token: str) -> int | None:
+        """Fully verify ``token`` and return the instant its acceptance ends, or None."""
         try:
             parts = token.split(".")
             if len(parts) != 3:
-                return False
+                return None
             header_b64, payload_b64, signature_b64 = parts
 
-            signing_input = f"{header_b64}.{payload_b64}".encode("utf-8")
-            expected_signature = b64url_encode(
-                hmac.new(secret.encode("utf-8"), signing_input, hashlib.sha256).digest()
-            )
-            if not hmac.compare_digest(signature_b64, expected_signature):
-                return False
-
+            # Select the key from the header alone; unknown or out-of-window kids
+            # are rejected before the signature is computed or the payload decoded.
             header = json.loads(b64url_decode(header_b64).decode("utf-8"))
-            payload = json.loads(b64url_decode(payload_b64).decode("utf-8"))
-
             if header.get("alg") != "HS256":
-                return False
-
+                return None
+            kid = header.get("kid", "")
+            if not isinstance(kid, str):
+                return None
             now = int(time.time())
+            signer = self._jwt_keys().signer(kid, now)
+            if signer is None:
+                return None
+
+            signer.update(f"{header_b64}.{payload_b64}".encode("utf-8"))
+            if not hmac.compare_digest(signature_b64, b64url_encode(signer.digest())):
+                return None
+
+            payload = json.loads(b64url_decode(payload_b64).decode("utf-8"))
+
             leeway = self._jwt_leeway_seconds()
             max_ttl = self._jwt_max_ttl_seconds()
 
@@ -176,18 +2626,18 @@ class Handler(BaseHTTPRequestHandler):
             token_store_id = payload.get("store_id")
 
             if not isinstance(exp, int) or not isinstance(iat, int):
-                return False
+                return None
             if exp <= (now - leeway):
-                return False
+                return None
             if iat > (now + leeway):
-                return False
+                return None
             if (exp - iat) > max_ttl:
-                return False
+                return None
             if (now - iat) > (max_ttl + leeway):
-                return False
+                return None
 
             if iss != self._jwt_issuer():
-                return False
+                return None
             if isinstance(aud, str):
                 audience_ok = aud == self._jwt_audience()
             elif isinstance(aud, list):
@@ -195,27 +2645,26 @@ class Handler(BaseHTTPRequestHandler):
             else:
                 audience_ok = False
             if not audience_ok:
-                return False
+                return None
 
             if token_store_id is not None and token_store_id != self._store_id():
-                return False
+                return None
 
-            return True
+            return exp + leeway
         except Exception:  # noqa: BLE001
-            return False
+            return None
 
     def _ensure_authorized(self) -> bool:
-        if self._is_authorized():
+        with self._trace.span("auth"):
+            authorized = self._is_authorized()
+        if authorized:
             return True
+        METRICS.inc("shop_agent_auth_failures_total")
         self._error(401, "unauthorized", "UNAUTHORIZED", retryable=False)
         return False
 
-    def _component_states(self) -> dict:
-        return {
-            "backend_reachable": "unknown",
-            "search_reachable": "unknown",
-            "cache_reachable": "unknown",
-        }
+    def _component_states(self) -> tuple[dict[str, str], str | None]:
+        return PROBER.snapshot(self.settings.probe_ttl_seconds)
 
     def _mark_successful_operation(self) -> str:
         ts = utc_ts()
@@ -229,19 +2678,50 @@ class Handler(BaseHTTPRequestHandler):
         payload["operation_timestamp"] = self._mark_successful_operation()
         if extra:
             payload.update(extra)
+        self._journal(operation, "success", None, payload["operation_timestamp"])
         self._send_json(200, payload)
 
+    def _journal(self, operation: str, outcome: str, error_code: str | None, finished_at: str | None = None) -> None:
+        elapsed = time.perf_counter() - self._started
+        finished = datetime.now(timezone.utc) if finished_at is None else datetime.fromisoformat(finished_at)
+        started_at = (finished - timedelta(seconds=elapsed)).isoformat()
+        JOURNAL.append(
+            operation, self._actor(), started_at, finished.isoformat(), round(elapsed * 1000, 3), outcome, error_code
+        )
+
     def _log_audit(self, outcome: str, http_code: int, error_code: str | None = None) -> None:
-        # Non-sensitive audit line for operations visibility.
-        print(
-            f"{utc_ts()} component=shop-agent method={self.command} path={self._path()} "
-            f"store_id={self._store_id()} actor={self._actor()} outcome={outcome} "
-            f"http_code={http_code} error_code={error_code or '-'}"
+        # Non-sensitive audit record for operations visibility.
+        log_event(
+            "audit",
+            method=self.command,
+            path=self._path(),
+            store_id=self._store_id(),
+            actor=self._actor(),
+            outcome=outcome,
+            http_code=http_code,
+            error_code=error_code,
+            idempotency=self._idempotency,
+            trace_id=self._trace.trace_id,
         )
+        if self._stored is not None:
+            self._stored.outcome = outcome
+            self._stored.error_code = error_code
+        # Every request ends with exactly one audit line, so outcome metrics are recorded here.
+        route = self._route_label()
+        METRICS.inc("shop_agent_requests_total", route, self.command, outcome, str(http_code))
+        METRICS.observe("shop_agent_request_duration_seconds", time.perf_counter() - self._started, route, outcome)
 
     def do_GET(self) -> None:  # noqa: N802
-        path = self._path()
+        self._begin_request()
+        try:
+            if not self._discard_body():
+                return
+            with self._trace.span("handler"):
+                self._serve_get(self._path())
+        finally:
+            self._end_request()
 
+    def _serve_get(self, path: str) -> None:
         if path == "/health":
             payload = self._base_payload("success", "shop-agent healthy")
             payload["component"] = "shop-agent"
@@ -250,6 +2730,14 @@ class Handler(BaseHTTPRequestHandler):
             self._log_audit("success", 200)
             return
 
+        if not self._acquire_slot():
+            return
+        try:
+            self._handle_get(path)
+        finally:
+            self._release_slot()
+
+    def _handle_get(self, path: str) -> None:
         if path == "/status":
             if not self._ensure_authorized():
                 self._log_audit("failure", 401, "UNAUTHORIZED")
@@ -259,7 +2747,43 @@ class Handler(BaseHTTPRequestHandler):
             payload["store_id"] = self._store_id()
             payload["deployment_version"] = self._deployment_version()
             payload["last_successful_operation_timestamp"] = get_last_successful_operation_timestamp()
-            payload["component_states"] = self._component_states()
+            payload["component_states"], payload["component_states_checked_at"] = self._component_states()
+            etag = status_etag(payload)
+            if etag_matches(self.headers.get("If-None-Match", ""), etag):
+                self._send_not_modified(etag)
+                self._log_audit("success", 304)
+                return
+            self._send_json(200, payload, {"ETag": etag})
+            self._log_audit("success", 200)
+            return
+
+        if path == "/metrics":
+            if not self._ensure_authorized():
+                self._log_audit("failure", 401, "UNAUTHORIZED")
+                return
+            self._send_body(200, METRICS.render().encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8")
+            self._log_audit("success", 200)
+            return
+
+        if path == "/ops/history":
+            if not self._ensure_authorized():
+                self._log_audit("failure", 401, "UNAUTHORIZED")
+                return
+            self._send_history()
+            return
+
+        if path.startswith("/ops/jobs/"):
+            if not self._ensure_authorized():
+                self._log_audit("failure", 401, "UNAUTHORIZED")
+                return
+            job = JOBS.get(path[len("/ops/jobs/"):])
+            if job is None:
+                self._error(404, "job not found", "JOB_NOT_FOUND", retryable=False)
+                self._log_audit("failure", 404, "JOB_NOT_FOUND")
+                return
+            payload = self._base_payload("success", "job status")
+            payload["store_id"] = self._store_id()
+            payload["job"] = job
             self._send_json(200, payload)
             self._log_audit("success", 200)
             return
@@ -267,34 +2791,121 @@ class Handler(BaseHTTPRequestHandler):
         self._error(404, "route not found", "NOT_FOUND", retryable=False)
         self._log_audit("failure", 404, "NOT_FOUND")
 
+    def _send_history(self) -> None:
+        query = parse_qs(urlsplit(self.path).query)
+        try:
+            limit = int(query.get("limit", [HISTORY_DEFAULT_LIMIT])[-1])
+            before = int(query["before"][-1]) if "before" in query else None
+        except ValueError:
+            limit = 0
+            before = None
+        if not 1 <= limit <= HISTORY_MAX_LIMIT:
+            self._error(
+                400, f"limit must be 1..{HISTORY_MAX_LIMIT} and before an integer", "INVALID_QUERY", retryable=False
+            )
+            self._log_audit("failure", 400, "INVALID_QUERY")
+            return
+        records = JOURNAL.history(before, limit)
+        payload = self._base_payload("success", "operation history")
+        payload["store_id"] = self._store_id()
+        payload["history"] = records
+        # Only a full page can have older records behind it.
+        payload["next_before"] = records[-1]["seq"] if len(records) == limit else None
+        self._send_json(200, payload)
+        self._log_audit("success", 200)
+
     def do_POST(self) -> None:  # noqa: N802
-        path = self._path()
+        self._begin_request()
+        try:
+            if not self._discard_body():
+                return
+            with self._trace.span("handler"):
+                if not self._acquire_slot():
+                    return
+                try:
+                    self._handle_post(self._path())
+                finally:
+                    self._release_slot()
+        finally:
+            self._end_request()
+
+    def _handle_post(self, path: str) -> None:
         if not self._ensure_authorized():
             self._log_audit("failure", 401, "UNAUTHORIZED")
             return
 
-        if path == "/ops/cache/flush":
-            self._op_success("ops.cache.flush", "cache flush completed")
-            self._log_audit("success", 200)
+        key = self.headers.get("Idempotency-Key")
+        if key is None:
+            self._dispatch_post(path)
+            return
+        if not key or len(key) > 255:
+            self._error(400, "invalid Idempotency-Key", "INVALID_IDEMPOTENCY_KEY", retryable=False)
+            self._log_audit("failure", 400, "INVALID_IDEMPOTENCY_KEY")
             return
 
-        if path == "/ops/index/reindex":
-            self._op_success("ops.index.reindex", "reindex completed")
-            self._log_audit("success", 200)
+        cache_key = (self._actor(), path, key)
+        while True:
+            entry, owner = IDEMPOTENCY.begin(cache_key)
+            if owner:
+                break
+            joined = not entry.done.is_set()
+            if not entry.done.wait(self.settings.idempotency_wait_seconds):
+                self._error(
+                    409, "request with this Idempotency-Key is in progress", "IDEMPOTENCY_IN_PROGRESS", retryable=True
+                )
+                self._log_audit("failure", 409, "IDEMPOTENCY_IN_PROGRESS")
+                return
+            if entry.response is not None:
+                self._replay(entry.response, "joined" if joined else "hit")
+                return
+            # The first call produced nothing replayable (shed or transient); run this one.
+
+        self._idempotency = "miss"
+        METRICS.inc("shop_agent_idempotency_requests_total", "miss")
+        try:
+            self._dispatch_post(path)
+        finally:
+            stored = self._stored
+            # Shed and transient (5xx) responses must not stick to the key.
+            if stored is not None and (stored.code >= 500 or stored.code == 429):
+                stored = None
+            IDEMPOTENCY.complete(cache_key, entry, stored, self.settings.idempotency_ttl_seconds)
+
+    def _replay(self, stored: StoredResponse, result: str) -> None:
+        self._idempotency = result
+        METRICS.inc("shop_agent_idempotency_requests_total", result)
+        headers = dict(stored.headers)
+        headers["Idempotent-Replayed"] = "true"
+        self._send_body(stored.code, stored.body, stored.content_type, headers)
+        self._log_audit(stored.outcome, stored.code, stored.error_code)
+
+    def _dispatch_post(self, path: str) -> None:
+        operation = POST_OPERATIONS.get(path)
+        if operation is not None and not self._admit(operation):
             return
 
-        if path == "/ops/cron/run":
-            self._op_success("ops.cron.run", "cron run completed")
-            self._log_audit("success", 200)
+        job_operation = JOB_OPERATIONS.get(path)
+        if job_operation is not None:
+            operation, message, runner = job_operation
+            job, coalesced = JOBS.submit(operation, self._actor(), runner)
+            payload = self._base_payload("success", message)
+            payload["operation"] = operation
+            payload["store_id"] = self._store_id()
+            payload["job"] = job
+            payload["coalesced"] = coalesced
+            self._send_json(202, payload, {"Location": f"/ops/jobs/{job['job_id']}"})
+            self._log_audit("success", 202)
             return
 
         if path == "/ops/diagnostics":
+            component_states, checked_at = self._component_states()
             self._op_success(
                 "ops.diagnostics",
                 "diagnostics collected",
                 {
                     "diagnostics": {
-                        "component_states": self._component_states(),
+                        "component_states": component_states,
+                        "component_states_checked_at": checked_at,
                         "error_codes": [],
                         "collected_at": utc_ts(),
                     }
@@ -304,28 +2915,36 @@ class Handler(BaseHTTPRequestHandler):
             return
 
         if path == "/verify/smoke":
-            self._op_success(
-                "verify.smoke",
-                "smoke verification passed",
-                {
-                    "smoke": {
-                        "result": "pass",
-                        "checks": [
-                            {"name": "shop-agent-health", "status": "pass"},
-                            {"name": "status-endpoint-auth", "status": "pass"},
-                        ],
-                    }
-                },
+            smoke = SMOKE.run(self.settings)
+            if smoke["result"] == "pass":
+                self._op_success("verify.smoke", "smoke verification passed", {"smoke": smoke})
+                self._log_audit("success", 200)
+                return
+            payload = self._base_payload("failure", "smoke verification failed")
+            payload.update(
+                operation="verify.smoke",
+                store_id=self._store_id(),
+                error_code="SMOKE_FAILED",
+                retryable=True,
+                smoke=smoke,
             )
-            self._log_audit("success", 200)
+            self._journal("verify.smoke", "failure", "SMOKE_FAILED")
+            self._send_json(503, payload)
+            self._log_audit("failure", 503, "SMOKE_FAILED")
             return
 
         self._error(404, "route not found", "NOT_FOUND", retryable=False)
         self._log_audit("failure", 404, "NOT_FOUND")
 
     def _method_not_allowed(self) -> None:
-        self._error(405, "method not allowed", "METHOD_NOT_ALLOWED", retryable=False)
-        self._log_audit("failure", 405, "METHOD_NOT_ALLOWED")
+        self._begin_request()
+        try:
+            if not self._discard_body():
+                return
+            self._error(405, "method not allowed", "METHOD_NOT_ALLOWED", retryable=False)
+            self._log_audit("failure", 405, "METHOD_NOT_ALLOWED")
+        finally:
+            self._end_request()
 
     def do_PUT(self) -> None:  # noqa: N802
         self._method_not_allowed()
@@ -337,16 +2956,213 @@ class Handler(BaseHTTPRequestHandler):
         self._method_not_allowed()
 
     def log_message(self, fmt: str, *args) -> None:  # noqa: A003
-        msg = fmt % args
-        print(f"{utc_ts()} component=shop-agent event=http-log msg={msg}")
+        log_event("http-log", msg=fmt % args)
+
+
+def build_server(settings: Settings, reuse_port: bool = False) -> HTTPServer:
+    address = (settings.host, settings.port)
+    if settings.server_mode == "single":
+        httpd = HTTPServer(address, Handler, bind_and_activate=False)
+        httpd.allow_reuse_port = reuse_port
+        try:
+            httpd.server_bind()
+            httpd.server_activate()
+        except OSError:
+            httpd.server_close()
+            raise
+        return httpd
+    return AgentHTTPServer(
+        address,
+        Handler,
+        max_workers=settings.max_workers,
+        max_in_flight=settings.max_in_flight,
+        idle_timeout=settings.keepalive_idle_seconds,
+        reuse_port=reuse_port,
+    )
+
+
+def _reload_and_log() -> None:
+    try:
+        settings = reload_settings()
+    except ValueError as exc:
+        log_event("settings-reload-rejected", error=str(exc))
+        return
+    log_event("settings-reloaded", store_id=settings.store_id, deployment_version=settings.deployment_version)
+
+
+RELOADER = SettingsReloader("shop-agent-settings-reload", _reload_and_log)
+
+
+def _handle_sighup(signum: int, frame: object) -> None:
+    RELOADER.request()
+
+
+def _handle_sigterm(signum: int, frame: object) -> None:
+    raise SystemExit(0)
+
+
+def _handle_sigusr2(signum: int, frame: object) -> None:
+    if not PROFILER.trigger():
+        log_event("profile-already-running", pid=os.getpid())
+
+
+def serve(settings: Settings, reuse_port: bool = False) -> None:
+    """Serve until SIGTERM, then drain open connections and running jobs within ``drain_seconds``."""
+    JOBS.configure(settings.job_workers, settings.job_retention)
+    PROBER.start()
+    httpd = build_server(settings, reuse_port=reuse_port)
+    log_event(
+        "listening",
+        host=settings.host,
+        port=settings.port,
+        store_id=settings.store_id,
+        mode=settings.server_mode,
+        pid=os.getpid(),
+    )
+    try:
+        httpd.serve_forever()
+    finally:
+        deadline = time.monotonic() + settings.drain_seconds
+        drained = httpd.drain(settings.drain_seconds) if isinstance(httpd, AgentHTTPServer) else True
+        drained = JOBS.drain(max(0.0, deadline - time.monotonic())) and drained
+        httpd.server_close()
+        PROBER.stop()
+        # A profile cut short by shutdown is still written.
+        PROFILER.stop()
+        # Journal records of drained jobs are written and fsynced before exit.
+        JOURNAL.close()
+        # Spans of drained requests are exported before exit.
+        TRACER.close()
+        log_event("stopped", pid=os.getpid(), drained=drained)
+        # Queued audit records are flushed before exit.
+        LOGGER.close()
+
+
+def _run_worker() -> None:
+    code = 1
+    try:
+        signal.signal(signal.SIGTERM, _handle_sigterm)
+        signal.signal(signal.SIGINT, _handle_sigterm)
+        RELOADER.start()
+        signal.signal(signal.SIGHUP, _handle_sighup)
+        signal.signal(signal.SIGUSR2, _handle_sigusr2)
+        serve(current_settings(), reuse_port=True)
+        code = 0
+    except SystemExit as exc:
+        code = exc.code if isinstance(exc.code, int) else 1
+    except BaseException:  # noqa: BLE001
+        code = 1
+    finally:
+        os._exit(code)
+
+
+def serve_prefork(settings: Settings) -> None:
+    """Supervise ``settings.processes`` forked workers that share the port via SO_REUSEPORT.
+
+    Crashed workers are restarted (with a short back-off when they die right after
+    start). SIGTERM/SIGINT are forwarded so each worker drains; workers still alive
+    after ``drain_seconds`` are killed. SIGHUP reloads settings here and in every
+    worker, so restarted workers pick up the reloaded snapshot too. SIGUSR2 is only
+    forwarded: each worker profiles itself.
+    """
+    workers: dict[int, float] = {}
+    stop_deadline: list[float] = []
+
+    def spawn() -> None:
+        # fork() must not copy a live writer thread (or its locks) into the child,
+        # nor a reload half applied.
+        with RELOADER.lock:
+            LOGGER.close()
+            TRACER.close()
+            pid = os.fork()
+        if pid == 0:
+            _run_worker()
+        workers[pid] = time.monotonic()
+        log_event("worker-started", pid=pid)
+
+    def forward(signum: int) -> None:
+        for pid in list(workers):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def on_stop(signum: int, frame: object) -> None:
+        if not stop_deadline:
+            stop_deadline.append(time.monotonic() + settings.drain_seconds + 1.0)
+            forward(signal.SIGTERM)
+
+    def on_reload(signum: int, frame: object) -> None:
+        _handle_sighup(signum, frame)
+        forward(signal.SIGHUP)
+
+    def on_profile(signum: int, frame: object) -> None:
+        forward(signal.SIGUSR2)
+
+    signal.signal(signal.SIGTERM, on_stop)
+    signal.signal(signal.SIGINT, on_stop)
+    RELOADER.start()
+    signal.signal(signal.SIGHUP, on_reload)
+    signal.signal(signal.SIGUSR2, on_profile)
+    for _ in range(settings.processes):
+        spawn()
+    log_event("supervisor-started", pid=os.getpid(), processes=settings.processes, port=settings.port)
+    while workers:
+        pid, status = os.waitpid(-1, os.WNOHANG)
+        if pid == 0:
+            if stop_deadline and time.monotonic() > stop_deadline[0]:
+                forward(signal.SIGKILL)
+            time.sleep(0.1)
+            continue
+        started = workers.pop(pid, None)
+        if started is None:
+            continue
+        code = os.waitstatus_to_exitcode(status)
+        if stop_deadline:
+            log_event("worker-stopped", pid=pid, code=code)
+            continue
+        log_event("worker-exited", pid=pid, code=code)
+        if time.monotonic() - started < 1.0:
+            time.sleep(1.0)
+        spawn()
+    log_event("supervisor-stopped", pid=os.getpid())
+    LOGGER.close()
 
 
 def main() -> None:
-    host = os.getenv("HOST", "0.0.0.0")
-    port = int(os.getenv("PORT", "8080"))
-    httpd = HTTPServer((host, port), Handler)
-    print(f"{utc_ts()} shop-agent listening on {host}:{port} store_id={os.getenv('STORE_ID', 'unknown-store')}")
-    httpd.serve_forever()
+    try:
+        settings = reload_settings()
+    except ValueError as exc:
+        raise SystemExit(f"shop-agent configuration error: {exc}") from None
+    if settings.processes > 1 and not (hasattr(os, "fork") and hasattr(socket, "SO_REUSEPORT")):
+        raise SystemExit("shop-agent configuration error: AGENT_PROCESSES > 1 needs fork() and SO_REUSEPORT")
+    LOGGER.configure(settings.log_queue_size, settings.log_overflow)
+    state_dir = settings.state_dir
+    if settings.processes > 1 and not state_dir:
+        state_dir = tempfile.mkdtemp(prefix="shop-agent-state-")
+    store = configure_shared_state(state_dir)
+    if store is not None:
+        # No worker is alive yet, so any job claim on disk belongs to a previous run.
+        store.clear_active()
+    try:
+        recovered = JOURNAL.configure(
+            settings.journal_dir, settings.journal_segment_bytes, settings.journal_max_segments
+        )
+    except OSError as exc:
+        raise SystemExit(f"shop-agent configuration error: AGENT_JOURNAL_DIR unusable: {exc.strerror}") from None
+    if recovered is not None and recovered > (get_last_successful_operation_timestamp() or ""):
+        set_last_successful_operation_timestamp(recovered)
+    if settings.processes > 1:
+        serve_prefork(settings)
+        return
+    if hasattr(signal, "SIGHUP"):
+        RELOADER.start()
+        signal.signal(signal.SIGHUP, _handle_sighup)
+    if hasattr(signal, "SIGUSR2"):
+        signal.signal(signal.SIGUSR2, _handle_sigusr2)
+    signal.signal(signal.SIGTERM, _handle_sigterm)
+    LOGGER.start()
+    serve(settings)
 
 
 if __name__ == "__main__":
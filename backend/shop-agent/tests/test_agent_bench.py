@@ -0,0 +1,45 @@
+import importlib.util
+import pathlib
+import unittest
+
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+BENCH_PATH = ROOT / "bench" / "agent_bench.py"
+
+spec = importlib.util.spec_from_file_location("shop_agent_bench", BENCH_PATH)
+bench = importlib.util.module_from_spec(spec)
+assert spec.loader is not None
+spec.loader.exec_module(bench)
+
+
+class AgentBenchTests(unittest.TestCase):
+    def test_percentile_uses_nearest_rank(self) -> None:
+        values = [float(n) for n in range(1, 101)]
+        self.assertEqual(bench.percentile(values, 0.50), 50.0)
+        self.assertEqual(bench.percentile(values, 0.99), 99.0)
+        self.assertEqual(bench.percentile([], 0.99), 0.0)
+
+    def test_compare_flags_latency_and_throughput_regressions(self) -> None:
+        row = {"throughput_rps": 1000.0, "p50_ms": 1.0, "p95_ms": 2.0, "p99_ms": 4.0}
+        baseline = {"scenarios": {"status": row}}
+        within = {"scenarios": {"status": dict(row, p99_ms=4.3)}}
+        slower = {"scenarios": {"status": dict(row, throughput_rps=800.0, p99_ms=6.0)}}
+        self.assertEqual(bench.compare(baseline, within, 0.10), [])
+        regressions = bench.compare(baseline, slower, 0.10)
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(regressions[0].startswith("status: throughput"))
+
+    def test_inprocess_run_reports_every_scenario(self) -> None:
+        args = bench.parse_args(
+            ["--scenarios", "health,status,ops", "--duration", "0.2", "--warmup", "0", "--concurrency", "2"]
+        )
+        report = bench.run_benchmark(args)
+        self.assertEqual(set(report["scenarios"]), {"health", "status", "ops"})
+        for row in report["scenarios"].values():
+            self.assertGreater(row["requests"], 0)
+            self.assertEqual(row["errors"], 0)
+            self.assertLessEqual(row["p50_ms"], row["p99_ms"])
+
+
+if __name__ == "__main__":
+    unittest.main()
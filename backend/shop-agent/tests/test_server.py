@@ -3,13 +3,21 @@ import hashlib
 import hmac
 import http.client
 import importlib.util
+import io
 import json
 import os
 import pathlib
+import re
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
 import threading
 import time
 import unittest
-from http.server import HTTPServer
+import unittest.mock
+from http.server import BaseHTTPRequestHandler, HTTPServer, ThreadingHTTPServer
 
 
 ROOT = pathlib.Path(__file__).resolve().parents[1]
@@ -20,19 +28,59 @@ server = importlib.util.module_from_spec(spec)
 assert spec.loader is not None
 spec.loader.exec_module(server)
 
+TEST_ENV = {
+    "AGENT_AUTH_MODE": "jwt",
+    "AGENT_JWT_SECRET": "test-secret",
+    "AGENT_JWT_ISSUER": "control-plane",
+    "AGENT_JWT_AUDIENCE": "shop-agent",
+    "AGENT_JWT_LEEWAY_SECONDS": "0",
+    "AGENT_JWT_MAX_TTL_SECONDS": "900",
+    "STORE_ID": "shop-001",
+    "SHOP_AGENT_VERSION": "0.1.0",
+    "DEPLOYMENT_VERSION": "ci",
+}
+
+
+class StubStoreHandler(BaseHTTPRequestHandler):
+    """Stands in for the storefront and Magento GraphQL during smoke tests."""
+
+    graphql_errors = False
+    delay_seconds = 0.0
+
+    def do_GET(self) -> None:  # noqa: N802
+        self._reply(200, b"<html>ok</html>", "text/html")
+
+    def do_POST(self) -> None:  # noqa: N802
+        time.sleep(self.delay_seconds)
+        query = json.loads(self.rfile.read(int(self.headers.get("Content-Length", "0"))))["query"]
+        if self.graphql_errors:
+            document: dict = {"errors": [{"message": "internal"}]}
+        elif "createEmptyCart" in query:
+            document = {"data": {"createEmptyCart": "cart-id"}}
+        else:
+            document = {"data": {"products": {"total_count": 1}}}
+        self._reply(200, json.dumps(document).encode("utf-8"), "application/json")
+
+    def _reply(self, code: int, body: bytes, content_type: str) -> None:
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: object) -> None:  # noqa: A002
+        return
+
+
+def configure_test_env() -> None:
+    os.environ.update(TEST_ENV)
+    server.reload_settings()
+
 
 class ShopAgentServerTests(unittest.TestCase):
     @classmethod
     def setUpClass(cls) -> None:
-        os.environ["AGENT_AUTH_MODE"] = "jwt"
-        os.environ["AGENT_JWT_SECRET"] = "test-secret"
-        os.environ["AGENT_JWT_ISSUER"] = "control-plane"
-        os.environ["AGENT_JWT_AUDIENCE"] = "shop-agent"
-        os.environ["AGENT_JWT_LEEWAY_SECONDS"] = "0"
-        os.environ["AGENT_JWT_MAX_TTL_SECONDS"] = "900"
-        os.environ["STORE_ID"] = "shop-001"
-        os.environ["SHOP_AGENT_VERSION"] = "0.1.0"
-        os.environ["DEPLOYMENT_VERSION"] = "ci"
+        configure_test_env()
 
         cls.httpd = HTTPServer(("127.0.0.1", 0), server.Handler)
         cls.port = cls.httpd.server_address[1]
@@ -48,6 +96,25 @@ class ShopAgentServerTests(unittest.TestCase):
     def setUp(self) -> None:
         server.reset_state_for_tests()
 
+    def start_stub_store(self, **extra: str) -> None:
+        stub = ThreadingHTTPServer(("127.0.0.1", 0), StubStoreHandler)
+        stub.handle_error = lambda request, client_address: None  # type: ignore[method-assign]
+        thread = threading.Thread(target=stub.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(thread.join, 5)
+        self.addCleanup(stub.server_close)
+        self.addCleanup(stub.shutdown)
+        base = f"http://127.0.0.1:{stub.server_address[1]}"
+        env = dict(
+            os.environ,
+            AGENT_SMOKE_STOREFRONT_URL=f"{base}/",
+            AGENT_SMOKE_GRAPHQL_URL=f"{base}/graphql",
+            AGENT_PROBE_BACKEND_URL=f"{base}/health_check.php",
+            AGENT_SMOKE_BUDGET_SECONDS="1",
+        )
+        server.reload_settings({**env, **extra})
+        self.addCleanup(server.reload_settings)
+
     def _b64url(self, raw: bytes) -> str:
         return base64.urlsafe_b64encode(raw).decode("utf-8").rstrip("=")
 
@@ -60,11 +127,14 @@ class ShopAgentServerTests(unittest.TestCase):
         store_id: str = "shop-001",
         iat: int | None = None,
         exp: int | None = None,
+        kid: str | None = None,
     ) -> str:
         now = int(time.time())
         iat = now if iat is None else iat
         exp = now + 120 if exp is None else exp
         header = {"alg": "HS256", "typ": "JWT"}
+        if kid is not None:
+            header["kid"] = kid
         payload = {
             "iss": issuer,
             "aud": audience,
@@ -127,15 +197,40 @@ class ShopAgentServerTests(unittest.TestCase):
         self.assertIn("last_successful_operation_timestamp", payload)
         self.assertIn("component_states", payload)
 
-    def test_allowlisted_ops_return_success(self) -> None:
-        routes = [
-            "/ops/cache/flush",
-            "/ops/index/reindex",
-            "/ops/cron/run",
-            "/ops/diagnostics",
-            "/verify/smoke",
-        ]
-        for route in routes:
+    def conditional_status(self, etag: str) -> tuple[int, str | None, bytes]:
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=5)
+        conn.request("GET", "/status", headers={"Authorization": f"Bearer {self.jwt_token()}", "If-None-Match": etag})
+        resp = conn.getresponse()
+        body = resp.read()
+        conn.close()
+        return resp.status, resp.getheader("ETag"), body
+
+    def test_status_etag_answers_not_modified_until_state_changes(self) -> None:
+        code, etag, _ = self.conditional_status('"none"')
+        self.assertEqual(code, 200)
+        self.assertTrue(etag.startswith('W/"'))
+
+        code, same_etag, body = self.conditional_status(f'"other", {etag}')
+        self.assertEqual((code, same_etag, body), (304, etag, b""))
+
+        self.request("POST", "/ops/diagnostics", token=self.jwt_token())
+        code, new_etag, body = self.conditional_status(etag)
+        self.assertEqual(code, 200)
+        self.assertNotEqual(new_etag, etag)
+        self.assertIsNotNone(json.loads(body)["last_successful_operation_timestamp"])
+
+    def wait_for_job(self, job_id: str, timeout: float = 5.0) -> dict:
+        deadline = time.monotonic() + timeout
+        while True:
+            code, payload = self.request("GET", f"/ops/jobs/{job_id}", token=self.jwt_token())
+            self.assertEqual(code, 200)
+            if payload["job"]["finished_at"] is not None or time.monotonic() > deadline:
+                return payload["job"]
+            time.sleep(0.01)
+
+    def test_synchronous_ops_return_success(self) -> None:
+        self.start_stub_store()
+        for route in ["/ops/diagnostics", "/verify/smoke"]:
             with self.subTest(route=route):
                 code, payload = self.request("POST", route, token=self.jwt_token())
                 self.assertEqual(code, 200)
@@ -144,20 +239,158 @@ class ShopAgentServerTests(unittest.TestCase):
                 self.assertIn("operation", payload)
                 self.assertIn("operation_timestamp", payload)
 
-    def test_operation_updates_last_success_timestamp(self) -> None:
-        code, _ = self.request("POST", "/ops/cache/flush", token=self.jwt_token())
-        self.assertEqual(code, 200)
+    def test_job_ops_are_accepted_and_complete(self) -> None:
+        for route in ["/ops/cache/flush", "/ops/index/reindex", "/ops/cron/run"]:
+            with self.subTest(route=route):
+                code, payload = self.request("POST", route, token=self.jwt_token())
+                self.assertEqual(code, 202)
+                self.assert_common_success(payload)
+                self.assertEqual(payload["store_id"], "shop-001")
+                self.assertIn("operation", payload)
+                job = self.wait_for_job(payload["job"]["job_id"])
+                self.assertEqual(job["state"], "succeeded")
+                self.assertEqual(job["operation"], payload["operation"])
+                self.assertIsNotNone(job["duration_ms"])
+
+    def test_operation_updates_last_success_timestamp_on_completion(self) -> None:
+        code, payload = self.request("POST", "/ops/cache/flush", token=self.jwt_token())
+        self.assertEqual(code, 202)
+        job = self.wait_for_job(payload["job"]["job_id"])
 
         code, status_payload = self.request("GET", "/status", token=self.jwt_token())
         self.assertEqual(code, 200)
-        self.assertIsNotNone(status_payload["last_successful_operation_timestamp"])
+        self.assertEqual(status_payload["last_successful_operation_timestamp"], job["finished_at"])
+
+    def test_concurrent_identical_ops_coalesce_into_one_job(self) -> None:
+        release = threading.Event()
+        runs: list[int] = []
+
+        def slow_flush() -> str:
+            runs.append(1)
+            release.wait(timeout=5)
+            return "cache flush completed"
+
+        route = server.JOB_OPERATIONS["/ops/cache/flush"]
+        with unittest.mock.patch.dict(server.JOB_OPERATIONS, {"/ops/cache/flush": (route[0], route[1], slow_flush)}):
+            job_ids = set()
+            coalesced = []
+            for _ in range(3):
+                code, payload = self.request("POST", "/ops/cache/flush", token=self.jwt_token())
+                self.assertEqual(code, 202)
+                job_ids.add(payload["job"]["job_id"])
+                coalesced.append(payload["coalesced"])
+            self.assertIsNone(server.get_last_successful_operation_timestamp())
+            release.set()
+            job = self.wait_for_job(job_ids.pop())
+
+        self.assertEqual(coalesced, [False, True, True])
+        self.assertEqual(len(job_ids), 0)
+        self.assertEqual(len(runs), 1)
+        self.assertEqual(job["state"], "succeeded")
+
+    def test_failed_job_does_not_update_last_success_timestamp(self) -> None:
+        def broken_cron() -> str:
+            raise RuntimeError("cron runner unavailable")
+
+        route = server.JOB_OPERATIONS["/ops/cron/run"]
+        with unittest.mock.patch.dict(server.JOB_OPERATIONS, {"/ops/cron/run": (route[0], route[1], broken_cron)}):
+            code, payload = self.request("POST", "/ops/cron/run", token=self.jwt_token())
+        self.assertEqual(code, 202)
+        job = self.wait_for_job(payload["job"]["job_id"])
+        self.assertEqual(job["state"], "failed")
+        self.assertEqual(job["error_code"], "OPERATION_FAILED")
+        self.assertIsNone(server.get_last_successful_operation_timestamp())
+
+    def test_ops_history_pages_newest_first(self) -> None:
+        for _ in range(3):
+            code, payload = self.request("POST", "/ops/cron/run", token=self.jwt_token())
+            self.wait_for_job(payload["job"]["job_id"])
+        self.request("POST", "/ops/diagnostics", token=self.jwt_token())
+
+        code, page = self.request("GET", "/ops/history?limit=2", token=self.jwt_token())
+        self.assertEqual(code, 200)
+        self.assert_common_success(page)
+        self.assertEqual([r["operation"] for r in page["history"]], ["ops.diagnostics", "ops.cron.run"])
+        self.assertEqual(page["history"][0]["actor"], "test-suite")
+        self.assertEqual(page["history"][0]["outcome"], "success")
+
+        code, rest = self.request("GET", f"/ops/history?limit=2&before={page['next_before']}", token=self.jwt_token())
+        self.assertEqual(code, 200)
+        self.assertEqual([r["seq"] for r in rest["history"]], [2, 1])
+        code, last = self.request("GET", "/ops/history?limit=2&before=1", token=self.jwt_token())
+        self.assertEqual((last["history"], last["next_before"]), ([], None))
+
+    def test_ops_history_requires_auth_and_bounded_limit(self) -> None:
+        code, _ = self.request("GET", "/ops/history")
+        self.assertEqual(code, 401)
+        for query in ["limit=0", "limit=201", "before=x"]:
+            with self.subTest(query=query):
+                code, payload = self.request("GET", f"/ops/history?{query}", token=self.jwt_token())
+                self.assertEqual(code, 400)
+                self.assertEqual(payload["error_code"], "INVALID_QUERY")
+
+    def test_unknown_job_returns_not_found(self) -> None:
+        code, payload = self.request("GET", "/ops/jobs/does-not-exist", token=self.jwt_token())
+        self.assertEqual(code, 404)
+        self.assert_common_failure(payload)
+        self.assertEqual(payload["error_code"], "JOB_NOT_FOUND")
 
     def test_verify_smoke_response_contains_summary(self) -> None:
+        self.start_stub_store()
         code, payload = self.request("POST", "/verify/smoke", token=self.jwt_token())
         self.assertEqual(code, 200)
         self.assert_common_success(payload)
         self.assertEqual(payload["smoke"]["result"], "pass")
-        self.assertGreaterEqual(len(payload["smoke"]["checks"]), 1)
+        self.assertFalse(payload["smoke"]["cached"])
+        self.assertEqual(
+            [check["name"] for check in payload["smoke"]["checks"]], [check.name for check in server.SMOKE_CHECKS]
+        )
+        for check in payload["smoke"]["checks"]:
+            self.assertEqual(check["status"], "pass")
+            self.assertIn("duration_ms", check)
+
+        code, repeat = self.request("POST", "/verify/smoke", token=self.jwt_token())
+        self.assertEqual(code, 200)
+        self.assertTrue(repeat["smoke"]["cached"])
+        self.assertEqual(repeat["smoke"]["run_id"], payload["smoke"]["run_id"])
+
+    def test_verify_smoke_fails_on_unconfigured_or_failing_check(self) -> None:
+        code, payload = self.request("POST", "/verify/smoke", token=self.jwt_token())
+        self.assertEqual(code, 503)
+        self.assert_common_failure(payload)
+        self.assertEqual(payload["error_code"], "SMOKE_FAILED")
+        statuses = {check["name"]: check["status"] for check in payload["smoke"]["checks"]}
+        self.assertEqual(set(statuses.values()), {"skipped"})
+
+        server.SMOKE.reset()
+        self.start_stub_store()
+        with unittest.mock.patch.object(StubStoreHandler, "graphql_errors", True):
+            code, payload = self.request("POST", "/verify/smoke", token=self.jwt_token())
+        self.assertEqual(code, 503)
+        checks = payload["smoke"]["checks"]
+        failed = {check["name"]: check.get("detail") for check in checks if check["status"] == "fail"}
+        self.assertEqual(failed, {"catalog-product-query": "graphql errors", "cart-create": "graphql errors"})
+        self.assertIsNone(server.get_last_successful_operation_timestamp())
+
+    def test_verify_smoke_drops_storefront_check_when_storefront_disabled(self) -> None:
+        self.start_stub_store(AGENT_STOREFRONT_ENABLED="0", AGENT_SMOKE_STOREFRONT_URL="http://127.0.0.1:1/")
+        code, payload = self.request("POST", "/verify/smoke", token=self.jwt_token())
+        self.assertEqual(code, 200)
+        names = [check["name"] for check in payload["smoke"]["checks"]]
+        self.assertNotIn("storefront-home", names)
+        self.assertEqual(len(names), len(server.SMOKE_CHECKS) - 1)
+
+    def test_verify_smoke_enforces_suite_budget(self) -> None:
+        self.start_stub_store()
+        with unittest.mock.patch.object(StubStoreHandler, "delay_seconds", 2.0):
+            started = time.monotonic()
+            code, payload = self.request("POST", "/verify/smoke", token=self.jwt_token())
+            elapsed = time.monotonic() - started
+        self.assertEqual(code, 503)
+        self.assertLess(elapsed, 1.8)
+        statuses = {check["name"]: check["status"] for check in payload["smoke"]["checks"]}
+        self.assertEqual(statuses["catalog-product-query"], "fail")
+        self.assertEqual(statuses["storefront-home"], "pass")
 
     def test_unknown_route_returns_not_found(self) -> None:
         code, payload = self.request("GET", "/unknown", token=self.jwt_token())
@@ -190,6 +423,1042 @@ class ShopAgentServerTests(unittest.TestCase):
         self.assert_common_failure(payload)
         self.assertEqual(payload["error_code"], "UNAUTHORIZED")
 
+    def test_repeated_token_is_served_from_verified_cache(self) -> None:
+        token = self.jwt_token()
+        for _ in range(3):
+            code, _ = self.request("GET", "/status", token=token)
+            self.assertEqual(code, 200)
+        stats = server.JWT_CACHE.stats()
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["hits"], 2)
+
+    def test_rejected_token_is_not_cached(self) -> None:
+        token = self.jwt_token(secret="wrong-secret")
+        for _ in range(2):
+            code, _ = self.request("GET", "/status", token=token)
+            self.assertEqual(code, 401)
+        self.assertEqual(server.JWT_CACHE.stats()["size"], 0)
+
+    def test_reloaded_settings_apply_to_next_request(self) -> None:
+        env = dict(os.environ, STORE_ID="shop-009", DEPLOYMENT_VERSION="rotated")
+        try:
+            server.reload_settings(env)
+            code, payload = self.request("GET", "/health")
+            self.assertEqual(code, 200)
+            self.assertEqual(payload["store_id"], "shop-009")
+        finally:
+            server.reload_settings()
+
+    def test_settings_reload_clears_verified_tokens(self) -> None:
+        code, _ = self.request("GET", "/status", token=self.jwt_token())
+        self.assertEqual(code, 200)
+        env = dict(os.environ, AGENT_JWT_SECRET="rotated-secret")
+        try:
+            server.reload_settings(env)
+            code, _ = self.request("GET", "/status", token=self.jwt_token())
+            self.assertEqual(code, 401)
+        finally:
+            server.reload_settings()
+
+    def test_keyring_accepts_current_and_previous_kid(self) -> None:
+        now = int(time.time())
+        keys = [
+            {"kid": "2026-10", "secret": "current-secret", "not_before": now - 60},
+            {"kid": "2026-09", "secret": "previous-secret", "not_after": now + 60},
+            {"kid": "2026-08", "secret": "retired-secret", "not_after": now - 1},
+        ]
+        env = dict(os.environ, AGENT_JWT_KEYS=json.dumps(keys))
+        try:
+            server.reload_settings(env)
+            cases = [
+                ("current", self.jwt_token(kid="2026-10", secret="current-secret"), 200),
+                ("previous", self.jwt_token(kid="2026-09", secret="previous-secret"), 200),
+                ("legacy", self.jwt_token(), 200),
+                ("retired", self.jwt_token(kid="2026-08", secret="retired-secret"), 401),
+                ("unknown", self.jwt_token(kid="2027-01", secret="current-secret"), 401),
+                ("mismatched", self.jwt_token(kid="2026-10", secret="previous-secret"), 401),
+            ]
+            for label, token, expected in cases:
+                with self.subTest(key=label):
+                    code, _ = self.request("GET", "/status", token=token)
+                    self.assertEqual(code, expected)
+        finally:
+            server.reload_settings()
+
+    def test_unknown_kid_rejected_before_payload_is_decoded(self) -> None:
+        token = self.jwt_token(kid="unknown")
+        header_b64 = token.split(".")[0]
+        with unittest.mock.patch.object(server, "b64url_decode", wraps=server.b64url_decode) as decode:
+            code, _ = self.request("GET", "/status", token=token)
+        self.assertEqual(code, 401)
+        self.assertEqual([call.args[0] for call in decode.call_args_list], [header_b64])
+
+    def test_status_reads_probed_component_snapshot(self) -> None:
+        code, payload = self.request("GET", "/status", token=self.jwt_token())
+        self.assertEqual(code, 200)
+        self.assertEqual(set(payload["component_states"].values()), {"unknown"})
+        self.assertIsNone(payload["component_states_checked_at"])
+
+        env = dict(os.environ, AGENT_PROBE_BACKEND_URL=f"http://127.0.0.1:{self.port}/health")
+        server.PROBER.refresh(server.Settings.from_env(env))
+        code, payload = self.request("GET", "/status", token=self.jwt_token())
+        self.assertEqual(payload["component_states"]["backend_reachable"], "yes")
+        self.assertEqual(payload["component_states"]["cache_reachable"], "unknown")
+        self.assertIsNotNone(payload["component_states_checked_at"])
+
+    def post_idempotent(
+        self, path: str, key: str, actor: str = "test-suite", port: int | None = None
+    ) -> tuple[int, dict, str | None]:
+        conn = http.client.HTTPConnection("127.0.0.1", port or self.port, timeout=5)
+        headers = {"Authorization": f"Bearer {self.jwt_token()}", "X-Actor-Id": actor, "Idempotency-Key": key}
+        conn.request("POST", path, headers=headers)
+        resp = conn.getresponse()
+        payload = json.loads(resp.read().decode("utf-8"))
+        conn.close()
+        return resp.status, payload, resp.getheader("Idempotent-Replayed")
+
+    def test_idempotency_key_replays_first_response(self) -> None:
+        code, first, replayed = self.post_idempotent("/ops/index/reindex", "deploy-42")
+        self.assertEqual(code, 202)
+        self.assertIsNone(replayed)
+        code, retry, replayed = self.post_idempotent("/ops/index/reindex", "deploy-42")
+        self.assertEqual(code, 202)
+        self.assertEqual(replayed, "true")
+        self.assertEqual(retry, first)
+
+        _, other_key, _ = self.post_idempotent("/ops/index/reindex", "deploy-43")
+        _, other_actor, _ = self.post_idempotent("/ops/index/reindex", "deploy-42", actor="operator")
+        self.assertNotEqual(other_key["request_id"], first["request_id"])
+        self.assertNotEqual(other_actor["request_id"], first["request_id"])
+
+        _, _, body = self.request_text("/metrics", token=self.jwt_token())
+        self.assertIn('shop_agent_idempotency_requests_total{result="miss"} 3', body)
+        self.assertIn('shop_agent_idempotency_requests_total{result="hit"} 1', body)
+
+    def test_idempotent_retry_waits_for_in_flight_call(self) -> None:
+        self.start_stub_store()
+        # The shared fixture server is single-threaded; overlapping calls need the pooled server.
+        pooled = server.AgentHTTPServer(
+            ("127.0.0.1", 0), server.Handler, max_workers=4, max_in_flight=4, idle_timeout=2
+        )
+        thread = threading.Thread(target=pooled.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(thread.join, 5)
+        self.addCleanup(pooled.server_close)
+        self.addCleanup(pooled.shutdown)
+        port = pooled.server_address[1]
+
+        results: list[tuple[int, dict, str | None]] = []
+        with unittest.mock.patch.object(StubStoreHandler, "delay_seconds", 0.3):
+            workers = [
+                threading.Thread(
+                    target=lambda: results.append(self.post_idempotent("/verify/smoke", "wave-1", port=port))
+                )
+                for _ in range(2)
+            ]
+            workers[0].start()
+            time.sleep(0.1)
+            workers[1].start()
+            for worker in workers:
+                worker.join(timeout=5)
+        self.assertEqual([code for code, _, _ in results], [200, 200])
+        self.assertEqual(results[0][1]["request_id"], results[1][1]["request_id"])
+        self.assertEqual(sorted(str(replayed) for _, _, replayed in results), ["None", "true"])
+        _, _, body = self.request_text("/metrics", token=self.jwt_token())
+        self.assertIn('shop_agent_idempotency_requests_total{result="joined"} 1', body)
+
+    def test_transient_failure_is_not_replayed(self) -> None:
+        first_code, first, _ = self.post_idempotent("/verify/smoke", "retry-me")
+        second_code, second, replayed = self.post_idempotent("/verify/smoke", "retry-me")
+        self.assertEqual((first_code, second_code), (503, 503))
+        self.assertIsNone(replayed)
+        self.assertNotEqual(first["request_id"], second["request_id"])
+
+        code, payload, _ = self.post_idempotent("/verify/smoke", "x" * 256)
+        self.assertEqual(code, 400)
+        self.assertEqual(payload["error_code"], "INVALID_IDEMPOTENCY_KEY")
+
+    def test_rate_limited_actor_gets_retry_after(self) -> None:
+        env = dict(os.environ, AGENT_RATE_LIMITS="ops.diagnostics=2/60")
+        try:
+            server.reload_settings(env)
+            for _ in range(2):
+                code, _ = self.request("POST", "/ops/diagnostics", token=self.jwt_token())
+                self.assertEqual(code, 200)
+            conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=5)
+            conn.request("POST", "/ops/diagnostics", headers={
+                "Authorization": f"Bearer {self.jwt_token()}", "X-Actor-Id": "test-suite"
+            })
+            resp = conn.getresponse()
+            payload = json.loads(resp.read().decode("utf-8"))
+            conn.close()
+            self.assertEqual(resp.status, 429)
+            self.assert_common_failure(payload)
+            self.assertEqual(payload["error_code"], "RATE_LIMITED")
+            self.assertTrue(payload["retryable"])
+            self.assertGreaterEqual(int(resp.getheader("Retry-After", "0")), 1)
+
+            code, _ = self.request("POST", "/verify/smoke", token=self.jwt_token())
+            self.assertNotEqual(code, 429)
+            _, _, body = self.request_text("/metrics", token=self.jwt_token())
+            self.assertIn(
+                'shop_agent_requests_shed_total{reason="rate_limited",operation="ops.diagnostics"} 1', body
+            )
+        finally:
+            server.reload_settings()
+
+    def request_text(self, path: str, token: str | None = None) -> tuple[int, str, str]:
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=5)
+        headers = {"X-Actor-Id": "test-suite"}
+        if token is not None:
+            headers["Authorization"] = f"Bearer {token}"
+        conn.request("GET", path, headers=headers)
+        resp = conn.getresponse()
+        body = resp.read().decode("utf-8")
+        conn.close()
+        return resp.status, resp.getheader("Content-Type", ""), body
+
+    def test_metrics_requires_auth(self) -> None:
+        code, payload = self.request("GET", "/metrics")
+        self.assertEqual(code, 401)
+        self.assertEqual(payload["error_code"], "UNAUTHORIZED")
+
+    def test_metrics_exports_prometheus_text(self) -> None:
+        self.request("GET", "/health")
+        self.request("GET", "/status")
+        self.request("GET", "/nope/123", token=self.jwt_token())
+
+        code, content_type, body = self.request_text("/metrics", token=self.jwt_token())
+        self.assertEqual(code, 200)
+        self.assertTrue(content_type.startswith("text/plain"))
+        self.assertIn(
+            'shop_agent_requests_total{route="/health",method="GET",outcome="success",code="200"} 1', body
+        )
+        self.assertIn('shop_agent_requests_total{route="unmatched",method="GET",outcome="failure",code="404"} 1', body)
+        self.assertIn("shop_agent_auth_failures_total 1", body)
+        self.assertIn('shop_agent_request_duration_seconds_bucket{route="/status",outcome="failure",le="+Inf"} 1', body)
+        self.assertIn("# TYPE shop_agent_request_duration_seconds histogram", body)
+        self.assertIn("shop_agent_requests_in_flight 1", body)
+
+
+class AsyncLogWriterTests(unittest.TestCase):
+    def test_records_are_written_as_json_lines_on_close(self) -> None:
+        stream = io.StringIO()
+        writer = server.AsyncLogWriter(stream=stream)
+        for code in (200, 401):
+            writer.emit({"event": "audit", "http_code": code})
+        writer.close()
+        lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual([line["http_code"] for line in lines], [200, 401])
+
+    def test_drop_policy_counts_overflow_without_blocking(self) -> None:
+        release = threading.Event()
+
+        class StalledStream(io.StringIO):
+            def write(self, data: str) -> int:
+                release.wait(timeout=5)
+                return super().write(data)
+
+        stream = StalledStream()
+        writer = server.AsyncLogWriter(max_queue=2, overflow="drop", stream=stream)
+        started = time.perf_counter()
+        for index in range(20):
+            writer.emit({"event": "audit", "index": index})
+        elapsed = time.perf_counter() - started
+        release.set()
+        writer.close()
+        self.assertLess(elapsed, 1.0)
+        self.assertGreater(writer.dropped, 0)
+        self.assertEqual(len(stream.getvalue().splitlines()) + writer.dropped, 20)
+
+    def test_audit_record_keeps_non_sensitive_fields(self) -> None:
+        stream = io.StringIO()
+        writer = server.AsyncLogWriter(stream=stream)
+        with unittest.mock.patch.object(server, "LOGGER", writer):
+            server.log_event("audit", store_id="shop-001", actor="ci", outcome="success", http_code=200, error_code=None)
+        writer.close()
+        record = json.loads(stream.getvalue())
+        self.assertEqual(record["component"], "shop-agent")
+        self.assertEqual(
+            {key: record[key] for key in ("store_id", "actor", "outcome", "http_code", "error_code")},
+            {"store_id": "shop-001", "actor": "ci", "outcome": "success", "http_code": 200, "error_code": None},
+        )
+
+
+class MetricsRegistryTests(unittest.TestCase):
+    def test_histogram_buckets_are_cumulative(self) -> None:
+        registry = server.MetricsRegistry()
+        registry.describe("latency_seconds", "histogram", "Latency.", ("route",))
+        for seconds in (0.0004, 0.002, 0.002, 50.0):
+            registry.observe("latency_seconds", seconds, "/x")
+        body = registry.render()
+        self.assertIn('latency_seconds_bucket{route="/x",le="0.0005"} 1', body)
+        self.assertIn('latency_seconds_bucket{route="/x",le="0.0025"} 3', body)
+        self.assertIn('latency_seconds_bucket{route="/x",le="30.0"} 3', body)
+        self.assertIn('latency_seconds_bucket{route="/x",le="+Inf"} 4', body)
+        self.assertIn('latency_seconds_count{route="/x"} 4', body)
+
+    def test_recording_cost_stays_in_microseconds(self) -> None:
+        registry = server.MetricsRegistry()
+        registry.describe("hits_total", "counter", "Hits.", ("route", "code"))
+        registry.describe("latency_seconds", "histogram", "Latency.", ("route",))
+        rounds = 20000
+        started = time.perf_counter()
+        for _ in range(rounds):
+            registry.inc("hits_total", "/status", "200")
+            registry.observe("latency_seconds", 0.003, "/status")
+        per_request_us = (time.perf_counter() - started) / rounds * 1_000_000
+        self.assertLess(per_request_us, 50.0)
+
+
+class SettingsTests(unittest.TestCase):
+    def base_env(self, **overrides: str) -> dict[str, str]:
+        env = {"AGENT_AUTH_MODE": "jwt", "AGENT_JWT_SECRET": "test-secret"}
+        env.update(overrides)
+        return env
+
+    def test_defaults_are_applied(self) -> None:
+        settings = server.Settings.from_env(self.base_env())
+        self.assertEqual(settings.store_id, "unknown-store")
+        self.assertEqual(settings.jwt_leeway_seconds, 5)
+        self.assertEqual(settings.server_mode, "pool")
+
+    def test_invalid_integer_fails_fast(self) -> None:
+        with self.assertRaisesRegex(ValueError, "AGENT_JWT_LEEWAY_SECONDS"):
+            server.Settings.from_env(self.base_env(AGENT_JWT_LEEWAY_SECONDS="five"))
+
+    def test_jwt_mode_requires_secret(self) -> None:
+        with self.assertRaisesRegex(ValueError, "AGENT_JWT_SECRET"):
+            server.Settings.from_env(self.base_env(AGENT_JWT_SECRET=""))
+
+    def test_jwt_keys_alone_satisfy_jwt_mode(self) -> None:
+        keys = json.dumps([{"kid": "k1", "secret": "s1"}])
+        settings = server.Settings.from_env(self.base_env(AGENT_JWT_SECRET="", AGENT_JWT_KEYS=keys))
+        self.assertEqual([key.kid for key in settings.jwt_keys.keys], ["k1"])
+        self.assertNotIn("s1", repr(settings))
+
+    def test_malformed_jwt_keys_rejected_without_echoing_secret(self) -> None:
+        for raw in ('{"kid": "k1"}', '[{"kid": "k1", "secret": "hunter2", "not_after": "soon"}]', "[{"):
+            with self.subTest(raw=raw):
+                with self.assertRaisesRegex(ValueError, "AGENT_JWT_KEYS") as caught:
+                    server.Settings.from_env(self.base_env(AGENT_JWT_KEYS=raw))
+                self.assertNotIn("hunter2", str(caught.exception))
+        duplicate = json.dumps([{"kid": "k1", "secret": "a"}, {"kid": "k1", "secret": "b"}])
+        with self.assertRaisesRegex(ValueError, "repeat"):
+            server.Settings.from_env(self.base_env(AGENT_JWT_KEYS=duplicate))
+
+    def test_unknown_auth_mode_rejected(self) -> None:
+        with self.assertRaisesRegex(ValueError, "AGENT_AUTH_MODE"):
+            server.Settings.from_env(self.base_env(AGENT_AUTH_MODE="none"))
+
+    def test_malformed_rate_limit_rejected(self) -> None:
+        with self.assertRaisesRegex(ValueError, "AGENT_RATE_LIMITS"):
+            server.Settings.from_env(self.base_env(AGENT_RATE_LIMITS="ops.cron.run=fast"))
+        settings = server.Settings.from_env(self.base_env(AGENT_RATE_LIMITS="ops.cron.run=3/60, verify.smoke=1/5"))
+        self.assertEqual(settings.rate_limits, (("ops.cron.run", 3, 60.0), ("verify.smoke", 1, 5.0)))
+
+    def test_settings_file_overrides_environment(self) -> None:
+        with tempfile.NamedTemporaryFile("w", suffix=".env", delete=False) as handle:
+            handle.write("# rotated values\nDEPLOYMENT_VERSION=2026.10\n")
+        self.addCleanup(os.unlink, handle.name)
+        env = dict(os.environ, AGENT_SETTINGS_FILE=handle.name)
+        with unittest.mock.patch.dict(os.environ, env, clear=True):
+            self.assertEqual(server.settings_source()["DEPLOYMENT_VERSION"], "2026.10")
+
+    def test_profile_settings_are_bounded(self) -> None:
+        settings = server.Settings.from_env(self.base_env())
+        self.assertEqual((settings.profile_seconds, settings.profile_interval_seconds), (30.0, 0.01))
+        self.assertEqual(settings.profile_dir, tempfile.gettempdir())
+        for name, value in (("AGENT_PROFILE_SECONDS", "601"), ("AGENT_PROFILE_INTERVAL_MS", "0")):
+            with self.subTest(name=name):
+                with self.assertRaisesRegex(ValueError, name):
+                    server.Settings.from_env(self.base_env(**{name: value}))
+
+    def test_prefork_requires_a_shared_journal_directory(self) -> None:
+        with self.assertRaisesRegex(ValueError, "AGENT_JOURNAL_DIR"):
+            server.Settings.from_env(self.base_env(AGENT_PROCESSES="2"))
+        settings = server.Settings.from_env(self.base_env(AGENT_PROCESSES="2", AGENT_JOURNAL_DIR="/tmp/journal"))
+        self.assertEqual(settings.journal_dir, "/tmp/journal")
+
+    def test_rejected_reload_keeps_previous_snapshot(self) -> None:
+        before = server.reload_settings(self.base_env())
+        with self.assertRaises(ValueError):
+            server.reload_settings(self.base_env(PORT="not-a-port"))
+        self.assertIs(server.current_settings(), before)
+        configure_test_env()
+
+    def test_sighup_reloads_on_the_reload_thread(self) -> None:
+        threads = []
+        done = threading.Event()
+
+        def reload() -> None:
+            threads.append(threading.get_ident())
+            done.set()
+
+        reloader = server.SettingsReloader("test-settings-reload", reload)
+        reloader.start()
+        previous = signal.signal(signal.SIGHUP, server._handle_sighup)
+        self.addCleanup(signal.signal, signal.SIGHUP, previous)
+        with unittest.mock.patch.object(server, "RELOADER", reloader):
+            # A reload in progress holds the lock; the signal handler must not wait for it.
+            with reloader.lock:
+                os.kill(os.getpid(), signal.SIGHUP)
+                self.assertFalse(done.wait(0.1))
+            self.assertTrue(done.wait(2))
+        self.assertEqual(len(threads), 1)
+        self.assertNotEqual(threads[0], threading.get_ident())
+
+
+class ComponentProberTests(unittest.TestCase):
+    def closed_port(self) -> int:
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            return sock.getsockname()[1]
+
+    def test_unreachable_targets_report_no(self) -> None:
+        port = self.closed_port()
+        env = dict(
+            TEST_ENV,
+            AGENT_PROBE_SEARCH_URL=f"http://127.0.0.1:{port}/",
+            AGENT_PROBE_CACHE_ADDRESS=f"127.0.0.1:{port}",
+            AGENT_PROBE_TIMEOUT_SECONDS="0.5",
+        )
+        prober = server.ComponentProber()
+        prober.refresh(server.Settings.from_env(env))
+        states, checked_at = prober.snapshot(ttl_seconds=30)
+        self.assertEqual(
+            states, {"backend_reachable": "unknown", "search_reachable": "no", "cache_reachable": "no"}
+        )
+        self.assertIsNotNone(checked_at)
+
+    def test_stale_snapshot_reports_unknown(self) -> None:
+        env = dict(TEST_ENV, AGENT_PROBE_CACHE_ADDRESS=f"127.0.0.1:{self.closed_port()}")
+        prober = server.ComponentProber()
+        prober.refresh(server.Settings.from_env(env))
+        time.sleep(0.01)
+        states, checked_at = prober.snapshot(ttl_seconds=0.001)
+        self.assertEqual(states["cache_reachable"], "unknown")
+        self.assertIsNotNone(checked_at)
+
+
+class RateLimiterTests(unittest.TestCase):
+    def test_buckets_are_per_actor_and_refill(self) -> None:
+        limiter = server.RateLimiter()
+        limiter.configure((("ops.cron.run", 1, 0.05),))
+        self.assertEqual(limiter.acquire("ci", "ops.cron.run"), 0.0)
+        self.assertGreater(limiter.acquire("ci", "ops.cron.run"), 0.0)
+        self.assertEqual(limiter.acquire("operator", "ops.cron.run"), 0.0)
+        self.assertEqual(limiter.acquire("ci", "verify.smoke"), 0.0)
+        time.sleep(0.06)
+        self.assertEqual(limiter.acquire("ci", "ops.cron.run"), 0.0)
+
+    def test_bucket_count_is_bounded(self) -> None:
+        limiter = server.RateLimiter(max_buckets=2)
+        limiter.configure((("ops.cron.run", 1, 60.0),))
+        for actor in ("a", "b", "c"):
+            limiter.acquire(actor, "ops.cron.run")
+        self.assertEqual(limiter.acquire("a", "ops.cron.run"), 0.0)
+        self.assertGreater(limiter.acquire("c", "ops.cron.run"), 0.0)
+
+
+class IdempotencyCacheTests(unittest.TestCase):
+    def test_completed_entry_expires_after_ttl(self) -> None:
+        cache = server.IdempotencyCache()
+        key = ("ci", "/ops/cron/run", "k")
+        entry, owner = cache.begin(key)
+        self.assertTrue(owner)
+        self.assertFalse(cache.begin(key)[1])
+        response = server.StoredResponse(202, b"{}", "application/json", {}, "success", None)
+        cache.complete(key, entry, response, ttl=0.01)
+        self.assertIs(cache.begin(key)[0].response, response)
+        time.sleep(0.02)
+        self.assertTrue(cache.begin(key)[1])
+
+    def test_unreplayable_response_releases_key_and_size_is_bounded(self) -> None:
+        cache = server.IdempotencyCache(max_entries=2)
+        entry, _ = cache.begin(("ci", "/verify/smoke", "k"))
+        cache.complete(("ci", "/verify/smoke", "k"), entry, None, ttl=60)
+        self.assertTrue(entry.done.is_set())
+        self.assertTrue(cache.begin(("ci", "/verify/smoke", "k"))[1])
+        for name in ("a", "b"):
+            cache.begin(("ci", "/verify/smoke", name))
+        self.assertTrue(cache.begin(("ci", "/verify/smoke", "k"))[1])
+
+
+class SharedStateStoreTests(unittest.TestCase):
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.store = server.SharedStateStore(directory.name)
+
+    def test_last_success_only_moves_forward(self) -> None:
+        self.store.record_success("2026-10-17T10:00:00+00:00")
+        self.store.record_success("2026-10-17T09:00:00+00:00")
+        self.assertEqual(self.store.last_success(), "2026-10-17T10:00:00+00:00")
+
+    def test_claim_joins_live_job_and_takes_over_dead_owner(self) -> None:
+        first = {"job_id": "a" * 32, "operation": "ops.cron.run", "finished_at": None}
+        second = {"job_id": "b" * 32, "operation": "ops.cron.run", "finished_at": None}
+        self.assertIsNone(self.store.claim("ops.cron.run", first))
+        self.assertEqual(self.store.claim("ops.cron.run", second), first)
+
+        self.store.write("active/ops.cron.run.json", {"job_id": first["job_id"], "pid": 2**22 + 1})
+        self.assertIsNone(self.store.claim("ops.cron.run", second))
+        self.store.release("ops.cron.run", second["job_id"], retain=1)
+        self.assertEqual(os.listdir(os.path.join(self.store.directory, "active")), [])
+        self.assertEqual(len(os.listdir(os.path.join(self.store.directory, "jobs"))), 1)
+
+    def test_job_ids_cannot_escape_the_state_directory(self) -> None:
+        self.store.write("last-success.json", {"timestamp": "x"})
+        self.assertIsNone(self.store.load_job("../last-success"))
+
+    def test_job_managers_share_jobs_across_processes(self) -> None:
+        server.configure_shared_state(self.store.directory)
+        self.addCleanup(server.configure_shared_state, None)
+        self.addCleanup(server.reset_state_for_tests)
+        release = threading.Event()
+        worker_a, worker_b = server.JobManager(), server.JobManager()
+
+        job, coalesced = worker_a.submit("ops.index.reindex", "ci", lambda: str(release.wait(timeout=5)))
+        joined, joined_coalesced = worker_b.submit("ops.index.reindex", "ci", lambda: "unexpected")
+        self.assertEqual((coalesced, joined_coalesced), (False, True))
+        self.assertEqual(joined["job_id"], job["job_id"])
+
+        release.set()
+        self.assertTrue(worker_a.drain(timeout=5))
+        finished = worker_b.get(job["job_id"])
+        assert finished is not None
+        self.assertEqual(finished["state"], "succeeded")
+        self.assertEqual(server.get_last_successful_operation_timestamp(), finished["finished_at"])
+
+
+@unittest.skipUnless(hasattr(os, "fork") and hasattr(socket, "SO_REUSEPORT"), "pre-fork needs fork and SO_REUSEPORT")
+class OperationJournalTests(unittest.TestCase):
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def journal(self, segment_bytes: int = 4096, max_segments: int = 2) -> tuple[object, str | None]:
+        journal = server.OperationJournal()
+        recovered = journal.configure(self.directory, segment_bytes, max_segments)
+        self.addCleanup(journal.close)
+        return journal, recovered
+
+    def append(self, journal, finished_at: str, outcome: str = "success") -> None:
+        error_code = None if outcome == "success" else "OPERATION_FAILED"
+        journal.append("ops.cron.run", "ci", finished_at, finished_at, 1.0, outcome, error_code)
+
+    def test_restart_recovers_last_success_and_history(self) -> None:
+        journal, recovered = self.journal()
+        self.assertIsNone(recovered)
+        self.append(journal, "2026-10-17T10:00:00+00:00")
+        self.append(journal, "2026-10-17T11:00:00+00:00", outcome="failure")
+        journal.close()
+
+        restarted, recovered = self.journal()
+        self.assertEqual(recovered, "2026-10-17T10:00:00+00:00")
+        self.assertEqual([r["seq"] for r in restarted.history(None, 10)], [2, 1])
+        self.append(restarted, "2026-10-17T12:00:00+00:00")
+        restarted.close()
+        self.assertEqual(restarted.history(None, 1)[0]["seq"], 3)
+
+    def test_rotation_compacts_into_checkpoint(self) -> None:
+        journal, _ = self.journal()
+        self.append(journal, "2026-10-17T09:00:00+00:00")
+        for minute in range(60):
+            journal.close()
+            self.append(journal, f"2026-10-17T10:{minute:02d}:00+00:00", outcome="failure")
+        journal.close()
+
+        segments = sorted(name for name in os.listdir(self.directory) if name.startswith("segment-"))
+        self.assertEqual(len(segments), 2)
+        self.assertNotIn("segment-000000000001.jsonl", segments)
+        history = journal.history(None, 200)
+        self.assertEqual(history[0]["seq"], 61)
+        self.assertEqual([r["seq"] for r in history], list(range(61, 61 - len(history), -1)))
+        # The only success lives in a deleted segment; the checkpoint still carries it.
+        _, recovered = self.journal()
+        self.assertEqual(recovered, "2026-10-17T09:00:00+00:00")
+
+    def test_torn_tail_is_cut_on_recovery(self) -> None:
+        journal, _ = self.journal()
+        self.append(journal, "2026-10-17T10:00:00+00:00")
+        journal.close()
+        (segment,) = [name for name in os.listdir(self.directory) if name.startswith("segment-")]
+        with open(os.path.join(self.directory, segment), "a", encoding="utf-8") as handle:
+            handle.write('{"seq":2,"operation":"ops.cr')
+
+        restarted, recovered = self.journal()
+        self.assertEqual(recovered, "2026-10-17T10:00:00+00:00")
+        self.append(restarted, "2026-10-17T11:00:00+00:00")
+        restarted.close()
+        self.assertEqual([r["seq"] for r in restarted.history(None, 10)], [2, 1])
+
+
+class PreforkServerTests(unittest.TestCase):
+    def setUp(self) -> None:
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            self.port = sock.getsockname()[1]
+        state_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(state_dir.cleanup)
+        self.state_dir = pathlib.Path(state_dir.name)
+        env = dict(
+            os.environ,
+            HOST="127.0.0.1",
+            PORT=str(self.port),
+            AGENT_AUTH_MODE="token",
+            AGENT_AUTH_TOKEN="prefork-token",
+            AGENT_PROCESSES="2",
+            AGENT_STATE_DIR=state_dir.name,
+            AGENT_JOURNAL_DIR=os.path.join(state_dir.name, "journal"),
+            AGENT_DRAIN_SECONDS="3",
+            AGENT_PROFILE_DIR=state_dir.name,
+            AGENT_PROFILE_SECONDS="0.2",
+        )
+        self.process = subprocess.Popen(
+            [sys.executable, str(SERVER_PATH)], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        self.addCleanup(self.process.kill)
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            try:
+                self.get("/health")
+                return
+            except OSError:
+                time.sleep(0.05)
+        self.fail("pre-fork agent did not start")
+
+    def get(self, path: str, method: str = "GET") -> tuple[int, dict]:
+        # A fresh connection per call lets the kernel pick either worker.
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=5)
+        conn.request(method, path, headers={"Authorization": "Bearer prefork-token"})
+        resp = conn.getresponse()
+        payload = json.loads(resp.read().decode("utf-8"))
+        conn.close()
+        return resp.status, payload
+
+    def test_status_is_consistent_across_workers_and_sigterm_drains(self) -> None:
+        code, accepted = self.get("/ops/cache/flush", method="POST")
+        self.assertEqual(code, 202)
+        job_id = accepted["job"]["job_id"]
+        deadline = time.monotonic() + 5
+        while True:
+            code, payload = self.get(f"/ops/jobs/{job_id}")
+            self.assertEqual(code, 200)
+            if payload["job"]["finished_at"] is not None or time.monotonic() > deadline:
+                break
+            time.sleep(0.02)
+        self.assertEqual(payload["job"]["state"], "succeeded")
+
+        answers = set()
+        for _ in range(8):
+            code, status = self.get("/status")
+            self.assertEqual(code, 200)
+            answers.add((status["last_successful_operation_timestamp"], json.dumps(status["component_states"])))
+        self.assertEqual(answers, {(payload["job"]["finished_at"], json.dumps(status["component_states"]))})
+
+        self.process.send_signal(signal.SIGTERM)
+        self.assertEqual(self.process.wait(timeout=10), 0)
+
+    def test_sigusr2_is_forwarded_so_each_worker_writes_a_profile(self) -> None:
+        self.process.send_signal(signal.SIGUSR2)
+        deadline = time.monotonic() + 5
+        while len(list(self.state_dir.glob("*.routes.json"))) < 2 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        pids = {json.loads(path.read_text(encoding="utf-8"))["pid"] for path in self.state_dir.glob("*.routes.json")}
+        self.assertEqual(len(pids), 2)
+        self.assertNotIn(self.process.pid, pids)
+
+
+class JwtKeyringTests(unittest.TestCase):
+    def test_signer_clones_prepared_state(self) -> None:
+        keyring = server.JwtKeyring((server.JwtKey("k1", "secret"),))
+        first = keyring.signer("k1", int(time.time()))
+        assert first is not None
+        first.update(b"payload-one")
+        second = keyring.signer("k1", int(time.time()))
+        assert second is not None
+        second.update(b"payload-two")
+        self.assertEqual(second.digest(), hmac.new(b"secret", b"payload-two", hashlib.sha256).digest())
+
+    def test_window_bounds_are_enforced(self) -> None:
+        keyring = server.JwtKeyring((server.JwtKey("k1", "secret", not_before=100, not_after=200),))
+        self.assertIsNone(keyring.signer("k1", 99))
+        self.assertIsNotNone(keyring.signer("k1", 150))
+        self.assertIsNone(keyring.signer("k1", 201))
+        self.assertIsNone(keyring.signer("k2", 150))
+
+
+class VerifiedTokenCacheTests(unittest.TestCase):
+    def test_entry_expires_at_deadline(self) -> None:
+        cache = server.VerifiedTokenCache(max_entries=4)
+        cache.add("live", time.time() + 60)
+        cache.add("stale", time.time() - 1)
+        self.assertTrue(cache.contains("live"))
+        self.assertFalse(cache.contains("stale"))
+        self.assertEqual(cache.stats(), {"size": 1, "hits": 1, "misses": 1})
+
+    def test_least_recently_used_entry_is_evicted(self) -> None:
+        cache = server.VerifiedTokenCache(max_entries=2)
+        deadline = time.time() + 60
+        cache.add("a", deadline)
+        cache.add("b", deadline)
+        self.assertTrue(cache.contains("a"))
+        cache.add("c", deadline)
+        self.assertTrue(cache.contains("a"))
+        self.assertFalse(cache.contains("b"))
+        self.assertTrue(cache.contains("c"))
+
+
+class PooledServerTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        configure_test_env()
+        cls.httpd = server.AgentHTTPServer(
+            ("127.0.0.1", 0), server.Handler, max_workers=4, max_in_flight=1, idle_timeout=2
+        )
+        cls.port = cls.httpd.server_address[1]
+        cls.thread = threading.Thread(target=cls.httpd.serve_forever, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.httpd.shutdown()
+        cls.httpd.server_close()
+        cls.thread.join(timeout=5)
+
+    def test_connection_is_kept_alive_across_requests(self) -> None:
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=5)
+        try:
+            for _ in range(3):
+                conn.request("GET", "/health", body="{}", headers={"Content-Type": "application/json"})
+                resp = conn.getresponse()
+                self.assertEqual(resp.status, 200)
+                self.assertEqual(resp.version, 11)
+                json.loads(resp.read().decode("utf-8"))
+            first_sock = conn.sock
+            conn.request("GET", "/health")
+            conn.getresponse().read()
+            self.assertIs(conn.sock, first_sock)
+        finally:
+            conn.close()
+
+    def test_health_served_while_request_slots_exhausted(self) -> None:
+        self.assertTrue(self.httpd.request_slots.acquire(blocking=False))
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=5)
+            conn.request("GET", "/health")
+            self.assertEqual(conn.getresponse().status, 200)
+            conn.close()
+
+            conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=5)
+            conn.request("POST", "/ops/cache/flush", body="{}")
+            resp = conn.getresponse()
+            payload = json.loads(resp.read().decode("utf-8"))
+            conn.close()
+            self.assertEqual(resp.status, 503)
+            self.assertEqual(payload["error_code"], "AGENT_BUSY")
+            self.assertTrue(payload["retryable"])
+            self.assertEqual(resp.getheader("Retry-After"), "1")
+        finally:
+            self.httpd.request_slots.release()
+
+    def test_idle_keep_alive_connections_do_not_hold_workers(self) -> None:
+        idle = []
+        for _ in range(8):
+            conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=5)
+            conn.request("GET", "/health")
+            conn.getresponse().read()
+            idle.append(conn)
+        # A bare connect that never sends a request must not take a worker either.
+        silent = socket.create_connection(("127.0.0.1", self.port))
+        try:
+            started = time.perf_counter()
+            conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=5)
+            conn.request("GET", "/health")
+            self.assertEqual(conn.getresponse().status, 200)
+            conn.close()
+            self.assertLess(time.perf_counter() - started, 0.5)
+            # Parked connections are resumed when their next request arrives.
+            for conn in idle:
+                conn.request("GET", "/health")
+                self.assertEqual(conn.getresponse().status, 200)
+        finally:
+            silent.close()
+            for conn in idle:
+                conn.close()
+
+    def test_pipelined_requests_are_all_answered(self) -> None:
+        with socket.create_connection(("127.0.0.1", self.port), timeout=5) as sock:
+            sock.sendall(b"GET /health HTTP/1.1\r\n\r\n" * 2 + b"GET /health HTTP/1.1\r\nConnection: close\r\n\r\n")
+            received = b""
+            while chunk := sock.recv(65536):
+                received += chunk
+        self.assertEqual(received.count(b"HTTP/1.1 200 OK"), 3)
+
+    def test_oversized_body_is_refused_before_it_is_read(self) -> None:
+        with socket.create_connection(("127.0.0.1", self.port), timeout=5) as sock:
+            sock.sendall(b"POST /ops/cache/flush HTTP/1.1\r\nContent-Length: 1000000000\r\n\r\n")
+            received = b""
+            while chunk := sock.recv(65536):
+                received += chunk
+        head, _, body = received.partition(b"\r\n\r\n")
+        self.assertTrue(head.startswith(b"HTTP/1.1 413"))
+        self.assertEqual(json.loads(body)["error_code"], "PAYLOAD_TOO_LARGE")
+
+    def test_idle_connection_is_closed_after_idle_timeout(self) -> None:
+        httpd = server.AgentHTTPServer(("127.0.0.1", 0), server.Handler, max_workers=1, idle_timeout=0.2)
+        thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(thread.join, 5)
+        self.addCleanup(httpd.server_close)
+        self.addCleanup(httpd.shutdown)
+        conn = http.client.HTTPConnection("127.0.0.1", httpd.server_address[1], timeout=5)
+        self.addCleanup(conn.close)
+        conn.request("GET", "/health")
+        conn.getresponse().read()
+        started = time.monotonic()
+        assert conn.sock is not None
+        self.assertEqual(conn.sock.recv(65536), b"")
+        self.assertLess(time.monotonic() - started, 2.0)
+
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+
+
+class TracingTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.httpd = HTTPServer(("127.0.0.1", 0), server.Handler)
+        cls.port = cls.httpd.server_address[1]
+        cls.thread = threading.Thread(target=cls.httpd.serve_forever, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.httpd.shutdown()
+        cls.httpd.server_close()
+        cls.thread.join(timeout=5)
+
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.export_file = pathlib.Path(tmp.name) / "spans.jsonl"
+        server.reset_state_for_tests()
+        self.addCleanup(configure_test_env)
+        self.addCleanup(server.TRACER.close)
+
+    def configure(self, **extra: str) -> None:
+        env = dict(TEST_ENV, AGENT_AUTH_MODE="token", AGENT_AUTH_TOKEN="trace-token")
+        env.update(AGENT_TRACE_EXPORT_FILE=str(self.export_file), **extra)
+        server.reload_settings(env)
+
+    def request(self, path: str, traceparent: str | None = None) -> tuple[int, dict]:
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=5)
+        headers = {"Authorization": "Bearer trace-token"}
+        if traceparent is not None:
+            headers["traceparent"] = traceparent
+        conn.request("GET", path, headers=headers)
+        resp = conn.getresponse()
+        payload = json.loads(resp.read().decode("utf-8"))
+        conn.close()
+        return resp.status, payload
+
+    def exported_spans(self, count: int = 0) -> list[dict]:
+        """Collect and remove exported spans, waiting up to a second for ``count`` of them.
+
+        The root span is recorded after the response is written, so it can trail the client's read.
+        The resource of the last export is kept in ``self.resource``.
+        """
+        spans: list[dict] = []
+        deadline = time.monotonic() + 1.0
+        while True:
+            server.TRACER.flush()
+            if self.export_file.exists():
+                for line in self.export_file.read_text(encoding="utf-8").splitlines():
+                    for resource in json.loads(line)["resourceSpans"]:
+                        self.resource = resource["resource"]
+                        for scope in resource["scopeSpans"]:
+                            spans.extend(scope["spans"])
+                self.export_file.unlink()
+            if len(spans) >= count or time.monotonic() > deadline:
+                return spans
+            time.sleep(0.01)
+
+    def test_traceparent_is_parsed_strictly(self) -> None:
+        self.assertEqual(
+            server.parse_traceparent(f"00-{TRACE_ID}-{PARENT_ID}-01"), (TRACE_ID, PARENT_ID, True)
+        )
+        self.assertEqual(server.parse_traceparent(f"01-{TRACE_ID}-{PARENT_ID}-02-extra"), (TRACE_ID, PARENT_ID, False))
+        for header in (
+            "", f"00-{TRACE_ID}-{PARENT_ID}", f"00-{TRACE_ID.upper()}-{PARENT_ID}-01", f"ff-{TRACE_ID}-{PARENT_ID}-01",
+            f"00-{'0' * 32}-{PARENT_ID}-01", f"00-{TRACE_ID}-{'0' * 16}-01", f"00-{TRACE_ID}-{PARENT_ID}-01-extra",
+        ):
+            with self.subTest(header=header):
+                self.assertIsNone(server.parse_traceparent(header))
+
+    def test_sampled_request_exports_server_auth_handler_and_write_spans(self) -> None:
+        self.configure(AGENT_TRACE_SAMPLE_RATIO="0")
+        code, payload = self.request("/status", f"00-{TRACE_ID}-{PARENT_ID}-01")
+        self.assertEqual(code, 200)
+        self.assertEqual(payload["trace_id"], TRACE_ID)
+        spans = {span["name"]: span for span in self.exported_spans(4)}
+        self.assertEqual(sorted(spans), ["GET /status", "auth", "handler", "write"])
+        root = spans["GET /status"]
+        self.assertEqual((root["traceId"], root["parentSpanId"], root["kind"]), (TRACE_ID, PARENT_ID, 2))
+        attributes = {entry["key"]: entry["value"] for entry in root["attributes"]}
+        self.assertEqual(attributes["http.route"], {"stringValue": "/status"})
+        self.assertEqual(attributes["http.response.status_code"], {"intValue": "200"})
+        self.assertEqual(spans["handler"]["parentSpanId"], root["spanId"])
+        self.assertEqual(spans["auth"]["parentSpanId"], spans["handler"]["spanId"])
+        self.assertEqual(spans["write"]["parentSpanId"], spans["handler"]["spanId"])
+        self.assertLessEqual(int(root["startTimeUnixNano"]), int(spans["auth"]["startTimeUnixNano"]))
+        self.assertIn({"key": "bolerdrop.store_id", "value": {"stringValue": "shop-001"}}, self.resource["attributes"])
+
+    def test_unsampled_or_untargeted_requests_record_nothing(self) -> None:
+        self.configure(AGENT_TRACE_SAMPLE_RATIO="1")
+        code, payload = self.request("/status", f"00-{TRACE_ID}-{PARENT_ID}-00")
+        self.assertEqual((code, payload["trace_id"]), (200, TRACE_ID))
+        self.assertEqual(self.exported_spans(), [])
+
+        # Without a parent the ratio decides; every trace is kept at 1 and none at 0.
+        code, payload = self.request("/health")
+        self.assertNotEqual(payload["trace_id"], TRACE_ID)
+        spans = self.exported_spans(3)
+        self.assertEqual(sorted(span["name"] for span in spans), ["GET /health", "handler", "write"])
+        self.assertEqual({span["traceId"] for span in spans}, {payload["trace_id"]})
+        self.configure(AGENT_TRACE_SAMPLE_RATIO="0")
+        self.request("/health")
+        self.assertEqual(self.exported_spans(), [])
+
+        server.reload_settings(dict(TEST_ENV, AGENT_TRACE_SAMPLE_RATIO="1"))
+        self.assertFalse(server.TRACER.begin(f"00-{TRACE_ID}-{PARENT_ID}-01").recording)
+
+    def test_full_buffer_drops_oldest_spans_and_counts_them(self) -> None:
+        self.configure(AGENT_TRACE_BUFFER_SIZE="16", AGENT_TRACE_EXPORT_INTERVAL_SECONDS="60")
+        trace = server.TRACER.begin(f"00-{TRACE_ID}-{PARENT_ID}-01")
+        for number in range(20):
+            with trace.span(f"step-{number}"):
+                pass
+        self.assertEqual(server.TRACER.dropped, 4)
+        self.assertEqual([span["name"] for span in self.exported_spans()], [f"step-{n}" for n in range(4, 20)])
+        self.assertEqual(server.TRACER.exported, 16)
+
+    def test_unsampled_request_costs_stay_in_microseconds(self) -> None:
+        self.configure()
+        header = f"00-{TRACE_ID}-{PARENT_ID}-00"
+        rounds = 20000
+        started = time.perf_counter()
+        for _ in range(rounds):
+            trace = server.TRACER.begin(header)
+            for name in ("handler", "auth", "write"):
+                with trace.span(name):
+                    pass
+            trace.finish(200)
+        per_request_us = (time.perf_counter() - started) / rounds * 1_000_000
+        self.assertLess(per_request_us, 50.0)
+
+
+
+class ProfilerTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.httpd = HTTPServer(("127.0.0.1", 0), server.Handler)
+        cls.port = cls.httpd.server_address[1]
+        cls.thread = threading.Thread(target=cls.httpd.serve_forever, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.httpd.shutdown()
+        cls.httpd.server_close()
+        cls.thread.join(timeout=5)
+
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.profile_dir = pathlib.Path(tmp.name)
+        server.reset_state_for_tests()
+        self.addCleanup(configure_test_env)
+        self.addCleanup(server.PROFILER.stop)
+        self.configure()
+
+    def configure(self, seconds: str = "5") -> None:
+        env = dict(TEST_ENV, AGENT_AUTH_MODE="token", AGENT_AUTH_TOKEN="profile-token", AGENT_PROFILE_INTERVAL_MS="2")
+        env.update(AGENT_PROFILE_DIR=str(self.profile_dir), AGENT_PROFILE_SECONDS=seconds)
+        server.reload_settings(env)
+
+    def request(self, path: str) -> int:
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=5)
+        conn.request("GET", path, headers={"Authorization": "Bearer profile-token"})
+        resp = conn.getresponse()
+        resp.read()
+        conn.close()
+        return resp.status
+
+    def profile(self) -> tuple[list[str], dict]:
+        [collapsed] = self.profile_dir.glob("*.collapsed")
+        [routes] = self.profile_dir.glob("*.routes.json")
+        return collapsed.read_text(encoding="utf-8").splitlines(), json.loads(routes.read_text(encoding="utf-8"))
+
+    def test_sigusr2_samples_stacks_and_attributes_wall_time_to_routes(self) -> None:
+        release = threading.Event()
+
+        def slow_operation() -> None:
+            server.PROFILER.enter("POST /ops/cache/flush")
+            try:
+                release.wait(5)
+            finally:
+                server.PROFILER.leave()
+
+        previous = signal.signal(signal.SIGUSR2, server._handle_sigusr2)
+        self.addCleanup(signal.signal, signal.SIGUSR2, previous)
+        os.kill(os.getpid(), signal.SIGUSR2)
+        deadline = time.monotonic() + 1
+        while not server.PROFILER.active and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(server.PROFILER.active)
+        worker = threading.Thread(target=slow_operation)
+        worker.start()
+        with unittest.mock.patch.object(server.PROFILER, "enter", wraps=server.PROFILER.enter) as enter:
+            self.assertEqual(self.request("/status"), 200)
+        enter.assert_called_once_with("GET /status")
+        time.sleep(0.1)
+        release.set()
+        worker.join(5)
+        server.PROFILER.stop()
+        self.assertFalse(server.PROFILER.active)
+
+        lines, summary = self.profile()
+        self.assertTrue(all(re.fullmatch(r"[^ ].*;.* \d+", line) for line in lines), lines[:3])
+        self.assertTrue(any(line.startswith("POST /ops/cache/flush;") and "slow_operation" in line for line in lines))
+        self.assertTrue(any(line.startswith("thread:MainThread;") for line in lines))
+        routes = {entry["route"]: entry["wall_seconds"] for entry in summary["routes"]}
+        self.assertGreater(routes["POST /ops/cache/flush"], 0.05)
+        self.assertEqual((summary["service"], summary["pid"]), ("shop-agent", os.getpid()))
+        self.assertGreater(summary["samples"], 10)
+
+    def test_idle_profiler_is_not_called_and_runs_end_on_their_own(self) -> None:
+        with unittest.mock.patch.object(server.PROFILER, "enter") as enter:
+            self.assertEqual(self.request("/status"), 200)
+        enter.assert_not_called()
+        self.assertEqual(list(self.profile_dir.iterdir()), [])
+
+        self.configure(seconds="0.1")
+        self.assertTrue(server.PROFILER.trigger())
+        self.assertFalse(server.PROFILER.trigger())
+        deadline = time.monotonic() + 2
+        while server.PROFILER.active and time.monotonic() < deadline:
+            time.sleep(0.01)
+        server.PROFILER.stop()
+        lines, summary = self.profile()
+        self.assertTrue(lines)
+        self.assertLess(summary["duration_seconds"], 1.0)
+        self.assertEqual(summary["routes"], [])
+
 
 if __name__ == "__main__":
     unittest.main()
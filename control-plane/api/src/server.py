@@ -1,18 +1,1870 @@
 #!/usr/bin/env python3
+import base64
 import errno
+import hashlib
+import hmac
+import http.client
 import json
 import os
+import random
+import re
+import selectors
+import signal
+import socket
+import sys
+import tempfile
+import time
+import urllib.request
+from bisect import bisect_left
+from collections import Counter, OrderedDict, deque
+from collections.abc import Callable, Iterator, Mapping
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from dataclasses import asdict, dataclass, field
 from datetime import datetime, timezone
 from http.server import BaseHTTPRequestHandler, HTTPServer
+from io import BufferedReader
+from threading import Event, Lock, Thread, get_ident
+from threading import enumerate as threading_enumerate
+from types import FrameType
+from urllib.parse import urlsplit
 from uuid import uuid4
 
 
+@dataclass(frozen=True)
+class FleetAgent:
+    store_id: str
+    url: str
+
+
+def parse_agents(raw: str) -> tuple[FleetAgent, ...]:
+    """Parse the agent registry: a JSON list of ``{"store_id", "url"}`` entries."""
+    try:
+        entries = json.loads(raw)
+    except ValueError:
+        raise ValueError("CONTROL_PLANE_AGENTS_FILE must contain a JSON list") from None
+    if not isinstance(entries, list):
+        raise ValueError("CONTROL_PLANE_AGENTS_FILE must contain a JSON list")
+    agents: list[FleetAgent] = []
+    seen: set[str] = set()
+    for index, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            raise ValueError(f"CONTROL_PLANE_AGENTS_FILE entry {index} must be an object")
+        store_id, url = entry.get("store_id"), entry.get("url")
+        if not isinstance(store_id, str) or not store_id:
+            raise ValueError(f"CONTROL_PLANE_AGENTS_FILE entry {index} needs a store_id")
+        if store_id in seen:
+            raise ValueError(f"CONTROL_PLANE_AGENTS_FILE lists store_id {store_id!r} twice")
+        if not isinstance(url, str) or urlsplit(url).scheme not in {"http", "https"} or not urlsplit(url).hostname:
+            raise ValueError(f"CONTROL_PLANE_AGENTS_FILE entry {index} needs an http(s) url")
+        seen.add(store_id)
+        agents.append(FleetAgent(store_id, url.rstrip("/")))
+    return tuple(agents)
+
+
+@dataclass(frozen=True)
+class Settings:
+    """Validated runtime configuration, loaded once and swapped atomically on reload."""
+
+    host: str
+    port: int
+    version: str
+    deployment_version: str
+    workers: int
+    idle_timeout_seconds: float
+    metrics_token: str
+    api_token: str = field(repr=False)
+    agents: tuple[FleetAgent, ...]
+    agent_jwt_secret: str = field(repr=False)
+    agent_jwt_issuer: str
+    agent_jwt_audience: str
+    agent_jwt_kid: str
+    agent_jwt_ttl_seconds: int
+    agent_jwt_max_ttl_seconds: int
+    agent_jwt_refresh_seconds: int
+    fleet_concurrency: int
+    fleet_timeout_seconds: float
+    fleet_poll_seconds: float
+    fleet_poll_jitter: float
+    fleet_stale_seconds: float
+    bulk_max_wave_size: int
+    bulk_call_timeout_seconds: float
+    bulk_job_timeout_seconds: float
+    bulk_job_poll_seconds: float
+    trace_sample_ratio: float
+    trace_buffer_size: int
+    trace_export_file: str
+    trace_export_url: str
+    trace_export_interval_seconds: float
+    profile_dir: str
+    profile_seconds: float
+    profile_interval_seconds: float
+
+    @classmethod
+    def from_env(cls, env: Mapping[str, str] | None = None) -> "Settings":
+        env = os.environ if env is None else env
+
+        def integer(name: str, default: str, minimum: int) -> int:
+            raw = env.get(name, default)
+            try:
+                value = int(raw)
+            except ValueError:
+                raise ValueError(f"{name} must be an integer, got {raw!r}") from None
+            if value < minimum:
+                raise ValueError(f"{name} must be >= {minimum}, got {value}")
+            return value
+
+        def seconds(name: str, default: str) -> float:
+            raw = env.get(name, default)
+            try:
+                value = float(raw)
+            except ValueError:
+                raise ValueError(f"{name} must be a number, got {raw!r}") from None
+            if value <= 0:
+                raise ValueError(f"{name} must be > 0, got {value}")
+            return value
+
+        def fraction(name: str, default: str) -> float:
+            raw = env.get(name, default)
+            try:
+                value = float(raw)
+            except ValueError:
+                raise ValueError(f"{name} must be a number, got {raw!r}") from None
+            if not 0 <= value < 1:
+                raise ValueError(f"{name} must be in [0, 1), got {value}")
+            return value
+
+        def ratio(name: str, default: str) -> float:
+            raw = env.get(name, default)
+            try:
+                value = float(raw)
+            except ValueError:
+                raise ValueError(f"{name} must be a number, got {raw!r}") from None
+            if not 0 <= value <= 1:
+                raise ValueError(f"{name} must be in [0, 1], got {value}")
+            return value
+
+        trace_export_url = env.get("CONTROL_PLANE_TRACE_EXPORT_URL", "")
+        if trace_export_url and urlsplit(trace_export_url).scheme not in ("http", "https"):
+            raise ValueError(f"CONTROL_PLANE_TRACE_EXPORT_URL must be an http(s) URL, got {trace_export_url!r}")
+        profile_seconds = seconds("CONTROL_PLANE_PROFILE_SECONDS", "30")
+        if profile_seconds > 600:
+            raise ValueError(f"CONTROL_PLANE_PROFILE_SECONDS must be <= 600, got {profile_seconds}")
+        profile_interval_ms = integer("CONTROL_PLANE_PROFILE_INTERVAL_MS", "10", 1)
+        if profile_interval_ms > 1000:
+            raise ValueError(f"CONTROL_PLANE_PROFILE_INTERVAL_MS must be <= 1000, got {profile_interval_ms}")
+        poll_seconds = seconds("CONTROL_PLANE_FLEET_POLL_SECONDS", "30")
+        # Agents reject tokens whose lifetime exceeds their AGENT_JWT_MAX_TTL_SECONDS; keep both in step.
+        max_ttl = integer("CONTROL_PLANE_AGENT_JWT_MAX_TTL_SECONDS", "900", 1)
+        ttl = integer("CONTROL_PLANE_AGENT_JWT_TTL_SECONDS", "300", 1)
+        if ttl > max_ttl:
+            raise ValueError(f"CONTROL_PLANE_AGENT_JWT_TTL_SECONDS must be <= {max_ttl}, got {ttl}")
+        refresh = integer("CONTROL_PLANE_AGENT_JWT_REFRESH_SECONDS", str(min(30, ttl // 2)), 0)
+        if refresh >= ttl:
+            raise ValueError(f"CONTROL_PLANE_AGENT_JWT_REFRESH_SECONDS must be < {ttl}, got {refresh}")
+        agents: tuple[FleetAgent, ...] = ()
+        agents_file = env.get("CONTROL_PLANE_AGENTS_FILE", "")
+        if agents_file:
+            try:
+                with open(agents_file, encoding="utf-8") as handle:
+                    agents = parse_agents(handle.read())
+            except OSError as exc:
+                raise ValueError(f"CONTROL_PLANE_AGENTS_FILE unreadable: {exc.strerror}") from None
+        agent_jwt_secret = env.get("CONTROL_PLANE_AGENT_JWT_SECRET", "")
+        if agents and not agent_jwt_secret:
+            raise ValueError("CONTROL_PLANE_AGENT_JWT_SECRET is required when CONTROL_PLANE_AGENTS_FILE lists agents")
+
+        return cls(
+            host=env.get("HOST", "0.0.0.0"),
+            port=integer("PORT", "8080", 0),
+            version=env.get("CONTROL_PLANE_VERSION", "dev"),
+            deployment_version=env.get("DEPLOYMENT_VERSION", "unknown"),
+            workers=integer("CONTROL_PLANE_WORKERS", "16", 1),
+            idle_timeout_seconds=seconds("CONTROL_PLANE_IDLE_TIMEOUT_SECONDS", "15"),
+            metrics_token=env.get("CONTROL_PLANE_METRICS_TOKEN", ""),
+            api_token=env.get("CONTROL_PLANE_API_TOKEN", ""),
+            agents=agents,
+            agent_jwt_secret=agent_jwt_secret,
+            agent_jwt_issuer=env.get("CONTROL_PLANE_AGENT_JWT_ISSUER", "control-plane"),
+            agent_jwt_audience=env.get("CONTROL_PLANE_AGENT_JWT_AUDIENCE", "shop-agent"),
+            agent_jwt_kid=env.get("CONTROL_PLANE_AGENT_JWT_KID", ""),
+            agent_jwt_ttl_seconds=ttl,
+            agent_jwt_max_ttl_seconds=max_ttl,
+            agent_jwt_refresh_seconds=refresh,
+            fleet_concurrency=integer("CONTROL_PLANE_FLEET_CONCURRENCY", "32", 1),
+            fleet_timeout_seconds=seconds("CONTROL_PLANE_FLEET_TIMEOUT_SECONDS", "2"),
+            fleet_poll_seconds=poll_seconds,
+            fleet_poll_jitter=fraction("CONTROL_PLANE_FLEET_POLL_JITTER", "0.2"),
+            fleet_stale_seconds=seconds("CONTROL_PLANE_FLEET_STALE_SECONDS", str(poll_seconds * 3)),
+            bulk_max_wave_size=integer("CONTROL_PLANE_BULK_MAX_WAVE_SIZE", "50", 1),
+            bulk_call_timeout_seconds=seconds("CONTROL_PLANE_BULK_CALL_TIMEOUT_SECONDS", "30"),
+            bulk_job_timeout_seconds=seconds("CONTROL_PLANE_BULK_JOB_TIMEOUT_SECONDS", "900"),
+            bulk_job_poll_seconds=seconds("CONTROL_PLANE_BULK_JOB_POLL_SECONDS", "2"),
+            trace_sample_ratio=ratio("CONTROL_PLANE_TRACE_SAMPLE_RATIO", "0.1"),
+            trace_buffer_size=integer("CONTROL_PLANE_TRACE_BUFFER_SIZE", "2048", 16),
+            trace_export_file=env.get("CONTROL_PLANE_TRACE_EXPORT_FILE", ""),
+            trace_export_url=trace_export_url,
+            trace_export_interval_seconds=seconds("CONTROL_PLANE_TRACE_EXPORT_INTERVAL_SECONDS", "5"),
+            profile_dir=env.get("CONTROL_PLANE_PROFILE_DIR", "") or tempfile.gettempdir(),
+            profile_seconds=profile_seconds,
+            profile_interval_seconds=profile_interval_ms / 1000,
+        )
+
+
+_SETTINGS: Settings | None = None
+
+
+def current_settings() -> Settings:
+    settings = _SETTINGS
+    if settings is None:
+        settings = reload_settings()
+    return settings
+
+
+def settings_source() -> dict[str, str]:
+    """Process environment overlaid with the optional ``CONTROL_PLANE_SETTINGS_FILE`` (KEY=VALUE lines).
+
+    The file is what makes SIGHUP reloads useful: a container's environment is fixed at
+    start, but a mounted file can be rewritten in place when secrets or versions rotate.
+    """
+    env = dict(os.environ)
+    path = env.get("CONTROL_PLANE_SETTINGS_FILE")
+    if not path:
+        return env
+    try:
+        with open(path, encoding="utf-8") as handle:
+            lines = handle.read().splitlines()
+    except OSError as exc:
+        raise ValueError(f"CONTROL_PLANE_SETTINGS_FILE unreadable: {exc.strerror}") from None
+    for number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        key, sep, value = line.partition("=")
+        if not sep:
+            raise ValueError(f"CONTROL_PLANE_SETTINGS_FILE has a malformed line {number}")
+        env[key.strip()] = value.strip()
+    return env
+
+
+def reload_settings(env: Mapping[str, str] | None = None) -> Settings:
+    """Validate configuration and publish it; raises ValueError and keeps the old snapshot on bad input."""
+    global _SETTINGS
+    settings = Settings.from_env(settings_source() if env is None else env)
+    FLEET.configure(settings.fleet_concurrency)
+    TRACER.configure(
+        settings.trace_sample_ratio,
+        settings.trace_buffer_size,
+        settings.trace_export_file,
+        settings.trace_export_url,
+        settings.trace_export_interval_seconds,
+        {"service.version": settings.version},
+    )
+    PROFILER.configure(settings.profile_dir, settings.profile_seconds, settings.profile_interval_seconds)
+    _SETTINGS = settings
+    return settings
+
+
+class SettingsReloader:
+    """Runs SIGHUP-requested settings reloads on a dedicated thread.
+
+    Reloading takes the locks of the token cache, tracer and log writer, which the main
+    thread may hold when the signal interrupts it, so the handler only calls ``request``
+    (an ``Event.set``) and this thread does the work. Requests that arrive during a
+    reload are coalesced into one more run. ``lock`` is held for the whole reload so a
+    fork can wait for a consistent state; ``start`` runs again in a forked child, which
+    inherits neither the thread nor a usable copy of its locks.
+    """
+
+    def __init__(self, name: str, reload: Callable[[], None]) -> None:
+        self.name = name
+        self.lock = Lock()
+        self._reload = reload
+        self._requested = Event()
+
+    def start(self) -> None:
+        self.lock = Lock()
+        self._requested = Event()
+        Thread(target=self._run, args=(self._requested,), name=self.name, daemon=True).start()
+
+    def request(self) -> None:
+        self._requested.set()
+
+    def _run(self, requested: Event) -> None:
+        while True:
+            requested.wait()
+            requested.clear()
+            with self.lock:
+                self._reload()
+
+
 def utc_ts() -> str:
     return datetime.now(timezone.utc).isoformat()
 
 
+def b64url_encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).decode("utf-8").rstrip("=")
+
+
+class AgentTokenMinter:
+    """Store-scoped HS256 tokens for shop agent calls, reused until shortly before expiry.
+
+    Each token carries ``iss``, ``aud``, ``sub``, ``store_id``, ``iat`` and ``exp`` and, when
+    ``agent_jwt_kid`` is set, a ``kid`` header naming the agent key that verifies it. A store's
+    token is reused while more than ``agent_jwt_refresh_seconds`` of its lifetime remain, so a
+    fan-out signs once per store per TTL instead of once per call (and agents hit their
+    verified-token cache). Changing the secret, ``kid``, issuer, audience or TTL drops every
+    cached token; the keyed HMAC state is prepared once per secret and cloned per signature.
+    Settings snapshots are immutable, so signing parameters are only compared when a new
+    snapshot is seen.
+    """
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._tokens: dict[str, tuple[str, int]] = {}
+        self._settings: Settings | None = None
+        self._generation: tuple | None = None
+        # Replaced by _rotate before the first token is signed.
+        self._signer = hmac.new(b"", digestmod=hashlib.sha256)
+        self._header = ""
+
+    def token(self, settings: Settings, store_id: str, now: int | None = None) -> str:
+        if not settings.agent_jwt_secret:
+            raise ValueError("CONTROL_PLANE_AGENT_JWT_SECRET is not set")
+        now = int(time.time()) if now is None else now
+        with self._lock:
+            if settings is not self._settings:
+                self._adopt(settings)
+            cached = self._tokens.get(store_id)
+            if cached is not None and cached[1] - now > settings.agent_jwt_refresh_seconds:
+                METRICS.inc("control_plane_agent_token_cache_requests_total", "hit")
+                return cached[0]
+            signer, header = self._signer, self._header
+        METRICS.inc("control_plane_agent_token_cache_requests_total", "miss")
+        exp = now + settings.agent_jwt_ttl_seconds
+        claims = {
+            "iss": settings.agent_jwt_issuer,
+            "aud": settings.agent_jwt_audience,
+            "sub": "control-plane",
+            "store_id": store_id,
+            "iat": now,
+            "exp": exp,
+        }
+        payload = b64url_encode(json.dumps(claims, separators=(",", ":")).encode("utf-8"))
+        mac = signer.copy()
+        mac.update(f"{header}.{payload}".encode("utf-8"))
+        token = f"{header}.{payload}.{b64url_encode(mac.digest())}"
+        METRICS.inc("control_plane_agent_tokens_signed_total")
+        with self._lock:
+            if self._settings is settings:
+                self._tokens[store_id] = (token, exp)
+        return token
+
+    def reset(self) -> None:
+        with self._lock:
+            self._tokens.clear()
+            self._settings = None
+            self._generation = None
+
+    def _adopt(self, settings: Settings) -> None:
+        # A reload that leaves the signing parameters unchanged keeps the cached tokens.
+        generation = (
+            hashlib.sha256(settings.agent_jwt_secret.encode("utf-8")).digest(),
+            settings.agent_jwt_kid,
+            settings.agent_jwt_issuer,
+            settings.agent_jwt_audience,
+            settings.agent_jwt_ttl_seconds,
+        )
+        self._settings = settings
+        if generation != self._generation:
+            self._rotate(settings, generation)
+
+    def _rotate(self, settings: Settings, generation: tuple) -> None:
+        header: dict[str, str] = {"alg": "HS256", "typ": "JWT"}
+        if settings.agent_jwt_kid:
+            header["kid"] = settings.agent_jwt_kid
+        self._header = b64url_encode(json.dumps(header, separators=(",", ":")).encode("utf-8"))
+        self._signer = hmac.new(settings.agent_jwt_secret.encode("utf-8"), digestmod=hashlib.sha256)
+        self._tokens.clear()
+        self._generation = generation
+
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class MetricsRegistry:
+    """In-process counters, gauges and fixed-bucket histograms in Prometheus text format.
+
+    Metrics are declared once with their label names; recording is a dict update under
+    a single short lock. Callback metrics are sampled only when rendering.
+    """
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._meta: dict[str, tuple[str, str, tuple[str, ...]]] = {}
+        self._values: dict[str, dict[tuple[str, ...], float]] = {}
+        self._histograms: dict[str, dict[tuple[str, ...], list[float]]] = {}
+        self._callbacks: dict[str, Callable[[], float]] = {}
+
+    def describe(
+        self,
+        name: str,
+        kind: str,
+        help_text: str,
+        labels: tuple[str, ...] = (),
+        callback: Callable[[], float] | None = None,
+    ) -> None:
+        self._meta[name] = (kind, help_text, labels)
+        if callback is not None:
+            self._callbacks[name] = callback
+        elif kind == "histogram":
+            self._histograms[name] = {}
+        else:
+            self._values[name] = {}
+
+    def inc(self, name: str, *labels: str, value: float = 1.0) -> None:
+        series = self._values[name]
+        with self._lock:
+            series[labels] = series.get(labels, 0.0) + value
+
+    def observe(self, name: str, seconds: float, *labels: str) -> None:
+        series = self._histograms[name]
+        index = bisect_left(LATENCY_BUCKETS, seconds)
+        with self._lock:
+            buckets = series.get(labels)
+            if buckets is None:
+                # One slot per bucket, then +Inf, then the running sum.
+                buckets = series[labels] = [0.0] * (len(LATENCY_BUCKETS) + 2)
+            buckets[index] += 1
+            buckets[-1] += seconds
+
+    def reset(self) -> None:
+        with self._lock:
+            for series in self._values.values():
+                series.clear()
+            for histogram in self._histograms.values():
+                histogram.clear()
+
+    def render(self) -> str:
+        lines: list[str] = []
+        with self._lock:
+            values = {name: dict(series) for name, series in self._values.items()}
+            histograms = {name: {k: list(v) for k, v in series.items()} for name, series in self._histograms.items()}
+        for name, (kind, help_text, label_names) in self._meta.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if name in self._callbacks:
+                lines.append(f"{name} {_format_metric_value(self._callbacks[name]())}")
+            elif kind == "histogram":
+                for labels, buckets in sorted(histograms[name].items()):
+                    cumulative = 0.0
+                    for bound, count in zip((*LATENCY_BUCKETS, float("inf")), buckets):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append(f"{name}_bucket{_format_labels(label_names, labels, le)} {_format_metric_value(cumulative)}")
+                    lines.append(f"{name}_sum{_format_labels(label_names, labels)} {buckets[-1]!r}")
+                    lines.append(f"{name}_count{_format_labels(label_names, labels)} {_format_metric_value(cumulative)}")
+            else:
+                for labels, value in sorted(values[name].items()):
+                    lines.append(f"{name}{_format_labels(label_names, labels)} {_format_metric_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], le: str | None = None) -> str:
+    pairs = [f'{key}="{value}"' for key, value in zip(names, values)]
+    if le is not None:
+        pairs.append(f'le="{le}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_metric_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+TRACE_EXPORT_BATCH = 512
+TRACE_EXPORT_TIMEOUT_SECONDS = 5.0
+_HEX_DIGITS = frozenset("0123456789abcdef")
+# Returned for every span of an unsampled request, so not recording costs no allocation.
+NO_SPAN = nullcontext()
+
+
+def parse_traceparent(header: str) -> tuple[str, str, bool] | None:
+    """Return ``(trace_id, parent_id, sampled)`` from a W3C ``traceparent`` header, or None if it is invalid."""
+    parts = header.strip().split("-")
+    if len(parts) < 4:
+        return None
+    version, trace_id, parent_id, flags = parts[:4]
+    # Version 00 has exactly four fields; later versions may append more and are read as 00.
+    if version == "ff" or (version == "00" and len(parts) != 4):
+        return None
+    if len(version) != 2 or len(trace_id) != 32 or len(parent_id) != 16 or len(flags) != 2:
+        return None
+    if not set(version + trace_id + parent_id + flags) <= _HEX_DIGITS:
+        return None
+    if trace_id == "0" * 32 or parent_id == "0" * 16:
+        return None
+    return trace_id, parent_id, bool(int(flags, 16) & 1)
+
+
+def _new_span_id() -> str:
+    return f"{random.getrandbits(64) or 1:016x}"
+
+
+def _otlp_attributes(attributes: Mapping[str, object]) -> list[dict]:
+    encoded = []
+    for key, value in attributes.items():
+        if isinstance(value, bool):
+            encoded.append({"key": key, "value": {"boolValue": value}})
+        elif isinstance(value, int):
+            encoded.append({"key": key, "value": {"intValue": str(value)}})
+        elif isinstance(value, float):
+            encoded.append({"key": key, "value": {"doubleValue": value}})
+        else:
+            encoded.append({"key": key, "value": {"stringValue": str(value)}})
+    return encoded
+
+
+class Span:
+    """One timed operation of a sampled trace; the tracer stamps its end when it is recorded."""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "attributes", "start_ns", "end_ns", "error")
+
+    def __init__(self, trace_id: str, parent_id: str | None, name: str, kind: int, attributes: dict) -> None:
+        self.trace_id = trace_id
+        self.span_id = _new_span_id()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.error = False
+
+    def set_status(self, code: int) -> None:
+        """Record an HTTP status; no response (``0``) and 5xx mark the span as failed."""
+        self.attributes["http.response.status_code"] = code
+        self.error = code == 0 or code >= 500
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": _otlp_attributes(self.attributes),
+            "status": {"code": 2 if self.error else 0},
+        }
+        if self.parent_id is not None:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class TraceContext:
+    """A request's place in a trace: W3C ids, the sampling decision and the span children attach to.
+
+    Spans are only allocated when the request is sampled and the tracer has an export
+    target; otherwise ``span`` and ``client`` return the shared ``NO_SPAN``. ``span``
+    nests (children opened inside it attach to it) and belongs to the request thread;
+    ``client`` opens a leaf span and may be used from fan-out threads.
+    """
+
+    __slots__ = ("trace_id", "sampled", "_tracer", "_root", "_current")
+
+    def __init__(
+        self, tracer: "Tracer", trace_id: str, parent_id: str | None, sampled: bool, name: str, kind: int
+    ) -> None:
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self._tracer = tracer
+        self._root = Span(trace_id, parent_id, name, kind, {}) if sampled and tracer.recording else None
+        self._current = _new_span_id() if self._root is None else self._root.span_id
+
+    @property
+    def recording(self) -> bool:
+        return self._root is not None
+
+    def traceparent(self, span: Span | None = None) -> str:
+        """Header value for an outgoing call made from ``span`` (default: the innermost open span)."""
+        parent_id = self._current if span is None else span.span_id
+        return f"00-{self.trace_id}-{parent_id}-{'01' if self.sampled else '00'}"
+
+    def span(self, name: str, attributes: dict | None = None) -> AbstractContextManager[Span | None]:
+        if self._root is None:
+            return NO_SPAN
+        return self._open(name, SPAN_KIND_INTERNAL, attributes or {}, nest=True)
+
+    def client(self, name: str, attributes: dict | None = None) -> AbstractContextManager[Span | None]:
+        if self._root is None:
+            return NO_SPAN
+        return self._open(name, SPAN_KIND_CLIENT, attributes or {}, nest=False)
+
+    @contextmanager
+    def _open(self, name: str, kind: int, attributes: dict, nest: bool) -> Iterator[Span]:
+        span = Span(self.trace_id, self._current, name, kind, attributes)
+        parent = self._current
+        if nest:
+            self._current = span.span_id
+        try:
+            yield span
+        except BaseException:
+            span.error = True
+            raise
+        finally:
+            if nest:
+                self._current = parent
+            self._tracer.record(span)
+
+    def finish(self, status_code: int = 0, attributes: dict | None = None, name: str | None = None) -> None:
+        """Record the root span, optionally renaming it; later calls are ignored."""
+        root = self._root
+        if root is None or root.end_ns:
+            return
+        if name is not None:
+            root.name = name
+        if attributes:
+            root.attributes.update(attributes)
+        if status_code:
+            root.set_status(status_code)
+        self._tracer.record(root)
+
+
+class Tracer:
+    """Head-sampled tracing with a bounded span buffer and batched OTLP/JSON export.
+
+    ``begin`` continues the caller's ``traceparent`` or starts a trace, and decides once:
+    a valid parent's sampled flag wins, otherwise the trace id is compared against
+    ``sample_ratio`` so every service keeps the same root traces. Spans are recorded
+    only for sampled requests while an export target is configured. Finished spans go
+    into a ring buffer of ``buffer_size`` (the oldest are dropped and counted when it is
+    full) that a daemon thread drains every ``export_interval`` seconds, or as soon as a
+    batch is full, writing one OTLP ``ExportTraceServiceRequest`` per batch: appended as
+    one line to ``export_file`` and/or POSTed to a collector's ``export_url``.
+    """
+
+    def __init__(self, service: str) -> None:
+        self.service = service
+        self.recording = False
+        self.exported = 0
+        self.dropped = 0
+        self._threshold = 0
+        self._resource: dict[str, object] = {"service.name": service}
+        self._export_file = ""
+        self._export_url = ""
+        self._interval = 5.0
+        self._buffer: deque[Span] = deque(maxlen=2048)
+        self._lock = Lock()
+        self._wake = Event()
+        self._stop = Event()
+        self._thread: Thread | None = None
+
+    def configure(
+        self,
+        sample_ratio: float,
+        buffer_size: int,
+        export_file: str,
+        export_url: str,
+        export_interval: float,
+        resource: Mapping[str, object],
+    ) -> None:
+        with self._lock:
+            self._threshold = int(sample_ratio * (1 << 64))
+            if buffer_size != self._buffer.maxlen:
+                self._buffer = deque(self._buffer, maxlen=buffer_size)
+            self._export_file = export_file
+            self._export_url = export_url
+            self._interval = export_interval
+            self._resource = {"service.name": self.service, **resource}
+            self.recording = bool(export_file or export_url)
+
+    def begin(self, traceparent: str | None, name: str = "request", kind: int = SPAN_KIND_SERVER) -> TraceContext:
+        parent = parse_traceparent(traceparent) if traceparent else None
+        if parent is not None:
+            return TraceContext(self, parent[0], parent[1], parent[2], name, kind)
+        trace_id = f"{random.getrandbits(128) or 1:032x}"
+        return TraceContext(self, trace_id, None, int(trace_id[16:], 16) < self._threshold, name, kind)
+
+    def record(self, span: Span) -> None:
+        span.end_ns = time.time_ns()
+        with self._lock:
+            if len(self._buffer) == self._buffer.maxlen:
+                self.dropped += 1
+            self._buffer.append(span)
+            full = len(self._buffer) >= TRACE_EXPORT_BATCH
+        if self._thread is None:
+            self.start()
+        if full:
+            self._wake.set()
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = Thread(target=self._run, name=f"{self.service}-trace-exporter", daemon=True)
+            self._thread.start()
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Stop the exporter thread after it exported what is buffered."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._stop.set()
+        self._wake.set()
+        thread.join(timeout=timeout)
+        self._stop.clear()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._buffer.clear()
+            self.exported = 0
+            self.dropped = 0
+
+    def flush(self) -> None:
+        while True:
+            with self._lock:
+                batch = [self._buffer.popleft() for _ in range(min(len(self._buffer), TRACE_EXPORT_BATCH))]
+                export_file, export_url, resource = self._export_file, self._export_url, self._resource
+            if not batch:
+                return
+            self._export(batch, export_file, export_url, resource)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self._interval)
+            self._wake.clear()
+            self.flush()
+        self.flush()
+
+    def _export(self, batch: list[Span], export_file: str, export_url: str, resource: dict[str, object]) -> None:
+        document = {
+            "resourceSpans": [
+                {
+                    "resource": {"attributes": _otlp_attributes({**resource, "process.pid": os.getpid()})},
+                    "scopeSpans": [{"scope": {"name": self.service}, "spans": [span.to_otlp() for span in batch]}],
+                }
+            ]
+        }
+        data = json.dumps(document, separators=(",", ":")).encode("utf-8")
+        ok = True
+        if export_file:
+            try:
+                # One O_APPEND write per batch keeps lines whole when several processes share the file.
+                fd = os.open(export_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o640)
+                try:
+                    os.write(fd, data + b"\n")
+                finally:
+                    os.close(fd)
+            except OSError:
+                ok = False
+        if export_url:
+            request = urllib.request.Request(
+                export_url, data=data, headers={"Content-Type": "application/json"}, method="POST"
+            )
+            try:
+                with urllib.request.urlopen(request, timeout=TRACE_EXPORT_TIMEOUT_SECONDS) as response:
+                    response.read()
+            except (OSError, ValueError):
+                ok = False
+        with self._lock:
+            if ok:
+                self.exported += len(batch)
+            else:
+                self.dropped += len(batch)
+
+
+def _collapse_stack(frame: FrameType | None, root: str) -> str:
+    """``root;outermost;...;innermost`` with one ``qualname (file:line)`` entry per frame."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    names.append(root.replace(";", ":"))
+    return ";".join(reversed(names))
+
+
+class SamplingProfiler:
+    """On-demand wall-clock sampler of every thread's stack, written as collapsed stacks.
+
+    Nothing runs until ``trigger`` (wired to SIGUSR2): a daemon thread then reads
+    ``sys._current_frames()`` every ``interval`` seconds for ``duration`` seconds and
+    counts each stack as one ``root;frame;...;frame count`` line, the format flame-graph
+    tools read. Request threads label themselves with their route only while a run is
+    ``active``, so an idle profiler costs one attribute read per request; requests
+    already in flight when a run starts are sampled under their thread name. Each run
+    writes ``<directory>/<service>-<pid>-<UTC time>.collapsed`` and a ``.routes.json``
+    with the wall time request threads spent per route.
+    """
+
+    def __init__(self, service: str, report: Callable[[str, dict[str, object]], None]) -> None:
+        self.service = service
+        self.active = False
+        self._report = report
+        self._directory = tempfile.gettempdir()
+        self._duration = 30.0
+        self._interval = 0.01
+        self._routes: dict[int, str] = {}
+        self._stop = Event()
+        self._thread: Thread | None = None
+
+    def configure(self, directory: str, duration: float, interval: float) -> None:
+        # Applies to the next run; a run in progress keeps the values it started with.
+        self._directory = directory
+        self._duration = duration
+        self._interval = interval
+
+    def enter(self, route: str) -> None:
+        self._routes[get_ident()] = route
+
+    def leave(self) -> None:
+        self._routes.pop(get_ident(), None)
+
+    def trigger(self) -> bool:
+        """Start a run unless one is in progress; cheap enough to call from a signal handler."""
+        if self._thread is not None and self._thread.is_alive():
+            return False
+        self._routes.clear()
+        self._stop.clear()
+        self.active = True
+        self._thread = Thread(
+            target=self._run,
+            args=(self._directory, self._duration, self._interval),
+            name=f"{self.service}-profiler",
+            daemon=True,
+        )
+        self._thread.start()
+        return True
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """End a run early; what was sampled so far is still written."""
+        thread = self._thread
+        if thread is None:
+            return
+        self._stop.set()
+        thread.join(timeout=timeout)
+
+    def _run(self, directory: str, duration: float, interval: float) -> None:
+        own = get_ident()
+        stacks: Counter[str] = Counter()
+        route_seconds: dict[str, float] = {}
+        samples = 0
+        started_at = datetime.now(timezone.utc)
+        begin = last = time.monotonic()
+        self._report("profile-started", {"duration_seconds": duration, "interval_seconds": interval})
+        try:
+            while True:
+                now = time.monotonic()
+                elapsed, last = now - last, now
+                routes = dict(self._routes)
+                names = {thread.ident: thread.name for thread in threading_enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident == own:
+                        continue
+                    route = routes.get(ident)
+                    stacks[_collapse_stack(frame, route or f"thread:{names.get(ident, ident)}")] += 1
+                    if route is not None:
+                        route_seconds[route] = route_seconds.get(route, 0.0) + elapsed
+                samples += 1
+                remaining = begin + duration - time.monotonic()
+                if remaining <= 0 or self._stop.wait(min(interval, remaining)):
+                    break
+        finally:
+            self.active = False
+            self._routes.clear()
+        base = os.path.join(directory, f"{self.service}-{os.getpid()}-{started_at.strftime('%Y%m%dT%H%M%SZ')}")
+        summary = {
+            "service": self.service,
+            "pid": os.getpid(),
+            "started_at": started_at.isoformat(),
+            "duration_seconds": round(time.monotonic() - begin, 3),
+            "interval_seconds": interval,
+            "samples": samples,
+            "routes": [
+                {"route": route, "wall_seconds": round(seconds, 6)}
+                for route, seconds in sorted(route_seconds.items(), key=lambda item: -item[1])
+            ],
+        }
+        try:
+            self._write(f"{base}.collapsed", "".join(f"{stack} {count}\n" for stack, count in sorted(stacks.items())))
+            self._write(f"{base}.routes.json", json.dumps(summary, indent=2) + "\n")
+        except OSError as exc:
+            self._report("profile-write-failed", {"error": exc.strerror})
+            return
+        self._report("profile-written", {"path": f"{base}.collapsed", "samples": samples})
+
+    def _write(self, path: str, text: str) -> None:
+        # Renamed into place so a watcher never reads a partial file.
+        fd = os.open(f"{path}.tmp", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o640)
+        with os.fdopen(fd, "w", encoding="utf-8") as handle:
+            handle.write(text)
+        os.replace(f"{path}.tmp", path)
+
+
+class AgentConnectionPool:
+    """Keep-alive HTTP connections to shop agents, reused across fan-outs.
+
+    Idle connections are kept per scheme and address, at most ``max_idle`` each. A
+    connection that errors is closed instead of returned; a request on a reused
+    connection that the agent already closed is retried once on a fresh one.
+    """
+
+    def __init__(self, max_idle: int = 4) -> None:
+        self.max_idle = max_idle
+        self._lock = Lock()
+        self._idle: dict[tuple[str, str], deque[http.client.HTTPConnection]] = {}
+
+    def get(self, url: str, headers: dict[str, str], timeout: float) -> tuple[int, http.client.HTTPMessage, bytes]:
+        return self.request("GET", url, headers, timeout)
+
+    def request(
+        self, method: str, url: str, headers: dict[str, str], timeout: float, body: bytes | None = None
+    ) -> tuple[int, http.client.HTTPMessage, bytes]:
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        path = parts.path or "/"
+        while True:
+            with self._lock:
+                idle = self._idle.get(key)
+                conn = idle.pop() if idle else None
+            reused = conn is not None
+            if conn is None:
+                conn_class = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+                conn = conn_class(parts.netloc, timeout=timeout)
+            elif conn.sock is not None:
+                conn.sock.settimeout(timeout)
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                body = response.read()
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                conn.close()
+                if reused:
+                    continue
+                raise
+            except BaseException:
+                conn.close()
+                raise
+            if response.will_close:
+                conn.close()
+            else:
+                self._release(key, conn)
+            return response.status, response.headers, body
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for conn in connections:
+                conn.close()
+
+    def _release(self, key: tuple[str, str], conn: http.client.HTTPConnection) -> None:
+        with self._lock:
+            idle = self._idle.setdefault(key, deque())
+            if len(idle) < self.max_idle:
+                idle.append(conn)
+                return
+        conn.close()
+
+
+# Only these /status fields are relayed; the fleet view carries no store business data.
+AGENT_STATUS_FIELDS = (
+    "agent_version",
+    "deployment_version",
+    "last_successful_operation_timestamp",
+    "component_states",
+    "component_states_checked_at",
+)
+
+
+def classify_agent_error(exc: BaseException) -> str:
+    if isinstance(exc, (TimeoutError, socket.timeout)):
+        return "timeout"
+    if isinstance(exc, http.client.HTTPException):
+        return "protocol error"
+    return "unreachable"
+
+
+class FleetClient:
+    """Fans ``GET /status`` out to every registered shop agent.
+
+    Reads run on a shared executor of ``fleet_concurrency`` threads, so concurrent
+    fleet requests together never open more agent calls than that. Each read uses a
+    pooled keep-alive connection and is bounded by ``fleet_timeout_seconds``; a slow
+    or failing agent yields a classified error entry instead of failing the fleet.
+    """
+
+    def __init__(self) -> None:
+        self.pool = AgentConnectionPool()
+        self._lock = Lock()
+        self._executor: ThreadPoolExecutor | None = None
+        self._workers = 0
+
+    def configure(self, concurrency: int) -> None:
+        with self._lock:
+            if concurrency == self._workers:
+                return
+            executor, self._executor = self._executor, None
+            self._workers = concurrency
+        if executor is not None:
+            executor.shutdown(wait=False)
+        self.pool.max_idle = max(4, concurrency // 8)
+
+    def executor(self, settings: Settings) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self._workers or settings.fleet_concurrency, thread_name_prefix="control-plane-fleet"
+                )
+            return self._executor
+
+    def statuses(self, settings: Settings, trace: TraceContext) -> Iterator[dict]:
+        """Yield one result per agent in completion order."""
+        if not settings.agents:
+            return
+        executor = self.executor(settings)
+        futures = [executor.submit(self.fetch, agent, settings, trace) for agent in settings.agents]
+        for future in as_completed(futures):
+            yield future.result()[0]
+
+    def call(
+        self,
+        trace: TraceContext,
+        agent: FleetAgent,
+        method: str,
+        path: str,
+        headers: dict[str, str],
+        timeout: float,
+        body: bytes | None = None,
+        route: str | None = None,
+    ) -> tuple[int, http.client.HTTPMessage, bytes]:
+        """Call ``agent`` on the shared pool under a client span that the agent receives as its ``traceparent``."""
+        with trace.client(f"{method} {route or path}", {"bolerdrop.store_id": agent.store_id}) as span:
+            headers = {**headers, "traceparent": trace.traceparent(span)}
+            code, response_headers, response_body = self.pool.request(
+                method, f"{agent.url}{path}", headers, timeout, body
+            )
+            if span is not None:
+                span.set_status(code)
+        return code, response_headers, response_body
+
+    def fetch(
+        self, agent: FleetAgent, settings: Settings, trace: TraceContext, etag: str | None = None
+    ) -> tuple[dict, str | None]:
+        """Read one agent's status; with ``etag``, a ``304`` yields ``not_modified`` and no status."""
+        result: dict = {"store_id": agent.store_id, "result": "error", "latency_ms": 0.0, "error": None, "status": None}
+        headers = {
+            "Authorization": f"Bearer {TOKENS.token(settings, agent.store_id)}",
+            "X-Actor-Id": "control-plane",
+        }
+        if etag:
+            headers["If-None-Match"] = etag
+        started = time.perf_counter()
+        try:
+            code, response_headers, body = self.call(
+                trace, agent, "GET", "/status", headers, settings.fleet_timeout_seconds
+            )
+        except Exception as exc:  # noqa: BLE001
+            code, response_headers, body = 0, None, b""
+            result["error"] = classify_agent_error(exc)
+        elapsed = time.perf_counter() - started
+        result["latency_ms"] = round(elapsed * 1000, 3)
+        new_etag = None if response_headers is None else response_headers.get("ETag")
+        outcome = "ok"
+        if code == 304 and etag:
+            result["result"] = outcome = "not_modified"
+            new_etag = etag
+        elif code in (401, 403):
+            result["error"] = "unauthorized"
+        elif code and code != 200:
+            result["error"] = f"http {code}"
+        elif code == 200:
+            try:
+                payload = json.loads(body)
+                result["status"] = {name: payload.get(name) for name in AGENT_STATUS_FIELDS}
+                result["result"] = "ok"
+            except (ValueError, AttributeError):
+                result["error"] = "invalid response"
+        METRICS.inc("control_plane_fleet_agent_requests_total", result["error"] or outcome)
+        METRICS.observe("control_plane_fleet_agent_duration_seconds", elapsed)
+        return result, new_etag if result["error"] is None else None
+
+
+class FleetStateCache:
+    """Fleet view kept current by a background poller, so dashboards never trigger sweeps.
+
+    Each store is re-read every ``fleet_poll_seconds``, jittered by ``fleet_poll_jitter``
+    so reads spread out instead of arriving in waves. Reads send the last ``ETag``;
+    a ``304`` only refreshes the entry's age. A failed read keeps the last known status
+    and its age, so an entry is ``stale`` once no read succeeded for ``fleet_stale_seconds``.
+    """
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._entries: dict[str, dict] = {}
+        self._due: dict[str, float] = {}
+        self._stop = Event()
+        self._thread: Thread | None = None
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = Thread(target=self._loop, name="control-plane-fleet-poller", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        with self._lock:
+            thread, self._thread = self._thread, None
+        self._stop.set()
+        if thread is not None:
+            thread.join(timeout=5)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._due.clear()
+
+    def poll_once(self, settings: Settings, now: float | None = None) -> int:
+        """Read every store due at ``now`` (default: the monotonic clock); returns how many were read."""
+        registered = time.monotonic()
+        now = registered if now is None else now
+        with self._lock:
+            due = []
+            for agent in settings.agents:
+                if agent.store_id not in self._due:
+                    # First reads are spread over the jitter window instead of all at once.
+                    self._due[agent.store_id] = registered + random.uniform(0, settings.fleet_poll_jitter) * min(
+                        settings.fleet_poll_seconds, 5.0
+                    )
+                if self._due[agent.store_id] <= now:
+                    entry = self._entries.get(agent.store_id)
+                    due.append((agent, None if entry is None else entry["etag"]))
+        if not due:
+            return 0
+        trace = TRACER.begin(None, "fleet.poll", SPAN_KIND_INTERNAL)
+        executor = FLEET.executor(settings)
+        futures = [executor.submit(FLEET.fetch, agent, settings, trace, etag) for agent, etag in due]
+        for future in as_completed(futures):
+            self._store(settings, *future.result())
+        trace.finish(attributes={"bolerdrop.stores": len(due)})
+        return len(due)
+
+    def snapshot(self, settings: Settings) -> list[dict]:
+        now = time.monotonic()
+        stores = []
+        with self._lock:
+            for agent in settings.agents:
+                entry = self._entries.get(agent.store_id)
+                if entry is None:
+                    stores.append(
+                        {
+                            "store_id": agent.store_id,
+                            "result": "pending",
+                            "error": None,
+                            "latency_ms": None,
+                            "status": None,
+                            "refreshed_at": None,
+                            "age_seconds": None,
+                            "stale": True,
+                        }
+                    )
+                    continue
+                age = None if entry["refreshed"] is None else round(now - entry["refreshed"], 3)
+                view = {key: value for key, value in entry.items() if key not in ("etag", "refreshed")}
+                view["age_seconds"] = age
+                view["stale"] = age is None or age > settings.fleet_stale_seconds
+                stores.append(view)
+        return stores
+
+    def _store(self, settings: Settings, result: dict, etag: str | None) -> None:
+        now = time.monotonic()
+        store_id = result["store_id"]
+        with self._lock:
+            previous = self._entries.get(store_id) or dict.fromkeys(("status", "refreshed_at", "etag", "refreshed"))
+            entry = {
+                "store_id": store_id,
+                "result": "error",
+                "error": result["error"],
+                "latency_ms": result["latency_ms"],
+                "status": previous["status"],
+                "refreshed_at": previous["refreshed_at"],
+                "etag": previous["etag"],
+                "refreshed": previous["refreshed"],
+            }
+            if result["error"] is None:
+                entry.update(result="ok", etag=etag, refreshed=now, refreshed_at=utc_ts())
+                if result["status"] is not None:
+                    entry["status"] = result["status"]
+            self._entries[store_id] = entry
+            jitter = settings.fleet_poll_jitter
+            self._due[store_id] = now + settings.fleet_poll_seconds * random.uniform(1 - jitter, 1 + jitter)
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            settings = current_settings()
+            try:
+                self.poll_once(settings)
+            except Exception as exc:  # noqa: BLE001
+                print(f"{utc_ts()} component=control-plane-api event=fleet-poll-failed error={type(exc).__name__}")
+            with self._lock:
+                registered = {agent.store_id for agent in settings.agents}
+                for store_id in [store_id for store_id in self._entries if store_id not in registered]:
+                    del self._entries[store_id]
+                    self._due.pop(store_id, None)
+                next_due = min(self._due.values(), default=time.monotonic() + 1.0)
+            self._stop.wait(min(1.0, max(0.05, next_due - time.monotonic())))
+
+
+# Agent operations a bulk run may dispatch (CONTROL_PLANE_AUTHORITY.md section 4.4): the agent
+# path, and whether the agent answers with a job to poll (202) instead of the final result (200).
+BULK_OPERATIONS: dict[str, tuple[str, bool]] = {
+    "ops.cache.flush": ("/ops/cache/flush", True),
+    "ops.index.reindex": ("/ops/index/reindex", True),
+    "ops.cron.run": ("/ops/cron/run", True),
+    "ops.diagnostics": ("/ops/diagnostics", False),
+    "verify.smoke": ("/verify/smoke", False),
+}
+# Agent answers that mean "not now" rather than "failed": shed calls and a concurrent call with the same key.
+BULK_RETRYABLE = frozenset({(429, "RATE_LIMITED"), (503, "AGENT_BUSY"), (409, "IDEMPOTENCY_IN_PROGRESS")})
+BULK_MAX_ATTEMPTS = 3
+BULK_MAX_RETRY_AFTER_SECONDS = 10.0
+BULK_MAX_WAVE_PAUSE_SECONDS = 3600.0
+ACTOR_PATTERN = re.compile(r"[A-Za-z0-9._@:-]{1,128}")
+
+
+def parse_bulk_request(payload: object, settings: Settings) -> tuple[str, tuple[FleetAgent, ...], int, int, float]:
+    """Validate a ``POST /bulk/operations`` body into operation, stores, wave size, error budget and pause."""
+    if not isinstance(payload, dict):
+        raise ValueError("request body must be a JSON object")
+    operation = payload.get("operation")
+    if operation not in BULK_OPERATIONS:
+        raise ValueError(f"operation must be one of {', '.join(sorted(BULK_OPERATIONS))}")
+
+    selector = payload.get("selector")
+    registered = {agent.store_id: agent for agent in settings.agents}
+    if not isinstance(selector, dict) or len(selector) != 1:
+        raise ValueError("selector must be {\"all\": true} or {\"store_ids\": [...]}")
+    if selector.get("all") is True:
+        agents = settings.agents
+    elif "store_ids" in selector:
+        store_ids = selector["store_ids"]
+        if not isinstance(store_ids, list) or not all(isinstance(store_id, str) for store_id in store_ids):
+            raise ValueError("selector.store_ids must be a list of store ids")
+        if len(set(store_ids)) != len(store_ids):
+            raise ValueError("selector.store_ids lists a store twice")
+        unknown = [store_id for store_id in store_ids if store_id not in registered]
+        if unknown:
+            raise ValueError(f"unknown store_id: {', '.join(unknown[:5])}")
+        agents = tuple(registered[store_id] for store_id in store_ids)
+    else:
+        raise ValueError("selector must be {\"all\": true} or {\"store_ids\": [...]}")
+    if not agents:
+        raise ValueError("selector matches no stores")
+
+    def integer(name: str, default: int, minimum: int, maximum: int) -> int:
+        value = payload.get(name, default)
+        if isinstance(value, bool) or not isinstance(value, int) or not minimum <= value <= maximum:
+            raise ValueError(f"{name} must be an integer between {minimum} and {maximum}")
+        return value
+
+    wave_size = integer("wave_size", min(10, settings.bulk_max_wave_size), 1, settings.bulk_max_wave_size)
+    max_failures = integer("max_failures", 0, 0, len(agents))
+    pause = payload.get("wave_pause_seconds", 0)
+    if isinstance(pause, bool) or not isinstance(pause, (int, float)) or not 0 <= pause <= BULK_MAX_WAVE_PAUSE_SECONDS:
+        raise ValueError(f"wave_pause_seconds must be a number between 0 and {BULK_MAX_WAVE_PAUSE_SECONDS:g}")
+    return operation, agents, wave_size, max_failures, float(pause)
+
+
+def _json_object(body: bytes) -> dict:
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return {}
+    return payload if isinstance(payload, dict) else {}
+
+
+def _retry_after(headers: http.client.HTTPMessage | None) -> float:
+    try:
+        value = float("1" if headers is None else headers.get("Retry-After", "1"))
+    except ValueError:
+        value = 1.0
+    return min(max(value, 0.0), BULK_MAX_RETRY_AFTER_SECONDS)
+
+
+class BulkConflict(Exception):
+    """Another bulk run for the same operation is still running."""
+
+    def __init__(self, bulk_id: str) -> None:
+        super().__init__(f"bulk run {bulk_id} for this operation is still running")
+        self.bulk_id = bulk_id
+
+
+@dataclass
+class BulkStore:
+    store_id: str
+    wave: int
+    state: str = "pending"
+    error: str | None = None
+    job_id: str | None = None
+    duration_ms: float | None = None
+
+
+@dataclass
+class BulkRun:
+    bulk_id: str
+    operation: str
+    actor: str
+    wave_size: int
+    max_failures: int
+    wave_pause_seconds: float
+    created_at: str
+    stores: list[BulkStore]
+    state: str = "running"
+    waves_completed: int = 0
+    finished_at: str | None = None
+
+
+class BulkDispatcher:
+    """Runs one allowlisted agent operation across selected stores in waves.
+
+    Stores are split into waves of ``wave_size`` calls that run concurrently; the
+    next wave starts only once every store in the current one finished (for job
+    operations: once the agent job finished), plus ``wave_pause_seconds``. When
+    more than ``max_failures`` stores failed at a wave boundary, the run is
+    ``halted`` and the remaining stores are ``skipped``. Each call carries an
+    ``Idempotency-Key`` of ``<bulk_id>:<store_id>``, so retries of shed calls never
+    run an operation twice. Only one run per operation is active at a time, and
+    the last ``max_retained`` runs are kept for progress reads.
+    """
+
+    def __init__(self, max_retained: int = 50) -> None:
+        self.max_retained = max_retained
+        self._lock = Lock()
+        self._runs: dict[str, BulkRun] = {}
+
+    def submit(
+        self,
+        settings: Settings,
+        operation: str,
+        agents: tuple[FleetAgent, ...],
+        wave_size: int,
+        max_failures: int,
+        wave_pause_seconds: float,
+        actor: str,
+        trace: TraceContext,
+    ) -> dict:
+        with self._lock:
+            for active in self._runs.values():
+                if active.operation == operation and active.state == "running":
+                    raise BulkConflict(active.bulk_id)
+            run = BulkRun(
+                bulk_id=uuid4().hex,
+                operation=operation,
+                actor=actor,
+                wave_size=wave_size,
+                max_failures=max_failures,
+                wave_pause_seconds=wave_pause_seconds,
+                created_at=utc_ts(),
+                stores=[BulkStore(agent.store_id, index // wave_size + 1) for index, agent in enumerate(agents)],
+            )
+            self._runs[run.bulk_id] = run
+            finished = [bulk_id for bulk_id, kept in self._runs.items() if kept.state != "running"]
+            for bulk_id in finished[: max(0, len(self._runs) - self.max_retained)]:
+                del self._runs[bulk_id]
+            snapshot = self._snapshot(run)
+        Thread(target=self._run, args=(run, agents, settings, trace), name="control-plane-bulk", daemon=True).start()
+        print(
+            f"{utc_ts()} component=control-plane-api event=bulk-started bulk_id={run.bulk_id} "
+            f"operation={operation} stores={len(agents)} wave_size={wave_size} max_failures={max_failures}"
+        )
+        return snapshot
+
+    def get(self, bulk_id: str) -> dict | None:
+        with self._lock:
+            run = self._runs.get(bulk_id)
+            return None if run is None else self._snapshot(run)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._runs.clear()
+
+    def _snapshot(self, run: BulkRun) -> dict:
+        payload = asdict(run)
+        counts = dict.fromkeys(("pending", "running", "succeeded", "failed", "skipped"), 0)
+        for store in run.stores:
+            counts[store.state] += 1
+        payload["waves_total"] = run.stores[-1].wave if run.stores else 0
+        payload["counts"] = counts
+        return payload
+
+    def _run(self, run: BulkRun, agents: tuple[FleetAgent, ...], settings: Settings, trace: TraceContext) -> None:
+        waves: dict[int, list[tuple[BulkStore, FleetAgent]]] = {}
+        for store, agent in zip(run.stores, agents):
+            waves.setdefault(store.wave, []).append((store, agent))
+        halted = False
+        with ThreadPoolExecutor(max_workers=run.wave_size, thread_name_prefix="control-plane-bulk") as executor:
+            for number, wave in waves.items():
+                for future in [
+                    executor.submit(self._dispatch, run, store, agent, settings, trace) for store, agent in wave
+                ]:
+                    future.result()
+                with self._lock:
+                    run.waves_completed = number
+                    halted = sum(1 for store in run.stores if store.state == "failed") > run.max_failures
+                    if halted:
+                        for store in run.stores:
+                            if store.state == "pending":
+                                store.state = "skipped"
+                if halted:
+                    break
+                if run.wave_pause_seconds and number < len(waves):
+                    time.sleep(run.wave_pause_seconds)
+        with self._lock:
+            run.state = "halted" if halted else "completed"
+            run.finished_at = utc_ts()
+            counts = self._snapshot(run)["counts"]
+        METRICS.inc("control_plane_bulk_operations_total", run.operation, run.state)
+        print(
+            f"{utc_ts()} component=control-plane-api event=bulk-finished bulk_id={run.bulk_id} "
+            f"operation={run.operation} state={run.state} succeeded={counts['succeeded']} "
+            f"failed={counts['failed']} skipped={counts['skipped']}"
+        )
+
+    def _dispatch(
+        self, run: BulkRun, store: BulkStore, agent: FleetAgent, settings: Settings, trace: TraceContext
+    ) -> None:
+        with self._lock:
+            store.state = "running"
+        started = time.perf_counter()
+        try:
+            error = self._execute(run, store, agent, settings, trace)
+        except Exception as exc:  # noqa: BLE001
+            error = classify_agent_error(exc)
+        result = "failed" if error else "succeeded"
+        with self._lock:
+            store.state = result
+            store.error = error
+            store.duration_ms = round((time.perf_counter() - started) * 1000, 3)
+        METRICS.inc("control_plane_bulk_store_results_total", run.operation, result)
+
+    def _headers(self, run: BulkRun, agent: FleetAgent, settings: Settings) -> dict[str, str]:
+        return {
+            "Authorization": f"Bearer {TOKENS.token(settings, agent.store_id)}",
+            "X-Actor-Id": run.actor,
+        }
+
+    def _execute(
+        self, run: BulkRun, store: BulkStore, agent: FleetAgent, settings: Settings, trace: TraceContext
+    ) -> str | None:
+        """Run the operation on one store; returns ``None`` on success, else a short error."""
+        path, is_job = BULK_OPERATIONS[run.operation]
+        for attempt in range(1, BULK_MAX_ATTEMPTS + 1):
+            headers = self._headers(run, agent, settings)
+            headers["Idempotency-Key"] = f"{run.bulk_id}:{store.store_id}"
+            headers["Content-Type"] = "application/json"
+            code, response_headers, body = FLEET.call(
+                trace, agent, "POST", path, headers, settings.bulk_call_timeout_seconds, b"{}"
+            )
+            payload = _json_object(body)
+            if (code, payload.get("error_code")) not in BULK_RETRYABLE or attempt == BULK_MAX_ATTEMPTS:
+                break
+            time.sleep(_retry_after(response_headers))
+        if code in (401, 403):
+            return "unauthorized"
+        if code == 200 and not is_job:
+            return None
+        if code == 202 and is_job:
+            job = payload.get("job")
+            job_id = job.get("job_id") if isinstance(job, dict) else None
+            if not isinstance(job_id, str) or not job_id.isalnum():
+                return "invalid response"
+            with self._lock:
+                store.job_id = job_id
+            return self._await_job(run, agent, job_id, settings, trace)
+        error_code = payload.get("error_code")
+        return error_code if isinstance(error_code, str) and error_code else f"http {code}"
+
+    def _await_job(
+        self, run: BulkRun, agent: FleetAgent, job_id: str, settings: Settings, trace: TraceContext
+    ) -> str | None:
+        """Poll ``GET /ops/jobs/{job_id}`` until the job finished; unreachable polls are retried until the deadline."""
+        deadline = time.monotonic() + settings.bulk_job_timeout_seconds
+        while True:
+            time.sleep(settings.bulk_job_poll_seconds)
+            try:
+                code, _, body = FLEET.call(
+                    trace,
+                    agent,
+                    "GET",
+                    f"/ops/jobs/{job_id}",
+                    self._headers(run, agent, settings),
+                    settings.bulk_call_timeout_seconds,
+                    route="/ops/jobs/{job_id}",
+                )
+            except Exception:  # noqa: BLE001
+                code, body = 0, b""
+            if code in (401, 403):
+                return "unauthorized"
+            if code == 404:
+                return "job not found"
+            job = _json_object(body).get("job") if code == 200 else None
+            if isinstance(job, dict) and job.get("finished_at"):
+                if job.get("state") == "succeeded":
+                    return None
+                error_code = job.get("error_code")
+                return error_code if isinstance(error_code, str) and error_code else "job failed"
+            if time.monotonic() >= deadline:
+                return "job timeout"
+
+
+METRICS = MetricsRegistry()
+TRACER = Tracer("control-plane-api")
+PROFILER = SamplingProfiler("control-plane-api", lambda event, fields: _log_profile(event, fields))
+TOKENS = AgentTokenMinter()
+FLEET = FleetClient()
+FLEET_CACHE = FleetStateCache()
+BULK = BulkDispatcher()
+METRICS.describe(
+    "control_plane_requests_total", "counter", "Requests by route, method and HTTP code.", ("route", "method", "code")
+)
+METRICS.describe(
+    "control_plane_request_duration_seconds", "histogram", "Request handling latency by route.", ("route",)
+)
+METRICS.describe("control_plane_requests_in_flight", "gauge", "Requests currently being handled.")
+METRICS.describe("control_plane_auth_failures_total", "counter", "Requests rejected as unauthorized.")
+METRICS.describe(
+    "control_plane_fleet_agent_requests_total", "counter", "Shop agent status reads by result.", ("result",)
+)
+METRICS.describe("control_plane_fleet_agent_duration_seconds", "histogram", "Shop agent status read latency.")
+METRICS.describe(
+    "control_plane_fleet_stale_entries",
+    "gauge",
+    "Fleet cache entries without a successful read within the staleness limit.",
+    callback=lambda: sum(1 for entry in FLEET_CACHE.snapshot(current_settings()) if entry["stale"]),
+)
+METRICS.describe("control_plane_agent_tokens_signed_total", "counter", "Agent tokens signed.")
+METRICS.describe(
+    "control_plane_trace_spans_exported_total", "counter", "Sampled spans exported.", callback=lambda: TRACER.exported
+)
+METRICS.describe(
+    "control_plane_trace_spans_dropped_total",
+    "counter",
+    "Sampled spans dropped because the span buffer was full or their export failed.",
+    callback=lambda: TRACER.dropped,
+)
+METRICS.describe(
+    "control_plane_agent_token_cache_requests_total",
+    "counter",
+    "Agent token lookups by cache result (hit reuses a signed token).",
+    ("result",),
+)
+METRICS.describe(
+    "control_plane_bulk_operations_total",
+    "counter",
+    "Finished bulk runs by operation and state.",
+    ("operation", "state"),
+)
+METRICS.describe(
+    "control_plane_bulk_store_results_total",
+    "counter",
+    "Per-store bulk operation results.",
+    ("operation", "result"),
+)
+
+
+@dataclass(frozen=True)
+class Route:
+    """One path template with its per-method ``Handler`` methods and required bearer token."""
+
+    template: str
+    methods: Mapping[str, str]
+    auth: str | None = None
+    pattern: "re.Pattern[str] | None" = None
+
+
+def route(template: str, auth: str | None = None, **methods: str) -> Route:
+    pattern = None
+    if "{" in template:
+        pattern = re.compile(re.sub(r"\{(\w+)\}", r"(?P<\1>[^/]+)", template))
+    return Route(template, methods, auth, pattern)
+
+
+# Compiled once at import; route templates double as the metric route label.
+ROUTES = (
+    route("/health", GET="_get_health"),
+    route("/status", GET="_get_status"),
+    route("/metrics", auth="metrics", GET="_get_metrics"),
+    route("/fleet/status", auth="api", GET="_get_fleet_status"),
+    route("/fleet/state", auth="api", GET="_get_fleet_state"),
+    route("/bulk/operations", auth="api", POST="_post_bulk_operation"),
+    route("/bulk/operations/{bulk_id}", auth="api", GET="_get_bulk_operation"),
+)
+STATIC_ROUTES = {entry.template: entry for entry in ROUTES if entry.pattern is None}
+PATTERN_ROUTES = tuple(entry for entry in ROUTES if entry.pattern is not None)
+MAX_REQUEST_BODY_BYTES = 65536
+
+
+def match_route(path: str) -> tuple[Route | None, dict[str, str]]:
+    """Resolve a parsed request path (no query string) to its route and path parameters."""
+    found = STATIC_ROUTES.get(path)
+    if found is not None:
+        return found, {}
+    for candidate in PATTERN_ROUTES:
+        assert candidate.pattern is not None
+        matched = candidate.pattern.fullmatch(path)
+        if matched is not None:
+            return candidate, matched.groupdict()
+    return None, {}
+
+
+def request_ready(handler: "Handler") -> bool:
+    """Whether the handler's next request can be read without blocking.
+
+    Pipelined requests may already sit in ``rfile``'s buffer where a selector cannot
+    see them, so the buffer is peeked with the socket briefly made non-blocking. A
+    closed or failed connection sets ``close_connection`` and is not ready.
+    """
+    connection = handler.connection
+    timeout = connection.gettimeout()
+    connection.setblocking(False)
+    try:
+        if isinstance(handler.rfile, BufferedReader) and handler.rfile.peek(1):
+            return True
+        # An empty peek is either "nothing yet" or EOF; only EOF reads as b"" here.
+        if connection.recv(1, socket.MSG_PEEK) == b"":
+            handler.close_connection = True
+        return False
+    except BlockingIOError:
+        return False
+    except OSError:
+        handler.close_connection = True
+        return False
+    finally:
+        connection.settimeout(timeout)
+
+
+class IdleConnectionPoller:
+    """Holds idle keep-alive connections off the worker pool until their next request.
+
+    A worker that answered a request and finds nothing more to read parks the handler
+    here instead of blocking on the connection. One thread waits on every parked socket
+    with a selector and passes the handler to ``resume`` once it turns readable (a new
+    request, or EOF when the client closed). Handlers idle for ``idle_timeout`` seconds
+    are passed to ``expire``. Deadlines follow parking order, so expiry only looks at
+    the oldest entries.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        idle_timeout: float,
+        resume: Callable[["Handler"], None],
+        expire: Callable[["Handler"], None],
+    ) -> None:
+        self.name = name
+        self.idle_timeout = idle_timeout
+        self._resume = resume
+        self._expire = expire
+        self._pending: deque["Handler"] = deque()
+        self._closed = False
+        self._lock = Lock()
+        self._thread: Thread | None = None
+        self._wake_reader, self._wake_writer = socket.socketpair()
+        self._wake_writer.setblocking(False)
+
+    def park(self, handler: "Handler") -> None:
+        with self._lock:
+            closed = self._closed
+            if not closed:
+                self._pending.append(handler)
+                if self._thread is None:
+                    self._thread = Thread(target=self._run, name=self.name, daemon=True)
+                    self._thread.start()
+        if closed:
+            self._expire(handler)
+            return
+        self._wake()
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Stop polling and expire every parked handler."""
+        with self._lock:
+            self._closed = True
+            thread = self._thread
+        self._wake()
+        if thread is not None:
+            thread.join(timeout=timeout)
+        else:
+            self._wake_reader.close()
+            self._wake_writer.close()
+
+    def _wake(self) -> None:
+        try:
+            self._wake_writer.send(b"\0")
+        except OSError:
+            # A full wake buffer already guarantees a wake-up; a closed one means shutdown.
+            pass
+
+    def _run(self) -> None:
+        selector = selectors.DefaultSelector()
+        selector.register(self._wake_reader, selectors.EVENT_READ)
+        deadlines: OrderedDict[int, tuple["Handler", float]] = OrderedDict()
+        try:
+            while True:
+                with self._lock:
+                    closed = self._closed
+                    pending = list(self._pending)
+                    self._pending.clear()
+                if closed:
+                    for handler in pending:
+                        self._expire(handler)
+                    break
+                now = time.monotonic()
+                for handler in pending:
+                    try:
+                        key = selector.register(handler.connection, selectors.EVENT_READ, handler)
+                    except (OSError, ValueError):
+                        self._expire(handler)
+                        continue
+                    deadlines[key.fd] = (handler, now + self.idle_timeout)
+                while deadlines:
+                    fd, (handler, deadline) = next(iter(deadlines.items()))
+                    if deadline > now:
+                        break
+                    del deadlines[fd]
+                    selector.unregister(handler.connection)
+                    self._expire(handler)
+                wait = next(iter(deadlines.values()))[1] - now if deadlines else None
+                for key, _ in selector.select(wait):
+                    if key.data is None:
+                        self._wake_reader.recv(4096)
+                        continue
+                    selector.unregister(key.fileobj)
+                    del deadlines[key.fd]
+                    self._resume(key.data)
+        finally:
+            for handler, _ in deadlines.values():
+                self._expire(handler)
+            selector.close()
+            self._wake_reader.close()
+            self._wake_writer.close()
+
+
+class ControlPlaneHTTPServer(HTTPServer):
+    """HTTP server that serves requests on a bounded worker pool.
+
+    Connections are kept alive (HTTP/1.1) until the client closes them or they
+    stay idle for ``idle_timeout`` seconds, so a slow fleet fan-out no longer
+    queues every other caller behind it. A connection holds a worker only while
+    it has a request to read; between requests it waits in an
+    ``IdleConnectionPoller``, so idle clients never starve the pool.
+    """
+
+    keep_alive = True
+    # UI and automation reconnect in bursts; the default backlog of 5 drops SYNs.
+    request_queue_size = 64
+
+    def __init__(
+        self,
+        server_address: tuple[str, int],
+        handler_class: type[BaseHTTPRequestHandler],
+        *,
+        max_workers: int = 16,
+        idle_timeout: float = 15.0,
+    ) -> None:
+        super().__init__(server_address, handler_class)
+        self.idle_timeout = idle_timeout
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="control-plane-worker")
+        self._handler_class = handler_class
+        self._idle = IdleConnectionPoller("control-plane-idle-connections", idle_timeout, self._resume, self._expire)
+
+    def process_request(self, request, client_address) -> None:
+        # Bounds a read that stalls mid-request; waiting between requests is the poller's job.
+        request.settimeout(self.idle_timeout)
+        self._pool.submit(self._process_request_worker, request, client_address)
+
+    def _process_request_worker(self, request, client_address) -> None:
+        try:
+            handler = self._handler_class(request, client_address, self)
+        except Exception:  # noqa: BLE001
+            self.handle_error(request, client_address)
+            self.shutdown_request(request)
+            return
+        self._after_turn(handler)
+
+    def _resume(self, handler: "Handler") -> None:
+        try:
+            self._pool.submit(self._resume_worker, handler)
+        except RuntimeError:
+            # The pool is shut down, so the server is closing.
+            self._expire(handler)
+
+    def _resume_worker(self, handler: "Handler") -> None:
+        try:
+            handler.handle()
+        except Exception:  # noqa: BLE001
+            handler.parked = False
+            self.handle_error(handler.request, handler.client_address)
+        finally:
+            handler.finish()
+        self._after_turn(handler)
+
+    def _after_turn(self, handler: BaseHTTPRequestHandler) -> None:
+        if isinstance(handler, Handler) and handler.parked:
+            self._idle.park(handler)
+        else:
+            self.shutdown_request(handler.request)
+
+    def _expire(self, handler: "Handler") -> None:
+        handler.parked = False
+        handler.finish()
+        self.shutdown_request(handler.request)
+
+    def server_close(self) -> None:
+        super().server_close()
+        self._idle.close()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
 class Handler(BaseHTTPRequestHandler):
     server_version = "BoilerDropControlPlane/0.1"
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out as separate writes; with Nagle enabled a kept-alive
+    # client waits for the delayed ACK (~40 ms) before receiving the body.
+    disable_nagle_algorithm = True
+    _trace: TraceContext
+    _response_code = 0
+    _started = 0.0
+    _body = b""
+    # Set when a pooled server should keep the connection open for the idle poller.
+    parked = False
+
+    def setup(self) -> None:
+        # Plain HTTPServer instances keep HTTP/1.0 semantics so one idle client
+        # cannot monopolise the only serving thread.
+        if not getattr(self.server, "keep_alive", False):
+            self.protocol_version = "HTTP/1.0"
+        super().setup()
+
+    def handle(self) -> None:
+        if not getattr(self.server, "keep_alive", False):
+            super().handle()
+            return
+        # Serve what can be read now; the server parks the connection until the next request.
+        self.parked = False
+        self.close_connection = False
+        while not self.close_connection and request_ready(self):
+            self.handle_one_request()
+        self.parked = not self.close_connection
+
+    def finish(self) -> None:
+        if not self.parked:
+            super().finish()
 
     def _is_client_disconnect(self, exc: BaseException) -> bool:
         if isinstance(exc, (BrokenPipeError, ConnectionResetError)):
@@ -21,14 +1873,17 @@ class Handler(BaseHTTPRequestHandler):
             return exc.errno in {errno.EPIPE, errno.ECONNRESET, 54}
         return False
 
-    def _send_json(self, code: int, payload: dict) -> bool:
-        body = json.dumps(payload).encode("utf-8")
+    def _send_json(self, code: int, payload: dict, headers: dict[str, str] | None = None) -> bool:
+        return self._send_body(code, json.dumps(payload).encode("utf-8"), "application/json", headers)
+
+    def _send_body(self, code: int, body: bytes, content_type: str, headers: dict[str, str] | None = None) -> bool:
+        self._response_code = code
         try:
-            self.send_response(code)
-            self.send_header("Content-Type", "application/json")
-            self.send_header("Content-Length", str(len(body)))
-            self.end_headers()
-            self.wfile.write(body)
+            with self._trace.span("write"):
+                self._send_head(code, content_type, headers)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
             return True
         except Exception as exc:  # noqa: BLE001
             if self._is_client_disconnect(exc):
@@ -39,33 +1894,211 @@ class Handler(BaseHTTPRequestHandler):
                 return False
             raise
 
+    def _send_head(self, code: int, content_type: str, headers: dict[str, str] | None) -> None:
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        # Time spent handling the request up to the response head, for client-side latency breakdowns.
+        self.send_header("Server-Timing", f"app;dur={(time.perf_counter() - self._started) * 1000:.3f}")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+
     def _base_payload(self, status: str, message: str) -> dict:
         return {
             "request_id": str(uuid4()),
+            "trace_id": self._trace.trace_id,
             "timestamp": utc_ts(),
             "status": status,
             "message": message,
         }
 
+    def _error(
+        self, code: int, message: str, error_code: str, retryable: bool, headers: dict[str, str] | None = None
+    ) -> None:
+        payload = self._base_payload("failure", message)
+        payload["error_code"] = error_code
+        payload["retryable"] = retryable
+        self._send_json(code, payload, headers)
+
+    def _has_bearer(self, expected: str) -> bool:
+        auth_header = self.headers.get("Authorization", "")
+        if not expected or not auth_header.startswith("Bearer "):
+            return False
+        return hmac.compare_digest(auth_header.split(" ", 1)[1], expected)
+
+    def _read_body(self) -> bool:
+        """Consume the request body so a kept-alive connection stays in sync; False if rejected."""
+        self._body = b""
+        try:
+            length = int(self.headers.get("Content-Length", "0"))
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.close_connection = True
+            self._error(400, "invalid Content-Length", "INVALID_REQUEST", retryable=False)
+            return False
+        if length > MAX_REQUEST_BODY_BYTES:
+            self.close_connection = True
+            self._error(413, "request body too large", "PAYLOAD_TOO_LARGE", retryable=False)
+            return False
+        if length:
+            self._body = self.rfile.read(length)
+        return True
+
+    def _dispatch(self) -> None:
+        self._started = time.perf_counter()
+        self._response_code = 0
+        METRICS.inc("control_plane_requests_in_flight")
+        matched, params = match_route(urlsplit(self.path).path)
+        label = "unmatched" if matched is None else matched.template
+        self._trace = TRACER.begin(self.headers.get("traceparent"), f"{self.command} {label}")
+        if PROFILER.active:
+            PROFILER.enter(f"{self.command} {label}")
+        try:
+            if self._read_body():
+                with self._trace.span("handler"):
+                    self._serve(current_settings(), matched, params)
+        finally:
+            if PROFILER.active:
+                PROFILER.leave()
+            METRICS.inc("control_plane_requests_in_flight", value=-1)
+            METRICS.inc("control_plane_requests_total", label, self.command, str(self._response_code))
+            METRICS.observe("control_plane_request_duration_seconds", time.perf_counter() - self._started, label)
+            if self._trace.recording:
+                self._trace.finish(self._response_code, {"http.request.method": self.command, "http.route": label})
+
+    def _serve(self, settings: Settings, matched: Route | None, params: dict[str, str]) -> None:
+        if matched is None:
+            self._error(404, "route not found", "NOT_FOUND", retryable=False)
+            return
+        method = matched.methods.get(self.command)
+        if method is None:
+            allow = ", ".join(sorted(matched.methods))
+            self._error(405, "method not allowed", "METHOD_NOT_ALLOWED", retryable=False, headers={"Allow": allow})
+            return
+        if matched.auth is not None:
+            expected = settings.metrics_token if matched.auth == "metrics" else settings.api_token
+            with self._trace.span("auth"):
+                authorized = self._has_bearer(expected)
+            if not authorized:
+                METRICS.inc("control_plane_auth_failures_total")
+                self._error(401, "unauthorized", "UNAUTHORIZED", retryable=False)
+                return
+        getattr(self, method)(settings, **params)
+
     def do_GET(self) -> None:  # noqa: N802
-        if self.path == "/health":
-            payload = self._base_payload("success", "control-plane-api healthy")
-            payload["component"] = "control-plane-api"
-            self._send_json(200, payload)
+        self._dispatch()
+
+    def do_POST(self) -> None:  # noqa: N802
+        self._dispatch()
+
+    def do_PUT(self) -> None:  # noqa: N802
+        self._dispatch()
+
+    def do_PATCH(self) -> None:  # noqa: N802
+        self._dispatch()
+
+    def do_DELETE(self) -> None:  # noqa: N802
+        self._dispatch()
+
+    def _get_health(self, settings: Settings) -> None:
+        payload = self._base_payload("success", "control-plane-api healthy")
+        payload["component"] = "control-plane-api"
+        self._send_json(200, payload)
+
+    def _get_status(self, settings: Settings) -> None:
+        payload = self._base_payload("success", "control-plane status")
+        payload["component"] = "control-plane-api"
+        payload["version"] = settings.version
+        payload["deployment_version"] = settings.deployment_version
+        self._send_json(200, payload)
+
+    def _get_metrics(self, settings: Settings) -> None:
+        self._send_body(200, METRICS.render().encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8")
+
+    def _get_fleet_state(self, settings: Settings) -> None:
+        stores = sorted(FLEET_CACHE.snapshot(settings), key=lambda entry: entry["store_id"])
+        payload = self._base_payload("success", "cached fleet state")
+        payload["stores"] = stores
+        payload["summary"] = {
+            "total": len(stores),
+            "ok": sum(1 for entry in stores if entry["result"] == "ok"),
+            "error": sum(1 for entry in stores if entry["result"] == "error"),
+            "stale": sum(1 for entry in stores if entry["stale"]),
+        }
+        self._send_json(200, payload)
+
+    def _get_fleet_status(self, settings: Settings) -> None:
+        if "application/x-ndjson" in self.headers.get("Accept", ""):
+            self._stream_fleet_status(settings)
             return
+        started = time.perf_counter()
+        stores = sorted(FLEET.statuses(settings, self._trace), key=lambda entry: entry["store_id"])
+        payload = self._base_payload("success", "fleet status")
+        payload["stores"] = stores
+        payload["summary"] = self._fleet_summary(stores, started)
+        self._send_json(200, payload)
 
-        if self.path == "/status":
-            payload = self._base_payload("success", "control-plane status")
-            payload["component"] = "control-plane-api"
-            payload["version"] = os.getenv("CONTROL_PLANE_VERSION", "dev")
-            payload["deployment_version"] = os.getenv("DEPLOYMENT_VERSION", "unknown")
-            self._send_json(200, payload)
+    def _get_bulk_operation(self, settings: Settings, bulk_id: str) -> None:
+        bulk = BULK.get(bulk_id)
+        if bulk is None:
+            self._error(404, "bulk run not found", "NOT_FOUND", retryable=False)
             return
+        payload = self._base_payload("success", f"bulk run {bulk['state']}")
+        payload["bulk"] = bulk
+        self._send_json(200, payload)
 
-        payload = self._base_payload("failure", "route not found")
-        payload["error_code"] = "NOT_FOUND"
-        payload["retryable"] = False
-        self._send_json(404, payload)
+    def _post_bulk_operation(self, settings: Settings) -> None:
+        actor = self.headers.get("X-Actor-Id", "control-plane")
+        try:
+            if not self._body:
+                raise ValueError("request body must be a JSON object")
+            payload = json.loads(self._body)
+            if not ACTOR_PATTERN.fullmatch(actor):
+                raise ValueError("X-Actor-Id must be 1-128 characters of [A-Za-z0-9._@:-]")
+            request = parse_bulk_request(payload, settings)
+        except ValueError as exc:
+            self._error(400, str(exc), "INVALID_REQUEST", retryable=False)
+            return
+        try:
+            bulk = BULK.submit(settings, *request, actor=actor, trace=self._trace)
+        except BulkConflict as exc:
+            self._error(409, str(exc), "BULK_IN_PROGRESS", retryable=True)
+            return
+        payload = self._base_payload("success", "bulk run accepted")
+        payload["bulk"] = bulk
+        self._send_json(202, payload, {"Location": f"/bulk/operations/{bulk['bulk_id']}"})
+
+    def _fleet_summary(self, stores: list[dict], started: float) -> dict:
+        ok = sum(1 for entry in stores if entry["result"] == "ok")
+        return {
+            "total": len(stores),
+            "ok": ok,
+            "error": len(stores) - ok,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+        }
+
+    def _stream_fleet_status(self, settings: Settings) -> None:
+        """Write one NDJSON line per store as its read finishes, then a summary line."""
+        started = time.perf_counter()
+        self._response_code = 200
+        # No Content-Length: the body ends when the connection closes.
+        self.close_connection = True
+        stores: list[dict] = []
+        try:
+            self._send_head(200, "application/x-ndjson", {"Connection": "close"})
+            self.end_headers()
+            for entry in FLEET.statuses(settings, self._trace):
+                stores.append(entry)
+                self.wfile.write((json.dumps({"type": "store", **entry}) + "\n").encode("utf-8"))
+            summary = {"type": "summary", **self._fleet_summary(stores, started)}
+            self.wfile.write((json.dumps(summary) + "\n").encode("utf-8"))
+        except Exception as exc:  # noqa: BLE001
+            if not self._is_client_disconnect(exc):
+                raise
+            print(
+                f"{utc_ts()} component=control-plane-api event=client-disconnect "
+                f"method={self.command} path={self.path} code=200"
+            )
 
     def log_message(self, fmt: str, *args) -> None:  # noqa: A003
         # Keep logs structured-ish and avoid noisy default format.
@@ -73,12 +2106,61 @@ class Handler(BaseHTTPRequestHandler):
         print(f"{utc_ts()} method={self.command} path={self.path} msg={msg}")
 
 
+def _reload_and_log() -> None:
+    try:
+        settings = reload_settings()
+    except ValueError as exc:
+        print(f"{utc_ts()} component=control-plane-api event=settings-reload-rejected error={exc}")
+        return
+    print(
+        f"{utc_ts()} component=control-plane-api event=settings-reloaded "
+        f"version={settings.version} deployment_version={settings.deployment_version}"
+    )
+
+
+RELOADER = SettingsReloader("control-plane-settings-reload", _reload_and_log)
+
+
+def _handle_sighup(signum: int, frame: object) -> None:
+    RELOADER.request()
+
+
+def _log_profile(event: str, fields: dict[str, object]) -> None:
+    details = " ".join(f"{key}={value}" for key, value in fields.items())
+    print(f"{utc_ts()} component=control-plane-api event={event} pid={os.getpid()} {details}")
+
+
+def _handle_sigusr2(signum: int, frame: object) -> None:
+    if not PROFILER.trigger():
+        print(f"{utc_ts()} component=control-plane-api event=profile-already-running pid={os.getpid()}")
+
+
 def main() -> None:
-    host = os.getenv("HOST", "0.0.0.0")
-    port = int(os.getenv("PORT", "8080"))
-    httpd = HTTPServer((host, port), Handler)
-    print(f"{utc_ts()} control-plane-api listening on {host}:{port}")
-    httpd.serve_forever()
+    try:
+        settings = reload_settings()
+    except ValueError as exc:
+        raise SystemExit(f"control-plane-api configuration error: {exc}") from None
+    if hasattr(signal, "SIGHUP"):
+        RELOADER.start()
+        signal.signal(signal.SIGHUP, _handle_sighup)
+    if hasattr(signal, "SIGUSR2"):
+        signal.signal(signal.SIGUSR2, _handle_sigusr2)
+    # Worker count and idle timeout apply at startup only; SIGHUP does not resize the pool.
+    httpd = ControlPlaneHTTPServer(
+        (settings.host, settings.port),
+        Handler,
+        max_workers=settings.workers,
+        idle_timeout=settings.idle_timeout_seconds,
+    )
+    FLEET_CACHE.start()
+    print(f"{utc_ts()} control-plane-api listening on {settings.host}:{settings.port}")
+    try:
+        httpd.serve_forever()
+    finally:
+        # A profile cut short by shutdown is still written.
+        PROFILER.stop()
+        # Buffered spans are exported before exit.
+        TRACER.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,809 @@
+import base64
+import hashlib
+import hmac
+import http.client
+import importlib.util
+import json
+import os
+import pathlib
+import signal
+import socket
+import tempfile
+import threading
+import time
+import unittest
+import unittest.mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+SERVER_PATH = ROOT / "src" / "server.py"
+
+spec = importlib.util.spec_from_file_location("control_plane_server", SERVER_PATH)
+server = importlib.util.module_from_spec(spec)
+assert spec.loader is not None
+spec.loader.exec_module(server)
+
+AGENT_SECRET = "fleet-secret"
+
+
+def _b64url_decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+class StubAgentHandler(BaseHTTPRequestHandler):
+    """Answers ``/<store_id>/...`` like a shop agent; the store id prefix picks the behavior."""
+
+    protocol_version = "HTTP/1.1"
+    client_ports: set[int] = set()
+    not_modified = 0
+    down: set[str] = set()
+    lock = threading.Lock()
+    in_flight = 0
+    max_in_flight = 0
+    posts: list[tuple[str, str, str | None, str | None]] = []
+    traceparents: list[tuple[str, str | None]] = []
+
+    def do_POST(self) -> None:  # noqa: N802
+        store_id, _, path = self.path.strip("/").partition("/")
+        self.rfile.read(int(self.headers.get("Content-Length", "0")))
+        with self.lock:
+            self.traceparents.append((store_id, self.headers.get("traceparent")))
+            StubAgentHandler.in_flight += 1
+            StubAgentHandler.max_in_flight = max(self.max_in_flight, self.in_flight)
+            attempt = sum(1 for post in self.posts if post[0] == store_id) + 1
+            self.posts.append((store_id, path, self.headers.get("Idempotency-Key"), self.headers.get("X-Actor-Id")))
+        time.sleep(0.1)
+        with self.lock:
+            StubAgentHandler.in_flight -= 1
+        if not self._authorized(store_id):
+            self._reply(401, b'{"error_code": "UNAUTHORIZED"}')
+        elif store_id.startswith("busy") and attempt == 1:
+            self._reply(503, b'{"error_code": "AGENT_BUSY"}', {"Retry-After": "0"})
+        elif path == "verify/smoke" and store_id.startswith("fail"):
+            self._reply(503, b'{"error_code": "SMOKE_FAILED"}')
+        elif path.startswith("ops/") and path != "ops/diagnostics":
+            job = {"job_id": f"job{store_id.replace('-', '')}", "state": "queued", "finished_at": None}
+            self._reply(202, json.dumps({"job": job}).encode("utf-8"))
+        else:
+            self._reply(200, b'{"status": "success"}')
+
+    def do_GET(self) -> None:  # noqa: N802
+        self.client_ports.add(self.client_address[1])
+        store_id = self.path.strip("/").split("/")[0]
+        with self.lock:
+            self.traceparents.append((store_id, self.headers.get("traceparent")))
+        if store_id.startswith("slow"):
+            time.sleep(1.0)
+        if not self._authorized(store_id):
+            self._reply(401, b'{"error_code": "UNAUTHORIZED"}')
+        elif "/ops/jobs/" in self.path:
+            failed = store_id.startswith("fail")
+            job = {
+                "job_id": self.path.rsplit("/", 1)[1],
+                "state": "failed" if failed else "succeeded",
+                "finished_at": "2026-10-17T00:00:00+00:00",
+                "error_code": "OPERATION_FAILED" if failed else None,
+            }
+            self._reply(200, json.dumps({"job": job}).encode("utf-8"))
+        elif store_id.startswith("fail") or store_id in self.down:
+            self._reply(500, b"{}")
+        elif store_id.startswith("garbage"):
+            self._reply(200, b"not json")
+        else:
+            status = {
+                "agent_version": "0.1.0",
+                "deployment_version": "ci",
+                "last_successful_operation_timestamp": None,
+                "component_states": {"backend_reachable": "yes"},
+                "component_states_checked_at": None,
+                "store_id": store_id,
+            }
+            etag = 'W/"v1"'
+            if self.headers.get("If-None-Match") == etag:
+                StubAgentHandler.not_modified += 1
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            self._reply(200, json.dumps(status).encode("utf-8"), {"ETag": etag})
+
+    def _authorized(self, store_id: str) -> bool:
+        token = self.headers.get("Authorization", "").removeprefix("Bearer ")
+        header, payload, signature = token.split(".")
+        expected = hmac.new(AGENT_SECRET.encode("utf-8"), f"{header}.{payload}".encode("utf-8"), hashlib.sha256)
+        claims = json.loads(_b64url_decode(payload))
+        return hmac.compare_digest(_b64url_decode(signature), expected.digest()) and claims["store_id"] == store_id
+
+    def _reply(self, code: int, body: bytes, headers: dict[str, str] | None = None) -> None:
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: object) -> None:  # noqa: A002
+        return
+
+
+class StubAgentServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # A whole fan-out connects at once; the default backlog of 5 drops SYNs.
+    request_queue_size = 64
+
+
+def closed_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class FleetTestCase(unittest.TestCase):
+    """Runs the control plane and a stub agent fleet; ``configure`` registers the given store ids."""
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.agents = StubAgentServer(("127.0.0.1", 0), StubAgentHandler)
+        # Timed-out reads leave the stub writing to a closed socket.
+        cls.agents.handle_error = lambda request, client_address: None  # type: ignore[method-assign]
+        cls.agents_thread = threading.Thread(target=cls.agents.serve_forever, daemon=True)
+        cls.agents_thread.start()
+        cls.httpd = server.ControlPlaneHTTPServer(("127.0.0.1", 0), server.Handler, max_workers=4, idle_timeout=2)
+        cls.port = cls.httpd.server_address[1]
+        cls.thread = threading.Thread(target=cls.httpd.serve_forever, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        for httpd, thread in ((cls.httpd, cls.thread), (cls.agents, cls.agents_thread)):
+            httpd.shutdown()
+            httpd.server_close()
+            thread.join(timeout=5)
+        server.FLEET.pool.close()
+
+    def configure(self, behaviors: list[str], **extra: str) -> None:
+        base = f"http://127.0.0.1:{self.agents.server_address[1]}"
+        registry = [{"store_id": name, "url": f"{base}/{name}"} for name in behaviors]
+        registry.append({"store_id": "offline", "url": f"http://127.0.0.1:{closed_port()}"})
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as handle:
+            json.dump(registry, handle)
+        self.addCleanup(os.unlink, handle.name)
+        env = {
+            "CONTROL_PLANE_API_TOKEN": "operator-token",
+            "CONTROL_PLANE_AGENTS_FILE": handle.name,
+            "CONTROL_PLANE_AGENT_JWT_SECRET": AGENT_SECRET,
+            "CONTROL_PLANE_FLEET_TIMEOUT_SECONDS": "0.3",
+            **extra,
+        }
+        server.reload_settings(env)
+        self.addCleanup(server.reload_settings, {})
+        server.FLEET.pool.close()
+        server.FLEET_CACHE.reset()
+        server.BULK.reset()
+        StubAgentHandler.client_ports = set()
+        StubAgentHandler.not_modified = 0
+        StubAgentHandler.down = set()
+        StubAgentHandler.in_flight = StubAgentHandler.max_in_flight = 0
+        StubAgentHandler.posts = []
+        StubAgentHandler.traceparents = []
+
+    def get(self, path: str, token: str | None = "operator-token") -> tuple[int, bytes]:
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=5)
+        headers = {}
+        if token is not None:
+            headers["Authorization"] = f"Bearer {token}"
+        conn.request("GET", path, headers=headers)
+        response = conn.getresponse()
+        body = response.read()
+        conn.close()
+        return response.status, body
+
+    def post(self, path: str, payload: object, headers: dict[str, str] | None = None) -> tuple[int, bytes, str | None]:
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=5)
+        body = json.dumps(payload).encode("utf-8")
+        conn.request("POST", path, body=body, headers={"Authorization": "Bearer operator-token", **(headers or {})})
+        response = conn.getresponse()
+        body = response.read()
+        conn.close()
+        return response.status, body, response.getheader("Location")
+
+
+class FleetStatusTests(FleetTestCase):
+    def test_fleet_status_requires_api_token(self) -> None:
+        self.configure(["shop-001"])
+        for token in (None, "wrong"):
+            with self.subTest(token=token):
+                code, body = self.get("/fleet/status", token=token)
+                self.assertEqual(code, 401)
+                self.assertEqual(json.loads(body)["error_code"], "UNAUTHORIZED")
+
+    def test_partial_results_are_classified_per_store(self) -> None:
+        self.configure(["shop-001", "slow", "fail", "garbage"])
+        code, body = self.get("/fleet/status")
+        self.assertEqual(code, 200)
+        payload = json.loads(body)
+        stores = {entry["store_id"]: entry for entry in payload["stores"]}
+        self.assertEqual(stores["shop-001"]["result"], "ok")
+        self.assertEqual(stores["shop-001"]["status"]["component_states"], {"backend_reachable": "yes"})
+        self.assertNotIn("store_id", stores["shop-001"]["status"])
+        self.assertEqual(
+            {name: entry["error"] for name, entry in stores.items() if entry["result"] == "error"},
+            {"slow": "timeout", "fail": "http 500", "garbage": "invalid response", "offline": "unreachable"},
+        )
+        self.assertLess(stores["slow"]["latency_ms"], 1000)
+        self.assertEqual(payload["summary"]["total"], 5)
+        self.assertEqual((payload["summary"]["ok"], payload["summary"]["error"]), (1, 4))
+
+    def test_agents_are_polled_concurrently(self) -> None:
+        self.configure([f"slow-{n}" for n in range(8)] + [f"shop-{n:03d}" for n in range(20)])
+        started = time.perf_counter()
+        code, body = self.get("/fleet/status")
+        self.assertEqual(code, 200)
+        # Eight 0.3 s timeouts in sequence would take 2.4 s.
+        self.assertLess(time.perf_counter() - started, 1.2)
+        self.assertEqual(json.loads(body)["summary"]["ok"], 20)
+
+    def test_connections_are_kept_alive_across_fan_outs(self) -> None:
+        self.configure(["shop-001"])
+        for _ in range(3):
+            code, _ = self.get("/fleet/status")
+            self.assertEqual(code, 200)
+        self.assertEqual(len(StubAgentHandler.client_ports), 1)
+
+    def test_ndjson_streams_each_store_then_summary(self) -> None:
+        self.configure(["shop-001", "slow"])
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=5)
+        conn.request(
+            "GET", "/fleet/status", headers={"Authorization": "Bearer operator-token", "Accept": "application/x-ndjson"}
+        )
+        response = conn.getresponse()
+        self.assertEqual(response.getheader("Content-Type"), "application/x-ndjson")
+        first = json.loads(response.readline())
+        # The fast stores arrive before the timed-out one finishes.
+        self.assertEqual(first["type"], "store")
+        self.assertNotEqual(first["store_id"], "slow")
+        lines = [json.loads(line) for line in response.read().splitlines()]
+        conn.close()
+        self.assertEqual([line["type"] for line in lines], ["store", "store", "summary"])
+        self.assertEqual(lines[-1]["total"], 3)
+
+
+class FleetStateCacheTests(FleetTestCase):
+    def poll(self, after: float = 1000.0) -> int:
+        return server.FLEET_CACHE.poll_once(server.current_settings(), time.monotonic() + after)
+
+    def cached(self) -> dict[str, dict]:
+        return {entry["store_id"]: entry for entry in server.FLEET_CACHE.snapshot(server.current_settings())}
+
+    def test_cache_revalidates_with_etag(self) -> None:
+        self.configure(["shop-001"])
+        self.assertEqual(self.cached()["shop-001"]["result"], "pending")
+        self.assertEqual(self.poll(), 2)
+        first = self.cached()
+        self.assertEqual(first["shop-001"]["status"]["agent_version"], "0.1.0")
+        self.assertFalse(first["shop-001"]["stale"])
+        self.assertEqual((first["offline"]["error"], first["offline"]["stale"]), ("unreachable", True))
+
+        self.poll(after=2000.0)
+        self.assertEqual(StubAgentHandler.not_modified, 1)
+        second = self.cached()["shop-001"]
+        self.assertEqual(second["status"], first["shop-001"]["status"])
+        self.assertGreaterEqual(second["refreshed_at"], first["shop-001"]["refreshed_at"])
+
+    def test_failed_read_keeps_last_status_and_turns_stale(self) -> None:
+        self.configure(["shop-001"], CONTROL_PLANE_FLEET_STALE_SECONDS="0.05")
+        self.poll()
+        StubAgentHandler.down = {"shop-001"}
+        time.sleep(0.1)
+        self.poll(after=2000.0)
+        entry = self.cached()["shop-001"]
+        self.assertEqual((entry["result"], entry["error"]), ("error", "http 500"))
+        self.assertEqual(entry["status"]["deployment_version"], "ci")
+        self.assertTrue(entry["stale"])
+        self.assertGreater(entry["age_seconds"], 0.05)
+
+    def test_poll_intervals_are_jittered_per_store(self) -> None:
+        self.configure([f"shop-{n:03d}" for n in range(20)], CONTROL_PLANE_FLEET_POLL_SECONDS="10")
+        self.poll()
+        now = time.monotonic()
+        self.assertEqual(self.poll(after=7.9), 0)
+        due = [server.FLEET_CACHE._due[f"shop-{n:03d}"] - now for n in range(20)]
+        self.assertTrue(all(7.9 <= delay <= 12.1 for delay in due))
+        self.assertGreater(len({round(delay, 3) for delay in due}), 10)
+
+    def test_fleet_state_endpoint_reads_the_cache(self) -> None:
+        self.configure(["shop-001"])
+        code, _ = self.get("/fleet/state", token="wrong")
+        self.assertEqual(code, 401)
+        self.poll()
+        code, body = self.get("/fleet/state")
+        self.assertEqual(code, 200)
+        payload = json.loads(body)
+        self.assertEqual(payload["summary"], {"total": 2, "ok": 1, "error": 1, "stale": 1})
+        self.assertEqual(len(StubAgentHandler.client_ports), 1)
+
+
+class BulkOperationTests(FleetTestCase):
+    def start(self, payload: dict, **extra: str) -> dict:
+        code, body, location = self.post("/bulk/operations", payload, {"X-Actor-Id": "ops@example"})
+        self.assertEqual(code, 202, body)
+        bulk = json.loads(body)["bulk"]
+        self.assertEqual(location, f"/bulk/operations/{bulk['bulk_id']}")
+        return bulk
+
+    def wait(self, bulk_id: str) -> dict:
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            code, body = self.get(f"/bulk/operations/{bulk_id}")
+            self.assertEqual(code, 200)
+            bulk = json.loads(body)["bulk"]
+            if bulk["state"] != "running":
+                return bulk
+            time.sleep(0.02)
+        self.fail(f"bulk run {bulk_id} did not finish")
+
+    def test_waves_bound_concurrency(self) -> None:
+        stores = [f"shop-{n:03d}" for n in range(6)]
+        self.configure(stores)
+        bulk = self.start({"operation": "ops.diagnostics", "selector": {"store_ids": stores}, "wave_size": 2})
+        self.assertEqual((bulk["waves_total"], bulk["counts"]["pending"] + bulk["counts"]["running"]), (3, 6))
+        bulk = self.wait(bulk["bulk_id"])
+        self.assertEqual((bulk["state"], bulk["waves_completed"], bulk["counts"]["succeeded"]), ("completed", 3, 6))
+        self.assertEqual(StubAgentHandler.max_in_flight, 2)
+        self.assertEqual([store["wave"] for store in bulk["stores"]], [1, 1, 2, 2, 3, 3])
+        self.assertEqual({post[3] for post in StubAgentHandler.posts}, {"ops@example"})
+
+    def test_error_budget_halts_the_rollout(self) -> None:
+        stores = ["fail-1", "fail-2", "shop-001", "shop-002", "shop-003"]
+        self.configure(stores, CONTROL_PLANE_BULK_JOB_POLL_SECONDS="0.01")
+        bulk = self.start(
+            {"operation": "ops.index.reindex", "selector": {"store_ids": stores}, "wave_size": 2, "max_failures": 1}
+        )
+        bulk = self.wait(bulk["bulk_id"])
+        self.assertEqual(bulk["state"], "halted")
+        self.assertEqual(bulk["counts"], {"pending": 0, "running": 0, "succeeded": 0, "failed": 2, "skipped": 3})
+        self.assertEqual(bulk["stores"][0]["error"], "OPERATION_FAILED")
+        self.assertEqual(len(StubAgentHandler.posts), 2)
+
+    def test_jobs_are_awaited_and_shed_calls_retried(self) -> None:
+        self.configure(["shop-001", "busy-1"], CONTROL_PLANE_BULK_JOB_POLL_SECONDS="0.01")
+        bulk = self.wait(self.start({"operation": "ops.cache.flush", "selector": {"all": True}})["bulk_id"])
+        stores = {store["store_id"]: store for store in bulk["stores"]}
+        self.assertEqual(stores["shop-001"]["job_id"], "jobshop001")
+        self.assertEqual((stores["busy-1"]["state"], stores["busy-1"]["job_id"]), ("succeeded", "jobbusy1"))
+        self.assertEqual((stores["offline"]["state"], stores["offline"]["error"]), ("failed", "unreachable"))
+        busy_keys = {post[2] for post in StubAgentHandler.posts if post[0] == "busy-1"}
+        self.assertEqual(busy_keys, {f"{bulk['bulk_id']}:busy-1"})
+        self.assertEqual(len([post for post in StubAgentHandler.posts if post[0] == "busy-1"]), 2)
+
+    def test_one_active_run_per_operation(self) -> None:
+        self.configure([f"shop-{n:03d}" for n in range(4)])
+        payload = {"operation": "ops.diagnostics", "selector": {"store_ids": ["shop-000", "shop-001"]}, "wave_size": 1}
+        bulk = self.start(payload)
+        code, body, _ = self.post("/bulk/operations", payload)
+        self.assertEqual((code, json.loads(body)["error_code"]), (409, "BULK_IN_PROGRESS"))
+        self.wait(bulk["bulk_id"])
+        self.wait(self.start(payload)["bulk_id"])
+
+    def test_invalid_requests_are_rejected(self) -> None:
+        self.configure(["shop-001"])
+        cases = [
+            [],
+            {"operation": "ops.db.drop", "selector": {"all": True}},
+            {"operation": "ops.cache.flush"},
+            {"operation": "ops.cache.flush", "selector": {"store_ids": ["shop-404"]}},
+            {"operation": "ops.cache.flush", "selector": {"all": True}, "wave_size": 0},
+            {"operation": "ops.cache.flush", "selector": {"all": True}, "max_failures": True},
+        ]
+        for payload in cases:
+            with self.subTest(payload=payload):
+                code, body, _ = self.post("/bulk/operations", payload)
+                self.assertEqual((code, json.loads(body)["error_code"]), (400, "INVALID_REQUEST"))
+        code, _, _ = self.post("/bulk/operations", cases[1], {"Authorization": "Bearer wrong"})
+        self.assertEqual(code, 401)
+        code, _ = self.get("/bulk/operations/unknown")
+        self.assertEqual(code, 404)
+        self.assertEqual(StubAgentHandler.posts, [])
+
+
+class StubCollectorHandler(BaseHTTPRequestHandler):
+    """Accepts OTLP/JSON trace exports on ``POST /v1/traces``."""
+
+    exports: list[tuple[str, str | None, dict]] = []
+
+    def do_POST(self) -> None:  # noqa: N802
+        body = self.rfile.read(int(self.headers.get("Content-Length", "0")))
+        self.exports.append((self.path, self.headers.get("Content-Type"), json.loads(body)))
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, format: str, *args: object) -> None:  # noqa: A002
+        return
+
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+
+
+class TracingTests(FleetTestCase):
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.export_file = pathlib.Path(tmp.name) / "spans.jsonl"
+        server.TRACER.reset()
+        self.addCleanup(server.TRACER.close)
+
+    def traced_get(self, path: str, flags: str) -> dict:
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=5)
+        headers = {"Authorization": "Bearer operator-token", "traceparent": f"00-{TRACE_ID}-{PARENT_ID}-{flags}"}
+        conn.request("GET", path, headers=headers)
+        response = conn.getresponse()
+        payload = json.loads(response.read())
+        conn.close()
+        self.assertEqual(response.status, 200)
+        return payload
+
+    def exported_spans(self, count: int) -> list[dict]:
+        """Spans exported so far, waiting up to a second for ``count`` (the root span trails the response)."""
+        deadline = time.monotonic() + 1.0
+        while True:
+            server.TRACER.flush()
+            spans = []
+            if self.export_file.exists():
+                for line in self.export_file.read_text(encoding="utf-8").splitlines():
+                    for resource in json.loads(line)["resourceSpans"]:
+                        for scope in resource["scopeSpans"]:
+                            spans.extend(scope["spans"])
+            if len(spans) >= count or time.monotonic() > deadline:
+                return spans
+            time.sleep(0.01)
+
+    def test_fleet_sweep_sends_each_agent_a_child_of_the_caller_trace(self) -> None:
+        self.configure(["shop-001", "fail"], CONTROL_PLANE_TRACE_EXPORT_FILE=str(self.export_file))
+        payload = self.traced_get("/fleet/status", "01")
+        self.assertEqual(payload["trace_id"], TRACE_ID)
+        received = dict(StubAgentHandler.traceparents)
+        self.assertEqual(sorted(received), ["fail", "shop-001"])
+        parsed = {store: server.parse_traceparent(header or "") for store, header in received.items()}
+        self.assertTrue(all(entry is not None and entry[0] == TRACE_ID and entry[2] for entry in parsed.values()))
+
+        by_name: dict[str, list[dict]] = {}
+        for span in self.exported_spans(7):
+            by_name.setdefault(span["name"], []).append(span)
+        self.assertEqual(sorted(by_name), ["GET /fleet/status", "GET /status", "auth", "handler", "write"])
+        root, handler = by_name["GET /fleet/status"][0], by_name["handler"][0]
+        self.assertEqual(root["parentSpanId"], PARENT_ID)
+        self.assertEqual(handler["parentSpanId"], root["spanId"])
+        calls = {}
+        for span in by_name["GET /status"]:
+            attributes = {entry["key"]: entry["value"] for entry in span["attributes"]}
+            calls[attributes["bolerdrop.store_id"]["stringValue"]] = span
+            self.assertEqual((span["kind"], span["parentSpanId"]), (3, handler["spanId"]))
+        # Each agent's parent id is the client span that timed its call.
+        for store in ("shop-001", "fail"):
+            entry = parsed[store]
+            assert entry is not None
+            self.assertEqual(entry[1], calls[store]["spanId"])
+        self.assertEqual(
+            {store: span["status"]["code"] for store, span in calls.items()}, {"shop-001": 0, "fail": 2, "offline": 2}
+        )
+
+    def test_unsampled_caller_is_propagated_without_recording(self) -> None:
+        self.configure(
+            ["shop-001"], CONTROL_PLANE_TRACE_EXPORT_FILE=str(self.export_file), CONTROL_PLANE_TRACE_SAMPLE_RATIO="1"
+        )
+        self.traced_get("/fleet/status", "00")
+        [(_, header)] = StubAgentHandler.traceparents
+        self.assertTrue(header is not None and header.startswith(f"00-{TRACE_ID}-") and header.endswith("-00"))
+        self.assertEqual(self.exported_spans(0), [])
+
+    def test_bulk_calls_join_the_submitting_request_trace(self) -> None:
+        self.configure(["shop-001", "shop-002"], CONTROL_PLANE_BULK_JOB_POLL_SECONDS="0.05")
+        code, body, _ = self.post(
+            "/bulk/operations",
+            {"operation": "ops.cache.flush", "selector": {"store_ids": ["shop-001", "shop-002"]}},
+            {"traceparent": f"00-{TRACE_ID}-{PARENT_ID}-01"},
+        )
+        self.assertEqual(code, 202)
+        payload = json.loads(body)
+        self.assertEqual(payload["trace_id"], TRACE_ID)
+        deadline = time.monotonic() + 5
+        while json.loads(self.get(f"/bulk/operations/{payload['bulk']['bulk_id']}")[1])["bulk"]["state"] == "running":
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.02)
+        # The flush POST and the job poll GET of each store.
+        self.assertEqual(len(StubAgentHandler.traceparents), 4)
+        self.assertTrue(all(header and header.split("-")[1] == TRACE_ID for _, header in StubAgentHandler.traceparents))
+
+    def test_spans_are_exported_to_a_collector_url(self) -> None:
+        collector = StubAgentServer(("127.0.0.1", 0), StubCollectorHandler)
+        thread = threading.Thread(target=collector.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(thread.join, 5)
+        self.addCleanup(collector.server_close)
+        self.addCleanup(collector.shutdown)
+        StubCollectorHandler.exports = []
+        url = f"http://127.0.0.1:{collector.server_address[1]}/v1/traces"
+        self.configure([], CONTROL_PLANE_TRACE_EXPORT_URL=url, CONTROL_PLANE_TRACE_SAMPLE_RATIO="1")
+        self.assertEqual(self.get("/status", token=None)[0], 200)
+        deadline = time.monotonic() + 1.0
+        while server.TRACER.exported < 3 and time.monotonic() < deadline:
+            server.TRACER.flush()
+            time.sleep(0.01)
+        path, content_type, document = StubCollectorHandler.exports[0]
+        self.assertEqual((path, content_type), ("/v1/traces", "application/json"))
+        resource = document["resourceSpans"][0]["resource"]["attributes"]
+        self.assertIn({"key": "service.name", "value": {"stringValue": "control-plane-api"}}, resource)
+        self.assertEqual((server.TRACER.exported, server.TRACER.dropped), (3, 0))
+
+
+class ProfilerTests(FleetTestCase):
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.profile_dir = pathlib.Path(tmp.name)
+        self.addCleanup(server.PROFILER.stop)
+        previous = signal.signal(signal.SIGUSR2, server._handle_sigusr2)
+        self.addCleanup(signal.signal, signal.SIGUSR2, previous)
+
+    def test_sigusr2_profile_attributes_a_slow_fan_out_to_its_route(self) -> None:
+        self.configure(
+            ["slow-001"], CONTROL_PLANE_PROFILE_DIR=str(self.profile_dir), CONTROL_PLANE_PROFILE_INTERVAL_MS="5"
+        )
+        with unittest.mock.patch.object(server.PROFILER, "enter") as enter:
+            self.assertEqual(self.get("/fleet/status")[0], 200)
+        enter.assert_not_called()
+
+        os.kill(os.getpid(), signal.SIGUSR2)
+        deadline = time.monotonic() + 1
+        while not server.PROFILER.active and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.get("/fleet/status")[0], 200)
+        server.PROFILER.stop()
+
+        [collapsed] = self.profile_dir.glob("control-plane-api-*.collapsed")
+        text = collapsed.read_text(encoding="utf-8")
+        self.assertNotIn("operator-token", text)
+        lines = text.splitlines()
+        self.assertTrue(any(line.startswith("GET /fleet/status;") and "_dispatch" in line for line in lines))
+        [routes] = self.profile_dir.glob("control-plane-api-*.routes.json")
+        summary = json.loads(routes.read_text(encoding="utf-8"))
+        wall = {entry["route"]: entry["wall_seconds"] for entry in summary["routes"]}
+        # The slow store is cut off by the 0.3 s fleet timeout.
+        self.assertGreater(wall["GET /fleet/status"], 0.2)
+
+
+class AgentTokenTests(unittest.TestCase):
+    def setUp(self) -> None:
+        server.TOKENS.reset()
+        server.METRICS.reset()
+        self.settings = server.Settings.from_env(
+            {"CONTROL_PLANE_AGENT_JWT_SECRET": AGENT_SECRET, "CONTROL_PLANE_AGENT_JWT_KID": "2026-10"}
+        )
+
+    def decode(self, token: str) -> tuple[dict, dict]:
+        header, payload, signature = token.split(".")
+        expected = hmac.new(AGENT_SECRET.encode("utf-8"), f"{header}.{payload}".encode("utf-8"), hashlib.sha256)
+        self.assertTrue(hmac.compare_digest(_b64url_decode(signature), expected.digest()))
+        return json.loads(_b64url_decode(header)), json.loads(_b64url_decode(payload))
+
+    def test_token_is_store_scoped_and_carries_kid(self) -> None:
+        header, claims = self.decode(server.TOKENS.token(self.settings, "shop-001", now=1000))
+        self.assertEqual(header, {"alg": "HS256", "typ": "JWT", "kid": "2026-10"})
+        self.assertEqual(
+            claims,
+            {"iss": "control-plane", "aud": "shop-agent", "sub": "control-plane", "store_id": "shop-001",
+             "iat": 1000, "exp": 1300},
+        )
+
+    def test_tokens_are_reused_until_shortly_before_expiry(self) -> None:
+        first = server.TOKENS.token(self.settings, "shop-001", now=1000)
+        self.assertEqual(server.TOKENS.token(self.settings, "shop-001", now=1269), first)
+        self.assertNotEqual(server.TOKENS.token(self.settings, "shop-002", now=1269), first)
+        renewed = server.TOKENS.token(self.settings, "shop-001", now=1270)
+        self.assertNotEqual(renewed, first)
+        self.assertEqual(self.decode(renewed)[1]["iat"], 1270)
+        metrics = server.METRICS.render()
+        self.assertIn("control_plane_agent_tokens_signed_total 3", metrics)
+        self.assertIn('control_plane_agent_token_cache_requests_total{result="hit"} 1', metrics)
+
+    def test_cache_hits_do_not_rehash_the_secret(self) -> None:
+        first = server.TOKENS.token(self.settings, "shop-001", now=1000)
+        with unittest.mock.patch.object(server.hashlib, "sha256", wraps=server.hashlib.sha256) as sha256:
+            self.assertEqual(server.TOKENS.token(self.settings, "shop-001", now=1001), first)
+        sha256.assert_not_called()
+        # A reloaded snapshot with the same signing parameters keeps the cached token.
+        reloaded = server.Settings.from_env(
+            {"CONTROL_PLANE_AGENT_JWT_SECRET": AGENT_SECRET, "CONTROL_PLANE_AGENT_JWT_KID": "2026-10"}
+        )
+        self.assertEqual(server.TOKENS.token(reloaded, "shop-001", now=1002), first)
+
+    def test_key_rotation_drops_cached_tokens(self) -> None:
+        first = server.TOKENS.token(self.settings, "shop-001", now=1000)
+        rotated = server.Settings.from_env(
+            {"CONTROL_PLANE_AGENT_JWT_SECRET": "next-secret", "CONTROL_PLANE_AGENT_JWT_KID": "2026-11"}
+        )
+        token = server.TOKENS.token(rotated, "shop-001", now=1001)
+        self.assertNotEqual(token, first)
+        self.assertEqual(json.loads(_b64url_decode(token.split(".")[0]))["kid"], "2026-11")
+
+    def test_agents_require_a_signing_secret(self) -> None:
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as handle:
+            json.dump([{"store_id": "shop-001", "url": "http://agent:8080"}], handle)
+        self.addCleanup(os.unlink, handle.name)
+        with self.assertRaisesRegex(ValueError, "CONTROL_PLANE_AGENT_JWT_SECRET"):
+            server.Settings.from_env({"CONTROL_PLANE_AGENTS_FILE": handle.name, "CONTROL_PLANE_AGENT_JWT_SECRET": ""})
+        # Without agents nothing is signed, so the secret stays optional.
+        unsigned = server.Settings.from_env({})
+        with self.assertRaisesRegex(ValueError, "CONTROL_PLANE_AGENT_JWT_SECRET"):
+            server.TOKENS.token(unsigned, "shop-001")
+
+    def test_ttl_must_fit_agent_max_ttl(self) -> None:
+        for env in (
+            {"CONTROL_PLANE_AGENT_JWT_TTL_SECONDS": "901"},
+            {"CONTROL_PLANE_AGENT_JWT_TTL_SECONDS": "60", "CONTROL_PLANE_AGENT_JWT_MAX_TTL_SECONDS": "30"},
+            {"CONTROL_PLANE_AGENT_JWT_TTL_SECONDS": "60", "CONTROL_PLANE_AGENT_JWT_REFRESH_SECONDS": "60"},
+        ):
+            with self.subTest(env=env):
+                with self.assertRaises(ValueError):
+                    server.Settings.from_env(env)
+
+
+class ServingTests(FleetTestCase):
+    def test_routes_match_the_parsed_path(self) -> None:
+        self.configure([])
+        server.METRICS.reset()
+        code, body = self.get("/status?verbose=1")
+        self.assertEqual((code, json.loads(body)["component"]), (200, "control-plane-api"))
+        code, _ = self.get("/status/extra")
+        self.assertEqual(code, 404)
+        # Requests are counted after the response is written.
+        deadline = time.monotonic() + 2
+        while 'route="unmatched"' not in server.METRICS.render() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        metrics = server.METRICS.render()
+        self.assertIn('control_plane_requests_total{route="/status",method="GET",code="200"} 1', metrics)
+        self.assertIn('control_plane_requests_total{route="unmatched",method="GET",code="404"} 1', metrics)
+
+    def test_wrong_method_is_405_with_allow(self) -> None:
+        self.configure([])
+        for method, path, allow in (("POST", "/status", "GET"), ("GET", "/bulk/operations", "POST"),
+                                    ("DELETE", "/bulk/operations/abc", "GET")):
+            with self.subTest(method=method, path=path):
+                conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=5)
+                conn.request(method, path, headers={"Authorization": "Bearer operator-token"})
+                response = conn.getresponse()
+                body = json.loads(response.read())
+                conn.close()
+                self.assertEqual((response.status, body["error_code"]), (405, "METHOD_NOT_ALLOWED"))
+                self.assertEqual(response.getheader("Allow"), allow)
+
+    def test_connection_is_kept_alive_with_timing(self) -> None:
+        self.configure([])
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=5)
+        conn.request("POST", "/bulk/operations", body=b"[]", headers={"Authorization": "Bearer operator-token"})
+        response = conn.getresponse()
+        response.read()
+        self.assertEqual(response.status, 400)
+        sock = conn.sock
+        for _ in range(3):
+            conn.request("GET", "/health")
+            response = conn.getresponse()
+            response.read()
+            self.assertEqual(response.status, 200)
+            self.assertRegex(response.getheader("Server-Timing"), r"^app;dur=\d+\.\d{3}$")
+        self.assertIs(conn.sock, sock)
+        conn.close()
+
+    def test_slow_requests_do_not_block_others(self) -> None:
+        self.configure(["slow"], CONTROL_PLANE_FLEET_TIMEOUT_SECONDS="2")
+        slow = threading.Thread(target=self.get, args=("/fleet/status",))
+        slow.start()
+        time.sleep(0.1)
+        started = time.perf_counter()
+        code, _ = self.get("/health")
+        self.assertEqual(code, 200)
+        self.assertLess(time.perf_counter() - started, 0.5)
+        self.assertTrue(slow.is_alive())
+        slow.join(timeout=5)
+
+    def test_idle_keep_alive_connections_do_not_hold_workers(self) -> None:
+        self.configure([])
+        idle = []
+        for _ in range(8):
+            conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=5)
+            conn.request("GET", "/health")
+            conn.getresponse().read()
+            idle.append(conn)
+        # A bare connect that never sends a request must not take a worker either.
+        silent = socket.create_connection(("127.0.0.1", self.port))
+        try:
+            started = time.perf_counter()
+            code, _ = self.get("/health")
+            self.assertEqual(code, 200)
+            self.assertLess(time.perf_counter() - started, 0.5)
+            # Parked connections are resumed when their next request arrives.
+            for conn in idle:
+                conn.request("GET", "/health")
+                self.assertEqual(conn.getresponse().status, 200)
+        finally:
+            silent.close()
+            for conn in idle:
+                conn.close()
+
+    def test_oversized_body_is_rejected(self) -> None:
+        self.configure([])
+        code, body, _ = self.post("/bulk/operations", {"pad": "x" * server.MAX_REQUEST_BODY_BYTES})
+        self.assertEqual((code, json.loads(body)["error_code"]), (413, "PAYLOAD_TOO_LARGE"))
+
+
+class SettingsTests(unittest.TestCase):
+    def parse(self, raw: str) -> tuple:
+        return server.parse_agents(raw)
+
+    def test_registry_entries_are_validated(self) -> None:
+        agents = self.parse('[{"store_id": "shop-001", "url": "http://agent:8080/"}]')
+        self.assertEqual(agents, (server.FleetAgent("shop-001", "http://agent:8080"),))
+        for raw in ("{}", '[{"url": "http://agent"}]', '[{"store_id": "a", "url": "ftp://agent"}]',
+                    '[{"store_id": "a", "url": "http://x"}, {"store_id": "a", "url": "http://y"}]'):
+            with self.subTest(raw=raw):
+                with self.assertRaises(ValueError):
+                    self.parse(raw)
+
+    def test_secrets_are_kept_out_of_repr(self) -> None:
+        settings = server.Settings.from_env(
+            {"CONTROL_PLANE_API_TOKEN": "api-secret", "CONTROL_PLANE_AGENT_JWT_SECRET": "jwt-secret"}
+        )
+        self.assertNotIn("api-secret", repr(settings))
+        self.assertNotIn("jwt-secret", repr(settings))
+
+    def test_invalid_fleet_timeout_fails_fast(self) -> None:
+        with self.assertRaises(ValueError):
+            server.Settings.from_env({"CONTROL_PLANE_FLEET_TIMEOUT_SECONDS": "0"})
+
+    def test_profile_settings_are_bounded(self) -> None:
+        settings = server.Settings.from_env({})
+        self.assertEqual((settings.profile_seconds, settings.profile_interval_seconds), (30.0, 0.01))
+        for env in ({"CONTROL_PLANE_PROFILE_SECONDS": "601"}, {"CONTROL_PLANE_PROFILE_INTERVAL_MS": "1001"}):
+            with self.subTest(env=env):
+                with self.assertRaisesRegex(ValueError, next(iter(env))):
+                    server.Settings.from_env(env)
+
+    def test_trace_settings_are_validated(self) -> None:
+        for env in (
+            {"CONTROL_PLANE_TRACE_SAMPLE_RATIO": "1.5"},
+            {"CONTROL_PLANE_TRACE_BUFFER_SIZE": "8"},
+            {"CONTROL_PLANE_TRACE_EXPORT_URL": "file:///tmp/spans"},
+        ):
+            with self.subTest(env=env):
+                with self.assertRaisesRegex(ValueError, next(iter(env))):
+                    server.Settings.from_env(env)
+
+    def test_sighup_reloads_on_the_reload_thread(self) -> None:
+        threads = []
+        done = threading.Event()
+
+        def reload() -> None:
+            threads.append(threading.get_ident())
+            done.set()
+
+        reloader = server.SettingsReloader("test-settings-reload", reload)
+        reloader.start()
+        previous = signal.signal(signal.SIGHUP, server._handle_sighup)
+        self.addCleanup(signal.signal, signal.SIGHUP, previous)
+        with unittest.mock.patch.object(server, "RELOADER", reloader):
+            # A reload in progress holds the lock; the signal handler must not wait for it.
+            with reloader.lock:
+                os.kill(os.getpid(), signal.SIGHUP)
+                self.assertFalse(done.wait(0.1))
+            self.assertTrue(done.wait(2))
+        self.assertEqual(len(threads), 1)
+        self.assertNotEqual(threads[0], threading.get_ident())
+
+
+if __name__ == "__main__":
+    unittest.main()
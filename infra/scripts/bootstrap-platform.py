@@ -0,0 +1,521 @@
+#!/usr/bin/env python3
+"""Provision and start multiple store instances in parallel.
+
+The whole run is planned before anything is written or started. A persistent port
+registry (``instances/.port-registry.json``) indexes every instance ``.env`` and
+``.env.example`` in one pass, re-parsing only files changed since the last run, and
+host ports for all requested stores are allocated up front from that index. Instance
+files are then rendered, the shared images are built once, and runtime slices are
+started (or installed) with bounded parallelism. Each store logs to its own file and
+reports its own status. ``--dry-run`` prints the plan without writing files or
+running Docker.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import secrets
+import shlex
+import shutil
+import socket
+import subprocess
+import sys
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+
+
+ROOT_DIR = Path(__file__).resolve().parents[2]
+INSTANCE_TEMPLATE_COMPOSE = ROOT_DIR / "infra" / "docker" / "instance" / "docker-compose.override.yml"
+INSTANCE_TEMPLATE_ENV = ROOT_DIR / "infra" / "docker" / "instance" / "env.example"
+INSTALL_SCRIPT = ROOT_DIR / "infra" / "scripts" / "install-magento.sh"
+CONTROL_PLANE_COMPOSE = ROOT_DIR / "control-plane" / "docker-compose.yml"
+CONTROL_PLANE_UP = ["docker", "compose", "-f", str(CONTROL_PLANE_COMPOSE), "up", "-d", "--build"]
+REGISTRY_NAME = ".port-registry.json"
+LOG_NAME = ".bootstrap.log"
+# First candidate host port per key; allocation walks upwards past reserved and bound ports.
+PORT_BASES = {"MAGENTO_HTTP_PORT": 8181, "SHOP_AGENT_PORT": 8191, "STOREFRONT_PORT": 8281}
+PORT_LABELS = {"MAGENTO_HTTP_PORT": "MAGENTO", "SHOP_AGENT_PORT": "SHOP_AGENT", "STOREFRONT_PORT": "STOREFRONT"}
+RUNTIME_SERVICES = (
+    "magento-db", "magento-search", "magento-cache", "magento-app", "magento-web", "magento-cron", "shop-agent",
+)
+# Build services whose image tag is shared by every store (magento-cron reuses the magento-app image).
+SHARED_IMAGES = {
+    "magento-app": "bolerdrop/magento-app:local",
+    "shop-agent": "bolerdrop/shop-agent:local",
+    "storefront": "bolerdrop/storefront:local",
+}
+
+USAGE = """\
+usage: bootstrap-platform.sh [options]
+
+Options:
+  --count <n>              Number of store instances to bootstrap (default: 1)
+  --start-index <n>        Starting numeric suffix for store IDs (default: 1)
+  --store-prefix <prefix>  Store ID prefix (default: shop)
+  --parallel <n>           Stores installed/started at the same time (default: 4)
+  --no-control-plane       Do not start Control Plane
+  --no-install             Create/ensure runtime and start containers only (skip Magento install)
+  --provision-only         Only create instance directories and env files, do not start containers
+  --dry-run                Print the plan (ports, files, commands) without writing files or running Docker
+  --instances-dir <path>   Directory holding <store-id>/ instance files (default: <repo>/instances)
+  -h, --help               Show help
+
+Examples:
+  bash infra/scripts/bootstrap-platform.sh --count 2
+  bash infra/scripts/bootstrap-platform.sh --count 3 --start-index 10 --no-install
+  bash infra/scripts/bootstrap-platform.sh --count 2 --provision-only
+  bash infra/scripts/bootstrap-platform.sh --count 50 --parallel 8 --dry-run
+"""
+
+
+class PlanError(Exception):
+    """The requested run cannot be planned; nothing has been written or started."""
+
+
+def read_env_file(path: Path) -> dict[str, str]:
+    """``KEY=VALUE`` lines; the first occurrence of a key wins, like ``grep | head -n 1``."""
+    values: dict[str, str] = {}
+    for line in path.read_text(encoding="utf-8").splitlines():
+        key, sep, value = line.partition("=")
+        if sep and key and not key.startswith("#"):
+            values.setdefault(key.strip(), value)
+    return values
+
+
+def port_values(env: dict[str, str]) -> dict[str, int]:
+    return {key: int(env[key]) for key in PORT_BASES if env.get(key, "").isdigit()}
+
+
+def is_port_bound(port: int) -> bool:
+    """True when something already listens on the local port (the ``nc -z`` probe)."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.settimeout(0.2)
+        return sock.connect_ex(("127.0.0.1", port)) == 0
+
+
+class PortRegistry:
+    """Persistent index of the host ports claimed by instance env files.
+
+    Entries are cached per file under its mtime and size, so a refresh stats every
+    env file in one directory pass but only parses the ones that changed.
+    """
+
+    VERSION = 1
+
+    def __init__(self, instances_dir: Path) -> None:
+        self.instances_dir = instances_dir
+        self.path = instances_dir / REGISTRY_NAME
+        self.files: dict[str, dict] = {}
+        self.parsed = 0
+
+    def refresh(self) -> None:
+        cached = self._load() if not self.files else self.files
+        self.files = {}
+        self.parsed = 0
+        paths = sorted(self.instances_dir.glob("*/.env")) + sorted(self.instances_dir.glob("*/.env.example"))
+        for path in paths:
+            stat = path.stat()
+            key = path.relative_to(self.instances_dir).as_posix()
+            entry = cached.get(key)
+            if entry is None or (entry.get("mtime_ns"), entry.get("size")) != (stat.st_mtime_ns, stat.st_size):
+                entry = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "ports": port_values(read_env_file(path))}
+                self.parsed += 1
+            self.files[key] = entry
+
+    def ports_for(self, store_id: str) -> dict[str, int]:
+        """Ports already recorded for a store; ``.env`` wins over ``.env.example`` per key."""
+        ports = dict(self.files.get(f"{store_id}/.env.example", {}).get("ports", {}))
+        ports.update(self.files.get(f"{store_id}/.env", {}).get("ports", {}))
+        return ports
+
+    def reserved(self) -> set[int]:
+        return {port for entry in self.files.values() for port in entry["ports"].values()}
+
+    def save(self) -> None:
+        self.instances_dir.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({"version": self.VERSION, "files": self.files}, indent=2) + "\n", encoding="utf-8")
+        tmp.replace(self.path)
+
+    def _load(self) -> dict[str, dict]:
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(data, dict) or data.get("version") != self.VERSION or not isinstance(data.get("files"), dict):
+            return {}
+        return data["files"]
+
+
+def allocate_ports(
+    store_ids: list[str], registry: PortRegistry, is_bound: Callable[[int], bool] = is_port_bound
+) -> dict[str, dict[str, int]]:
+    """Assign every store its three host ports before anything is started.
+
+    Ports a store already records are kept; missing ones come from per-key cursors
+    that skip every port claimed in the registry, assigned earlier in this run, or
+    currently bound on the host, so no two stores can receive the same port.
+    """
+    reserved = registry.reserved()
+    cursors = dict(PORT_BASES)
+    allocation: dict[str, dict[str, int]] = {}
+    for store_id in store_ids:
+        existing = registry.ports_for(store_id)
+        ports: dict[str, int] = {}
+        for key in PORT_BASES:
+            port = existing.get(key)
+            if port is None:
+                port = cursors[key]
+                while port in reserved or is_bound(port):
+                    port += 1
+            reserved.add(port)
+            cursors[key] = max(cursors[key], port + 1)
+            ports[key] = port
+        allocation[store_id] = ports
+    return allocation
+
+
+@dataclass
+class StorePlan:
+    store_id: str
+    directory: Path
+    ports: dict[str, int]
+    create_env: bool
+    storefront: bool
+    shared_images: bool
+    status: str = "planned"
+    detail: str = ""
+
+    @property
+    def env_file(self) -> Path:
+        return self.directory / ".env"
+
+    @property
+    def compose_file(self) -> Path:
+        return self.directory / "docker-compose.override.yml"
+
+    @property
+    def log_file(self) -> Path:
+        return self.directory / LOG_NAME
+
+    def describe_ports(self) -> str:
+        return ", ".join(f"{PORT_LABELS[key]}={port}" for key, port in self.ports.items())
+
+    def compose(self) -> list[str]:
+        return ["docker", "compose", "--env-file", str(self.env_file), "-f", str(self.compose_file)]
+
+
+def storefront_enabled(env: dict[str, str], env_file: Path) -> bool:
+    value = env.get("STOREFRONT_ENABLED") or "1"
+    if value not in ("0", "1"):
+        raise PlanError(f"invalid STOREFRONT_ENABLED in {env_file}; expected 0 or 1")
+    return value == "1"
+
+
+def uses_shared_images(compose_text: str) -> bool:
+    """Instance compose files copied before images were tagged still build per store."""
+    return all(f"image: {image}" in compose_text for image in SHARED_IMAGES.values())
+
+
+def plan_stores(
+    store_ids: list[str], instances_dir: Path, registry: PortRegistry, is_bound: Callable[[int], bool] = is_port_bound
+) -> list[StorePlan]:
+    allocation = allocate_ports(store_ids, registry, is_bound)
+    template_compose = INSTANCE_TEMPLATE_COMPOSE.read_text(encoding="utf-8")
+    plans: list[StorePlan] = []
+    for store_id in store_ids:
+        directory = instances_dir / store_id
+        env_file = directory / ".env"
+        compose_file = directory / "docker-compose.override.yml"
+        env = read_env_file(env_file) if env_file.is_file() else {}
+        if env_file.is_file() and env.get("STORE_ID", "") != store_id:
+            raise PlanError(f"existing {env_file} has STORE_ID={env.get('STORE_ID', '')}, expected {store_id}")
+        compose_text = compose_file.read_text(encoding="utf-8") if compose_file.is_file() else ""
+        plans.append(
+            StorePlan(
+                store_id=store_id,
+                directory=directory,
+                ports=allocation[store_id],
+                create_env=not env_file.is_file(),
+                storefront=storefront_enabled(env, env_file),
+                shared_images=uses_shared_images(compose_text or template_compose),
+            )
+        )
+    return plans
+
+
+def render_env_example(template: str, store_id: str, ports: dict[str, int]) -> str:
+    replacements = {
+        "STORE_ID": store_id,
+        "MAGENTO_BASE_URL": f"http://localhost:{ports['MAGENTO_HTTP_PORT']}",
+        "MAGENTO_HTTP_PORT": str(ports["MAGENTO_HTTP_PORT"]),
+        "SHOP_AGENT_PORT": str(ports["SHOP_AGENT_PORT"]),
+        "STOREFRONT_BASE_URL": f"http://localhost:{ports['STOREFRONT_PORT']}",
+        "STOREFRONT_PORT": str(ports["STOREFRONT_PORT"]),
+    }
+    lines = []
+    for line in template.splitlines(keepends=True):
+        key = line.partition("=")[0]
+        if key in replacements:
+            line = f"{key}={replacements[key]}\n"
+        lines.append(line)
+    return "".join(lines)
+
+
+def render_runtime_env(store_id: str, ports: dict[str, int]) -> str:
+    magento, agent, storefront = (ports[key] for key in PORT_BASES)
+    admin_user = "admin_" + store_id.replace("-", "_")
+    return f"""\
+# Auto-generated local runtime file. Do not commit.
+STORE_ID={store_id}
+SHOP_AGENT_VERSION=0.1.0
+DEPLOYMENT_VERSION=local
+
+MAGENTO_BASE_URL=http://localhost:{magento}
+MAGENTO_HTTP_PORT={magento}
+SHOP_AGENT_PORT={agent}
+STOREFRONT_BASE_URL=http://localhost:{storefront}
+STOREFRONT_PORT={storefront}
+STOREFRONT_ENABLED=1
+STOREFRONT_THEME=dropship
+
+MAGENTO_SOURCE_MODE=git
+MAGENTO_PACKAGE=magento/project-community-edition
+MAGENTO_VERSION=
+MAGENTO_REPO_PUBLIC_KEY=__SET_AT_RUNTIME__
+MAGENTO_REPO_PRIVATE_KEY=__SET_AT_RUNTIME__
+MAGENTO_GIT_REPOSITORY=https://github.com/magento/magento2.git
+MAGENTO_GIT_REF=2.4-develop
+
+MAGENTO_DB_NAME=magento
+MAGENTO_DB_USER=magento
+MAGENTO_DB_PASSWORD=db_{secrets.token_hex(12)}
+MYSQL_ROOT_PASSWORD=root_{secrets.token_hex(12)}
+
+MAGENTO_ADMIN_USER={admin_user}
+MAGENTO_ADMIN_PASSWORD=Aa1!{secrets.token_hex(12)}
+MAGENTO_ADMIN_EMAIL={store_id}@local.example
+MAGENTO_ADMIN_FIRSTNAME=Store
+MAGENTO_ADMIN_LASTNAME=Admin
+MAGENTO_LANGUAGE=en_US
+MAGENTO_CURRENCY=USD
+MAGENTO_TIMEZONE=UTC
+MAGENTO_USE_REWRITES=1
+
+AGENT_JWT_SECRET=jwt_{secrets.token_hex(24)}
+AGENT_JWT_ISSUER={store_id}-issuer
+AGENT_JWT_AUDIENCE={store_id}-audience
+AGENT_JWT_LEEWAY_SECONDS=5
+AGENT_JWT_MAX_TTL_SECONDS=900
+"""
+
+
+def render_store(plan: StorePlan, env_template: str) -> None:
+    """Write the store's compose copy, ``.env.example`` and (missing) runtime ``.env``."""
+    plan.directory.mkdir(parents=True, exist_ok=True)
+    if not plan.compose_file.is_file() or plan.compose_file.stat().st_size == 0:
+        shutil.copyfile(INSTANCE_TEMPLATE_COMPOSE, plan.compose_file)
+    example = render_env_example(env_template, plan.store_id, plan.ports)
+    (plan.directory / ".env.example").write_text(example, encoding="utf-8")
+    if plan.create_env:
+        fd = os.open(plan.env_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as handle:
+            handle.write(render_runtime_env(plan.store_id, plan.ports))
+        return
+    env = read_env_file(plan.env_file)
+    storefront_port = plan.ports["STOREFRONT_PORT"]
+    missing = [
+        (key, value)
+        for key, value in (
+            ("STOREFRONT_PORT", str(storefront_port)),
+            ("STOREFRONT_BASE_URL", f"http://localhost:{storefront_port}"),
+            ("STOREFRONT_ENABLED", "1"),
+            ("STOREFRONT_THEME", "dropship"),
+        )
+        if key not in env
+    ]
+    if missing:
+        with plan.env_file.open("a", encoding="utf-8") as handle:
+            handle.write("\n" + "".join(f"{key}={value}\n" for key, value in missing))
+
+
+def start_commands(plan: StorePlan, run_install: bool) -> list[list[str]]:
+    if run_install:
+        return [["bash", str(INSTALL_SCRIPT), plan.store_id]]
+    services = [*RUNTIME_SERVICES, "storefront"] if plan.storefront else list(RUNTIME_SERVICES)
+    commands = [[*plan.compose(), "up", "-d", "--no-build" if plan.shared_images else "--build", *services]]
+    if not plan.storefront:
+        commands.append([*plan.compose(), "rm", "-sf", "storefront"])
+    return commands
+
+
+def build_command(plans: list[StorePlan]) -> list[str] | None:
+    """One ``compose build`` for the shared images, using the first store that tags them."""
+    shared = [plan for plan in plans if plan.shared_images]
+    if not shared:
+        return None
+    services = ["magento-app", "shop-agent"]
+    if any(plan.storefront for plan in shared):
+        services.append("storefront")
+    return [*shared[0].compose(), "build", *services]
+
+
+def run_command(argv: list[str], log_path: Path | None = None, env: dict[str, str] | None = None) -> int:
+    """Run one command; with ``log_path`` its output is appended there instead of the terminal."""
+    if log_path is None:
+        return subprocess.run(argv, check=False, env=env).returncode
+    with log_path.open("a", encoding="utf-8") as log:
+        log.write(f"$ {shlex.join(argv)}\n")
+        log.flush()
+        return subprocess.run(argv, check=False, env=env, stdout=log, stderr=subprocess.STDOUT).returncode
+
+
+def start_store(plan: StorePlan, run_install: bool) -> StorePlan:
+    started = time.monotonic()
+    env = None
+    if run_install and plan.shared_images:
+        env = {**os.environ, "BOOTSTRAP_SKIP_BUILD": "1"}
+    for index, argv in enumerate(start_commands(plan, run_install)):
+        try:
+            code = run_command(argv, plan.log_file, env)
+        except OSError as exc:
+            # A missing tool or unwritable log fails this store only; the others still report.
+            plan.status = "failed"
+            plan.detail = f"{argv[0]} not runnable: {exc.strerror or exc}"
+            return plan
+        # Removing a disabled storefront is best effort, as in the single-store flow.
+        if code != 0 and index == 0:
+            plan.status = "failed"
+            plan.detail = f"{Path(argv[1]).name if run_install else 'docker compose up'} exited {code}"
+            return plan
+    plan.status = "installed" if run_install else "started"
+    plan.detail = f"{time.monotonic() - started:.1f}s"
+    return plan
+
+
+def print_plan(plans: list[StorePlan], args: argparse.Namespace, registry: PortRegistry) -> None:
+    print(
+        f"plan: {len(plans)} store(s), parallel {args.parallel}, "
+        f"registry re-parsed {registry.parsed} of {len(registry.files)} env file(s)"
+    )
+    if args.control_plane:
+        print(f"control-plane: {shlex.join(CONTROL_PLANE_UP)}")
+    build = None if args.provision_only else build_command(plans)
+    if build:
+        print(f"build once: {shlex.join(build)}")
+    for plan in plans:
+        action = "create .env" if plan.create_env else "reuse .env"
+        print(f"{plan.store_id}: {plan.describe_ports()} ({action})")
+        if not args.provision_only:
+            for argv in start_commands(plan, args.install):
+                print(f"  {shlex.join(argv)}")
+
+
+def _parse_args(argv: list[str]) -> tuple[argparse.Namespace, list[str]]:
+    parser = argparse.ArgumentParser(prog="bootstrap-platform.sh", usage=USAGE, add_help=False)
+    parser.add_argument("--count", default="1")
+    parser.add_argument("--start-index", default="1")
+    parser.add_argument("--store-prefix", default="shop")
+    parser.add_argument("--parallel", default="4")
+    parser.add_argument("--no-control-plane", dest="control_plane", action="store_false")
+    parser.add_argument("--no-install", dest="install", action="store_false")
+    parser.add_argument("--provision-only", action="store_true")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--instances-dir", type=Path, default=ROOT_DIR / "instances")
+    return parser.parse_known_args(argv)
+
+
+def main(argv: list[str]) -> int:
+    if "-h" in argv or "--help" in argv:
+        print(USAGE, end="")
+        return 0
+    args, unknown = _parse_args(argv)
+    if unknown:
+        print(f"unknown option: {unknown[0]}")
+        print(USAGE, end="")
+        return 1
+    for flag in ("count", "start_index", "parallel"):
+        value = getattr(args, flag)
+        if not value.isdigit() or int(value) < 1:
+            print(f"--{flag.replace('_', '-')} must be a positive integer")
+            return 1
+        setattr(args, flag, int(value))
+    if args.provision_only:
+        args.install = args.control_plane = False
+
+    for path, label in ((INSTANCE_TEMPLATE_COMPOSE, "compose template"), (INSTANCE_TEMPLATE_ENV, "env template")):
+        if not path.is_file():
+            print(f"missing {label}: {path}")
+            return 1
+    if not os.access(INSTALL_SCRIPT, os.X_OK):
+        print(f"missing executable install script: {INSTALL_SCRIPT}")
+        return 1
+    if not args.provision_only and not args.dry_run and shutil.which("docker") is None:
+        print("docker is required")
+        return 1
+
+    store_ids = [f"{args.store_prefix}-{index:03d}" for index in range(args.start_index, args.start_index + args.count)]
+    registry = PortRegistry(args.instances_dir)
+    registry.refresh()
+    try:
+        plans = plan_stores(store_ids, args.instances_dir, registry, is_port_bound)
+    except PlanError as exc:
+        print(exc)
+        return 1
+    if args.dry_run:
+        print_plan(plans, args, registry)
+        return 0
+
+    env_template = INSTANCE_TEMPLATE_ENV.read_text(encoding="utf-8")
+    for plan in plans:
+        render_store(plan, env_template)
+        plan.status = "provisioned"
+    registry.refresh()
+    registry.save()
+
+    if args.provision_only:
+        for plan in plans:
+            print(f"provisioned {plan.store_id} ({plan.describe_ports()})")
+        print("provision-only complete")
+        return 0
+
+    if args.control_plane:
+        print("starting Control Plane runtime")
+        if run_command(CONTROL_PLANE_UP) != 0:
+            print("Control Plane failed to start")
+            return 1
+
+    build = build_command(plans)
+    if build:
+        print("building shared store images once")
+        if run_command(build) != 0:
+            print("shared image build failed; no store was started")
+            return 1
+
+    verb = "bootstrap + install" if args.install else "start runtime only"
+    print(f"{verb}: {len(plans)} store(s), {args.parallel} at a time; per-store output in <store>/{LOG_NAME}")
+    with ThreadPoolExecutor(max_workers=args.parallel, thread_name_prefix="bootstrap") as executor:
+        futures = [executor.submit(start_store, plan, args.install) for plan in plans]
+        for future in as_completed(futures):
+            plan = future.result()
+            if plan.status == "failed":
+                print(f"[{plan.store_id}] failed: {plan.detail}; see {plan.log_file}")
+            else:
+                print(f"[{plan.store_id}] {plan.status} in {plan.detail} ({plan.describe_ports()})")
+
+    failed = [plan.store_id for plan in plans if plan.status == "failed"]
+    print(f"{len(plans) - len(failed)} of {len(plans)} store(s) up")
+    if failed:
+        print(f"failed: {' '.join(failed)}; rerun the same command to retry (ports and .env files are kept)")
+        return 1
+    print("platform bootstrap complete")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
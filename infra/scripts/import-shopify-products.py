@@ -0,0 +1,519 @@
+#!/usr/bin/env python3
+"""Import Shopify product feed data into a Magento instance.
+
+Streams every page of a Shopify ``products.json`` feed, maps fields in-process and
+upserts simple products through the Magento REST API over pooled keep-alive
+connections with bounded concurrency. Each product's first image is downloaded and
+attached in the same worker, so images are fetched in parallel too. Finished SKUs
+are appended to a checkpoint file; a rerun after a failure or interruption skips
+them, and the checkpoint is removed once an import completes cleanly.
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import http.client
+import json
+import math
+import os
+import re
+import subprocess
+import sys
+import threading
+from collections import deque
+from collections.abc import Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from urllib.parse import parse_qsl, quote, urlencode, urljoin, urlsplit, urlunsplit
+
+
+ROOT_DIR = Path(__file__).resolve().parents[2]
+DEFAULT_SOURCE_URL = "https://<shop-domain>/collections/<collection-handle>/products.json?limit=250&page=1"
+CHECKPOINT_NAME = ".import-shopify-products.checkpoint.jsonl"
+REQUEST_TIMEOUT_SECONDS = 60.0
+MAX_REDIRECTS = 5
+FALLBACK_PRICE = 19.99
+REINDEX_SCRIPT = (
+    "set -e; cd /var/www/html; php -d memory_limit=2G bin/magento indexer:reindex; "
+    "php -d memory_limit=2G bin/magento cache:flush"
+)
+
+USAGE = """\
+usage: import-shopify-products.sh <store-id> [--limit <count>] [--source-url <url>]
+         [--concurrency <count>] [--checkpoint <path>] [--restart] [--skip-reindex]
+
+Imports product seed data into a Magento instance by:
+1. streaming products from every page of a source JSON feed,
+2. creating/updating simple products through Magento REST API,
+3. attaching the first product image when possible.
+
+Defaults:
+  --limit              10
+  --source-url         https://<shop-domain>/collections/<collection-handle>/products.json?limit=250&page=1
+  --concurrency        8 parallel product upserts (each also fetches and attaches its image)
+  --checkpoint         instances/<store-id>/.import-shopify-products.checkpoint.jsonl
+  --restart            ignore an existing checkpoint and import everything again
+  --skip-reindex       do not run indexer:reindex + cache:flush in the Magento container
+  --instances-dir      directory holding <store-id>/.env (default: <repo>/instances)
+"""
+
+
+class HttpError(Exception):
+    """Non-2xx answer; the message names method, path and status only (never headers or tokens)."""
+
+    def __init__(self, method: str, url: str, status: int) -> None:
+        super().__init__(f"{method} {urlsplit(url).path} returned HTTP {status}")
+        self.status = status
+
+
+class KeepAliveSession:
+    """Thread-safe HTTP client that reuses idle keep-alive connections per scheme and host.
+
+    A request on a reused connection that the server already closed is retried once
+    on a fresh connection. GET requests follow redirects like ``curl -L``.
+    """
+
+    def __init__(self, max_idle: int = 8, timeout: float = REQUEST_TIMEOUT_SECONDS) -> None:
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self.connections_opened = 0
+        self._lock = threading.Lock()
+        self._idle: dict[tuple[str, str], deque[http.client.HTTPConnection]] = {}
+
+    def request(
+        self, method: str, url: str, headers: dict[str, str] | None = None, body: bytes | None = None
+    ) -> bytes:
+        for _ in range(MAX_REDIRECTS + 1):
+            status, location, payload = self._send(method, url, headers or {}, body)
+            if method == "GET" and status in (301, 302, 303, 307, 308) and location:
+                url = urljoin(url, location)
+                continue
+            if not 200 <= status < 300:
+                raise HttpError(method, url, status)
+            return payload
+        raise HttpError(method, url, status)
+
+    def json(self, method: str, url: str, headers: dict[str, str] | None = None, payload: object = None) -> object:
+        request_headers = {"Accept": "application/json", **(headers or {})}
+        body = None
+        if payload is not None:
+            body = json.dumps(payload).encode("utf-8")
+            request_headers["Content-Type"] = "application/json"
+        return json.loads(self.request(method, url, request_headers, body) or b"null")
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for conn in connections:
+                conn.close()
+
+    def _send(
+        self, method: str, url: str, headers: dict[str, str], body: bytes | None
+    ) -> tuple[int, str | None, bytes]:
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        target = urlunsplit(("", "", parts.path or "/", parts.query, ""))
+        while True:
+            with self._lock:
+                idle = self._idle.get(key)
+                conn = idle.pop() if idle else None
+            reused = conn is not None
+            if conn is None:
+                conn_class = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+                conn = conn_class(parts.netloc, timeout=self.timeout)
+                with self._lock:
+                    self.connections_opened += 1
+            try:
+                conn.request(method, target, body=body, headers=headers)
+                response = conn.getresponse()
+                payload = response.read()
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                conn.close()
+                if reused:
+                    continue
+                raise
+            except BaseException:
+                conn.close()
+                raise
+            if response.will_close:
+                conn.close()
+            else:
+                self._release(key, conn)
+            return response.status, response.getheader("Location"), payload
+
+    def _release(self, key: tuple[str, str], conn: http.client.HTTPConnection) -> None:
+        with self._lock:
+            idle = self._idle.setdefault(key, deque())
+            if len(idle) < self.max_idle:
+                idle.append(conn)
+                return
+        conn.close()
+
+
+class Checkpoint:
+    """Append-only record of finished SKUs, valid only for the same feed and SKU prefix."""
+
+    def __init__(self, path: Path, source_url: str, sku_prefix: str, restart: bool) -> None:
+        self.path = path
+        self.done: set[str] = set()
+        self._lock = threading.Lock()
+        header = {"source_url": source_url, "sku_prefix": sku_prefix}
+        if not restart and path.exists():
+            lines = path.read_text(encoding="utf-8").splitlines()
+            try:
+                matches = bool(lines) and json.loads(lines[0]) == header
+            except ValueError:
+                matches = False
+            if matches:
+                for line in lines[1:]:
+                    try:
+                        self.done.add(json.loads(line)["sku"])
+                    except (ValueError, KeyError, TypeError):
+                        # A torn last line from an interrupted run only loses that SKU.
+                        continue
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if self.done:
+            torn = not path.read_bytes().endswith(b"\n")
+            self._handle = path.open("a", encoding="utf-8")
+            if torn:
+                self._handle.write("\n")
+        else:
+            self._handle = path.open("w", encoding="utf-8")
+            self._write(header)
+
+    def record(self, sku: str) -> None:
+        with self._lock:
+            self.done.add(sku)
+            self._write({"sku": sku})
+
+    def finish(self, success: bool) -> None:
+        self._handle.close()
+        if success:
+            self.path.unlink(missing_ok=True)
+
+    def _write(self, entry: dict[str, str]) -> None:
+        self._handle.write(json.dumps(entry) + "\n")
+        self._handle.flush()
+
+
+def read_env_file(path: Path) -> dict[str, str]:
+    """``KEY=VALUE`` lines; the first occurrence of a key wins, like ``grep | head -n 1``."""
+    values: dict[str, str] = {}
+    for line in path.read_text(encoding="utf-8").splitlines():
+        key, sep, value = line.partition("=")
+        if sep and re.fullmatch(r"[A-Za-z_][A-Za-z0-9_]*", key) and key not in values:
+            values[key] = value
+    return values
+
+
+def page_urls(source_url: str) -> Iterator[tuple[str, int | None]]:
+    """Yield the feed URL for each page, starting at the URL's own ``page`` (default 1)."""
+    parts = urlsplit(source_url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    params = dict(query)
+    page = int(params["page"]) if params.get("page", "").isdigit() else 1
+    page_size = int(params["limit"]) if params.get("limit", "").isdigit() else None
+    while True:
+        params["page"] = str(page)
+        yield urlunsplit(parts._replace(query=urlencode(list(params.items())))), page_size
+        page += 1
+
+
+def stream_products(session: KeepAliveSession, source_url: str, limit: int) -> Iterator[dict]:
+    """Yield up to ``limit`` raw products, fetching the next feed page only when needed."""
+    produced = 0
+    for url, page_size in page_urls(source_url):
+        payload = session.json("GET", url)
+        products = payload.get("products") if isinstance(payload, dict) else None
+        if not isinstance(products, list) or not products:
+            return
+        for product in products:
+            if isinstance(product, dict):
+                yield product
+                produced += 1
+                if produced >= limit:
+                    return
+        if page_size is not None and len(products) < page_size:
+            return
+
+
+def _text(value: object) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, list):
+        return ", ".join(str(item) for item in value)
+    return str(value)
+
+
+def sanitize_sku(raw: str, prefix: str) -> str:
+    safe = re.sub(r"-+", "-", re.sub(r"[^a-z0-9-]+", "-", raw.lower())).strip("-") or "product"
+    return f"{prefix}-{safe}"[:64]
+
+
+def parse_price(raw: str) -> float | int:
+    try:
+        price = float(raw)
+    except ValueError:
+        price = 0.0
+    if price == 0 or not math.isfinite(price):
+        return FALLBACK_PRICE
+    return int(price) if price.is_integer() else price
+
+
+def short_text(html: str) -> str:
+    text = re.sub(r"<[^>]+>", " ", html).replace("&nbsp;", " ").replace("&amp;", "&")
+    return re.sub(r"\s+", " ", text).strip()[:240]
+
+
+def map_product(source: dict, sku_prefix: str) -> dict | None:
+    """Map one feed product to the Magento payload and image URL; ``None`` when it has no title."""
+    variants = source.get("variants") or [{}]
+    images = source.get("images") or [{}]
+    handle = _text(source.get("handle"))
+    title = _text(source.get("title"))
+    body_html = _text(source.get("body_html"))
+    price = _text(variants[0].get("price") if isinstance(variants[0], dict) else None) or "0"
+    image_url = _text(images[0].get("src") if isinstance(images[0], dict) else None)
+    tags = _text(source.get("tags"))
+    vendor = _text(source.get("vendor"))
+    if not title:
+        return None
+
+    sku = sanitize_sku(handle, sku_prefix)
+    summary = short_text(body_html)
+    meta_description = f"{summary} · {vendor}" if vendor else summary
+    description_html = f"{body_html}<p><strong>Source tags:</strong> {tags}</p>" if tags else body_html
+    payload = {
+        "product": {
+            "sku": sku,
+            "name": title,
+            "attribute_set_id": 4,
+            "status": 1,
+            "visibility": 4,
+            "type_id": "simple",
+            "price": parse_price(price),
+            "weight": 1,
+            "extension_attributes": {"stock_item": {"qty": 100, "is_in_stock": True}},
+            "custom_attributes": [
+                {"attribute_code": "description", "value": description_html},
+                {"attribute_code": "short_description", "value": summary},
+                {"attribute_code": "url_key", "value": handle},
+                {"attribute_code": "meta_title", "value": title},
+                {"attribute_code": "meta_description", "value": meta_description},
+            ],
+        },
+        "saveOptions": True,
+    }
+    return {"sku": sku, "title": title, "image_url": image_url, "payload": payload}
+
+
+def mime_from_url(url: str) -> str:
+    lower = url.lower()
+    if ".png" in lower:
+        return "image/png"
+    if ".webp" in lower:
+        return "image/webp"
+    return "image/jpeg"
+
+
+def image_download_url(url: str) -> str:
+    if "cdn.shopify.com" not in url:
+        return url
+    return f"{url}&width=1200" if "?" in url else f"{url}?width=1200"
+
+
+class Importer:
+    def __init__(self, session: KeepAliveSession, base_url: str, token: str, checkpoint: Checkpoint) -> None:
+        self.session = session
+        self.base_url = base_url.rstrip("/")
+        self.checkpoint = checkpoint
+        self._auth = {"Authorization": f"Bearer {token}"}
+
+    def import_product(self, product: dict) -> str:
+        """Upsert one product and attach its image if it has none; returns a progress note."""
+        sku = product["sku"]
+        url = f"{self.base_url}/rest/V1/products/{quote(sku, safe='')}"
+        saved = self.session.json("PUT", url, self._auth, product["payload"])
+        note = self._attach_image(sku, product["title"], product["image_url"], saved)
+        self.checkpoint.record(sku)
+        return note
+
+    def _attach_image(self, sku: str, title: str, image_url: str, saved: object) -> str:
+        if not image_url:
+            return "no image URL in source feed, skipping media upload"
+        # The upsert answers with the saved product, so no extra read is needed to see existing media.
+        entries = saved.get("media_gallery_entries") if isinstance(saved, dict) else None
+        if isinstance(entries, list) and entries:
+            return "media already present, skipping upload"
+        try:
+            image = self.session.request("GET", image_download_url(image_url))
+        except (HttpError, OSError, http.client.HTTPException):
+            return "failed to download image, skipping media upload"
+        name = os.path.basename(image_url.split("?", 1)[0]) or f"{sku}.jpg"
+        entry = {
+            "entry": {
+                "media_type": "image",
+                "label": title,
+                "position": 1,
+                "disabled": False,
+                "types": ["image", "small_image", "thumbnail"],
+                "content": {
+                    "base64_encoded_data": base64.b64encode(image).decode("ascii"),
+                    "type": mime_from_url(image_url),
+                    "name": name,
+                },
+            }
+        }
+        url = f"{self.base_url}/rest/V1/products/{quote(sku, safe='')}/media"
+        try:
+            self.session.json("POST", url, self._auth, entry)
+        except (HttpError, OSError, http.client.HTTPException):
+            return "media upload failed, continuing"
+        return "image attached"
+
+
+def _parse_args(argv: list[str]) -> tuple[argparse.Namespace, list[str]]:
+    parser = argparse.ArgumentParser(prog="import-shopify-products.sh", usage=USAGE, add_help=False)
+    parser.add_argument("store_id")
+    parser.add_argument("--limit", default="10")
+    parser.add_argument("--source-url", default=DEFAULT_SOURCE_URL)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--checkpoint", type=Path)
+    parser.add_argument("--restart", action="store_true")
+    parser.add_argument("--skip-reindex", action="store_true")
+    parser.add_argument("--instances-dir", type=Path, default=ROOT_DIR / "instances")
+    return parser.parse_known_args(argv)
+
+
+def _reindex(instance_dir: Path, env_file: Path) -> None:
+    subprocess.run(
+        [
+            "docker", "compose", "--env-file", str(env_file), "-f", str(instance_dir / "docker-compose.override.yml"),
+            "exec", "-T", "--user", "www-data", "magento-app", "sh", "-lc", REINDEX_SCRIPT,
+        ],
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+
+
+def main(argv: list[str]) -> int:
+    if not argv:
+        print(USAGE, end="")
+        return 1
+    if "-h" in argv or "--help" in argv:
+        print(USAGE, end="")
+        return 0
+    args, unknown = _parse_args(argv)
+    if unknown:
+        print(f"unknown argument: {unknown[0]}", file=sys.stderr)
+        print(USAGE, end="")
+        return 1
+
+    if not args.limit.isdigit() or int(args.limit) <= 0:
+        print(f"invalid --limit value: {args.limit}", file=sys.stderr)
+        return 1
+    limit = int(args.limit)
+    if "<" in args.source_url or ">" in args.source_url:
+        print("invalid --source-url: placeholder detected. Provide a real Shopify products feed URL.", file=sys.stderr)
+        return 1
+    if urlsplit(args.source_url).scheme not in ("http", "https"):
+        print("invalid --source-url: expected http(s) URL.", file=sys.stderr)
+        return 1
+    if args.concurrency < 1:
+        print(f"invalid --concurrency value: {args.concurrency}", file=sys.stderr)
+        return 1
+
+    instance_dir = args.instances_dir / args.store_id
+    env_file = instance_dir / ".env"
+    if not env_file.is_file():
+        print(f"missing runtime env file: {env_file}", file=sys.stderr)
+        return 1
+    env = read_env_file(env_file)
+    for key in ("MAGENTO_BASE_URL", "MAGENTO_ADMIN_USER", "MAGENTO_ADMIN_PASSWORD"):
+        if not env.get(key):
+            print(f"required env key missing in {env_file}: {key}", file=sys.stderr)
+            return 1
+    sku_prefix = os.environ.get("SKU_PREFIX") or "shopify"
+    base_url = env["MAGENTO_BASE_URL"].rstrip("/")
+
+    session = KeepAliveSession(max_idle=args.concurrency)
+    try:
+        print("requesting Magento admin token")
+        token = session.json(
+            "POST",
+            f"{base_url}/rest/V1/integration/admin/token",
+            payload={"username": env["MAGENTO_ADMIN_USER"], "password": env["MAGENTO_ADMIN_PASSWORD"]},
+        )
+        if not isinstance(token, str) or not token:
+            print("failed to obtain Magento admin token", file=sys.stderr)
+            return 1
+
+        checkpoint = Checkpoint(
+            args.checkpoint or instance_dir / CHECKPOINT_NAME, args.source_url, sku_prefix, args.restart
+        )
+        if checkpoint.done:
+            print(f"resuming: {len(checkpoint.done)} products already imported")
+        importer = Importer(session, base_url, token, checkpoint)
+        seen = imported = skipped = failed = 0
+        pending: dict[Future[str], str] = {}
+
+        def collect(block_until_below: int) -> None:
+            nonlocal imported, failed
+            while len(pending) >= block_until_below:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    sku = pending.pop(future)
+                    try:
+                        note = future.result()
+                    except (HttpError, OSError, ValueError, http.client.HTTPException) as exc:
+                        failed += 1
+                        print(f"[{sku}] upsert failed: {exc}", file=sys.stderr)
+                        continue
+                    imported += 1
+                    print(f"[{imported}] upserted {sku}: {note}")
+
+        print(f"streaming up to {limit} products into {args.store_id}")
+        with ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix="import") as executor:
+            for raw in stream_products(session, args.source_url, limit):
+                seen += 1
+                product = map_product(raw, sku_prefix)
+                if product is None:
+                    print(f"[{seen}] source product has empty title, skipping")
+                    continue
+                if product["sku"] in checkpoint.done:
+                    skipped += 1
+                    continue
+                # Keep the feed at most one batch ahead of the workers.
+                collect(args.concurrency * 2)
+                pending[executor.submit(importer.import_product, product)] = product["sku"]
+            collect(1)
+        checkpoint.finish(success=failed == 0)
+    except (HttpError, OSError, ValueError, http.client.HTTPException) as exc:
+        print(f"import failed: {exc}", file=sys.stderr)
+        return 1
+    finally:
+        session.close()
+
+    if seen == 0:
+        print("source feed returned zero products")
+        return 1
+    print(
+        f"imported {imported}, already done {skipped}, failed {failed} "
+        f"over {session.connections_opened} connection(s)"
+    )
+    if failed:
+        print("rerun the same command to retry; finished products are skipped", file=sys.stderr)
+        return 1
+
+    if not args.skip_reindex:
+        print("triggering reindex + cache flush inside container")
+        _reindex(instance_dir, env_file)
+    print("seed import complete")
+    print(f"verify catalog at {base_url} and storefront listing page")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -107,7 +107,12 @@ if [[ "${storefront_enabled}" == "1" ]]; then
 fi
 
 echo "starting ${STORE_ID} runtime containers (STOREFRONT_ENABLED=${storefront_enabled})"
-"${compose_cmd[@]}" up -d --build "${compose_services[@]}"
+# bootstrap-platform.py builds the shared store images once and sets this for every store it installs.
+build_flag="--build"
+if [[ "${BOOTSTRAP_SKIP_BUILD:-0}" == "1" ]]; then
+  build_flag="--no-build"
+fi
+"${compose_cmd[@]}" up -d "${build_flag}" "${compose_services[@]}"
 
 if [[ "${storefront_enabled}" == "0" ]]; then
   "${compose_cmd[@]}" rm -sf storefront >/dev/null 2>&1 || true
@@ -1,23 +1,96 @@
 #!/usr/bin/env python3
 """Minimal Python standards gate for first-party services.
 
-Enforces a small set of non-negotiable safety/quality rules without external deps.
+Enforces a small set of non-negotiable safety/quality rules without external deps,
+plus performance rules for request-handling code where the path config enables them.
+
+Rules register themselves with the node types they inspect. Each file is parsed once
+and its tree walked once; every node is routed only to the enabled rules registered
+for its type. Results are cached on disk by file content hash, rule-set version and
+enabled rules, so unchanged files are not re-parsed, and cache misses are scanned in
+a process pool when there are enough of them to pay for one.
+
+Performance findings on a line can be suppressed with a trailing
+``# standards: ignore[PF003]`` comment (codes comma-separated). Safety rules cannot
+be suppressed.
 """
 
 from __future__ import annotations
 
 import ast
+import hashlib
+import json
+import os
+import re
+import subprocess
 import sys
+import tomllib
+from collections import Counter
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
 
 
-RULES = {
-    "PY001": "Wildcard imports are forbidden.",
-    "PY002": "Bare except is forbidden.",
-    "PY003": "eval/exec is forbidden.",
-    "PY004": "os.system is forbidden.",
-    "PY005": "subprocess with shell=True is forbidden.",
-}
+USAGE = """\
+Usage: python3 infra/scripts/python-standards-check.py <path> [<path> ...]
+Options:
+  --jobs <n>               worker processes for uncached files (default: CPU count)
+  --cache <file>           result cache location (default: <repo>/.cache/python-standards-check.json)
+  --no-cache               neither read nor write the result cache
+  --changed-since <ref>    only check files changed since a git ref (plus untracked files)
+  --config <file>          rule selection per path (default: infra/scripts/python-standards.toml)"""
+
+DEFAULT_CACHE = Path(__file__).resolve().parents[2] / ".cache" / "python-standards-check.json"
+DEFAULT_CONFIG = Path(__file__).resolve().with_name("python-standards.toml")
+# The checker's own source is the rule-set version: any edit to a rule invalidates cached results.
+RULESET_VERSION = hashlib.sha256(Path(__file__).read_bytes()).hexdigest()[:16]
+# Below this many uncached files, process start-up costs more than the scan it would parallelise.
+MIN_PARALLEL_FILES = 16
+MAX_CACHE_ENTRIES = 20000
+SAFETY = "safety"
+PERFORMANCE = "performance"
+SUPPRESSION_PATTERN = re.compile(r"#\s*standards:\s*ignore\[([A-Z0-9,\s]+)\]")
+HANDLER_BASES = frozenset({"BaseHTTPRequestHandler", "SimpleHTTPRequestHandler", "StreamRequestHandler"})
+
+# A finding is (line, code, message); the path is attached when it is reported.
+Finding = tuple[int, str, str]
+# Findings plus the codes of findings suppressed inline.
+ScanResult = tuple[list[Finding], list[str]]
+
+
+@dataclass(frozen=True)
+class Context:
+    """Where a node sits: inside a request handler class method, and which top-level function."""
+
+    handler: bool = False
+    function: str | None = None
+
+
+@dataclass(frozen=True)
+class Rule:
+    code: str
+    message: str
+    family: str
+    node_types: tuple[type[ast.AST], ...]
+    check: Callable[[ast.AST, Context], bool]
+
+
+RULE_REGISTRY: dict[str, Rule] = {}
+
+
+def rule(
+    code: str, message: str, family: str, *node_types: type[ast.AST]
+) -> Callable[[Callable[[ast.AST, Context], bool]], Callable[[ast.AST, Context], bool]]:
+    """Register ``check(node, context) -> bool`` for the given node types under ``code``."""
+
+    def register(check: Callable[[ast.AST, Context], bool]) -> Callable[[ast.AST, Context], bool]:
+        if code in RULE_REGISTRY:
+            raise ValueError(f"duplicate rule code: {code}")
+        RULE_REGISTRY[code] = Rule(code, message, family, node_types, check)
+        return check
+
+    return register
 
 
 def _iter_py_files(targets: list[str]) -> list[Path]:
@@ -48,66 +121,432 @@ def _name_of(node: ast.AST) -> str | None:
     return None
 
 
-def _check_file(path: Path) -> list[str]:
-    src = path.read_text(encoding="utf-8")
+def _call_name(node: ast.AST) -> str | None:
+    return _name_of(node.func) if isinstance(node, ast.Call) else None
+
+
+@rule("PY001", "Wildcard imports are forbidden.", SAFETY, ast.ImportFrom)
+def _wildcard_import(node: ast.AST, context: Context) -> bool:
+    return isinstance(node, ast.ImportFrom) and any(alias.name == "*" for alias in node.names)
+
+
+@rule("PY002", "Bare except is forbidden.", SAFETY, ast.ExceptHandler)
+def _bare_except(node: ast.AST, context: Context) -> bool:
+    return isinstance(node, ast.ExceptHandler) and node.type is None
+
+
+@rule("PY003", "eval/exec is forbidden.", SAFETY, ast.Call)
+def _eval_exec(node: ast.AST, context: Context) -> bool:
+    return _call_name(node) in {"eval", "exec"}
+
+
+@rule("PY004", "os.system is forbidden.", SAFETY, ast.Call)
+def _os_system(node: ast.AST, context: Context) -> bool:
+    return _call_name(node) == "os.system"
+
+
+@rule("PY005", "subprocess with shell=True is forbidden.", SAFETY, ast.Call)
+def _subprocess_shell(node: ast.AST, context: Context) -> bool:
+    call_name = _call_name(node)
+    if not (isinstance(node, ast.Call) and call_name and call_name.startswith("subprocess.")):
+        return False
+    return any(
+        kw.arg == "shell" and isinstance(kw.value, ast.Constant) and kw.value.value is True for kw in node.keywords
+    )
+
+
+@rule(
+    "PF001", "Environment read in a request handler; resolve settings once at startup.", PERFORMANCE,
+    ast.Call, ast.Subscript,
+)
+def _handler_env_read(node: ast.AST, context: Context) -> bool:
+    if not context.handler:
+        return False
+    if isinstance(node, ast.Subscript):
+        return isinstance(node.ctx, ast.Load) and _name_of(node.value) in {"os.environ", "environ"}
+    return _call_name(node) in {"os.getenv", "getenv", "os.environ.get", "environ.get"}
+
+
+@rule("PF002", "print in a do_* request handler; log outside the request path.", PERFORMANCE, ast.Call)
+def _handler_print(node: ast.AST, context: Context) -> bool:
+    return context.handler and (context.function or "").startswith("do_") and _call_name(node) == "print"
+
+
+@rule("PF003", "time.sleep in a request handler blocks a serving thread.", PERFORMANCE, ast.Call)
+def _handler_sleep(node: ast.AST, context: Context) -> bool:
+    return context.handler and _call_name(node) in {"time.sleep", "sleep"}
+
+
+# Network calls and the positional index of their timeout argument.
+NETWORK_CALLS = {
+    "urlopen": 2,
+    "urllib.request.urlopen": 2,
+    "request.urlopen": 2,
+    "HTTPConnection": 2,
+    "HTTPSConnection": 2,
+    "http.client.HTTPConnection": 2,
+    "http.client.HTTPSConnection": 2,
+    "create_connection": 1,
+    "socket.create_connection": 1,
+}
+
+
+@rule("PF004", "Network call without a timeout in a request handler.", PERFORMANCE, ast.Call)
+def _handler_untimed_network_call(node: ast.AST, context: Context) -> bool:
+    if not (context.handler and isinstance(node, ast.Call)):
+        return False
+    timeout_index = NETWORK_CALLS.get(_call_name(node) or "")
+    if timeout_index is None:
+        return False
+    return len(node.args) <= timeout_index and not any(kw.arg in {"timeout", None} for kw in node.keywords)
+
+
+@rule("PF005", "json.dumps of a constant payload inside a function; encode it once at import.", PERFORMANCE, ast.Call)
+def _constant_json_encoding(node: ast.AST, context: Context) -> bool:
+    if context.function is None or not isinstance(node, ast.Call) or _call_name(node) not in {"json.dumps", "dumps"}:
+        return False
+    if not node.args or not isinstance(node.args[0], (ast.Dict, ast.List, ast.Tuple, ast.Constant)):
+        return False
     try:
-        tree = ast.parse(src, filename=str(path))
+        ast.literal_eval(node.args[0])
+    except ValueError:
+        return False
+    return True
+
+
+@rule("PF006", "subprocess call in a request handler; run it outside the request path.", PERFORMANCE, ast.Call)
+def _handler_subprocess(node: ast.AST, context: Context) -> bool:
+    call_name = _call_name(node) or ""
+    return context.handler and (call_name.startswith("subprocess.") or call_name == "os.popen")
+
+
+RULES = {code: registered.message for code, registered in RULE_REGISTRY.items()}
+FAMILIES = {registered.family for registered in RULE_REGISTRY.values()}
+_DISPATCH_CACHE: dict[frozenset[str], dict[type[ast.AST], tuple[Rule, ...]]] = {}
+
+
+def _dispatch_table(codes: frozenset[str]) -> dict[type[ast.AST], tuple[Rule, ...]]:
+    """Node type -> enabled rules interested in it, in registration order."""
+    table = _DISPATCH_CACHE.get(codes)
+    if table is None:
+        routes: dict[type[ast.AST], list[Rule]] = {}
+        for registered in RULE_REGISTRY.values():
+            if registered.code in codes:
+                for node_type in registered.node_types:
+                    routes.setdefault(node_type, []).append(registered)
+        table = _DISPATCH_CACHE[codes] = {node_type: tuple(rules) for node_type, rules in routes.items()}
+    return table
+
+
+def _handler_classes(tree: ast.Module) -> set[str]:
+    """Module-level classes deriving (directly or via an earlier class here) from a request handler."""
+    names = set(HANDLER_BASES)
+    found: set[str] = set()
+    for node in tree.body:
+        if isinstance(node, ast.ClassDef):
+            bases = {(_name_of(base) or "").rsplit(".", 1)[-1] for base in node.bases}
+            if bases & names:
+                names.add(node.name)
+                found.add(node.name)
+    return found
+
+
+def _suppressions(src: str) -> dict[int, set[str]]:
+    suppressed: dict[int, set[str]] = {}
+    if "standards:" not in src:
+        return suppressed
+    for number, line in enumerate(src.splitlines(), start=1):
+        match = SUPPRESSION_PATTERN.search(line)
+        if match:
+            suppressed[number] = {code.strip() for code in match.group(1).split(",") if code.strip()}
+    return suppressed
+
+
+def _scan_source(src: str, filename: str, codes: frozenset[str] = frozenset(RULES)) -> ScanResult:
+    try:
+        tree = ast.parse(src, filename=filename)
     except SyntaxError as exc:
-        line = exc.lineno or 1
-        return [f"{path}:{line}: PY000 Syntax error: {exc.msg}"]
+        return [(exc.lineno or 1, "PY000", f"Syntax error: {exc.msg}")], []
+
+    table = _dispatch_table(codes)
+    handlers = _handler_classes(tree)
+    findings: list[Finding] = []
+    # Breadth-first like ast.walk, carrying each node's context along with it.
+    queue: list[tuple[ast.AST, Context]] = [(tree, Context())]
+    for node, context in queue:
+        for registered in table.get(type(node), ()):
+            if registered.check(node, context):
+                findings.append((getattr(node, "lineno", 1), registered.code, registered.message))
+        in_handler_class = isinstance(node, ast.ClassDef) and node.name in handlers
+        for child in ast.iter_child_nodes(node):
+            child_context = context
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                if in_handler_class:
+                    child_context = Context(handler=True, function=child.name)
+                elif context.function is None:
+                    child_context = Context(function=child.name)
+            queue.append((child, child_context))
+
+    suppressed_lines = _suppressions(src)
+    kept: list[Finding] = []
+    suppressed: list[str] = []
+    for finding in findings:
+        line, code, _ = finding
+        if RULE_REGISTRY[code].family != SAFETY and code in suppressed_lines.get(line, ()):
+            suppressed.append(code)
+        else:
+            kept.append(finding)
+    return kept, suppressed
+
+
+def _scan_file(path: Path, codes: frozenset[str] = frozenset(RULES)) -> ScanResult:
+    return _scan_source(path.read_text(encoding="utf-8"), str(path), codes)
+
+
+def _scan_job(job: tuple[Path, frozenset[str]]) -> ScanResult:
+    return _scan_file(*job)
+
+
+def _format(path: Path, findings: list[Finding]) -> list[str]:
+    return [f"{path}:{line}: {code} {message}" for line, code, message in findings]
+
+
+def _check_file(path: Path) -> list[str]:
+    return _format(path, _scan_file(path)[0])
+
+
+class RuleConfig:
+    """Rules enabled per path prefix; the longest matching prefix wins and safety rules always apply.
+
+    The TOML file has a ``root`` (relative to the file) and a ``[paths]`` table mapping
+    path prefixes under that root to lists of rule families and/or rule codes.
+    """
 
-    violations: list[str] = []
+    def __init__(self, root: Path, paths: dict[str, list[str]]) -> None:
+        self.root = root.resolve()
+        self.prefixes: list[tuple[tuple[str, ...], frozenset[str]]] = []
+        safety = {code for code, registered in RULE_REGISTRY.items() if registered.family == SAFETY}
+        for prefix, selectors in paths.items():
+            codes = set(safety)
+            for selector in selectors:
+                if selector in FAMILIES:
+                    codes.update(code for code, registered in RULE_REGISTRY.items() if registered.family == selector)
+                elif selector in RULE_REGISTRY:
+                    codes.add(selector)
+                else:
+                    raise ValueError(f"unknown rule family or code for {prefix!r}: {selector}")
+            parts = tuple(part for part in Path(prefix).parts if part != ".")
+            self.prefixes.append((parts, frozenset(codes)))
+        self.prefixes.sort(key=lambda entry: len(entry[0]), reverse=True)
+        self.default = frozenset(safety)
 
-    for node in ast.walk(tree):
-        if isinstance(node, ast.ImportFrom):
-            if any(alias.name == "*" for alias in node.names):
-                violations.append(f"{path}:{node.lineno}: PY001 {RULES['PY001']}")
+    @classmethod
+    def load(cls, path: Path | None) -> RuleConfig:
+        if path is None or not path.is_file():
+            return cls(Path.cwd(), {})
+        with path.open("rb") as handle:
+            data = tomllib.load(handle)
+        paths = data.get("paths", {})
+        if not isinstance(paths, dict) or not all(isinstance(value, list) for value in paths.values()):
+            raise ValueError(f"{path}: [paths] must map path prefixes to lists")
+        return cls(path.parent / str(data.get("root", ".")), paths)
 
-        if isinstance(node, ast.ExceptHandler):
-            if node.type is None:
-                violations.append(f"{path}:{node.lineno}: PY002 {RULES['PY002']}")
+    def codes_for(self, file: Path) -> frozenset[str]:
+        try:
+            parts = file.resolve().relative_to(self.root).parts
+        except ValueError:
+            return self.default
+        for prefix, codes in self.prefixes:
+            if parts[: len(prefix)] == prefix:
+                return codes
+        return self.default
 
-        if isinstance(node, ast.Call):
-            call_name = _name_of(node.func)
-            if call_name in {"eval", "exec"}:
-                violations.append(f"{path}:{node.lineno}: PY003 {RULES['PY003']}")
-            if call_name == "os.system":
-                violations.append(f"{path}:{node.lineno}: PY004 {RULES['PY004']}")
-            if call_name and call_name.startswith("subprocess."):
-                for kw in node.keywords:
-                    if kw.arg == "shell" and isinstance(kw.value, ast.Constant) and kw.value.value is True:
-                        violations.append(f"{path}:{node.lineno}: PY005 {RULES['PY005']}")
-                        break
 
-    return violations
+class ResultCache:
+    """Scan results per file content hash and enabled rules, valid for one rule-set version."""
+
+    def __init__(self, path: Path | None) -> None:
+        self.path = path
+        self.entries: dict[str, ScanResult] = {}
+        self.dirty = False
+        if path is None:
+            return
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return
+        if isinstance(data, dict) and data.get("version") == RULESET_VERSION and isinstance(data.get("files"), dict):
+            self.entries = {
+                key: ([(int(line), str(code), str(message)) for line, code, message in findings], list(suppressed))
+                for key, (findings, suppressed) in data["files"].items()
+            }
+
+    def get(self, key: str) -> ScanResult | None:
+        result = self.entries.pop(key, None)
+        if result is not None:
+            # Re-insert so recently used entries survive trimming.
+            self.entries[key] = result
+        return result
+
+    def put(self, key: str, result: ScanResult) -> None:
+        self.entries[key] = result
+        self.dirty = True
+
+    def save(self) -> None:
+        if self.path is None or not self.dirty:
+            return
+        entries = list(self.entries.items())[-MAX_CACHE_ENTRIES:]
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_text(json.dumps({"version": RULESET_VERSION, "files": dict(entries)}), encoding="utf-8")
+            tmp.replace(self.path)
+        except OSError:
+            # The cache only saves time; a read-only checkout still gets a correct result.
+            return
+
+
+def _changed_files(ref: str) -> set[Path]:
+    """Files that differ from ``ref`` in the working tree, plus untracked files."""
+    top = subprocess.run(
+        ["git", "rev-parse", "--show-toplevel"], capture_output=True, text=True, check=True
+    ).stdout.strip()
+    diff = subprocess.run(
+        ["git", "diff", "--name-only", "--diff-filter=ACMR", "-z", ref, "--"],
+        capture_output=True, text=True, check=True, cwd=top,
+    ).stdout
+    untracked = subprocess.run(
+        ["git", "ls-files", "--others", "--exclude-standard", "-z"],
+        capture_output=True, text=True, check=True, cwd=top,
+    ).stdout
+    return {(Path(top) / name).resolve() for name in (diff + untracked).split("\0") if name}
+
+
+def _parse_options(args: list[str]) -> tuple[dict[str, str | None], list[str]]:
+    options: dict[str, str | None] = {
+        "jobs": None, "cache": str(DEFAULT_CACHE), "changed_since": None, "config": str(DEFAULT_CONFIG),
+    }
+    targets: list[str] = []
+    index = 0
+    while index < len(args):
+        arg = args[index]
+        if arg == "--no-cache":
+            options["cache"] = None
+        elif arg in ("--jobs", "--cache", "--changed-since", "--config"):
+            if index + 1 >= len(args):
+                raise ValueError(f"{arg} requires a value")
+            options[arg[2:].replace("-", "_")] = args[index + 1]
+            index += 1
+        elif arg.startswith("--"):
+            raise ValueError(f"Unknown option: {arg}")
+        else:
+            targets.append(arg)
+        index += 1
+    jobs = options["jobs"]
+    if jobs is not None and (not jobs.isdigit() or int(jobs) < 1):
+        raise ValueError(f"--jobs must be a positive integer: {jobs}")
+    return options, targets
+
+
+def _scan_all(files: list[Path], config: RuleConfig, cache: ResultCache, jobs: int) -> dict[Path, ScanResult]:
+    results: dict[Path, ScanResult] = {}
+    misses: list[tuple[Path, frozenset[str], str]] = []
+    for file in files:
+        codes = config.codes_for(file)
+        key = f"{hashlib.sha256(file.read_bytes()).hexdigest()}:{','.join(sorted(codes))}"
+        cached = cache.get(key)
+        if cached is None:
+            misses.append((file, codes, key))
+        else:
+            results[file] = cached
+
+    to_scan = [(file, codes) for file, codes, _ in misses]
+    if jobs > 1 and len(misses) >= MIN_PARALLEL_FILES:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            chunksize = max(1, len(misses) // (jobs * 4))
+            scanned = list(executor.map(_scan_job, to_scan, chunksize=chunksize))
+    else:
+        scanned = [_scan_job(job) for job in to_scan]
+    for (file, _, key), result in zip(misses, scanned):
+        cache.put(key, result)
+        results[file] = result
+    return results
+
+
+def _print_summary(counts: Counter[str], suppressed: Counter[str]) -> None:
+    if counts:
+        print("Summary by rule:")
+        for code in sorted(counts):
+            print(f"  {code} {counts[code]:>4}  {RULES.get(code, 'Syntax error.')}")
+    if suppressed:
+        listed = ", ".join(f"{code} x{suppressed[code]}" for code in sorted(suppressed))
+        print(f"Suppressed inline: {listed}")
 
 
 def main(argv: list[str]) -> int:
-    if len(argv) < 2:
-        print("Usage: python3 infra/scripts/python-standards-check.py <path> [<path> ...]")
+    try:
+        options, targets = _parse_options(argv[1:])
+    except ValueError as exc:
+        print(str(exc))
+        print(USAGE)
+        return 2
+    if not targets:
+        print(USAGE)
         return 2
 
     try:
-        files = _iter_py_files(argv[1:])
+        files = _iter_py_files(targets)
     except FileNotFoundError as exc:
         print(str(exc))
         return 2
 
+    config_path = options["config"]
+    try:
+        config = RuleConfig.load(Path(config_path) if config_path else None)
+    except (OSError, ValueError) as exc:
+        print(f"Invalid standards config: {exc}")
+        return 2
+
+    ref = options["changed_since"]
+    if ref is not None:
+        try:
+            changed = _changed_files(ref)
+        except (OSError, subprocess.CalledProcessError) as exc:
+            print(f"Cannot list files changed since {ref}: {exc}")
+            return 2
+        files = [file for file in files if file.resolve() in changed]
+        if not files:
+            print(f"No Python files changed since {ref} in provided targets.")
+            return 0
+
     if not files:
         print("No Python files found in provided targets.")
         return 0
 
+    cache_path = options["cache"]
+    cache = ResultCache(Path(cache_path) if cache_path else None)
+    jobs = int(options["jobs"] or os.cpu_count() or 1)
+    results = _scan_all(files, config, cache, jobs)
+    cache.save()
+
     all_violations: list[str] = []
+    counts: Counter[str] = Counter()
+    suppressed: Counter[str] = Counter()
     for file in files:
-        all_violations.extend(_check_file(file))
+        findings, suppressed_codes = results[file]
+        all_violations.extend(_format(file, findings))
+        counts.update(code for _, code, _ in findings)
+        suppressed.update(suppressed_codes)
 
     if all_violations:
         print("Python standards check failed:")
         for violation in all_violations:
             print(f"- {violation}")
+        _print_summary(counts, suppressed)
         return 1
 
     print(f"Python standards check passed for {len(files)} file(s).")
+    _print_summary(counts, suppressed)
     return 0
 
 
@@ -0,0 +1,213 @@
+import contextlib
+import importlib.util
+import io
+import os
+import pathlib
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+SCRIPT_PATH = ROOT / "bootstrap-platform.py"
+
+spec = importlib.util.spec_from_file_location("bootstrap_platform", SCRIPT_PATH)
+bootstrap = importlib.util.module_from_spec(spec)
+assert spec.loader is not None
+# Dataclasses resolve annotations through sys.modules.
+sys.modules[spec.name] = bootstrap
+spec.loader.exec_module(bootstrap)
+
+
+def write_env(path: pathlib.Path, store_id: str, magento: int, agent: int, storefront: int) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(
+        f"STORE_ID={store_id}\nMAGENTO_HTTP_PORT={magento}\nSHOP_AGENT_PORT={agent}\nSTOREFRONT_PORT={storefront}\n",
+        encoding="utf-8",
+    )
+
+
+class FakeDocker:
+    """Records commands instead of running them and tracks how many stores start at once."""
+
+    def __init__(self, failing: set[str] = frozenset(), missing: set[str] = frozenset()) -> None:
+        self.failing = failing
+        self.missing = missing
+        self.calls: list[tuple[list[str], pathlib.Path | None, dict[str, str] | None]] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, argv: list[str], log_path: pathlib.Path | None = None, env: dict | None = None) -> int:
+        with self.lock:
+            self.calls.append((argv, log_path, env))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(0.02)
+        with self.lock:
+            self.in_flight -= 1
+        if log_path is not None and log_path.parent.name in self.missing:
+            raise FileNotFoundError(2, "No such file or directory", argv[0])
+        return 1 if log_path is not None and log_path.parent.name in self.failing else 0
+
+    def commands(self, verb: str) -> list[list[str]]:
+        return [argv for argv, _, _ in self.calls if verb in argv]
+
+
+class BootstrapTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.instances = pathlib.Path(tmp.name)
+        patcher = mock.patch.object(bootstrap, "is_port_bound", return_value=False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_main(self, *argv: str) -> tuple[int, str]:
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            code = bootstrap.main([*argv, "--instances-dir", str(self.instances)])
+        return code, out.getvalue()
+
+
+class AllocationTests(BootstrapTestCase):
+    def test_ports_are_allocated_up_front_without_collisions(self) -> None:
+        write_env(self.instances / "shop-002" / ".env", "shop-002", 8182, 8191, 8281)
+        write_env(self.instances / "other-001" / ".env.example", "other-001", 8181, 8193, 8283)
+        registry = bootstrap.PortRegistry(self.instances)
+        registry.refresh()
+
+        allocation = bootstrap.allocate_ports(
+            [f"shop-00{n}" for n in range(1, 5)], registry, is_bound=lambda port: port == 8184
+        )
+
+        self.assertEqual(allocation["shop-002"], {"MAGENTO_HTTP_PORT": 8182, "SHOP_AGENT_PORT": 8191,
+                                                  "STOREFRONT_PORT": 8281})
+        self.assertEqual(allocation["shop-001"]["MAGENTO_HTTP_PORT"], 8183)
+        self.assertEqual(allocation["shop-003"]["MAGENTO_HTTP_PORT"], 8185)
+        ports = [port for store in allocation.values() for port in store.values()] + [8181, 8193, 8283]
+        self.assertEqual(len(ports), len(set(ports)))
+
+    def test_registry_only_reparses_changed_env_files(self) -> None:
+        for number in range(1, 4):
+            write_env(self.instances / f"shop-00{number}" / ".env", f"shop-00{number}", 8180 + number, 0, 0)
+        registry = bootstrap.PortRegistry(self.instances)
+        registry.refresh()
+        self.assertEqual(registry.parsed, 3)
+        registry.save()
+
+        reloaded = bootstrap.PortRegistry(self.instances)
+        reloaded.refresh()
+        self.assertEqual(reloaded.parsed, 0)
+        self.assertEqual(reloaded.ports_for("shop-002")["MAGENTO_HTTP_PORT"], 8182)
+
+        write_env(self.instances / "shop-002" / ".env", "shop-002", 9000, 9001, 9002)
+        reloaded.refresh()
+        self.assertEqual(reloaded.parsed, 1)
+        self.assertEqual(reloaded.ports_for("shop-002")["MAGENTO_HTTP_PORT"], 9000)
+
+
+class ProvisionTests(BootstrapTestCase):
+    def test_dry_run_prints_the_plan_and_writes_nothing(self) -> None:
+        code, output = self.run_main("--count", "3", "--no-install", "--dry-run")
+        self.assertEqual(code, 0, output)
+        self.assertEqual(list(self.instances.iterdir()), [])
+        self.assertIn("plan: 3 store(s), parallel 4", output)
+        self.assertIn("shop-003: MAGENTO=8183, SHOP_AGENT=8193, STOREFRONT=8283 (create .env)", output)
+        self.assertEqual(output.count("build magento-app shop-agent storefront"), 1)
+        self.assertEqual(output.count("up -d --no-build"), 3)
+
+    def test_provision_only_renders_files_and_is_stable_on_rerun(self) -> None:
+        code, output = self.run_main("--count", "2", "--provision-only")
+        self.assertEqual(code, 0, output)
+        self.assertIn("provisioned shop-002 (MAGENTO=8182, SHOP_AGENT=8192, STOREFRONT=8282)", output)
+        env_file = self.instances / "shop-002" / ".env"
+        env = bootstrap.read_env_file(env_file)
+        self.assertEqual((env["STORE_ID"], env["MAGENTO_BASE_URL"]), ("shop-002", "http://localhost:8182"))
+        self.assertNotIn("__SET_AT_RUNTIME__", env["MAGENTO_DB_PASSWORD"] + env["AGENT_JWT_SECRET"])
+        self.assertEqual(os.stat(env_file).st_mode & 0o777, 0o600)
+        example = bootstrap.read_env_file(self.instances / "shop-002" / ".env.example")
+        self.assertEqual((example["STOREFRONT_PORT"], example["AGENT_JWT_SECRET"]), ("8282", "__SET_AT_RUNTIME__"))
+        self.assertTrue((self.instances / "shop-001" / "docker-compose.override.yml").is_file())
+        self.assertTrue((self.instances / bootstrap.REGISTRY_NAME).is_file())
+
+        before = env_file.read_text(encoding="utf-8")
+        code, output = self.run_main("--count", "3", "--provision-only")
+        self.assertEqual(code, 0, output)
+        self.assertEqual(env_file.read_text(encoding="utf-8"), before)
+        self.assertIn("provisioned shop-003 (MAGENTO=8183, SHOP_AGENT=8193, STOREFRONT=8283)", output)
+
+    def test_mismatched_store_id_stops_before_writing(self) -> None:
+        write_env(self.instances / "shop-002" / ".env", "shop-999", 8182, 8192, 8282)
+        code, output = self.run_main("--count", "2", "--provision-only")
+        self.assertEqual(code, 1)
+        self.assertIn("has STORE_ID=shop-999, expected shop-002", output)
+        self.assertFalse((self.instances / "shop-001").exists())
+
+    def test_cli_validation(self) -> None:
+        for argv, message in (
+            (["--count", "0"], "--count must be a positive integer"),
+            (["--parallel", "x"], "--parallel must be a positive integer"),
+            (["--bogus"], "unknown option: --bogus"),
+        ):
+            with self.subTest(argv=argv):
+                code, output = self.run_main(*argv)
+                self.assertEqual(code, 1)
+                self.assertIn(message, output)
+
+
+class StartTests(BootstrapTestCase):
+    def start(self, docker: FakeDocker, *argv: str) -> tuple[int, str]:
+        with mock.patch.object(bootstrap, "run_command", docker), \
+                mock.patch.object(bootstrap.shutil, "which", return_value="/usr/bin/docker"):
+            return self.run_main(*argv)
+
+    def test_images_are_built_once_and_stores_start_with_bounded_parallelism(self) -> None:
+        docker = FakeDocker()
+        code, output = self.start(docker, "--count", "6", "--parallel", "2", "--no-install", "--no-control-plane")
+        self.assertEqual(code, 0, output)
+        builds = docker.commands("build")
+        self.assertEqual(len(builds), 1)
+        self.assertEqual(builds[0][-3:], ["magento-app", "shop-agent", "storefront"])
+        self.assertEqual(len(docker.commands("--no-build")), 6)
+        # The build runs alone before any store starts; stores then never exceed --parallel.
+        self.assertEqual(docker.calls[0][0], builds[0])
+        self.assertEqual(docker.max_in_flight, 2)
+        self.assertIn("6 of 6 store(s) up", output)
+
+    def test_install_mode_skips_per_store_builds_and_reports_failures(self) -> None:
+        docker = FakeDocker(failing={"shop-002"})
+        code, output = self.start(docker, "--count", "3", "--no-control-plane")
+        self.assertEqual(code, 1)
+        installs = [call for call in docker.calls if call[0][0] == "bash"]
+        self.assertEqual(sorted(argv[-1] for argv, _, _ in installs), ["shop-001", "shop-002", "shop-003"])
+        self.assertTrue(all(env and env["BOOTSTRAP_SKIP_BUILD"] == "1" for _, _, env in installs))
+        self.assertIn("[shop-002] failed: install-magento.sh exited 1", output)
+        self.assertIn("[shop-003] installed in", output)
+        self.assertIn("2 of 3 store(s) up", output)
+
+    def test_a_store_whose_command_cannot_run_fails_alone(self) -> None:
+        docker = FakeDocker(missing={"shop-001"})
+        code, output = self.start(docker, "--count", "3", "--no-install", "--no-control-plane")
+        self.assertEqual(code, 1)
+        self.assertIn("[shop-001] failed: docker not runnable: No such file or directory", output)
+        self.assertIn("[shop-002] started in", output)
+        self.assertIn("[shop-003] started in", output)
+        self.assertIn("2 of 3 store(s) up", output)
+
+    def test_legacy_compose_copies_keep_building_per_store(self) -> None:
+        store_dir = self.instances / "shop-001"
+        store_dir.mkdir()
+        (store_dir / "docker-compose.override.yml").write_text("services: {}\n", encoding="utf-8")
+        docker = FakeDocker()
+        code, output = self.start(docker, "--no-install", "--no-control-plane")
+        self.assertEqual(code, 0, output)
+        self.assertEqual(docker.commands("build"), [])
+        self.assertEqual(len(docker.commands("--build")), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
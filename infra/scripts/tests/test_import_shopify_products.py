@@ -0,0 +1,252 @@
+import base64
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import pathlib
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
+
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+SCRIPT_PATH = ROOT / "import-shopify-products.py"
+
+spec = importlib.util.spec_from_file_location("import_shopify_products", SCRIPT_PATH)
+importer = importlib.util.module_from_spec(spec)
+assert spec.loader is not None
+spec.loader.exec_module(importer)
+
+PNG = b"\x89PNG\r\n\x1a\nstub"
+
+
+def feed_product(number: int, base: str = "", **overrides: object) -> dict:
+    product = {
+        "handle": f"Tee Shirt {number}",
+        "title": f"Tee {number}",
+        "body_html": "<p>Soft&nbsp;cotton &amp;   dye</p>",
+        "vendor": "Acme",
+        "tags": ["summer", "cotton"],
+        "variants": [{"price": "25.00"}],
+        "images": [{"src": f"{base}/images/tee-{number}.png?v=1"}],
+    }
+    product.update(overrides)
+    return product
+
+
+class StubCatalogHandler(BaseHTTPRequestHandler):
+    """Serves a paged Shopify feed, product images and the Magento REST calls the importer makes."""
+
+    protocol_version = "HTTP/1.1"
+    pages: list[list[dict]] = []
+    lock = threading.Lock()
+    requests: list[tuple[str, str]] = []
+    upserts: dict[str, dict] = {}
+    media: dict[str, dict] = {}
+    failing_skus: set[str] = set()
+    existing_media: set[str] = set()
+    magento_ports: set[int] = set()
+
+    def do_GET(self) -> None:  # noqa: N802
+        self._record()
+        parts = urlsplit(self.path)
+        if parts.path == "/collections/all/products.json":
+            page = int(parse_qs(parts.query)["page"][0])
+            products = self.pages[page - 1] if page <= len(self.pages) else []
+            self._reply(200, json.dumps({"products": products}).encode("utf-8"))
+        elif parts.path.startswith("/images/"):
+            self._reply(200, PNG, "image/png")
+        else:
+            self._reply(404, b"{}")
+
+    def do_POST(self) -> None:  # noqa: N802
+        body = self._record()
+        if self.path == "/rest/V1/integration/admin/token":
+            credentials = json.loads(body)
+            ok = credentials == {"username": "admin", "password": "secret"}
+            self._reply(200 if ok else 401, b'"admin-token"' if ok else b"{}")
+        elif self.path.endswith("/media") and self._authorized():
+            sku = self.path.split("/")[-2]
+            with self.lock:
+                self.media[sku] = json.loads(body)
+            self._reply(200, b"1")
+        else:
+            self._reply(401, b"{}")
+
+    def do_PUT(self) -> None:  # noqa: N802
+        body = self._record()
+        sku = self.path.rsplit("/", 1)[1]
+        if not self._authorized():
+            self._reply(401, b"{}")
+            return
+        if sku in self.failing_skus:
+            self._reply(500, b'{"message": "boom"}')
+            return
+        product = json.loads(body)["product"]
+        with self.lock:
+            self.upserts[sku] = product
+        media = [{"id": 1}] if sku in self.existing_media else []
+        self._reply(200, json.dumps({**product, "media_gallery_entries": media}).encode("utf-8"))
+
+    def _record(self) -> bytes:
+        body = self.rfile.read(int(self.headers.get("Content-Length", "0")))
+        with self.lock:
+            self.requests.append((self.command, self.path))
+            if self.path.startswith("/rest/"):
+                self.magento_ports.add(self.client_address[1])
+        return body
+
+    def _authorized(self) -> bool:
+        return self.headers.get("Authorization") == "Bearer admin-token"
+
+    def _reply(self, code: int, body: bytes, content_type: str = "application/json") -> None:
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: object) -> None:  # noqa: A002
+        return
+
+
+class ImporterTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.httpd = ThreadingHTTPServer(("127.0.0.1", 0), StubCatalogHandler)
+        cls.httpd.daemon_threads = True
+        cls.thread = threading.Thread(target=cls.httpd.serve_forever, daemon=True)
+        cls.thread.start()
+        cls.base = f"http://127.0.0.1:{cls.httpd.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.httpd.shutdown()
+        cls.httpd.server_close()
+        cls.thread.join(timeout=5)
+
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.instances = pathlib.Path(tmp.name)
+        (self.instances / "shop-001").mkdir()
+        (self.instances / "shop-001" / ".env").write_text(
+            f"MAGENTO_BASE_URL={self.base}/\nMAGENTO_ADMIN_USER=admin\nMAGENTO_ADMIN_PASSWORD=secret\n",
+            encoding="utf-8",
+        )
+        self.checkpoint = self.instances / "shop-001" / importer.CHECKPOINT_NAME
+        products = [feed_product(number, self.base) for number in range(1, 6)]
+        StubCatalogHandler.pages = [products[0:2], products[2:4], products[4:]]
+        StubCatalogHandler.requests = []
+        StubCatalogHandler.upserts = {}
+        StubCatalogHandler.media = {}
+        StubCatalogHandler.failing_skus = set()
+        StubCatalogHandler.existing_media = set()
+        StubCatalogHandler.magento_ports = set()
+
+    def run_import(self, *extra: str, limit: str = "100", env: dict[str, str] | None = None) -> tuple[int, str]:
+        argv = [
+            "shop-001", "--limit", limit, "--source-url", f"{self.base}/collections/all/products.json?limit=2&page=1",
+            "--instances-dir", str(self.instances), "--skip-reindex", "--concurrency", "3", *extra,
+        ]
+        out = io.StringIO()
+        with mock.patch.dict(os.environ, env or {}), contextlib.redirect_stdout(out), \
+                contextlib.redirect_stderr(out):
+            code = importer.main(argv)
+        return code, out.getvalue()
+
+    def feed_pages_requested(self) -> list[str]:
+        return [path for method, path in StubCatalogHandler.requests if "products.json" in path]
+
+    def test_streams_every_page_and_maps_fields(self) -> None:
+        code, output = self.run_import(env={"SKU_PREFIX": "seed"})
+        self.assertEqual(code, 0, output)
+        self.assertEqual(sorted(StubCatalogHandler.upserts), [f"seed-tee-shirt-{n}" for n in range(1, 6)])
+        # The third page is short, so no fourth page is requested.
+        self.assertEqual(len(self.feed_pages_requested()), 3)
+        product = StubCatalogHandler.upserts["seed-tee-shirt-1"]
+        self.assertEqual((product["name"], product["price"], product["type_id"]), ("Tee 1", 25, "simple"))
+        attributes = {entry["attribute_code"]: entry["value"] for entry in product["custom_attributes"]}
+        self.assertEqual(attributes["short_description"], "Soft cotton & dye")
+        self.assertEqual(attributes["meta_description"], "Soft cotton & dye · Acme")
+        self.assertTrue(attributes["description"].endswith("<p><strong>Source tags:</strong> summer, cotton</p>"))
+        self.assertEqual(attributes["url_key"], "Tee Shirt 1")
+        content = StubCatalogHandler.media["seed-tee-shirt-1"]["entry"]["content"]
+        self.assertEqual((content["type"], content["name"]), ("image/png", "tee-1.png"))
+        self.assertEqual(base64.b64decode(content["base64_encoded_data"]), PNG)
+        self.assertLessEqual(len(StubCatalogHandler.magento_ports), 3)
+        self.assertFalse(self.checkpoint.exists())
+
+    def test_limit_stops_streaming(self) -> None:
+        code, output = self.run_import(limit="3")
+        self.assertEqual(code, 0, output)
+        self.assertEqual(len(StubCatalogHandler.upserts), 3)
+        self.assertEqual(len(self.feed_pages_requested()), 2)
+
+    def test_rerun_resumes_from_checkpoint(self) -> None:
+        StubCatalogHandler.failing_skus = {"shopify-tee-shirt-4"}
+        code, output = self.run_import()
+        self.assertEqual(code, 1)
+        self.assertIn("upsert failed", output)
+        self.assertEqual(len(StubCatalogHandler.upserts), 4)
+        self.assertTrue(self.checkpoint.exists())
+
+        StubCatalogHandler.failing_skus = set()
+        StubCatalogHandler.upserts = {}
+        code, output = self.run_import()
+        self.assertEqual(code, 0, output)
+        self.assertEqual(list(StubCatalogHandler.upserts), ["shopify-tee-shirt-4"])
+        self.assertFalse(self.checkpoint.exists())
+
+    def test_existing_media_and_missing_titles_are_skipped(self) -> None:
+        StubCatalogHandler.pages = [[feed_product(1, title=None), feed_product(2, images=[], variants=[])]]
+        StubCatalogHandler.existing_media = {"shopify-tee-shirt-2"}
+        code, output = self.run_import()
+        self.assertEqual(code, 0, output)
+        self.assertIn("source product has empty title, skipping", output)
+        self.assertEqual(list(StubCatalogHandler.upserts), ["shopify-tee-shirt-2"])
+        self.assertEqual(StubCatalogHandler.upserts["shopify-tee-shirt-2"]["price"], 19.99)
+        self.assertEqual(StubCatalogHandler.media, {})
+
+    def test_cli_validation_matches_the_shell_script(self) -> None:
+        for argv, message in (
+            (["shop-001", "--limit", "0"], "invalid --limit value: 0"),
+            (["shop-001"], "placeholder detected"),
+            (["shop-001", "--source-url", "ftp://feed"], "expected http(s) URL"),
+            (["shop-001", "--source-url", "http://feed", "--instances-dir", "/nonexistent"], "missing runtime env"),
+            (["shop-001", "--bogus"], "unknown argument: --bogus"),
+        ):
+            with self.subTest(argv=argv):
+                out = io.StringIO()
+                with contextlib.redirect_stdout(out), contextlib.redirect_stderr(out):
+                    self.assertEqual(importer.main(argv), 1)
+                self.assertIn(message, out.getvalue())
+
+
+class MappingTests(unittest.TestCase):
+    def test_sku_is_sanitized_prefixed_and_truncated(self) -> None:
+        self.assertEqual(importer.sanitize_sku("Blue  Shirt!!_XL", "shopify"), "shopify-blue-shirt-xl")
+        self.assertEqual(importer.sanitize_sku("---", "shopify"), "shopify-product")
+        self.assertEqual(importer.sanitize_sku("a--b_c", "shopify"), "shopify-a-b-c")
+        self.assertEqual(len(importer.sanitize_sku("x" * 100, "shopify")), 64)
+
+    def test_unusable_prices_fall_back(self) -> None:
+        self.assertEqual(importer.parse_price("25.50"), 25.5)
+        self.assertEqual(importer.parse_price("30.00"), 30)
+        for raw in ("", "0", "nan", "inf", "-inf"):
+            with self.subTest(raw=raw):
+                self.assertEqual(importer.parse_price(raw), importer.FALLBACK_PRICE)
+
+    def test_shopify_cdn_images_are_resized(self) -> None:
+        resized = importer.image_download_url("https://cdn.shopify.com/a.jpg?v=1")
+        self.assertEqual(resized, "https://cdn.shopify.com/a.jpg?v=1&width=1200")
+        self.assertEqual(importer.image_download_url("https://img.example/a.webp"), "https://img.example/a.webp")
+        self.assertEqual(importer.mime_from_url("https://img.example/a.WEBP"), "image/webp")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,236 @@
+import contextlib
+import importlib.util
+import io
+import pathlib
+import re
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+SCRIPT_PATH = ROOT / "python-standards-check.py"
+
+spec = importlib.util.spec_from_file_location("python_standards_check", SCRIPT_PATH)
+checker = importlib.util.module_from_spec(spec)
+assert spec.loader is not None
+# Dataclasses resolve annotations through sys.modules.
+sys.modules[spec.name] = checker
+spec.loader.exec_module(checker)
+
+VIOLATIONS = """\
+import os
+import subprocess
+from json import *
+
+try:
+    eval("1")
+except:
+    os.system("true")
+subprocess.run("ls", shell=True)
+"""
+
+
+class StandardsCheckTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = pathlib.Path(tmp.name)
+        self.src = self.tmp / "src"
+        self.src.mkdir()
+        self.cache = self.tmp / "cache.json"
+
+    def write(self, name: str, text: str) -> pathlib.Path:
+        path = self.src / name
+        path.write_text(text, encoding="utf-8")
+        return path
+
+    def run_check(self, *argv: str) -> tuple[int, str]:
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            code = checker.main(["python-standards-check.py", "--cache", str(self.cache), *argv])
+        return code, out.getvalue()
+
+
+class OutputTests(StandardsCheckTestCase):
+    def test_report_format_and_exit_codes(self) -> None:
+        bad = self.write("bad.py", VIOLATIONS)
+        self.write("broken.py", "def broken(:\n")
+        self.write("clean.py", "VALUE = 1\n")
+
+        code, output = self.run_check(str(self.src))
+        self.assertEqual(code, 1)
+        lines = output.splitlines()
+        self.assertEqual(lines[0], "Python standards check failed:")
+        self.assertEqual(
+            lines[1:6],
+            [
+                f"- {bad}:3: PY001 Wildcard imports are forbidden.",
+                f"- {bad}:7: PY002 Bare except is forbidden.",
+                f"- {bad}:9: PY005 subprocess with shell=True is forbidden.",
+                f"- {bad}:6: PY003 eval/exec is forbidden.",
+                f"- {bad}:8: PY004 os.system is forbidden.",
+            ],
+        )
+        self.assertTrue(lines[6].startswith(f"- {self.src / 'broken.py'}:1: PY000 Syntax error:"))
+
+        code, output = self.run_check(str(self.src / "clean.py"))
+        self.assertEqual((code, output), (0, "Python standards check passed for 1 file(s).\n"))
+        self.assertEqual(self.run_check()[0], 2)
+        self.assertEqual(self.run_check(str(self.tmp / "missing"))[0], 2)
+
+    def test_parallel_scan_matches_serial_scan(self) -> None:
+        for number in range(checker.MIN_PARALLEL_FILES + 4):
+            self.write(f"module_{number:02d}.py", VIOLATIONS if number % 3 == 0 else "VALUE = 1\n")
+        serial = self.run_check("--no-cache", "--jobs", "1", str(self.src))
+        # Run as a script so worker processes can import it under any multiprocessing start method.
+        parallel = subprocess.run(
+            [sys.executable, str(SCRIPT_PATH), "--no-cache", "--jobs", "3", str(self.src)],
+            capture_output=True, text=True, check=False,
+        )
+        self.assertEqual((parallel.returncode, parallel.stdout), serial)
+
+
+class CacheTests(StandardsCheckTestCase):
+    def test_unchanged_files_are_served_from_the_cache(self) -> None:
+        self.write("bad.py", VIOLATIONS)
+        clean = self.write("clean.py", "VALUE = 1\n")
+        first = self.run_check(str(self.src))
+        self.assertTrue(self.cache.is_file())
+
+        with mock.patch.object(checker.ast, "parse", wraps=checker.ast.parse) as parse:
+            self.assertEqual(self.run_check(str(self.src)), first)
+            self.assertEqual(parse.call_count, 0)
+            clean.write_text("from os import *\n", encoding="utf-8")
+            code, output = self.run_check(str(self.src))
+            self.assertEqual(parse.call_count, 1)
+        self.assertIn(f"{clean}:1: PY001", output)
+
+    def test_cache_from_another_rule_set_version_is_ignored(self) -> None:
+        self.write("bad.py", VIOLATIONS)
+        self.run_check(str(self.src))
+        with mock.patch.object(checker, "RULESET_VERSION", "other"), \
+                mock.patch.object(checker.ast, "parse", wraps=checker.ast.parse) as parse:
+            self.run_check(str(self.src))
+        self.assertEqual(parse.call_count, 1)
+
+
+HANDLER_SOURCE = """\
+import json
+import os
+import subprocess
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler
+
+STATIC = json.dumps({"status": "ok"})
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        print("request")
+        mode = os.environ["MODE"]
+        time.sleep(0.1)  # standards: ignore[PF003]
+        urllib.request.urlopen("http://upstream/")
+        urllib.request.urlopen("http://upstream/", timeout=2)
+        self.wfile.write(json.dumps({"status": "ok"}).encode())
+        self._render(mode)
+
+    def _render(self, mode):
+        subprocess.run(["true"], check=False)  # standards: ignore[PF001]
+        return os.getenv("COLOR")
+
+
+class Versioned(Handler):
+    def do_POST(self):
+        time.sleep(1)
+
+
+def build_report():
+    time.sleep(1)
+    print("not a handler")
+    return subprocess.run(["true"], check=False), json.dumps([1, 2])
+"""
+
+
+class PerformanceRuleTests(StandardsCheckTestCase):
+    def write_config(self, *selectors: str) -> pathlib.Path:
+        config = self.tmp / "standards.toml"
+        listed = ", ".join(f'"{selector}"' for selector in selectors)
+        config.write_text(f'root = "."\n\n[paths]\n"src/service" = [{listed}]\n', encoding="utf-8")
+        return config
+
+    def test_rules_apply_only_to_configured_paths_and_honour_suppressions(self) -> None:
+        (self.src / "service").mkdir()
+        service = self.src / "service" / "server.py"
+        service.write_text(HANDLER_SOURCE, encoding="utf-8")
+        script = self.write("script.py", HANDLER_SOURCE)
+
+        code, output = self.run_check("--config", str(self.write_config("performance")), str(self.src))
+        self.assertEqual(code, 1)
+        reported = re.findall(r"^- (.+):(\d+): (\w+) ", output, re.MULTILINE)
+        self.assertEqual(
+            sorted((int(line), code) for path, line, code in reported if path == str(service)),
+            [(13, "PF002"), (14, "PF001"), (16, "PF004"), (18, "PF005"), (22, "PF006"), (23, "PF001"), (28, "PF003"),
+             (34, "PF005")],
+        )
+        self.assertFalse([entry for entry in reported if entry[0] == str(script)])
+        self.assertIn("Summary by rule:", output)
+        self.assertIn("  PF001    2  Environment read in a request handler", output)
+        # The PF003 suppression applies; PF001 on the subprocess line names a rule that is not reported there.
+        self.assertIn("Suppressed inline: PF003 x1", output)
+
+    def test_codes_can_be_selected_individually(self) -> None:
+        (self.src / "service").mkdir()
+        (self.src / "service" / "server.py").write_text(HANDLER_SOURCE, encoding="utf-8")
+        code, output = self.run_check("--config", str(self.write_config("PF006")), str(self.src))
+        self.assertEqual(code, 1)
+        self.assertEqual([line.split()[2] for line in output.splitlines() if line.startswith("- ")], ["PF006"])
+
+        code, output = self.run_check("--config", str(self.write_config("fast")), str(self.src))
+        self.assertEqual(code, 2)
+        self.assertIn("unknown rule family or code", output)
+
+    def test_safety_rules_cannot_be_suppressed(self) -> None:
+        self.write("bad.py", "eval('1')  # standards: ignore[PY003]\n")
+        code, output = self.run_check(str(self.src))
+        self.assertEqual(code, 1)
+        self.assertIn("PY003 eval/exec is forbidden.", output)
+        self.assertNotIn("Suppressed inline", output)
+
+    def test_repository_service_sources_pass_with_performance_rules(self) -> None:
+        repo = ROOT.parents[1]
+        code, output = self.run_check(
+            "--no-cache", str(repo / "backend" / "shop-agent" / "src"), str(repo / "control-plane" / "api" / "src")
+        )
+        self.assertEqual(code, 0, output)
+
+
+class ChangedSinceTests(StandardsCheckTestCase):
+    def git(self, *args: str) -> None:
+        subprocess.run(["git", "-C", str(self.tmp), *args], check=True, capture_output=True)
+
+    def test_only_files_changed_since_the_ref_are_checked(self) -> None:
+        self.write("committed.py", VIOLATIONS)
+        self.write("edited.py", "VALUE = 1\n")
+        self.git("init", "-q")
+        self.git("add", ".")
+        self.git("-c", "user.name=ci", "-c", "user.email=ci@example.invalid", "commit", "-qm", "base")
+        self.write("edited.py", "VALUE = 2\n")
+        self.write("new.py", "VALUE = 3\n")
+
+        with contextlib.chdir(self.tmp):
+            code, output = self.run_check("--changed-since", "HEAD", str(self.src))
+            self.assertEqual((code, output), (0, "Python standards check passed for 2 file(s).\n"))
+            self.git("add", ".")
+            self.git("-c", "user.name=ci", "-c", "user.email=ci@example.invalid", "commit", "-qm", "edit")
+            code, output = self.run_check("--changed-since", "HEAD", str(self.src))
+            self.assertEqual(code, 0)
+            self.assertIn("No Python files changed since HEAD", output)
+            self.assertEqual(self.run_check("--changed-since", "no-such-ref", str(self.src))[0], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import ast
+import pathlib
+import unittest
+
+
+REPO = pathlib.Path(__file__).resolve().parents[3]
+AGENT_SERVER = REPO / "backend" / "shop-agent" / "src" / "server.py"
+CONTROL_PLANE_SERVER = REPO / "control-plane" / "api" / "src" / "server.py"
+
+# Both services ship as one server.py per image (ADR 0006, ADR 0007), so these
+# definitions are copied rather than imported and must not drift apart.
+SHARED = (
+    "LATENCY_BUCKETS",
+    "_format_labels",
+    "_format_metric_value",
+    "MetricsRegistry",
+    "SPAN_KIND_INTERNAL",
+    "SPAN_KIND_SERVER",
+    "SPAN_KIND_CLIENT",
+    "TRACE_EXPORT_BATCH",
+    "TRACE_EXPORT_TIMEOUT_SECONDS",
+    "_HEX_DIGITS",
+    "parse_traceparent",
+    "_new_span_id",
+    "_otlp_attributes",
+    "Span",
+    "NO_SPAN",
+    "TraceContext",
+    "Tracer",
+    "_collapse_stack",
+    "SamplingProfiler",
+    "request_ready",
+    "IdleConnectionPoller",
+    "SettingsReloader",
+)
+
+# Same code, but each service reads its own environment prefix.
+PREFIXED = {"settings_source": ("AGENT_", "CONTROL_PLANE_")}
+
+
+def top_level_definitions(path: pathlib.Path) -> dict[str, str]:
+    source = path.read_text(encoding="utf-8")
+    definitions = {}
+    for node in ast.parse(source).body:
+        if isinstance(node, (ast.FunctionDef, ast.ClassDef)):
+            names = [node.name]
+        elif isinstance(node, ast.Assign):
+            names = [target.id for target in node.targets if isinstance(target, ast.Name)]
+        elif isinstance(node, ast.AnnAssign) and isinstance(node.target, ast.Name):
+            names = [node.target.id]
+        else:
+            continue
+        segment = ast.get_source_segment(source, node)
+        for name in names:
+            definitions[name] = segment
+    return definitions
+
+
+class SharedServiceCodeTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.agent = top_level_definitions(AGENT_SERVER)
+        cls.control_plane = top_level_definitions(CONTROL_PLANE_SERVER)
+
+    def test_shared_definitions_are_identical(self) -> None:
+        for name in SHARED:
+            with self.subTest(name=name):
+                self.assertIn(name, self.agent)
+                self.assertIn(name, self.control_plane)
+                self.assertEqual(self.agent[name], self.control_plane[name])
+
+    def test_prefixed_definitions_differ_only_by_prefix(self) -> None:
+        for name, (agent_prefix, control_plane_prefix) in PREFIXED.items():
+            with self.subTest(name=name):
+                self.assertIn(agent_prefix, self.agent[name])
+                normalised = self.control_plane[name].replace(control_plane_prefix, agent_prefix)
+                self.assertEqual(self.agent[name], normalised)
+
+
+if __name__ == "__main__":
+    unittest.main()